@@ -85,10 +85,19 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST"),  # Debe ser 'db' según tu compose
         "PORT": os.environ.get("POSTGRES_PORT"),  # Por defecto 5432
+        # Conexiones persistentes: cada hilo del pool del servidor MCP
+        # (run_mcp_server --db-workers N) reutiliza la suya entre llamadas.
+        "CONN_MAX_AGE": int(os.environ.get("POSTGRES_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
 
+# Caché en memoria de datos maestros del servidor MCP (gestion.servicios.maestros).
+# Segundos que vale cada entrada; 0 la desactiva.
+MAESTROS_CACHE_TTL = int(os.environ.get("MAESTROS_CACHE_TTL", "300"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
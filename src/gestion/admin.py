@@ -1,4 +1,20 @@
-from django.contrib import admin
+import csv
+import json
+import tempfile
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
 
 from .models import (
     AnalisisLaboratorio,
@@ -10,26 +26,292 @@ from .models import (
     Dummy,
     EquipoAplicacion,
     Explotacion,
+    LineaDAT,
     Parcela,
     Persona,
     Personal,
     RegistroMovimientoProducto,
     RegistroTransporte,
     SemillaTratada,
+    SerieDAT,
+    SnapshotCuaderno,
     Titular,
     Transportista,
     Vehiculo,
 )
+from .servicios import maestros
+from .servicios.hojas_calculo import escribir_historico_xlsx
+from .servicios.sigpac import ErrorImportacion, importar_recintos
+
+# Filas leídas de la BD en cada viaje al exportar a CSV
+TAMANO_LOTE_CSV = 2000
+
+
+class _Eco:
+    """Pseudo-fichero para ``csv.writer``: devuelve cada fila en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False, default=str)
+    return valor
+
+
+def _filas_csv(queryset, campos):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel reconozca el UTF-8 (tildes, eñes)
+    yield "\ufeff" + escritor.writerow([campo.verbose_name for campo in campos])
+    for objeto in queryset.iterator(chunk_size=TAMANO_LOTE_CSV):
+        yield escritor.writerow(
+            [
+                _valor_csv(
+                    getattr(objeto, campo.name)
+                    if campo.is_relation
+                    else getattr(objeto, campo.attname)
+                )
+                for campo in campos
+            ]
+        )
+
+
+@admin.action(description="Exportar a CSV los registros seleccionados")
+def exportar_csv(modeladmin, request, queryset):
+    """
+    Envía los registros en CSV a medida que se leen de la BD (por lotes), sin
+    cargarlos todos en memoria. Las claves ajenas se leen con ``select_related``.
+    """
+    opciones = queryset.model._meta
+    campos = list(opciones.concrete_fields)
+    relaciones = [campo.name for campo in campos if campo.is_relation]
+    queryset = queryset.select_related(*relaciones)
+    if not queryset.query.order_by and not opciones.ordering:
+        queryset = queryset.order_by("pk")
+    nombre = f"{opciones.model_name}_{timezone.localdate():%Y%m%d}.csv"
+    return StreamingHttpResponse(
+        _filas_csv(queryset, campos),
+        content_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
+# A partir de este nº de filas el listado sin filtros muestra el total estimado
+UMBRAL_CONTEO_ESTIMADO = 10_000
+# Opciones como máximo en los filtros por clave ajena del listado
+LIMITE_FILTRO = 50
+# Ids como máximo de una tabla relacionada que se pasan como lista en la búsqueda
+LIMITE_IDS_BUSQUEDA = 1000
+# Filas como máximo de la exportación del diario a XLSX desde el admin: el libro
+# se genera entero antes de empezar a enviarlo (más filas, con exportar_historico)
+LIMITE_XLSX = 50_000
+
+
+def filas_estimadas(modelo, using="default"):
+    """
+    Nº de filas de la tabla de ``modelo`` según las estadísticas de PostgreSQL
+    (``pg_class.reltuples``, sumando sus particiones si está particionada), sin
+    recorrerla. ``None`` en otras bases de datos o si no hay estadísticas.
+    """
+    conexion = connections[using]
+    if conexion.vendor != "postgresql":
+        return None
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT SUM(GREATEST(c.reltuples, 0))::bigint
+            FROM pg_class c
+            WHERE (c.oid = %s::regclass AND c.relkind = 'r')
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+            """,
+            [modelo._meta.db_table] * 2,
+        )
+        estimadas = cursor.fetchone()[0]
+    return estimadas or None
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginador del admin que, en los listados sin filtros de tablas grandes, usa el
+    nº de filas estimado en lugar de un ``COUNT(*)`` que recorre la tabla entera.
+    Con filtros o búsqueda cuenta exactamente (las consultas usan índices).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimadas = filas_estimadas(queryset.model, queryset.db)
+            if estimadas and estimadas >= UMBRAL_CONTEO_ESTIMADO:
+                return estimadas
+        return super().count
+
+
+class FiltroRelacionado(admin.RelatedFieldListFilter):
+    """
+    Filtro por clave ajena que lista como máximo LIMITE_FILTRO opciones (más la
+    elegida) en vez de cargar toda la tabla relacionada; el resto se encuentra
+    con la búsqueda.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        ordenacion = self.field_admin_ordering(field, request, model_admin) or ["pk"]
+        relacionados = field.remote_field.model._default_manager.order_by(*ordenacion)
+        opciones = [(obj.pk, str(obj)) for obj in relacionados[:LIMITE_FILTRO]]
+        elegidos = set(self.lookup_val or ()) - {str(pk) for pk, _ in opciones}
+        if elegidos:
+            opciones += [
+                (obj.pk, str(obj)) for obj in relacionados.filter(pk__in=elegidos)
+            ]
+        return opciones
+
+
+class GestionAdmin(admin.ModelAdmin):
+    """
+    Base de los admins de gestión: exportación a CSV y listados que no crecen en
+    consultas con el nº de filas (claves ajenas con ``select_related``, filtros y
+    selectores de claves ajenas sin cargar las tablas relacionadas y total
+    estimado en los listados sin filtros). ``gestion.tests.test_admin`` comprueba
+    que ningún listado supera CONSULTAS_MAXIMAS y ``benchmark_mcp --escenario
+    admin`` lo mide con muchos datos.
+    """
+
+    CONSULTAS_MAXIMAS = 12
+
+    actions = [exportar_csv]
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def _clave_ajena(self, nombre):
+        try:
+            campo = self.model._meta.get_field(nombre)
+        except FieldDoesNotExist:
+            return None
+        return campo if campo.is_relation and campo.concrete else None
+
+    def get_list_select_related(self, request):
+        if self.list_select_related:
+            return self.list_select_related
+        return [
+            nombre
+            for nombre in self.get_list_display(request)
+            if isinstance(nombre, str) and self._clave_ajena(nombre)
+        ]
+
+    def get_list_filter(self, request):
+        return [
+            (
+                (filtro, FiltroRelacionado)
+                if isinstance(filtro, str)
+                and "__" not in filtro
+                and self._clave_ajena(filtro)
+                else filtro
+            )
+            for filtro in super().get_list_filter(request)
+        ]
+
+    def _campo_busqueda(self, ruta):
+        """
+        ``(clave_ajena, campo)`` de un campo de ``search_fields`` que se puede
+        buscar con índices: un campo de texto del modelo (``clave_ajena`` es
+        ``None``) o de una tabla a la que apunta una clave ajena (``explotacion__nombre``).
+        ``None`` si tiene prefijo (``^``, ``=``, ``@``) o sigue otro tipo de relación.
+        """
+        partes = ruta.split("__")
+        if ruta[0] in "^=@" or len(partes) > 2:
+            return None
+        clave_ajena = None
+        modelo = self.model
+        try:
+            if len(partes) == 2:
+                clave_ajena = modelo._meta.get_field(partes[0])
+                if not (clave_ajena.many_to_one or clave_ajena.one_to_one):
+                    return None
+                if not clave_ajena.concrete:
+                    return None
+                modelo = clave_ajena.related_model
+            campo = modelo._meta.get_field(partes[-1])
+        except FieldDoesNotExist:
+            return None
+        if campo.is_relation or campo.get_internal_type() not in (
+            "CharField",
+            "TextField",
+            "EmailField",
+        ):
+            return None
+        return clave_ajena, campo
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        En PostgreSQL, busca cada palabra con ``icontains`` (lo sirven los índices
+        de trigramas sobre ``UPPER(campo)`` de las migraciones 0009 y 0013), pero
+        los campos de tablas relacionadas se resuelven antes en esa tabla (pequeña)
+        y se filtran por la clave ajena (``explotacion_id IN (...)``), sin JOIN.
+        Así todas las condiciones del OR usan un índice de la tabla y PostgreSQL
+        las combina (BitmapOr) en vez de recorrerla entera. En otras bases de
+        datos, o con campos de otro tipo, usa la búsqueda estándar del admin.
+        """
+        campos = [
+            self._campo_busqueda(ruta) for ruta in self.get_search_fields(request)
+        ]
+        if (
+            not search_term
+            or not campos
+            or None in campos
+            or connections[queryset.db].vendor != "postgresql"
+        ):
+            return super().get_search_results(request, queryset, search_term)
+
+        for palabra in smart_split(search_term):
+            if palabra.startswith(('"', "'")) and palabra[0] == palabra[-1]:
+                palabra = unescape_string_literal(palabra)
+            condicion = Q()
+            for clave_ajena, campo in campos:
+                if clave_ajena is None:
+                    condicion |= Q(**{f"{campo.name}__icontains": palabra})
+                    continue
+                relacionados = campo.model._default_manager.filter(
+                    **{f"{campo.name}__icontains": palabra}
+                ).values_list("pk", flat=True)
+                ids = list(relacionados[: LIMITE_IDS_BUSQUEDA + 1])
+                if len(ids) > LIMITE_IDS_BUSQUEDA:
+                    ids = relacionados
+                if ids:
+                    condicion |= Q(**{f"{clave_ajena.attname}__in": ids})
+            # Sin condiciones (solo campos relacionados sin coincidencias) no hay resultados
+            queryset = queryset.filter(condicion) if condicion else queryset.none()
+        return queryset, False
+
+    def get_autocomplete_fields(self, request):
+        """Selector con búsqueda para las claves ajenas a modelos con búsqueda en el admin."""
+        if self.autocomplete_fields:
+            return self.autocomplete_fields
+        return [
+            campo.name
+            for campo in self.model._meta.get_fields()
+            if campo.is_relation
+            and campo.concrete
+            and campo.editable
+            and campo.name not in self.raw_id_fields
+            and getattr(
+                self.admin_site._registry.get(campo.related_model),
+                "search_fields",
+                None,
+            )
+        ]
 
 
 @admin.register(Dummy)
-class DummyAdmin(admin.ModelAdmin):
+class DummyAdmin(GestionAdmin):
     list_display = ("id", "nombre", "creado_en")  # Columnas visibles en la lista
     search_fields = ("nombre",)  # Barra de búsqueda
 
 
 @admin.register(Direccion)
-class DireccionAdmin(admin.ModelAdmin):
+class DireccionAdmin(GestionAdmin):
     list_display = (
         "id",
         "tipo_via",
@@ -45,14 +327,14 @@ class DireccionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Persona)
-class PersonaAdmin(admin.ModelAdmin):
+class PersonaAdmin(GestionAdmin):
     list_display = ("id", "nombre", "nif", "sexo", "telefono", "email")
     search_fields = ("nombre", "nif", "email")
     list_filter = ("sexo",)
 
 
 @admin.register(Explotacion)
-class ExplotacionAdmin(admin.ModelAdmin):
+class ExplotacionAdmin(GestionAdmin):
     list_display = (
         "id",
         "nombre",
@@ -70,8 +352,20 @@ class ExplotacionAdmin(admin.ModelAdmin):
     list_filter = ("tipo_representacion",)
 
 
+class ImportarRecintosForm(forms.Form):
+    explotacion = forms.ModelChoiceField(
+        Explotacion.objects.order_by("nombre"), label="Explotación"
+    )
+    fichero = forms.FileField(
+        label="Fichero",
+        help_text="CSV o GeoJSON exportado del visor SIGPAC o de la declaración de "
+        "la PAC. Los recintos que ya existen (mismo polígono, parcela y recinto) "
+        "se actualizan.",
+    )
+
+
 @admin.register(Parcela)
-class ParcelaAdmin(admin.ModelAdmin):
+class ParcelaAdmin(GestionAdmin):
     list_display = (
         "id",
         "explotacion",
@@ -80,6 +374,7 @@ class ParcelaAdmin(admin.ModelAdmin):
         "parcela",
         "recinto",
         "especie",
+        "alias",
         "superficie_cultivada",
     )
     search_fields = (
@@ -88,13 +383,61 @@ class ParcelaAdmin(admin.ModelAdmin):
         "parcela",
         "recinto",
         "especie",
+        "alias",
         "explotacion__nombre",
     )
     list_filter = ("explotacion", "secano_regadio", "aire_protegido", "especie")
 
+    def get_urls(self):
+        return [
+            path(
+                "importar/",
+                self.admin_site.admin_view(self.importar_sigpac),
+                name="gestion_parcela_importar",
+            )
+        ] + super().get_urls()
+
+    def importar_sigpac(self, request):
+        """Importa los recintos de un export SIGPAC/PAC (ver gestion.servicios.sigpac)."""
+        if not (
+            self.has_add_permission(request) and self.has_change_permission(request)
+        ):
+            raise PermissionDenied
+        form = ImportarRecintosForm(
+            request.POST or None,
+            request.FILES or None,
+            initial={"explotacion": maestros.explotacion_principal()},
+        )
+        if request.method == "POST" and form.is_valid():
+            explotacion = form.cleaned_data["explotacion"]
+            fichero = form.cleaned_data["fichero"]
+            try:
+                creadas, actualizadas = importar_recintos(
+                    explotacion, fichero.read(), fichero.name
+                )
+            except ErrorImportacion as e:
+                form.add_error("fichero", str(e))
+            else:
+                self.message_user(
+                    request,
+                    f"{explotacion.nombre}: {creadas} parcelas creadas y "
+                    f"{actualizadas} actualizadas.",
+                    messages.SUCCESS,
+                )
+                return redirect("admin:gestion_parcela_changelist")
+        contexto = {
+            **self.admin_site.each_context(request),
+            "opts": self.opts,
+            "title": "Importar recintos SIGPAC",
+            "form": form,
+        }
+        return TemplateResponse(
+            request, "admin/gestion/parcela/importar_sigpac.html", contexto
+        )
+
 
 @admin.register(Titular)
-class TitularAdmin(admin.ModelAdmin):
+class TitularAdmin(GestionAdmin):
     list_display = (
         "id",
         "nombre",
@@ -108,14 +451,14 @@ class TitularAdmin(admin.ModelAdmin):
 
 
 @admin.register(Vehiculo)
-class VehiculoAdmin(admin.ModelAdmin):
+class VehiculoAdmin(GestionAdmin):
     list_display = ("id", "tipo", "matricula", "marca", "modelo")
     search_fields = ("matricula", "marca", "modelo")
     list_filter = ("tipo",)
 
 
 @admin.register(Destinatario)
-class DestinatarioAdmin(admin.ModelAdmin):
+class DestinatarioAdmin(GestionAdmin):
     list_display = (
         "id",
         "nombre",
@@ -129,7 +472,7 @@ class DestinatarioAdmin(admin.ModelAdmin):
 
 
 @admin.register(Personal)
-class PersonalAdmin(admin.ModelAdmin):
+class PersonalAdmin(GestionAdmin):
     list_display = (
         "nombre",
         "apellidos",
@@ -144,7 +487,7 @@ class PersonalAdmin(admin.ModelAdmin):
 
 
 @admin.register(DiarioActividad)
-class DiarioActividadAdmin(admin.ModelAdmin):
+class DiarioActividadAdmin(GestionAdmin):
     list_display = (
         "id",
         "fecha",
@@ -162,10 +505,37 @@ class DiarioActividadAdmin(admin.ModelAdmin):
     )
     list_filter = ("fecha", "tipo", "estado_validacion", "explotacion")
     date_hierarchy = "fecha"
+    actions = [exportar_csv, "exportar_xlsx"]
+
+    @admin.action(description="Exportar a XLSX las actividades seleccionadas")
+    def exportar_xlsx(self, request, queryset):
+        """
+        Envía las actividades en XLSX. El libro se escribe en un fichero temporal
+        y se envía en trozos desde él, pero la descarga no empieza hasta que está
+        completo: con más de LIMITE_XLSX filas se pide usar exportar_historico.
+        """
+        if queryset[: LIMITE_XLSX + 1].count() > LIMITE_XLSX:
+            self.message_user(
+                request,
+                f"La exportación a XLSX desde el admin admite como máximo "
+                f"{LIMITE_XLSX} actividades. Filtra la selección, expórtala a CSV "
+                "o usa «python manage.py exportar_historico fichero.xlsx» (con "
+                "--desde, --hasta, --producto...).",
+                messages.WARNING,
+            )
+            return None
+        archivo = tempfile.TemporaryFile()
+        escribir_historico_xlsx(queryset.order_by("fecha", "pk"), archivo)
+        archivo.seek(0)
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=f"diario_{timezone.localdate():%Y%m%d}.xlsx",
+        )
 
 
 @admin.register(SemillaTratada)
-class SemillaTratadaAdmin(admin.ModelAdmin):
+class SemillaTratadaAdmin(GestionAdmin):
     list_display = (
         "id",
         "fecha_siembra",
@@ -186,7 +556,7 @@ class SemillaTratadaAdmin(admin.ModelAdmin):
 
 
 @admin.register(RegistroMovimientoProducto)
-class RegistroMovimientoProductoAdmin(admin.ModelAdmin):
+class RegistroMovimientoProductoAdmin(GestionAdmin):
     list_display = (
         "id",
         "fecha",
@@ -209,7 +579,7 @@ class RegistroMovimientoProductoAdmin(admin.ModelAdmin):
 
 
 @admin.register(AnalisisLaboratorio)
-class AnalisisLaboratorioAdmin(admin.ModelAdmin):
+class AnalisisLaboratorioAdmin(GestionAdmin):
     list_display = (
         "id",
         "fecha",
@@ -231,13 +601,21 @@ class AnalisisLaboratorioAdmin(admin.ModelAdmin):
 
 
 @admin.register(Transportista)
-class TransportistaAdmin(admin.ModelAdmin):
+class TransportistaAdmin(GestionAdmin):
     list_display = ("nombre", "nif", "telefono", "email", "direccion")
     search_fields = ("nombre", "nif", "telefono", "email")
 
 
+class LineaDATInline(admin.TabularInline):
+    model = LineaDAT
+    extra = 0
+    autocomplete_fields = ("destinatario",)
+    fields = ("orden", "producto", "variedad", "cantidad", "unidad")
+
+
 @admin.register(DocumentoDAT)
-class DocumentoDATAdmin(admin.ModelAdmin):
+class DocumentoDATAdmin(GestionAdmin):
+    inlines = [LineaDATInline]
     list_display = (
         "id",
         "numero",
@@ -252,8 +630,14 @@ class DocumentoDATAdmin(admin.ModelAdmin):
     date_hierarchy = "fecha_emision"
 
 
+@admin.register(SerieDAT)
+class SerieDATAdmin(GestionAdmin):
+    list_display = ("explotacion", "anio", "ultimo_numero")
+    list_filter = ("anio", "explotacion")
+
+
 @admin.register(RegistroTransporte)
-class RegistroTransporteAdmin(admin.ModelAdmin):
+class RegistroTransporteAdmin(GestionAdmin):
     list_display = (
         "id",
         "referencia",
@@ -280,14 +664,14 @@ class RegistroTransporteAdmin(admin.ModelAdmin):
 
 
 @admin.register(Asesor)
-class AsesorAdmin(admin.ModelAdmin):
+class AsesorAdmin(GestionAdmin):
     list_display = ("id", "persona", "numero_inscripcion_ropo", "tipo_carnet")
     search_fields = ("persona__nombre", "numero_inscripcion_ropo", "tipo_carnet")
     list_filter = ("tipo_carnet",)
 
 
 @admin.register(EquipoAplicacion)
-class EquipoAplicacionAdmin(admin.ModelAdmin):
+class EquipoAplicacionAdmin(GestionAdmin):
     list_display = (
         "id",
         "descripcion",
@@ -299,3 +683,17 @@ class EquipoAplicacionAdmin(admin.ModelAdmin):
     search_fields = ("descripcion", "numero_inscripcion_roma", "explotacion__nombre")
     list_filter = ("explotacion", "fecha_ultima_inspeccion")
     date_hierarchy = "fecha_ultima_inspeccion"
+
+
+@admin.register(SnapshotCuaderno)
+class SnapshotCuadernoAdmin(GestionAdmin):
+    list_display = (
+        "explotacion",
+        "anio",
+        "seccion",
+        "valido",
+        "version",
+        "generado_en",
+    )
+    list_filter = ("valido", "anio", "seccion", "explotacion")
+    readonly_fields = ("version", "generado_en")
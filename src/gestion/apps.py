@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class GestionConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "gestion"
+
+    def ready(self):
+        from gestion.servicios import maestros, parcelas, snapshots
+
+        maestros.conectar_senales()
+        parcelas.conectar_senales()
+        snapshots.conectar_senales()
@@ -0,0 +1,158 @@
+"""
+Ejecución del trabajo ORM lanzado desde las herramientas asíncronas del servidor MCP.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger("mcp-django")
+
+
+def _con_conexion_reciclada(func):
+    """Envuelve ``func`` para que recicle la conexión del hilo antes y después."""
+
+    @wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return inner
+
+
+class _ContadorConsultas:
+    """
+    ``execute_wrapper`` que cuenta las sentencias SQL ejecutadas en una llamada
+    (y guarda el tiempo que la llamada ha pasado en el hilo de BD).
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.segundos_bd = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class EjecutorBD:
+    """
+    Ejecuta funciones síncronas de acceso a BD desde corrutinas.
+
+    - ``workers=0``: comportamiento por defecto de Django (``sync_to_async`` con
+      ``thread_sensitive=True``). Todo el trabajo de BD se serializa en un único hilo.
+    - ``workers=N``: el trabajo se reparte en un pool acotado de N hilos. Cada hilo
+      mantiene su propia conexión y la recicla con ``close_old_connections``
+      (respetando ``CONN_MAX_AGE``) en cada llamada.
+
+    Se usa igual que ``sync_to_async``: ``await db(func)(*args)``. Si se indica
+    ``herramienta``, la llamada se contabiliza en el informe de rendimiento
+    (consultas SQL, tiempo en el hilo de BD y tiempo total incluyendo la espera).
+    """
+
+    def __init__(self, workers=0):
+        self.workers = max(int(workers or 0), 0)
+        self._metricas = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        if self.workers:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="mcp-bd"
+            )
+
+    @property
+    def concurrente(self):
+        return self._pool is not None
+
+    def __call__(self, func, herramienta=None):
+        if herramienta is None:
+            return self._asincrono(func)
+
+        @wraps(func)
+        def contado(contador, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                with connection.execute_wrapper(contador):
+                    return func(*args, **kwargs)
+            finally:
+                contador.segundos_bd = time.perf_counter() - t0
+
+        ejecutar = self._asincrono(contado)
+
+        async def medido(*args, **kwargs):
+            # Un contador por llamada: la misma función envuelta puede ejecutarse
+            # varias veces a la vez (p. ej. las secciones del cuaderno)
+            contador = _ContadorConsultas()
+            t0 = time.perf_counter()
+            try:
+                return await ejecutar(contador, *args, **kwargs)
+            finally:
+                total = time.perf_counter() - t0
+                self._registrar(
+                    herramienta, contador.total, contador.segundos_bd, total
+                )
+
+        return medido
+
+    def _asincrono(self, func):
+        if self._pool is None:
+            return sync_to_async(func)
+        return sync_to_async(
+            _con_conexion_reciclada(func),
+            thread_sensitive=False,
+            executor=self._pool,
+        )
+
+    def _registrar(self, herramienta, consultas, segundos_bd, segundos_total):
+        logger.debug(
+            "%s: %d consultas, %.1f ms BD, %.1f ms total",
+            herramienta,
+            consultas,
+            segundos_bd * 1000,
+            segundos_total * 1000,
+        )
+        with self._lock:
+            m = self._metricas.setdefault(
+                herramienta,
+                {"llamadas": 0, "consultas": 0, "bd": 0.0, "total": 0.0, "max": 0.0},
+            )
+            m["llamadas"] += 1
+            m["consultas"] += consultas
+            m["bd"] += segundos_bd
+            m["total"] += segundos_total
+            m["max"] = max(m["max"], segundos_total)
+
+    def informe(self):
+        """Tabla de consultas y latencia media por herramienta."""
+        with self._lock:
+            metricas = {k: dict(v) for k, v in self._metricas.items()}
+        if not metricas:
+            return "Sin llamadas registradas."
+
+        lineas = [
+            f"{'herramienta':<34} {'llamadas':>8} {'consultas':>9} {'ms BD':>8} {'ms total':>9} {'ms máx':>8}"
+        ]
+        for nombre, m in sorted(metricas.items()):
+            n = m["llamadas"]
+            lineas.append(
+                f"{nombre:<34} {n:>8} {m['consultas'] / n:>9.1f} "
+                f"{m['bd'] / n * 1000:>8.1f} {m['total'] / n * 1000:>9.1f} {m['max'] * 1000:>8.1f}"
+            )
+        return "\n".join(lineas)
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __repr__(self):
+        modo = f"pool de {self.workers} hilos" if self.workers else "hilo único"
+        return f"<EjecutorBD {modo}>"
@@ -0,0 +1,781 @@
+import asyncio
+import io
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as ClienteWeb
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from fastmcp import Client
+
+from gestion.admin import GestionAdmin
+from gestion.ejecutor import EjecutorBD
+from gestion.management.commands.run_mcp_server import Command as ServidorMCP
+from gestion.models import (
+    AnalisisLaboratorio,
+    DiarioActividad,
+    DocumentoDAT,
+    Explotacion,
+    Parcela,
+    Persona,
+    RegistroMovimientoProducto,
+    SemillaTratada,
+    SerieDAT,
+)
+from gestion.servicios import dat_pdf, maestros
+from gestion.servicios.cuaderno import (
+    SECCIONES,
+    escribir_cuaderno,
+    generar_cuaderno,
+    generar_cuaderno_concurrente,
+)
+from gestion.servicios.dat import (
+    emitir_datos_dats,
+    emitir_dats,
+    normalizar_peticion,
+)
+
+
+def _lista_enteros(valor):
+    try:
+        return [int(x) for x in valor.split(",") if x.strip()]
+    except ValueError:
+        raise CommandError(f"Lista de enteros inválida: '{valor}'")
+
+
+def _consulta_representativa():
+    """Carga de BD típica de una herramienta de lectura (explotación + histórico)."""
+    explotacion = Explotacion.objects.first()
+    qs = DiarioActividad.objects.filter(explotacion=explotacion)
+    total = qs.count()
+    ultimos = list(qs.select_related("parcela").order_by("-fecha")[:50])
+    return total, len(ultimos)
+
+
+def sembrar_historico(filas):
+    """
+    Genera ``filas`` actividades sintéticas repartidas en 20 explotaciones y 10
+    campañas (y un 5 % de semillas, análisis y ventas) y actualiza las
+    estadísticas. Devuelve una explotación, una de sus parcelas y una campaña.
+    """
+    explotaciones = Explotacion.objects.bulk_create(
+        Explotacion(nombre=f"Finca {i}") for i in range(20)
+    )
+    parcelas = Parcela.objects.bulk_create(
+        Parcela(
+            explotacion=e,
+            referencia_sigpac=f"29:94:0:0:{i}:{j}:1",
+            especie="MANGO",
+        )
+        for i, e in enumerate(explotaciones)
+        for j in range(10)
+    )
+    tipos = ["TRATAMIENTO", "RIEGO", "ABONADO", "RIEGO", "OTRO"]
+    inicio = date(date.today().year - 9, 1, 1)
+    dias = (date(date.today().year, 12, 31) - inicio).days
+
+    def fecha(i):
+        return inicio + timedelta(days=i * 7919 % dias)
+
+    DiarioActividad.objects.bulk_create(
+        (
+            DiarioActividad(
+                explotacion_id=parcelas[i % len(parcelas)].explotacion_id,
+                parcela=parcelas[i % len(parcelas)],
+                fecha=fecha(i),
+                tipo=tipos[i % len(tipos)],
+                producto_nombre="Cobre",
+            )
+            for i in range(filas)
+        ),
+        batch_size=5000,
+    )
+    otras = max(filas // 20, 1)
+    SemillaTratada.objects.bulk_create(
+        (
+            SemillaTratada(explotacion=explotaciones[i % 20], fecha_siembra=fecha(i))
+            for i in range(otras)
+        ),
+        batch_size=5000,
+    )
+    AnalisisLaboratorio.objects.bulk_create(
+        (
+            AnalisisLaboratorio(explotacion=explotaciones[i % 20], fecha=fecha(i))
+            for i in range(otras)
+        ),
+        batch_size=5000,
+    )
+    RegistroMovimientoProducto.objects.bulk_create(
+        (
+            RegistroMovimientoProducto(
+                explotacion=explotaciones[i % 20], fecha=fecha(i), producto="MANGO"
+            )
+            for i in range(otras)
+        ),
+        batch_size=5000,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return explotaciones[7], parcelas[75], date.today().year - 3
+
+
+@contextmanager
+def _bd_temporal():
+    """
+    Crea una BD de pruebas desechable (``test_<nombre>``) para los escenarios que
+    escriben datos, y la destruye al terminar.
+    """
+    nombre_original = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks de rendimiento del servidor MCP contra la BD configurada"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--escenario",
+            choices=[
+                "concurrencia",
+                "escritura",
+                "numeracion_dat",
+                "dat_pdf",
+                "cuaderno",
+                "admin",
+            ],
+            default="concurrencia",
+            help="Escenario a medir.",
+        )
+        parser.add_argument(
+            "--db-workers",
+            default="0,2,4,8",
+            help="Valores de --db-workers a comparar (separados por comas).",
+        )
+        parser.add_argument(
+            "--clientes",
+            default="1,4,16",
+            help="Nº de clientes concurrentes a simular (separados por comas).",
+        )
+        parser.add_argument(
+            "--peticiones",
+            type=int,
+            default=200,
+            help="Peticiones totales por combinación (DAT emitidos en numeracion_dat y dat_pdf).",
+        )
+        parser.add_argument(
+            "--iteraciones",
+            type=int,
+            default=20,
+            help="Repeticiones de cada herramienta (escenario escritura).",
+        )
+        parser.add_argument(
+            "--filas",
+            type=int,
+            default=200_000,
+            help="Actividades del diario a generar (escenarios cuaderno y admin).",
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, f"_escenario_{options['escenario']}")(options)
+
+    # ==============================================================================
+    # ESCENARIO: concurrencia (--db-workers)
+    # ==============================================================================
+
+    def _escenario_concurrencia(self, options):
+        workers_list = _lista_enteros(options["db_workers"])
+        clientes_list = _lista_enteros(options["clientes"])
+        peticiones = options["peticiones"]
+
+        self.stdout.write(
+            f"{'workers':>8} {'clientes':>9} {'pet/s':>10} {'p50 ms':>9} {'p95 ms':>9}"
+        )
+        for workers in workers_list:
+            db = EjecutorBD(workers=workers)
+            try:
+                for clientes in clientes_list:
+                    duracion, latencias = asyncio.run(
+                        self._ronda(db, clientes, peticiones)
+                    )
+                    latencias.sort()
+                    p95 = latencias[max(int(len(latencias) * 0.95) - 1, 0)]
+                    self.stdout.write(
+                        f"{workers:>8} {clientes:>9} {len(latencias) / duracion:>10.1f} "
+                        f"{statistics.median(latencias) * 1000:>9.2f} {p95 * 1000:>9.2f}"
+                    )
+            finally:
+                db.cerrar()
+
+    async def _ronda(self, db, clientes, peticiones):
+        latencias = []
+        por_cliente = max(peticiones // clientes, 1)
+
+        async def cliente():
+            for _ in range(por_cliente):
+                t0 = time.perf_counter()
+                await db(_consulta_representativa)()
+                latencias.append(time.perf_counter() - t0)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente() for _ in range(clientes)))
+        return time.perf_counter() - inicio, latencias
+
+    # ==============================================================================
+    # ESCENARIO: escritura (consultas y latencia por herramienta)
+    # ==============================================================================
+
+    def _escenario_escritura(self, options):
+        workers = _lista_enteros(options["db_workers"])[0]
+        db = EjecutorBD(workers=workers)
+        try:
+            with _bd_temporal():
+                mcp = ServidorMCP().construir_mcp(db)
+                asyncio.run(self._llamadas_escritura(mcp, options["iteraciones"]))
+        finally:
+            db.cerrar()
+        self.stdout.write(db.informe())
+        self.stdout.write(maestros.cache.estadisticas())
+
+    async def _llamadas_escritura(self, mcp, iteraciones):
+        async with Client(mcp) as client:
+            await client.call_tool(
+                "configurar_explotacion_principal",
+                {
+                    "nombre_comercial": "Finca Benchmark",
+                    "nif_titular": "B0000000",
+                    "registro_nacional": "ES000",
+                    "municipio": "Vélez-Málaga",
+                    "provincia": "Málaga",
+                },
+            )
+            for i in range(iteraciones):
+                llamadas = [
+                    (
+                        "crear_titular",
+                        {
+                            "nombre": f"Titular {i}",
+                            "nif": f"T{i:07d}",
+                            "registro_explotacion": "ES000",
+                            "municipio": "Vélez-Málaga",
+                        },
+                    ),
+                    ("crear_vehiculo", {"matricula": f"{i:04d}BMK", "tipo": "COCHE"}),
+                    (
+                        "crear_cliente_destinatario",
+                        {
+                            "nombre_fiscal": f"Cliente {i}",
+                            "nif": f"C{i:07d}",
+                            "matricula_vehiculo_preferido": f"{i:04d}BMK",
+                            "municipio": "Vélez-Málaga",
+                        },
+                    ),
+                    (
+                        "crear_parcela",
+                        {
+                            "nombre_comun": f"Parcela {i}",
+                            "referencia_sigpac": f"29:94:0:0:1:{i}:1",
+                            "cultivo": "MANGO",
+                            "superficie_ha": 1.5,
+                        },
+                    ),
+                    (
+                        "crear_personal_aplicador",
+                        {
+                            "nombre": f"Aplicador {i}",
+                            "documento": f"P{i:07d}",
+                            "habilitado_fitosanitarios": True,
+                        },
+                    ),
+                    (
+                        "crear_maquina_roma",
+                        {
+                            "descripcion": f"Mochila {i}",
+                            "numero_inscripcion_roma": str(i),
+                        },
+                    ),
+                    (
+                        "crear_asesor_tecnico",
+                        {
+                            "nombre": f"Asesor {i}",
+                            "nif": f"A{i:07d}",
+                            "codigo_ropo": str(i),
+                        },
+                    ),
+                    (
+                        "crear_transportista_externo",
+                        {"nombre": f"Transportes {i}", "nif": f"X{i:07d}"},
+                    ),
+                    (
+                        "registrar_tratamiento",
+                        {
+                            "fecha": "2025-05-01",
+                            "referencia_sigpac": f"29:94:0:0:1:{i}:1",
+                            "producto": "Cobre",
+                            "dosis": 2.5,
+                            "plaga": "Oídio",
+                        },
+                    ),
+                    (
+                        "registrar_riego",
+                        {
+                            "fecha": "2025-05-02",
+                            "referencia_sigpac": f"29:94:0:0:1:{i}:1",
+                            "tipo_actividad": "Riego",
+                            "cantidad": 30,
+                        },
+                    ),
+                    (
+                        "registrar_actividades_lote",
+                        {
+                            "tipo_actividad": "Tratamiento",
+                            "fecha": "2025-05-03",
+                            "referencias_sigpac": [
+                                f"29:94:0:0:1:{j}:1" for j in range(i + 1)
+                            ],
+                            "producto": "Cobre",
+                            "dosis": 2.5,
+                            "plaga": "Oídio",
+                        },
+                    ),
+                    (
+                        "registrar_siembra",
+                        {
+                            "fecha": "2025-03-01",
+                            "referencia_sigpac": f"29:94:0:0:1:{i}:1",
+                            "cultivo": "MANGO",
+                            "kilos_semilla": 1,
+                        },
+                    ),
+                    (
+                        "registrar_analisis",
+                        {
+                            "fecha": "2025-06-01",
+                            "material": "Vegetal",
+                            "cultivo": "MANGO",
+                            "numero_boletin": f"B{i}",
+                            "laboratorio": "Lab",
+                            "resultado": "Sin residuos",
+                        },
+                    ),
+                    (
+                        "registrar_venta",
+                        {
+                            "fecha": "2025-08-01",
+                            "producto": "MANGO",
+                            "cantidad": 500,
+                            "cliente": f"Cliente {i}",
+                            "albaran": f"ALB-{i}",
+                        },
+                    ),
+                    (
+                        "generar_dat",
+                        {
+                            "nombre_destinatario": f"Cliente {i}",
+                            "productos": ["MANGO"],
+                            "cantidades": [500],
+                            "unidades": ["CAJAS"],
+                        },
+                    ),
+                    (
+                        "generar_dats_lote",
+                        {
+                            "dats": [
+                                {
+                                    "nombre_destinatario": f"Cliente {j}",
+                                    "productos": ["MANGO"],
+                                    "cantidades": [500],
+                                    "unidades": ["CAJAS"],
+                                    "matricula_vehiculo": f"{j:04d}BMK",
+                                }
+                                for j in range(i + 1)
+                            ]
+                        },
+                    ),
+                ]
+                for nombre, argumentos in llamadas:
+                    await client.call_tool(nombre, argumentos)
+
+    # ==============================================================================
+    # ESCENARIO: numeracion_dat (prueba de estrés del numerador de DAT)
+    # ==============================================================================
+
+    def _escenario_numeracion_dat(self, options):
+        """
+        Emite ``--peticiones`` DAT con ``generar_dat`` desde varios clientes
+        concurrentes y comprueba que no hay números repetidos ni huecos en la serie.
+        """
+        workers_list = _lista_enteros(options["db_workers"])
+        clientes_list = _lista_enteros(options["clientes"])
+        peticiones = options["peticiones"]
+
+        self.stdout.write(
+            f"{'workers':>8} {'clientes':>9} {'DAT':>6} {'errores':>8} {'DAT/min':>10}"
+        )
+        with _bd_temporal():
+            preparado = False
+            for workers in workers_list:
+                db = EjecutorBD(workers=workers)
+                try:
+                    mcp = ServidorMCP().construir_mcp(db)
+                    for clientes in clientes_list:
+                        duracion, errores = asyncio.run(
+                            self._ronda_dat(
+                                mcp, clientes, peticiones, preparar=not preparado
+                            )
+                        )
+                        preparado = True
+                        emitidos = peticiones - len(errores)
+                        self.stdout.write(
+                            f"{workers:>8} {clientes:>9} {emitidos:>6} {len(errores):>8} "
+                            f"{emitidos / duracion * 60:>10.0f}"
+                        )
+                        for error in errores[:3]:
+                            self.stdout.write(self.style.WARNING(f"  {error}"))
+                finally:
+                    db.cerrar()
+            self._verificar_series()
+
+    async def _ronda_dat(self, mcp, clientes, peticiones, preparar):
+        errores = []
+        pendientes = iter(range(peticiones))
+
+        async with Client(mcp) as client:
+            if preparar:
+                await client.call_tool(
+                    "configurar_explotacion_principal",
+                    {
+                        "nombre_comercial": "Finca Benchmark",
+                        "nif_titular": "B0000000",
+                        "registro_nacional": "ES000",
+                        "municipio": "Vélez-Málaga",
+                        "provincia": "Málaga",
+                    },
+                )
+                await client.call_tool(
+                    "crear_cliente_destinatario",
+                    {
+                        "nombre_fiscal": "Cliente Benchmark",
+                        "nif": "C0000000",
+                        "municipio": "Vélez-Málaga",
+                    },
+                )
+
+            async def cliente():
+                for _ in pendientes:
+                    resultado = await client.call_tool(
+                        "generar_dat",
+                        {
+                            "nombre_destinatario": "Cliente Benchmark",
+                            "productos": ["MANGO"],
+                            "cantidades": [500],
+                            "unidades": ["CAJAS"],
+                        },
+                    )
+                    texto = resultado.content[0].text
+                    if not texto.startswith("DAT GENERADO"):
+                        errores.append(texto)
+
+            inicio = time.perf_counter()
+            await asyncio.gather(*(cliente() for _ in range(clientes)))
+            return time.perf_counter() - inicio, errores
+
+    def _verificar_series(self):
+        numeros = list(DocumentoDAT.objects.values_list("numero", flat=True))
+        emitidos = sum(SerieDAT.objects.values_list("ultimo_numero", flat=True))
+        repetidos = len(numeros) - len(set(numeros))
+        huecos = emitidos - len(numeros)
+
+        self.stdout.write(
+            f"\nDAT en BD: {len(numeros)} | Números de serie consumidos: {emitidos} | "
+            f"Repetidos: {repetidos} | Huecos: {huecos}"
+        )
+        if repetidos or huecos:
+            raise CommandError("La numeración de DAT no es correlativa y única.")
+        self.stdout.write(self.style.SUCCESS("Numeración correcta."))
+
+    # ==============================================================================
+    # ESCENARIO: dat_pdf (tiempo de generación del DAT en el formulario oficial)
+    # ==============================================================================
+
+    def _escenario_dat_pdf(self, options):
+        """
+        Emite ``--peticiones`` DAT y mide el tiempo por DAT de rellenar el
+        formulario oficial: uno a uno, todos en un único PDF y en un ZIP con un
+        PDF por DAT. La primera fila es el primer DAT del proceso, que incluye
+        leer la plantilla.
+        """
+        with _bd_temporal():
+            asyncio.run(self._preparar_datos_dat())
+            Persona.objects.create(nombre="Titular Benchmark", nif="B0000000")
+            emitidos = emitir_datos_dats(
+                {
+                    "nombre_destinatario": f"Cliente {i % 5}",
+                    "productos": ["MANGO", "AGUACATE"],
+                    "cantidades": [500, 20],
+                    "unidades": ["KG", "CAJAS"],
+                    "nif_transportista": "X0000000",
+                    "es_ecologico": True,
+                }
+                for i in range(options["peticiones"])
+            )
+
+        def uno_a_uno(salida):
+            for datos in emitidos:
+                salida.write(dat_pdf.generar_dat_pdf(datos))
+
+        dat_pdf.plantilla.cache_clear()
+        modos = [
+            (
+                "primero",
+                1,
+                lambda salida: salida.write(dat_pdf.generar_dat_pdf(emitidos[0])),
+            ),
+            ("uno a uno", len(emitidos), uno_a_uno),
+            (
+                "un PDF",
+                len(emitidos),
+                lambda salida: dat_pdf.escribir_dats_pdf(emitidos, salida),
+            ),
+            (
+                "ZIP",
+                len(emitidos),
+                lambda salida: dat_pdf.escribir_dats_zip(emitidos, salida),
+            ),
+        ]
+        self.stdout.write(f"{len(emitidos)} DAT\n")
+        self.stdout.write(f"{'modo':<10} {'ms':>9} {'ms/DAT':>8} {'KB':>8}")
+        for nombre, documentos, generar in modos:
+            salida = io.BytesIO()
+            t0 = time.perf_counter()
+            generar(salida)
+            ms = (time.perf_counter() - t0) * 1000
+            self.stdout.write(
+                f"{nombre:<10} {ms:>9.1f} {ms / documentos:>8.2f} "
+                f"{len(salida.getvalue()) // 1024:>8}"
+            )
+
+    async def _preparar_datos_dat(self):
+        mcp = ServidorMCP().construir_mcp(EjecutorBD())
+        async with Client(mcp) as client:
+            await client.call_tool(
+                "configurar_explotacion_principal",
+                {
+                    "nombre_comercial": "Finca Benchmark",
+                    "nif_titular": "B0000000",
+                    "registro_nacional": "ES000",
+                    "municipio": "Vélez-Málaga",
+                    "provincia": "Málaga",
+                },
+            )
+            await client.call_tool(
+                "crear_parcela",
+                {
+                    "nombre_comun": "Parcela Benchmark",
+                    "referencia_sigpac": "29:94:0:0:1:1:1",
+                    "cultivo": "MANGO",
+                    "superficie_ha": 1.5,
+                },
+            )
+            await client.call_tool(
+                "crear_transportista_externo",
+                {"nombre": "Transportes Benchmark", "nif": "X0000000"},
+            )
+            for i in range(5):
+                await client.call_tool(
+                    "crear_vehiculo", {"matricula": f"{i:04d}BMK", "tipo": "COCHE"}
+                )
+                await client.call_tool(
+                    "crear_cliente_destinatario",
+                    {
+                        "nombre_fiscal": f"Cliente {i}",
+                        "nif": f"C{i:07d}",
+                        "matricula_vehiculo_preferido": f"{i:04d}BMK",
+                        "municipio": "Vélez-Málaga",
+                    },
+                )
+
+    # ==============================================================================
+    # ESCENARIO: cuaderno (tiempo y memoria pico al generar el cuaderno)
+    # ==============================================================================
+
+    def _escenario_cuaderno(self, options):
+        """
+        Genera el cuaderno de la campaña con más actividades sobre ``--filas``
+        actividades sintéticas y mide tiempo y memoria pico, escribiéndolo en un
+        fichero (memoria independiente del nº de filas) y como cadena completa,
+        y después generando los snapshots y leyéndolos ya guardados. Por último
+        compara la latencia de generar las secciones una tras otra (hilo único)
+        y a la vez (pool de hilos, una conexión por sección), sin snapshots.
+        """
+        with _bd_temporal():
+            sembrar_historico(options["filas"])
+            explotacion = maestros.explotacion_principal()
+            anio = (
+                DiarioActividad.objects.filter(explotacion=explotacion)
+                .values_list("fecha__year", flat=True)
+                .order_by("-fecha")
+                .first()
+            )
+            filas = DiarioActividad.objects.filter(
+                explotacion=explotacion, fecha__year=anio
+            ).count()
+            self.stdout.write(
+                f"Cuaderno {anio} de '{explotacion.nombre}': {filas} actividades\n"
+            )
+
+            class Descarte:
+                def write(self, texto):
+                    pass
+
+            modos = [
+                (
+                    "fichero",
+                    lambda: escribir_cuaderno(anio, Descarte(), usar_snapshots=False),
+                ),
+                ("cadena", lambda: generar_cuaderno(anio, usar_snapshots=False)),
+                ("snapshots", lambda: generar_cuaderno(anio)),
+                ("caché", lambda: generar_cuaderno(anio)),
+            ]
+            self.stdout.write(f"{'modo':<10} {'ms':>9} {'pico KB':>10}")
+            for nombre, generar in modos:
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                generar()
+                ms = (time.perf_counter() - t0) * 1000
+                pico = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+                self.stdout.write(f"{nombre:<10} {ms:>9.1f} {pico:>10}")
+
+            self.stdout.write(f"\n{'secciones':<10} {'p50 ms':>9} {'máx ms':>9}")
+            for nombre, workers in (("seguidas", 0), ("a la vez", len(SECCIONES))):
+                db = EjecutorBD(workers=workers)
+                try:
+                    latencias = asyncio.run(
+                        self._latencias_cuaderno(db, anio, options["iteraciones"])
+                    )
+                finally:
+                    db.cerrar()
+                self.stdout.write(
+                    f"{nombre:<10} {statistics.median(latencias) * 1000:>9.1f} "
+                    f"{max(latencias) * 1000:>9.1f}"
+                )
+
+    # ==============================================================================
+    # ESCENARIO: admin (consultas por página del admin con muchos datos)
+    # ==============================================================================
+
+    def _escenario_admin(self, options):
+        """
+        Sobre ``--filas`` actividades y ``--peticiones`` DAT, abre con un
+        superusuario el listado (sin filtros, filtrado por explotación y con
+        búsqueda) y la ficha del primer registro de cada modelo de gestión y
+        cuenta sus consultas. Falla si alguna página supera
+        GestionAdmin.CONSULTAS_MAXIMAS (p. ej. por un N+1 en una columna).
+        """
+        with _bd_temporal():
+            asyncio.run(self._preparar_datos_dat())
+            Persona.objects.create(nombre="Titular Benchmark", nif="B0000000")
+            emitir_dats(
+                normalizar_peticion(
+                    {
+                        "nombre_destinatario": f"Cliente {i % 5}",
+                        "productos": ["MANGO", "AGUACATE"],
+                        "cantidades": [500, 20],
+                        "unidades": ["KG", "CAJAS"],
+                        "nif_transportista": "X0000000",
+                        "matricula_vehiculo": f"{i % 5:04d}BMK",
+                    }
+                )
+                for i in range(options["peticiones"])
+            )
+            sembrar_historico(options["filas"])
+            explotacion = Explotacion.objects.order_by("pk").last()
+
+            setup_test_environment()
+            try:
+                cliente = ClienteWeb()
+                cliente.force_login(
+                    get_user_model().objects.create_superuser(
+                        "benchmark", "benchmark@example.com", "benchmark"
+                    )
+                )
+                excedidos = self._paginas_admin(cliente, explotacion)
+            finally:
+                teardown_test_environment()
+
+        if excedidos:
+            raise CommandError(
+                f"Páginas del admin con más de {GestionAdmin.CONSULTAS_MAXIMAS} "
+                "consultas: " + ", ".join(excedidos)
+            )
+        self.stdout.write(self.style.SUCCESS("Presupuesto de consultas respetado."))
+
+    def _paginas_admin(self, cliente, explotacion):
+        excedidos = []
+        self.stdout.write(
+            f"{'modelo':<28} {'filas':>8} {'listado':>8} {'filtro':>7} "
+            f"{'búsqueda':>9} {'ficha':>6}"
+        )
+        for modelo, modelo_admin in admin.site._registry.items():
+            if not isinstance(modelo_admin, GestionAdmin):
+                continue
+            opciones = modelo._meta
+            listado = reverse(f"admin:gestion_{opciones.model_name}_changelist")
+            paginas = {"listado": listado, "filtro": None, "búsqueda": None}
+            filtros = [
+                f if isinstance(f, str) else f[0] for f in modelo_admin.list_filter
+            ]
+            if "explotacion" in filtros:
+                paginas["filtro"] = f"{listado}?explotacion__id__exact={explotacion.pk}"
+            if modelo_admin.search_fields:
+                paginas["búsqueda"] = f"{listado}?q=benchmark"
+            primero = modelo._default_manager.order_by("pk").first()
+            paginas["ficha"] = (
+                reverse(
+                    f"admin:gestion_{opciones.model_name}_change", args=[primero.pk]
+                )
+                if primero
+                else None
+            )
+
+            consultas = {}
+            for nombre, url in paginas.items():
+                if url is None:
+                    consultas[nombre] = "-"
+                    continue
+                with CaptureQueriesContext(connection) as capturadas:
+                    respuesta = cliente.get(url)
+                if respuesta.status_code != 200:
+                    raise CommandError(f"{url}: HTTP {respuesta.status_code}")
+                consultas[nombre] = len(capturadas)
+                if len(capturadas) > GestionAdmin.CONSULTAS_MAXIMAS:
+                    excedidos.append(f"{opciones.model_name} ({nombre})")
+            self.stdout.write(
+                f"{opciones.object_name:<28} {modelo._default_manager.count():>8} "
+                f"{consultas['listado']:>8} {consultas['filtro']:>7} "
+                f"{consultas['búsqueda']:>9} {consultas['ficha']:>6}"
+            )
+        return excedidos
+
+    async def _latencias_cuaderno(self, db, anio, iteraciones):
+        latencias = []
+        for _ in range(iteraciones):
+            t0 = time.perf_counter()
+            await generar_cuaderno_concurrente(anio, db, usar_snapshots=False)
+            latencias.append(time.perf_counter() - t0)
+        return latencias
@@ -0,0 +1,69 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.servicios.particiones import (
+    MODELOS_PARTICIONADOS,
+    crear_particion,
+    esta_particionada,
+    particiones,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea por adelantado las particiones anuales de las tablas particionadas "
+        "(DiarioActividad). Pensado para ejecutarse periódicamente (p. ej. cada mes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--anios",
+            type=int,
+            default=2,
+            help="Años futuros a cubrir además del actual (por defecto 2).",
+        )
+        parser.add_argument(
+            "--desde",
+            type=int,
+            help="Crear también las particiones de años pasados desde este año "
+            "(p. ej. antes de importar cuadernos antiguos).",
+        )
+
+    def handle(self, *args, **options):
+        anio_actual = date.today().year
+        desde = options["desde"] or anio_actual
+        if desde > anio_actual:
+            raise CommandError("--desde no puede ser posterior al año actual.")
+        anios = range(desde, anio_actual + options["anios"] + 1)
+
+        for modelo in MODELOS_PARTICIONADOS:
+            nombre = modelo._meta.db_table
+            if not esta_particionada(modelo):
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"{nombre} no está particionada (requiere PostgreSQL y la "
+                        "migración 0011)."
+                    )
+                )
+                continue
+
+            existentes = set(particiones(modelo))
+            for anio in anios:
+                if anio in existentes:
+                    continue
+                movidas = crear_particion(modelo, anio)
+                self.stdout.write(
+                    f"{nombre}_{anio} creada"
+                    + (
+                        f" ({movidas} filas movidas de la partición por defecto)"
+                        if movidas
+                        else ""
+                    )
+                )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{nombre}: particiones de {min(existentes | set(anios))} "
+                    f"a {max(existentes | set(anios))}."
+                )
+            )
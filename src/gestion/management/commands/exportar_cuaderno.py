@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.servicios.cuaderno import TAMANO_LOTE, ErrorCuaderno, escribir_cuaderno
+from gestion.servicios.hojas_calculo import escribir_cuaderno_xlsx
+
+
+class Command(BaseCommand):
+    help = (
+        "Escribe el Cuaderno de Explotación de un año en un fichero (o por pantalla) "
+        "a medida que se genera, sin cargarlo entero en memoria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("anio", type=int, help="Año de la campaña.")
+        parser.add_argument(
+            "--salida",
+            help="Fichero de destino (por defecto, la salida estándar; "
+            "obligatorio con --formato xlsx).",
+        )
+        parser.add_argument(
+            "--formato",
+            choices=["texto", "xlsx"],
+            default="texto",
+            help="Texto del cuaderno o libro XLSX con una hoja por sección "
+            "(por defecto, texto).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=TAMANO_LOTE,
+            help=f"Filas leídas de la BD en cada viaje (por defecto {TAMANO_LOTE}).",
+        )
+
+    def handle(self, *args, **options):
+        if options["formato"] == "xlsx" and not options["salida"]:
+            raise CommandError("Indica el fichero XLSX con --salida.")
+        try:
+            if options["formato"] == "xlsx":
+                escribir_cuaderno_xlsx(
+                    options["anio"], options["salida"], options["lote"]
+                )
+                self.stderr.write(
+                    self.style.SUCCESS(f"Cuaderno guardado en {options['salida']}.")
+                )
+            elif options["salida"]:
+                with open(options["salida"], "w", encoding="utf-8") as salida:
+                    escribir_cuaderno(options["anio"], salida, options["lote"])
+                self.stderr.write(
+                    self.style.SUCCESS(f"Cuaderno guardado en {options['salida']}.")
+                )
+            else:
+                # Los trozos se escriben tal cual: sin el salto de línea que
+                # OutputWrapper añade a cada write
+                self.stdout.ending = ""
+                escribir_cuaderno(options["anio"], self.stdout, options["lote"])
+        except ErrorCuaderno as e:
+            raise CommandError(str(e))
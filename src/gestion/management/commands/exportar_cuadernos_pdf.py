@@ -0,0 +1,124 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from gestion.models import Explotacion
+from gestion.servicios.cuaderno import TAMANO_LOTE
+from gestion.servicios.cuaderno_pdf import escribir_cuaderno_pdf, plantilla
+
+
+def _iniciar_proceso():
+    # Con "spawn" (macOS, Windows) el proceso hijo arranca sin Django configurado
+    django.setup()
+    plantilla()
+
+
+def _exportar(explotacion_id, anio, directorio, lote):
+    """Genera un cuaderno en PDF. Se ejecuta en un proceso del pool."""
+    explotacion = Explotacion.objects.select_related("titular", "direccion").get(
+        pk=explotacion_id
+    )
+    ruta = Path(directorio) / f"cuaderno_{explotacion_id}_{anio}.pdf"
+    with open(ruta, "wb") as salida:
+        hojas = escribir_cuaderno_pdf(explotacion, anio, salida, lote)
+    return ruta, hojas
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera en PDF, sobre el modelo oficial, los cuadernos de varias "
+        "explotaciones y años repartiéndolos entre varios procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--anio",
+            type=int,
+            nargs="+",
+            required=True,
+            help="Año o años de campaña.",
+        )
+        parser.add_argument(
+            "--explotacion",
+            type=int,
+            nargs="+",
+            help="IDs de las explotaciones (por defecto, todas).",
+        )
+        parser.add_argument(
+            "--salida",
+            default="cuadernos_pdf",
+            help="Directorio donde guardar cada cuaderno como "
+            "cuaderno_<explotación>_<año>.pdf.",
+        )
+        parser.add_argument(
+            "--procesos",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Procesos en paralelo (por defecto, uno por CPU).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=TAMANO_LOTE,
+            help=f"Filas leídas de la BD en cada viaje (por defecto {TAMANO_LOTE}).",
+        )
+
+    def handle(self, *args, **options):
+        explotaciones = Explotacion.objects.order_by("pk")
+        if options["explotacion"]:
+            explotaciones = explotaciones.filter(pk__in=options["explotacion"])
+        ids = list(explotaciones.values_list("pk", flat=True))
+        if not ids:
+            raise CommandError("No hay explotaciones que exportar.")
+
+        directorio = Path(options["salida"])
+        directorio.mkdir(parents=True, exist_ok=True)
+        tareas = [
+            (explotacion_id, anio, str(directorio), options["lote"])
+            for explotacion_id, anio in product(ids, options["anio"])
+        ]
+        procesos = max(min(options["procesos"], len(tareas)), 1)
+
+        inicio = time.perf_counter()
+        errores = []
+        if procesos == 1:
+            plantilla()
+            for tarea in tareas:
+                self._resultado(tarea, lambda t=tarea: _exportar(*t), errores)
+        else:
+            # Los procesos hijos abren sus propias conexiones: no heredar las del padre
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=procesos, initializer=_iniciar_proceso
+            ) as pool:
+                futuros = {pool.submit(_exportar, *tarea): tarea for tarea in tareas}
+                for futuro in as_completed(futuros):
+                    self._resultado(futuros[futuro], futuro.result, errores)
+        segundos = time.perf_counter() - inicio
+
+        hechos = len(tareas) - len(errores)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{hechos} cuadernos en {directorio} con {procesos} proceso(s) "
+                f"en {segundos:.1f} s."
+            )
+        )
+        if errores:
+            raise CommandError(f"{len(errores)} cuadernos no se pudieron generar.")
+
+    def _resultado(self, tarea, obtener, errores):
+        """Informa del resultado de ``tarea`` (``obtener()`` lo devuelve o lanza el error)."""
+        explotacion_id, anio = tarea[:2]
+        try:
+            ruta, hojas = obtener()
+        except Exception as e:
+            errores.append(tarea)
+            self.stderr.write(f"Explotación {explotacion_id}, {anio}: {e}")
+        else:
+            self.stdout.write(f"{ruta} ({hojas} hojas)")
@@ -0,0 +1,59 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from gestion.servicios.cuaderno import TAMANO_LOTE
+from gestion.servicios.historico import buscar_actividades
+from gestion.servicios.hojas_calculo import escribir_historico_xlsx
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta a XLSX las actividades del diario (de uno o varios años, con los "
+        "mismos filtros que consultar_historico) sin cargarlas en memoria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("salida", help="Fichero XLSX de destino.")
+        parser.add_argument("--desde", type=int, help="Primer año (incluido).")
+        parser.add_argument("--hasta", type=int, help="Último año (incluido).")
+        parser.add_argument("--producto", help="El producto contiene este texto.")
+        parser.add_argument("--tipo", help="El tipo de actividad contiene este texto.")
+        parser.add_argument("--parcela", help="Referencia SIGPAC, cultivo o alias.")
+        parser.add_argument("--plaga", help="La plaga contiene este texto.")
+        parser.add_argument(
+            "--texto", help="Palabras en el producto, la plaga o las observaciones."
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=TAMANO_LOTE,
+            help=f"Filas leídas de la BD en cada viaje (por defecto {TAMANO_LOTE}).",
+        )
+
+    def handle(self, *args, **options):
+        actividades, filtros = buscar_actividades(
+            texto=options["texto"],
+            producto=options["producto"],
+            tipo_actividad=options["tipo"],
+            parcela_ref=options["parcela"],
+            plaga=options["plaga"],
+            por_relevancia=False,
+        )
+        if options["desde"]:
+            actividades = actividades.filter(fecha__gte=date(options["desde"], 1, 1))
+            filtros.append(f"Desde {options['desde']}")
+        if options["hasta"]:
+            actividades = actividades.filter(fecha__lte=date(options["hasta"], 12, 31))
+            filtros.append(f"Hasta {options['hasta']}")
+
+        filas = escribir_historico_xlsx(
+            actividades.order_by("fecha", "pk"), options["salida"], options["lote"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{filas} actividades guardadas en {options['salida']}"
+                + (f" ({', '.join(filtros)})" if filtros else "")
+                + "."
+            )
+        )
@@ -0,0 +1,85 @@
+import json
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.servicios.dat import ErrorDAT, emitir_datos_dats, renderizar_dat
+from gestion.servicios.dat_pdf import escribir_dats_pdf, escribir_dats_zip
+
+
+class Command(BaseCommand):
+    help = (
+        "Emite de una vez los DAT de todas las cargas del día a partir de un JSON "
+        "con una lista de DAT (mismos campos que la herramienta generar_dat)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "fichero",
+            help="Fichero JSON con la lista de DAT ('-' para leer de la entrada estándar).",
+        )
+        parser.add_argument(
+            "--salida",
+            help="Directorio donde guardar cada DAT como <número>.txt "
+            "(por defecto se imprimen por pantalla).",
+        )
+        parser.add_argument(
+            "--pdf",
+            help="Fichero PDF donde guardar todos los DAT en el formulario oficial.",
+        )
+        parser.add_argument(
+            "--zip",
+            help="Fichero ZIP donde guardar cada DAT en el formulario oficial "
+            "como <número>.pdf.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options["fichero"] == "-":
+                dats = json.load(sys.stdin)
+            else:
+                with open(options["fichero"], encoding="utf-8") as f:
+                    dats = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise CommandError(f"No se pudo leer la lista de DAT: {e}")
+
+        if isinstance(dats, dict):
+            dats = dats.get("dats", [])
+        if not isinstance(dats, list) or not dats:
+            raise CommandError("El JSON debe ser una lista de DAT no vacía.")
+
+        try:
+            emitidos = emitir_datos_dats(dats)
+        except ErrorDAT as e:
+            raise CommandError(str(e))
+        reportes = [renderizar_dat(datos) for datos in emitidos]
+
+        salida = Path(options["salida"]) if options["salida"] else None
+        if salida:
+            salida.mkdir(parents=True, exist_ok=True)
+
+        for datos, reporte in zip(emitidos, reportes):
+            if salida:
+                (salida / f"{datos['numero']}.txt").write_text(
+                    reporte, encoding="utf-8"
+                )
+            else:
+                self.stdout.write(reporte)
+
+        if options["pdf"]:
+            with open(options["pdf"], "wb") as pdf:
+                paginas = escribir_dats_pdf(emitidos, pdf)
+            self.stdout.write(f"PDF: {options['pdf']} ({paginas} páginas)")
+        if options["zip"]:
+            with open(options["zip"], "wb") as archivo:
+                escribir_dats_zip(emitidos, archivo)
+            self.stdout.write(f"ZIP: {options['zip']}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(reportes)} DAT emitidos"
+                + (f" en {salida}" if salida else "")
+                + "."
+            )
+        )
@@ -0,0 +1,139 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from gestion.models import Explotacion
+from gestion.servicios import maestros
+from gestion.servicios.cuadernos_antiguos import cargar_cuaderno, leer_cuaderno
+from gestion.servicios.sigpac import ErrorImportacion
+
+EXTENSIONES = (".doc", ".docx", ".txt")
+
+
+def _iniciar_proceso():
+    # Con "spawn" (macOS, Windows) el proceso hijo arranca sin Django configurado
+    django.setup()
+
+
+def _leer(ruta):
+    """Lee un cuaderno (sin tocar la BD). Se ejecuta en un proceso del pool."""
+    ruta = Path(ruta)
+    return leer_cuaderno(ruta.read_bytes(), ruta.name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa cuadernos de campo antiguos en Word (.doc, .docx o exportados a "
+        "texto): los lee repartiéndolos entre varios procesos y guarda cada uno "
+        "en bloque y en una sola transacción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ficheros",
+            nargs="+",
+            help="Cuadernos o directorios con cuadernos (.doc, .docx, .txt).",
+        )
+        parser.add_argument(
+            "--explotacion",
+            type=int,
+            help="ID de la explotación (por defecto, la del NIF del cuaderno o, "
+            "si no hay ninguna con ese NIF, la principal).",
+        )
+        parser.add_argument(
+            "--procesos",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Procesos en paralelo para leer (por defecto, uno por CPU).",
+        )
+
+    def handle(self, *args, **options):
+        rutas = []
+        for nombre in options["ficheros"]:
+            ruta = Path(nombre)
+            if ruta.is_dir():
+                rutas += sorted(
+                    p for p in ruta.iterdir() if p.suffix.lower() in EXTENSIONES
+                )
+            elif ruta.is_file():
+                rutas.append(ruta)
+            else:
+                raise CommandError(f"No existe el fichero {ruta}.")
+        if not rutas:
+            raise CommandError("No hay cuadernos que importar.")
+
+        self.explotacion = None
+        if options["explotacion"]:
+            self.explotacion = Explotacion.objects.filter(
+                pk=options["explotacion"]
+            ).first()
+            if not self.explotacion:
+                raise CommandError("No hay una explotación configurada con ese ID.")
+        procesos = max(min(options["procesos"], len(rutas)), 1)
+
+        inicio = time.perf_counter()
+        errores = []
+        if procesos == 1:
+            for ruta in rutas:
+                self._cargar(ruta, lambda r=ruta: _leer(r), errores)
+        else:
+            # Los procesos hijos solo leen ficheros; la carga se hace aquí, según
+            # van terminando, con la conexión del proceso principal
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=procesos, initializer=_iniciar_proceso
+            ) as pool:
+                futuros = {pool.submit(_leer, str(ruta)): ruta for ruta in rutas}
+                for futuro in as_completed(futuros):
+                    self._cargar(futuros[futuro], futuro.result, errores)
+        segundos = time.perf_counter() - inicio
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(rutas) - len(errores)} cuadernos importados con {procesos} "
+                f"proceso(s) en {segundos:.1f} s."
+            )
+        )
+        if errores:
+            raise CommandError(f"{len(errores)} cuadernos no se pudieron importar.")
+
+    def _explotacion(self, cuaderno):
+        if self.explotacion:
+            return self.explotacion
+        if cuaderno["nif"]:
+            explotacion = Explotacion.objects.filter(nif__iexact=cuaderno["nif"])
+            explotacion = (
+                explotacion.first()
+                or Explotacion.objects.filter(
+                    titular__documento__iexact=cuaderno["nif"]
+                ).first()
+            )
+            if explotacion:
+                return explotacion
+        return maestros.explotacion_principal()
+
+    def _cargar(self, ruta, obtener, errores):
+        """Guarda el cuaderno de ``ruta`` (``obtener()`` lo devuelve leído o lanza el error)."""
+        try:
+            cuaderno = obtener()
+            explotacion = self._explotacion(cuaderno)
+            if not explotacion:
+                raise ErrorImportacion("No hay una explotación configurada.")
+            resumen = cargar_cuaderno(explotacion, cuaderno)
+        except Exception as e:
+            errores.append(ruta)
+            self.stderr.write(f"{ruta}: {e}")
+            return
+        for aviso in cuaderno["avisos"]:
+            self.stderr.write(f"{ruta}: {aviso}")
+        self.stdout.write(
+            f"{ruta} -> {explotacion.nombre}: {resumen['parcelas']} parcelas, "
+            f"{resumen['actividades']} actividades, {resumen['semillas']} siembras, "
+            f"{resumen['analisis']} análisis y {resumen['ventas']} ventas "
+            f"({resumen['omitidos']} ya existían)."
+        )
@@ -0,0 +1,145 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from gestion.models import Explotacion
+from gestion.servicios.dat_importacion import cargar_dats, leer_dat_pdf
+
+
+def _iniciar_proceso():
+    # Con "spawn" (macOS, Windows) el proceso hijo arranca sin Django configurado
+    django.setup()
+
+
+def _leer(ruta):
+    """Lee los DAT de un PDF (sin tocar la BD). Se ejecuta en un proceso del pool."""
+    ruta = Path(ruta)
+    return leer_dat_pdf(ruta.read_bytes(), ruta.name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa DAT ya emitidos en PDF (formulario oficial rellenable o aplanado): "
+        "los lee repartiéndolos entre varios procesos y los guarda en lotes, cada "
+        "uno en bloque y en una sola transacción. Los DAT cuyo número ya existe "
+        "se omiten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ficheros", nargs="+", help="PDF de DAT o directorios con PDF de DAT."
+        )
+        parser.add_argument(
+            "--explotacion",
+            type=int,
+            help="ID de la explotación (por defecto, la del NIF del titular o, "
+            "si no hay ninguna con ese NIF, la principal).",
+        )
+        parser.add_argument(
+            "--procesos",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Procesos en paralelo para leer (por defecto, uno por CPU).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=200,
+            help="DAT que se guardan por transacción (por defecto, 200).",
+        )
+
+    def handle(self, *args, **options):
+        rutas = []
+        for nombre in options["ficheros"]:
+            ruta = Path(nombre)
+            if ruta.is_dir():
+                rutas += sorted(p for p in ruta.iterdir() if p.suffix.lower() == ".pdf")
+            elif ruta.is_file():
+                rutas.append(ruta)
+            else:
+                raise CommandError(f"No existe el fichero {ruta}.")
+        if not rutas:
+            raise CommandError("No hay DAT que importar.")
+
+        self.explotacion = None
+        if options["explotacion"]:
+            self.explotacion = Explotacion.objects.filter(
+                pk=options["explotacion"]
+            ).first()
+            if not self.explotacion:
+                raise CommandError("No hay una explotación configurada con ese ID.")
+        self.tamano_lote = max(options["lote"], 1)
+        procesos = max(min(options["procesos"], len(rutas)), 1)
+
+        inicio = time.perf_counter()
+        self.pendientes, self.errores = [], []
+        self.resumen = dict.fromkeys(
+            ("dats", "omitidos", "destinatarios", "vehiculos", "transportistas"), 0
+        )
+        if procesos == 1:
+            for ruta in rutas:
+                self._leido(ruta, lambda r=ruta: _leer(r))
+        else:
+            # Los procesos hijos solo leen ficheros; los lotes se guardan aquí, según
+            # se completan, con la conexión del proceso principal
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=procesos, initializer=_iniciar_proceso
+            ) as pool:
+                futuros = {pool.submit(_leer, str(ruta)): ruta for ruta in rutas}
+                for futuro in as_completed(futuros):
+                    self._leido(futuros[futuro], futuro.result)
+        self._guardar()
+        segundos = time.perf_counter() - inicio
+
+        resumen = self.resumen
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{resumen['dats']} DAT importados ({resumen['omitidos']} ya "
+                f"existían), {resumen['destinatarios']} destinatarios, "
+                f"{resumen['vehiculos']} vehículos y {resumen['transportistas']} "
+                f"transportistas nuevos; {len(rutas)} ficheros leídos con {procesos} "
+                f"proceso(s) en {segundos:.1f} s."
+            )
+        )
+        if self.errores:
+            raise CommandError(f"{len(self.errores)} ficheros no se pudieron importar.")
+
+    def _leido(self, ruta, obtener):
+        """Añade al lote los DAT de ``ruta`` (``obtener()`` los devuelve o lanza el error)."""
+        try:
+            dats = obtener()
+        except Exception as e:
+            self.errores.append(ruta)
+            self.stderr.write(f"{ruta}: {e}")
+            return
+        for dat in dats:
+            for aviso in dat["avisos"]:
+                self.stderr.write(f"{ruta} ({dat['numero']}): {aviso}")
+        self.pendientes += [(ruta, dat) for dat in dats]
+        if len(self.pendientes) >= self.tamano_lote:
+            self._guardar()
+
+    def _guardar(self):
+        """Guarda los DAT pendientes en una transacción."""
+        lote, self.pendientes = self.pendientes, []
+        if not lote:
+            return
+        try:
+            resumen = cargar_dats([dat for _, dat in lote], self.explotacion)
+        except Exception as e:
+            rutas = sorted({str(ruta) for ruta, _ in lote})
+            self.errores += rutas
+            self.stderr.write(f"Lote de {len(lote)} DAT ({', '.join(rutas)}): {e}")
+            return
+        for clave, valor in resumen.items():
+            self.resumen[clave] += valor
+        self.stdout.write(
+            f"Lote de {len(lote)} DAT: {resumen['dats']} importados, "
+            f"{resumen['omitidos']} ya existían."
+        )
@@ -0,0 +1,51 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.models import Explotacion
+from gestion.servicios import maestros
+from gestion.servicios.sigpac import ErrorImportacion, importar_recintos
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa los recintos de un export SIGPAC o de la declaración de la PAC "
+        "(CSV o GeoJSON) como parcelas de una explotación: crea las nuevas y "
+        "actualiza las existentes (por polígono/parcela/recinto) en bloque."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fichero", help="Fichero CSV o GeoJSON de recintos.")
+        parser.add_argument(
+            "--explotacion",
+            type=int,
+            help="ID de la explotación (por defecto, la principal).",
+        )
+
+    def handle(self, *args, **options):
+        if options["explotacion"]:
+            explotacion = Explotacion.objects.filter(pk=options["explotacion"]).first()
+        else:
+            explotacion = maestros.explotacion_principal()
+        if not explotacion:
+            raise CommandError("No hay una explotación configurada con ese ID.")
+
+        ruta = Path(options["fichero"])
+        if not ruta.is_file():
+            raise CommandError(f"No existe el fichero {ruta}.")
+
+        inicio = time.perf_counter()
+        try:
+            creadas, actualizadas = importar_recintos(
+                explotacion, ruta.read_bytes(), ruta.name
+            )
+        except ErrorImportacion as e:
+            raise CommandError(str(e))
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{explotacion.nombre}: {creadas} parcelas creadas y {actualizadas} "
+                f"actualizadas en {segundos:.2f} s."
+            )
+        )
@@ -1,11 +1,13 @@
 import logging
-from datetime import date, datetime
+import os
+from datetime import date, timedelta
 
-from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.db import transaction
 from fastmcp import FastMCP
 
+from gestion.ejecutor import EjecutorBD
+
 # Importación de TODOS los modelos necesarios del sistema
 from gestion.models import (
     AnalisisLaboratorio,
@@ -13,19 +15,36 @@ from gestion.models import (
     Destinatario,
     DiarioActividad,
     Direccion,
-    DocumentoDAT,
     EquipoAplicacion,
     Explotacion,
     Parcela,
     Persona,
     Personal,
     RegistroMovimientoProducto,
-    RegistroTransporte,
     SemillaTratada,
     Titular,
     Transportista,
     Vehiculo,
 )
+from gestion.servicios import maestros, snapshots
+from gestion.servicios.cuaderno import ErrorCuaderno, generar_cuaderno_concurrente
+from gestion.servicios.dat import (
+    ErrorDAT,
+    emitir_datos_dats,
+    emitir_dats,
+    renderizar_dat,
+    volumen_por_destinatario_mes,
+)
+from gestion.servicios.historico import (
+    AGRUPACIONES,
+    agregar_actividades,
+    buscar_actividades,
+    paginar,
+    usa_postgres,
+)
+from gestion.servicios.parcelas import indice as indice_parcelas
+from gestion.servicios.parcelas import resolver_parcela, resolver_parcelas
+from gestion.servicios.sigpac import desglosar_referencia, normalizar_numero
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -35,7 +54,37 @@ logger = logging.getLogger("mcp-django")
 class Command(BaseCommand):
     help = "Inicia el servidor FastMCP con contexto de Django para Agricultura"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--db-workers",
+            type=int,
+            default=int(os.environ.get("MCP_DB_WORKERS", "0")),
+            help=(
+                "Nº de hilos para el trabajo de BD de las herramientas. "
+                "0 = hilo único compartido (thread_sensitive, por defecto)."
+            ),
+        )
+
     def handle(self, *args, **kwargs):
+        # Ejecutor de BD compartido por todas las herramientas
+        db = EjecutorBD(workers=kwargs["db_workers"])
+        logger.info("Trabajo de BD de las herramientas: %r", db)
+
+        mcp = self.construir_mcp(db)
+
+        self.stdout.write(
+            self.style.SUCCESS("Iniciando servidor MCP Agrícola en puerto 8001...")
+        )
+        try:
+            mcp.run(transport="http", host="0.0.0.0", port=8001, path="/mcp")
+        finally:
+            db.cerrar()
+
+    def construir_mcp(self, db):
+        """
+        Crea el servidor FastMCP con todas las herramientas registradas.
+        ``db`` es el EjecutorBD con el que las herramientas ejecutan su trabajo ORM.
+        """
         mcp = FastMCP(
             "Agente Agricola Django",
             instructions="Servidor MCP para gestión integral de datos agrícolas (Maestros, Cuaderno y DAT).",
@@ -67,15 +116,17 @@ class Command(BaseCommand):
             Crea un registro en el modelo Titular y su Dirección asociada.
             Comando asociado: /nuevo_titular
             """
-            try:
+
+            @transaction.atomic
+            def _operacion_db():
                 # 1. Verificar existencia
-                if await sync_to_async(Titular.objects.filter(documento=nif).exists)():
+                if Titular.objects.filter(documento=nif).exists():
                     return f"Error: Ya existe un titular con el documento {nif}."
 
                 # 2. Crear Dirección (si se proporcionan datos básicos)
                 direccion_obj = None
                 if direccion_via or municipio or provincia:
-                    direccion_obj = await sync_to_async(Direccion.objects.create)(
+                    direccion_obj = Direccion.objects.create(
                         nombre_via=direccion_via,
                         numero=direccion_numero,
                         localidad=municipio,
@@ -87,7 +138,7 @@ class Command(BaseCommand):
                     )
 
                 # 3. Crear Titular
-                obj = await sync_to_async(Titular.objects.create)(
+                obj = Titular.objects.create(
                     nombre=nombre,
                     apellidos=apellidos,
                     documento=nif,
@@ -104,6 +155,8 @@ class Command(BaseCommand):
                 )
                 return f"Titular creado: {obj.nombre} {obj.apellidos or ''} (REGA: {obj.registro_explotacion}){info_dir}."
 
+            try:
+                return await db(_operacion_db, "crear_titular")()
             except Exception as e:
                 return f"Error creando titular: {str(e)}"
 
@@ -127,11 +180,13 @@ class Command(BaseCommand):
             Configura la Explotación Agrícola principal, su titular y dirección.
             Comando asociado: /config_explotacion
             """
-            try:
+
+            @transaction.atomic
+            def _operacion_db():
                 # 1. Crear Dirección de la Explotación (si hay datos)
                 direccion_obj = None
                 if direccion_via or municipio or provincia:
-                    direccion_obj = await sync_to_async(Direccion.objects.create)(
+                    direccion_obj = Direccion.objects.create(
                         nombre_via=direccion_via,
                         numero=direccion_numero,
                         localidad=municipio,
@@ -144,7 +199,7 @@ class Command(BaseCommand):
                     nombre_titular if nombre_titular else f"Titular {nif_titular}"
                 )
 
-                titular, created = await sync_to_async(Titular.objects.get_or_create)(
+                titular, created = Titular.objects.get_or_create(
                     documento=nif_titular,
                     defaults={
                         "nombre": nombre_t,
@@ -165,12 +220,10 @@ class Command(BaseCommand):
                         titular.apellidos = apellidos_titular
                         update_t = True
                     if update_t:
-                        await sync_to_async(titular.save)()
+                        titular.save()
 
                 # 3. Crear o actualizar la Explotación
-                explotacion, created_exp = await sync_to_async(
-                    Explotacion.objects.update_or_create
-                )(
+                Explotacion.objects.update_or_create(
                     nif=nif_titular,
                     defaults={
                         "nombre": nombre_comercial,
@@ -184,6 +237,9 @@ class Command(BaseCommand):
 
                 info_dir = f" en {municipio}" if direccion_obj else ""
                 return f"Explotación '{nombre_comercial}' configurada{info_dir}. Titular: {titular.nombre}."
+
+            try:
+                return await db(_operacion_db, "configurar_explotacion_principal")()
             except Exception as e:
                 return f"Error en configuración inicial: {str(e)}"
 
@@ -205,29 +261,104 @@ class Command(BaseCommand):
             Da de alta una nueva parcela.
             Comando asociado: /nueva_parcela
             """
-            try:
-                explotacion = await sync_to_async(Explotacion.objects.first)()
+
+            @transaction.atomic
+            def _operacion_db():
+                explotacion = maestros.explotacion_principal()
                 if not explotacion:
                     return "Error: No hay una explotación configurada. Usa /config_explotacion primero."
 
-                await sync_to_async(Parcela.objects.create)(
+                # Polígono/parcela/recinto identifican el recinto en la explotación
+                partes = [normalizar_numero(v) for v in (poligono, parcela, recinto)]
+                if not all(partes):
+                    desglose = desglosar_referencia(referencia_sigpac)
+                    if desglose:
+                        partes = list(desglose[4:])
+                if (
+                    all(partes)
+                    and Parcela.objects.filter(
+                        explotacion=explotacion,
+                        poligono=partes[0],
+                        parcela=partes[1],
+                        recinto=partes[2],
+                    ).exists()
+                ):
+                    return (
+                        f"Error: Ya existe la parcela del recinto {'/'.join(partes)} "
+                        "(polígono/parcela/recinto)."
+                    )
+
+                Parcela.objects.create(
                     explotacion=explotacion,
                     referencia_sigpac=referencia_sigpac,
-                    poligono=poligono,
-                    parcela=parcela,
-                    recinto=recinto,
+                    poligono=partes[0],
+                    parcela=partes[1],
+                    recinto=partes[2],
                     uso_sigpac=uso_sigpac,
                     especie=cultivo,
                     variedad=variedad,
                     secano_regadio=secano_regadio,
                     aire_protegido=aire_protegido,
+                    alias=nombre_comun,
                     superficie_cultivada=superficie_ha,
                     superficie_sigpac=superficie_ha,
                 )
                 return f"Parcela creada: {cultivo} {variedad} en {referencia_sigpac} ({superficie_ha} ha) - Alias: {nombre_comun}"
+
+            try:
+                return await db(_operacion_db, "crear_parcela")()
             except Exception as e:
                 return f"Error creando parcela: {str(e)}"
 
+        @mcp.tool()
+        async def anadir_alias_parcela(referencia_sigpac: str, alias: str) -> str:
+            """
+            Añade un nombre coloquial a una parcela (p. ej. "la de abajo") para poder
+            referirse a ella así en tratamientos, riegos y siembras.
+            """
+
+            @transaction.atomic
+            def _operacion_db():
+                parcela = resolver_parcela(referencia_sigpac)
+                if not parcela:
+                    return f"Error: Parcela '{referencia_sigpac}' no encontrada."
+                parcela = Parcela.objects.select_for_update().get(pk=parcela.pk)
+                existentes = [a.strip() for a in parcela.alias.split(",") if a.strip()]
+                if alias.strip().lower() not in [a.lower() for a in existentes]:
+                    existentes.append(alias.strip())
+                parcela.alias = ", ".join(existentes)
+                parcela.save(update_fields=["alias"])
+                return f"Parcela {parcela.referencia_sigpac} ({parcela.especie}). Alias: {parcela.alias}"
+
+            try:
+                return await db(_operacion_db, "anadir_alias_parcela")()
+            except Exception as e:
+                return f"Error añadiendo alias: {str(e)}"
+
+        @mcp.tool()
+        async def buscar_parcela(texto: str) -> str:
+            """
+            Muestra las parcelas que encajan con un texto (referencia SIGPAC, cultivo,
+            variedad o alias), de más a menos probable. Útil para desambiguar antes de
+            registrar una actividad.
+            """
+            try:
+                candidatas = await db(indice_parcelas.candidatas, "buscar_parcela")(
+                    texto
+                )
+            except Exception as e:
+                return f"Error buscando parcela: {str(e)}"
+            if not candidatas:
+                return f"No hay parcelas que encajen con '{texto}'."
+            resumen = f"Parcelas para '{texto}':\n"
+            for parcela, puntos in candidatas:
+                resumen += (
+                    f"- {parcela.referencia_sigpac} | {parcela.especie} {parcela.variedad} | "
+                    f"Alias: {parcela.alias or '-'} | {parcela.superficie_cultivada} ha "
+                    f"(coincidencia {puntos})\n"
+                )
+            return resumen
+
         @mcp.tool()
         async def crear_cliente_destinatario(
             nombre_fiscal: str,
@@ -244,22 +375,22 @@ class Command(BaseCommand):
             Crea un cliente/destinatario y le asigna un vehículo preferido para automatizar DATs.
             Comando asociado: /nuevo_cliente
             """
-            try:
+
+            @transaction.atomic
+            def _operacion_db():
                 # 1. Gestionar Vehículo
                 vehiculo = None
                 if matricula_vehiculo_preferido:
-                    vehiculo = await sync_to_async(
-                        Vehiculo.objects.filter(
-                            matricula=matricula_vehiculo_preferido
-                        ).first
-                    )()
+                    vehiculo = Vehiculo.objects.filter(
+                        matricula=matricula_vehiculo_preferido
+                    ).first()
                     if not vehiculo:
                         return f"Error: El vehículo {matricula_vehiculo_preferido} no existe. Regístralo con /nuevo_vehiculo."
 
                 # 2. Crear Dirección (si aplica)
                 direccion_obj = None
                 if direccion_via or municipio or provincia:
-                    direccion_obj = await sync_to_async(Direccion.objects.create)(
+                    direccion_obj = Direccion.objects.create(
                         nombre_via=direccion_via,
                         numero=direccion_numero,
                         localidad=municipio,
@@ -268,9 +399,7 @@ class Command(BaseCommand):
                     )
 
                 # 3. Crear Destinatario (Modelo específico)
-                destinatario, created = await sync_to_async(
-                    Destinatario.objects.get_or_create
-                )(
+                destinatario, created = Destinatario.objects.get_or_create(
                     documento=nif,
                     defaults={
                         "nombre": nombre_fiscal,
@@ -290,10 +419,10 @@ class Command(BaseCommand):
                         destinatario.direccion = direccion_obj
                         update_needed = True
                     if update_needed:
-                        await sync_to_async(destinatario.save)()
+                        destinatario.save()
 
                 # 4. Sincronizar con Persona (para que RegistroTransporte funcione con FK a Persona)
-                await sync_to_async(Persona.objects.get_or_create)(
+                Persona.objects.get_or_create(
                     nif=nif,
                     defaults={"nombre": nombre_fiscal, "direccion": direccion_obj},
                 )
@@ -304,6 +433,9 @@ class Command(BaseCommand):
                     else "Sin vehículo asignado"
                 )
                 return f"Cliente '{nombre_fiscal}' configurado. {info_vehiculo}"
+
+            try:
+                return await db(_operacion_db, "crear_cliente_destinatario")()
             except Exception as e:
                 return f"Error creando cliente: {str(e)}"
 
@@ -316,7 +448,7 @@ class Command(BaseCommand):
             Comando asociado: /nuevo_vehiculo
             """
             try:
-                obj = await sync_to_async(Vehiculo.objects.create)(
+                obj = await db(Vehiculo.objects.create, "crear_vehiculo")(
                     matricula=matricula,
                     tipo=tipo.upper(),  # TRACTOR, COCHE, REMOLQUE, FURGONETA
                     marca=marca,
@@ -337,12 +469,14 @@ class Command(BaseCommand):
             Registra maquinaria de aplicación (ROMA) con sus fechas.
             Comando asociado: /nueva_maquina
             """
-            try:
-                explotacion = await sync_to_async(Explotacion.objects.first)()
+
+            @transaction.atomic
+            def _operacion_db():
+                explotacion = maestros.explotacion_principal()
                 if not explotacion:
                     return "Error: No hay una explotación configurada."
 
-                obj = await sync_to_async(EquipoAplicacion.objects.create)(
+                obj = EquipoAplicacion.objects.create(
                     descripcion=descripcion,
                     numero_inscripcion_roma=numero_inscripcion_roma,
                     fecha_adquisicion=fecha_adquisicion,
@@ -350,6 +484,9 @@ class Command(BaseCommand):
                     explotacion=explotacion,
                 )
                 return f"Máquina registrada: {obj.descripcion} (ROMA: {obj.numero_inscripcion_roma})"
+
+            try:
+                return await db(_operacion_db, "crear_maquina_roma")()
             except Exception as e:
                 return f"Error registrando máquina: {str(e)}"
 
@@ -369,10 +506,12 @@ class Command(BaseCommand):
             Registra personal/aplicador con todos sus detalles.
             Comando asociado: /nuevo_personal
             """
-            try:
+
+            @transaction.atomic
+            def _operacion_db():
                 # 1. Crear Persona (Base para FKs en DiarioActividad)
                 # Usamos 'nif' en Persona para mapear con 'documento' de Personal
-                persona, _ = await sync_to_async(Persona.objects.get_or_create)(
+                Persona.objects.get_or_create(
                     nif=documento,
                     defaults={
                         "nombre": f"{nombre} {apellidos}".strip(),
@@ -390,7 +529,7 @@ class Command(BaseCommand):
                     else ("Aplicador" if habilitado_fitosanitarios else "Trabajador")
                 )
 
-                await sync_to_async(Personal.objects.create)(
+                Personal.objects.create(
                     nombre=nombre,
                     apellidos=apellidos,
                     documento=documento,
@@ -403,6 +542,9 @@ class Command(BaseCommand):
                 )
 
                 return f"Personal registrado: {nombre} {apellidos} (Doc: {documento}). Cargo: {cargo_final}"
+
+            try:
+                return await db(_operacion_db, "crear_personal_aplicador")()
             except Exception as e:
                 return f"Error registrando personal: {str(e)}"
 
@@ -414,17 +556,22 @@ class Command(BaseCommand):
             Registra un Asesor Técnico (GIP).
             Comando asociado: /nuevo_asesor
             """
-            try:
-                persona, _ = await sync_to_async(Persona.objects.get_or_create)(
+
+            @transaction.atomic
+            def _operacion_db():
+                persona, _ = Persona.objects.get_or_create(
                     nif=nif, defaults={"nombre": nombre}
                 )
 
-                await sync_to_async(Asesor.objects.create)(
+                Asesor.objects.create(
                     persona=persona,
                     numero_inscripcion_ropo=codigo_ropo,
                     tipo_carnet=tipo_asesoramiento,
                 )
                 return f"Asesor registrado: {nombre} (ROPO: {codigo_ropo})"
+
+            try:
+                return await db(_operacion_db, "crear_asesor_tecnico")()
             except Exception as e:
                 return f"Error creando asesor: {str(e)}"
 
@@ -437,7 +584,7 @@ class Command(BaseCommand):
             Comando asociado: /nuevo_transportista
             """
             try:
-                await sync_to_async(Transportista.objects.create)(
+                await db(Transportista.objects.create, "crear_transportista_externo")(
                     nombre=nombre, nif=nif, telefono=telefono, email=email
                 )
                 return f"Transportista registrado: {nombre} (Tel: {telefono})"
@@ -465,39 +612,27 @@ class Command(BaseCommand):
             Comando asociado: /tratamiento
             """
 
+            @transaction.atomic
             def _operacion_db():
                 # 1. Buscar Parcela
-                parcela = (
-                    Parcela.objects.filter(
-                        Q(referencia_sigpac__icontains=referencia_sigpac)
-                        | Q(especie__icontains=referencia_sigpac)
-                    )
-                    .select_related("explotacion")
-                    .first()
-                )
+                parcela = resolver_parcela(referencia_sigpac)
 
                 if not parcela:
                     return f"Error: Parcela '{referencia_sigpac}' no encontrada."
 
                 # 2. Buscar Aplicador (Lógica corregida: Personal -> Persona)
                 # Buscamos primero en Personal a alguien con carné
-                aplicador_persona = Personal.objects.filter(
-                    habilitado_fitosanitarios=True
-                ).first()
+                aplicador_persona = maestros.aplicador_habilitado()
 
                 if not aplicador_persona:
                     return "Error: No hay personas registradas para asignar como aplicador."
 
                 # 3. Buscar Equipo (Opcional)
-                equipo = None
-                if nombre_equipo:
-                    equipo = EquipoAplicacion.objects.filter(
-                        descripcion__icontains=nombre_equipo
-                    ).first()
+                equipo = maestros.equipo_por_nombre(nombre_equipo)
 
                 # 4. Crear Registro
                 actividad = DiarioActividad.objects.create(
-                    explotacion=parcela.explotacion,
+                    explotacion_id=parcela.explotacion_id,
                     fecha=fecha,
                     tipo="TRATAMIENTO",
                     parcela=parcela,
@@ -514,8 +649,7 @@ class Command(BaseCommand):
                 return f"Tratamiento registrado ID: {actividad.id}. {producto} contra {plaga} en {parcela.referencia_sigpac}."
 
             try:
-                resultado = await sync_to_async(_operacion_db)()
-                return resultado
+                return await db(_operacion_db, "registrar_tratamiento")()
             except Exception as e:
                 return f"Error al registrar tratamiento: {str(e)}"
 
@@ -536,16 +670,10 @@ class Command(BaseCommand):
             Comando asociado: /riego
             """
 
+            @transaction.atomic
             def _operacion_db():
                 # 1. Buscar Parcela
-                parcela = (
-                    Parcela.objects.filter(
-                        Q(referencia_sigpac__icontains=referencia_sigpac)
-                        | Q(especie__icontains=referencia_sigpac)
-                    )
-                    .select_related("explotacion")
-                    .first()
-                )
+                parcela = resolver_parcela(referencia_sigpac)
 
                 if not parcela:
                     return f"Error: Parcela '{referencia_sigpac}' no encontrada."
@@ -556,7 +684,7 @@ class Command(BaseCommand):
 
                 # 2. Crear Registro
                 actividad = DiarioActividad.objects.create(
-                    explotacion=parcela.explotacion,
+                    explotacion_id=parcela.explotacion_id,
                     fecha=fecha,
                     tipo=tipo_db,
                     parcela=parcela,
@@ -571,11 +699,156 @@ class Command(BaseCommand):
                 return f"Actividad de {tipo_db} registrada ID: {actividad.id}."
 
             try:
-                resultado = await sync_to_async(_operacion_db)()
-                return resultado
+                return await db(_operacion_db, "registrar_riego")()
             except Exception as e:
                 return f"Error al registrar riego: {str(e)}"
 
+        @mcp.tool()
+        async def registrar_actividades_lote(
+            tipo_actividad: str,  # "Tratamiento", "Riego" o "Abonado"
+            referencias_sigpac: list[str] = None,
+            fecha: str = "",
+            producto: str = "",
+            dosis: float = 0.0,
+            dosis_text: str = "",
+            plaga: str = "",
+            eficacia: str = "",
+            nombre_equipo: str = "",
+            hora_inicio: str = None,
+            hora_fin: str = None,
+            observaciones: str = "",
+            actividades: list[dict] = None,
+        ) -> str:
+            """
+            Registra el mismo tratamiento, riego o abonado en varias parcelas a la vez.
+            - referencias_sigpac: lista de parcelas que comparten todos los datos.
+            - actividades: filas individuales con 'referencia_sigpac' y, opcionalmente,
+              cualquier otro campo de esta herramienta para sobrescribir el común
+              (p. ej. dosis o fecha distintas por parcela).
+            Si alguna parcela no existe no se registra nada.
+            Comandos asociados: /tratamiento, /riego (varias parcelas)
+            """
+            comunes = {
+                "tipo_actividad": tipo_actividad,
+                "fecha": fecha,
+                "producto": producto,
+                "dosis": dosis,
+                "dosis_text": dosis_text,
+                "plaga": plaga,
+                "eficacia": eficacia,
+                "nombre_equipo": nombre_equipo,
+                "hora_inicio": hora_inicio,
+                "hora_fin": hora_fin,
+                "observaciones": observaciones,
+            }
+            filas = [
+                {**comunes, "referencia_sigpac": ref}
+                for ref in referencias_sigpac or []
+            ]
+            filas += [{**comunes, **fila} for fila in actividades or []]
+
+            @transaction.atomic
+            def _operacion_db():
+                if not filas:
+                    return "Error: Indica al menos una parcela."
+                if any(not f.get("fecha") for f in filas):
+                    return "Error: Falta la fecha en alguna actividad."
+
+                # 1. Todas las parcelas en una sola consulta
+                parcelas = resolver_parcelas(
+                    [str(f.get("referencia_sigpac") or "") for f in filas]
+                )
+                faltan = [
+                    str(f.get("referencia_sigpac") or "")
+                    for f in filas
+                    if not parcelas.get(str(f.get("referencia_sigpac") or "").strip())
+                ]
+                if faltan:
+                    return f"Error: Parcelas no encontradas: {', '.join(faltan)}. No se ha registrado nada."
+
+                # 2. Aplicador (solo tratamientos) y equipos, desde la caché de maestros
+                def _tipo(fila):
+                    texto = str(fila["tipo_actividad"]).lower()
+                    if "trata" in texto:
+                        return "TRATAMIENTO"
+                    if "abono" in texto or fila["producto"]:
+                        return "ABONADO"
+                    return "RIEGO"
+
+                aplicador_persona = None
+                if any(_tipo(f) == "TRATAMIENTO" for f in filas):
+                    aplicador_persona = maestros.aplicador_habilitado()
+                    if not aplicador_persona:
+                        return "Error: No hay personas registradas para asignar como aplicador."
+
+                # 3. Inserción masiva
+                nuevas = []
+                for fila in filas:
+                    parcela = parcelas[str(fila["referencia_sigpac"]).strip()]
+                    tipo_db = _tipo(fila)
+                    if tipo_db == "TRATAMIENTO":
+                        nuevas.append(
+                            DiarioActividad(
+                                explotacion_id=parcela.explotacion_id,
+                                fecha=fila["fecha"],
+                                tipo=tipo_db,
+                                parcela=parcela,
+                                superficie_tratada_ha=parcela.superficie_cultivada,
+                                producto_nombre=fila["producto"],
+                                dosis=fila["dosis"],
+                                dosis_text=fila["dosis_text"],
+                                problema_fitosanitario=fila["plaga"],
+                                eficacia=fila["eficacia"],
+                                equipo=maestros.equipo_por_nombre(
+                                    fila["nombre_equipo"]
+                                ),
+                                hora_inicio=fila["hora_inicio"],
+                                hora_fin=fila["hora_fin"],
+                                observaciones=fila["observaciones"],
+                                aplicador=aplicador_persona,
+                            )
+                        )
+                    else:
+                        nuevas.append(
+                            DiarioActividad(
+                                explotacion_id=parcela.explotacion_id,
+                                fecha=fila["fecha"],
+                                tipo=tipo_db,
+                                parcela=parcela,
+                                superficie_tratada_ha=parcela.superficie_cultivada,
+                                producto_nombre=fila["producto"],
+                                dosis=fila["dosis"],
+                                dosis_text=fila["dosis_text"],
+                                hora_inicio=fila["hora_inicio"],
+                                hora_fin=fila["hora_fin"],
+                                observaciones=f"Registro de {fila['tipo_actividad']}. {fila['observaciones']}",
+                            )
+                        )
+                creadas = DiarioActividad.objects.bulk_create(nuevas)
+                # bulk_create no emite señales: se invalida el cuaderno a mano
+                for clave in {(a.explotacion_id, a.fecha, a.tipo) for a in creadas}:
+                    snapshots.invalidar_actividades(*clave)
+
+                # 4. Resumen compacto
+                por_tipo = {}
+                for actividad in creadas:
+                    por_tipo.setdefault(actividad.tipo, []).append(
+                        actividad.parcela.referencia_sigpac
+                    )
+                resumen = "; ".join(
+                    f"{tipo} en {len(refs)} parcela(s): {', '.join(refs)}"
+                    for tipo, refs in por_tipo.items()
+                )
+                ids = ", ".join(str(a.id) for a in creadas if a.id is not None)
+                return f"Registradas {len(creadas)} actividades. {resumen}." + (
+                    f" IDs: {ids}." if ids else ""
+                )
+
+            try:
+                return await db(_operacion_db, "registrar_actividades_lote")()
+            except Exception as e:
+                return f"Error al registrar actividades en lote: {str(e)}"
+
         @mcp.tool()
         async def registrar_siembra(
             fecha: str,
@@ -590,22 +863,17 @@ class Command(BaseCommand):
             Registra siembra con semilla tratada.
             Comando asociado: /siembra
             """
-            try:
+
+            @transaction.atomic
+            def _operacion_db():
                 # Buscar parcela por referencia o cultivo (nombre común a veces coincide)
-                parcela = await sync_to_async(
-                    Parcela.objects.filter(
-                        Q(referencia_sigpac__icontains=referencia_sigpac)
-                        | Q(especie__icontains=referencia_sigpac)
-                    )
-                    .select_related("explotacion")
-                    .first
-                )()
+                parcela = resolver_parcela(referencia_sigpac)
 
                 if not parcela:
                     return f"Error: Parcela '{referencia_sigpac}' no encontrada."
 
-                await sync_to_async(SemillaTratada.objects.create)(
-                    explotacion=parcela.explotacion,
+                SemillaTratada.objects.create(
+                    explotacion_id=parcela.explotacion_id,
                     fecha_siembra=fecha,
                     parcela=parcela,
                     cultivo=cultivo,
@@ -616,6 +884,9 @@ class Command(BaseCommand):
                     observaciones=observaciones,
                 )
                 return f"Siembra registrada: {cultivo} en {parcela.referencia_sigpac}. Tratamiento semilla: {producto_semilla}"
+
+            try:
+                return await db(_operacion_db, "registrar_siembra")()
             except Exception as e:
                 return f"Error al registrar siembra: {str(e)}"
 
@@ -632,12 +903,14 @@ class Command(BaseCommand):
             Registra análisis de laboratorio completo.
             Comando asociado: /analisis
             """
-            try:
-                explotacion = await sync_to_async(Explotacion.objects.first)()
+
+            @transaction.atomic
+            def _operacion_db():
+                explotacion = maestros.explotacion_principal()
                 if not explotacion:
                     return "Error: No hay explotación configurada."
 
-                obj = await sync_to_async(AnalisisLaboratorio.objects.create)(
+                obj = AnalisisLaboratorio.objects.create(
                     explotacion=explotacion,
                     fecha=fecha,
                     material_analizado=material,
@@ -647,6 +920,9 @@ class Command(BaseCommand):
                     sustancias_activas_detectadas=resultado,
                 )
                 return f"Análisis registrado ID: {obj.id} (Bol: {numero_boletin})."
+
+            try:
+                return await db(_operacion_db, "registrar_analisis")()
             except Exception as e:
                 return f"Error al registrar análisis: {str(e)}"
 
@@ -684,293 +960,67 @@ class Command(BaseCommand):
             Genera los datos completos para el Documento de Acompañamiento al Transporte (DAT).
             Busca datos en los modelos (Transportista, Persona) si se proporcionan NIFs.
             """
-            try:
-                # 0. Validaciones básicas
-                if not (len(productos) == len(cantidades) == len(unidades)):
-                    return "Error: Las listas de productos, cantidades y unidades deben tener la misma longitud."
-
-                variedades_safe = variedades + [""] * (len(productos) - len(variedades))
-
-                # 1. Recuperar Destinatario y Explotación (Base)
-                destinatario = await sync_to_async(
-                    Destinatario.objects.filter(nombre__icontains=nombre_destinatario)
-                    .select_related("transporte_asignado", "direccion")
-                    .first
-                )()
-
-                if not destinatario:
-                    return f"Error: Destinatario '{nombre_destinatario}' no encontrado. Créalo con /nuevo_cliente."
-
-                explotacion = await sync_to_async(
-                    Explotacion.objects.select_related("titular", "direccion").first
-                )()
-                if not explotacion:
-                    return "Error: No hay Explotación configurada como origen."
-
-                # 2. LÓGICA INTELIGENTE: TRANSPORTISTA
-                t_nombre = nombre_transportista or "(Rellenar)"
-                t_nif = nif_transportista or "VACÍO"
-                t_tel = telefono_transportista or "VACÍO"
-                t_email = email_transportista or "VACÍO"
-
-                if nif_transportista:
-                    transp_db = await sync_to_async(
-                        Transportista.objects.filter(nif=nif_transportista).first
-                    )()
-                    if transp_db:
-                        t_nombre = transp_db.nombre
-                        t_tel = transp_db.telefono or t_tel
-                        t_email = transp_db.email or t_email
-                    else:
-                        persona_transp = await sync_to_async(
-                            Persona.objects.filter(nif=nif_transportista).first
-                        )()
-                        if persona_transp:
-                            t_nombre = persona_transp.nombre
-                            t_tel = (
-                                persona_transp.telefono or persona_transp.movil or t_tel
-                            )
-                            t_email = persona_transp.email or t_email
-
-                # 3. LÓGICA INTELIGENTE: AUTORIZADO
-                auth_nom = nombre_autorizado or "VACÍO"
-                auth_nif = nif_autorizado or "VACÍO"
-
-                if nif_autorizado:
-                    persona_auth = await sync_to_async(
-                        Persona.objects.filter(nif=nif_autorizado).first
-                    )()
-                    if persona_auth:
-                        auth_nom = persona_auth.nombre
-
-                titular = explotacion.titular
-                if (
-                    auth_nom == "VACÍO"
-                    and explotacion.tipo_representacion == "REPRESENTANTE"
-                    and titular
-                ):
-                    auth_nom = titular.nombre
-                    auth_nif = titular.documento
-
-                # 4. Buscar Parcela de Origen
-                parcela_origen = await sync_to_async(
-                    Parcela.objects.filter(
-                        explotacion=explotacion, especie__icontains=productos[0]
-                    ).first
-                )()
 
-                # 5. Generar Registros en BD
-                vehiculo = destinatario.transporte_asignado
-                numero_dat = f"DAT-{datetime.now().strftime('%Y%m%d-%H%M')}"
-                obs = f"Destino: {destinatario.nombre}. Eco: {es_ecologico}. Total líneas: {len(productos)}"
+            peticion = {
+                "nombre_destinatario": nombre_destinatario,
+                "productos": productos,
+                "cantidades": cantidades,
+                "unidades": unidades,
+                "variedades": variedades,
+                "matricula_remolque": matricula_remolque,
+                "nif_transportista": nif_transportista,
+                "nombre_transportista": nombre_transportista,
+                "telefono_transportista": telefono_transportista,
+                "email_transportista": email_transportista,
+                "fecha_entrega_estimada": fecha_entrega_estimada,
+                "nombre_autorizado": nombre_autorizado,
+                "nif_autorizado": nif_autorizado,
+                "es_ecologico": es_ecologico,
+                "es_integrada": es_integrada,
+                "denominacion_origen": denominacion_origen,
+                "indicacion_geografica": indicacion_geografica,
+                "especialidad_tradicional": especialidad_tradicional,
+                "categoria": categoria,
+                "naturaleza": naturaleza,
+                "finalidad": finalidad,
+                "instrucciones_uso": instrucciones_uso,
+                "condiciones_transporte": condiciones_transporte,
+            }
 
-                nuevo_dat = await sync_to_async(DocumentoDAT.objects.create)(
-                    numero=numero_dat,
-                    fecha_emision=date.today(),
-                    explotacion=explotacion,
-                    producto=productos[0],
-                    cantidad=cantidades[0],
-                    unidad=unidades[0],
-                    observaciones=obs,
-                )
+            def _operacion_db():
+                try:
+                    return emitir_dats([peticion])[0]
+                except ErrorDAT as e:
+                    return f"Error: {e}"
 
-                await sync_to_async(RegistroTransporte.objects.create)(
-                    documento_dat=nuevo_dat,
-                    fecha_transporte=datetime.now(),
-                    destinatario=destinatario,
-                    vehiculo=vehiculo,
-                    cantidad=cantidades[0],
-                    unidad=unidades[0],
-                    estado="emitido",
-                )
+            try:
+                return await db(_operacion_db, "generar_dat")()
+            except Exception as e:
+                return f"Error generando DAT: {str(e)}"
 
-                # 6. Reporte Final
-                def fmt_parts(d):
-                    if not d:
-                        return {
-                            "via": "",
-                            "nombre": "",
-                            "num": "",
-                            "cp": "",
-                            "loc": "",
-                            "prov": "",
-                            "entidad": "",
-                            "pais": "",
-                        }
-                    return {
-                        "via": d.tipo_via or "",
-                        "nombre": d.nombre_via or "",
-                        "num": d.numero or "",
-                        "cp": d.codigo_postal or "",
-                        "loc": d.localidad or "",
-                        "prov": d.provincia or "",
-                        "entidad": d.entidad_poblacion or d.localidad or "",
-                        "pais": d.pais or "España",
-                    }
-
-                org = fmt_parts(explotacion.direccion)
-                dst = fmt_parts(destinatario.direccion)
-
-                # Datos Titular
-                t_nombre = titular.nombre if titular else explotacion.nombre
-                t_nif = titular.documento if titular else explotacion.nif
-
-                t_tel = "VACÍO"
-                t_movil = ""
-                t_email = "VACÍO"
-                check_sexo_h = "[ ]"
-                check_sexo_m = "[ ]"
-
-                if t_nif:
-                    persona_titular = await sync_to_async(
-                        Persona.objects.filter(nif=t_nif).first
-                    )()
-                    if persona_titular:
-                        t_tel = persona_titular.telefono or "VACÍO"
-                        t_movil = persona_titular.movil or ""
-                        t_email = persona_titular.email or "VACÍO"
-                        if persona_titular.sexo == "H":
-                            check_sexo_h = "[X]"
-                        if persona_titular.sexo == "M":
-                            check_sexo_m = "[X]"
-
-                # Datos Destinatario (Extra)
-                persona_dest = await sync_to_async(
-                    Persona.objects.filter(nif=destinatario.documento).first
-                )()
-                dest_tel = persona_dest.telefono if persona_dest else ""
-                dest_movil = persona_dest.movil if persona_dest else ""
-                dest_email = persona_dest.email if persona_dest else ""
-
-                # Sigpac
-                sigpac_data = {"prov": "", "mun": "", "pol": "", "par": "", "rec": ""}
-                if parcela_origen:
-                    sigpac_data = {
-                        "prov": (
-                            explotacion.direccion.provincia
-                            if explotacion.direccion
-                            else ""
-                        ),
-                        "mun": (
-                            explotacion.direccion.localidad
-                            if explotacion.direccion
-                            else ""
-                        ),
-                        "pol": parcela_origen.poligono or "",
-                        "par": parcela_origen.parcela or "",
-                        "rec": parcela_origen.recinto or "",
-                    }
-
-                # Transporte
-                v_mat = vehiculo.matricula if vehiculo else "PENDIENTE DE ASIGNAR"
-                fecha_salida = datetime.now().strftime("%d/%m/%Y")
-                hora_salida = datetime.now().strftime("%H:%M")
-
-                check_dop = (
-                    f"[X] {denominacion_origen}"
-                    if denominacion_origen
-                    else "[ ] Denominación de Origen Protegida"
-                )
-                check_igp = (
-                    f"[X] {indicacion_geografica}"
-                    if indicacion_geografica
-                    else "[ ] Indicación Geográfica Protegida"
-                )
-                check_etg = (
-                    f"[X] {especialidad_tradicional}"
-                    if especialidad_tradicional
-                    else "[ ] Especialidad Tradicional Garantizada"
-                )
-                check_eco = (
-                    "[X] Producción ecológica"
-                    if es_ecologico
-                    else "[ ] Producción ecológica"
-                )
-                check_int = (
-                    "[X] Producción integrada de Andalucía"
-                    if es_integrada
-                    else "[ ] Producción integrada de Andalucía"
-                )
-                es_calidad_dif = (
-                    "SÍ"
-                    if (
-                        denominacion_origen
-                        or indicacion_geografica
-                        or especialidad_tradicional
-                    )
-                    else "NO"
-                )
+        @mcp.tool()
+        async def generar_dats_lote(dats: list[dict]) -> str:
+            """
+            Emite varios DAT a la vez (p. ej. todas las cargas del día a primera hora).
+            Cada elemento de 'dats' admite los mismos campos que generar_dat
+            (nombre_destinatario, productos, cantidades y unidades obligatorios) y,
+            opcionalmente, 'matricula_vehiculo' para indicar el camión de esa carga.
+            Si algún DAT no es válido no se emite ninguno.
+            """
 
-                lineas_carga = ""
-                for i, (prod, cant, unid, var) in enumerate(
-                    zip(productos, cantidades, unidades, variedades_safe), 1
-                ):
-                    lineas_carga += f"\n* LÍNEA {i}:\n - Denominación: {prod}\n - Variedad: {var or 'VACÍO'}\n - Unidad: {unid}\n - Cantidad: {cant}"
-
-                reporte = f"""DAT GENERADO: {numero_dat}
---------------------------------------------------------------------------------
-1. ORIGEN DEL PORTE
-1.1 TITULAR:
-- Nombre/Razón Social: {t_nombre}
-- DNI/NIE/NIF: {t_nif} | Sexo: {check_sexo_h}H {check_sexo_m}M
-- Domicilio: {org['via']} {org['nombre']} Nº {org['num']}
-- Entidad Población: {org['entidad']} | Municipio: {org['loc']}
-- Provincia: {org['prov']} | CP: {org['cp']} | País: {org['pais']}
-- Teléfono: {t_tel} | Móvil: {t_movil} | Email: {t_email}
-- Autorizado: {auth_nom} | DNI Autorizado: {auth_nif}
-
-1.2 UNIDAD DE PRODUCCIÓN (SIGPAC):
-- Nombre Explotación: {explotacion.nombre}
-- Provincia: {sigpac_data['prov']} | Municipio: {sigpac_data['mun']}
-- Polígono: {sigpac_data['pol']} | Parcela: {sigpac_data['par']} | Recinto: {sigpac_data['rec']}
-
---------------------------------------------------------------------------------
-2. DESTINATARIO
-- Nombre/Razón Social: {destinatario.nombre}
-- DNI/NIE/NIF: {destinatario.documento}
-- Domicilio: {dst['via']} {dst['nombre']} Nº {dst['num']}
-- Entidad Población: {dst['entidad']} | Municipio: {dst['loc']}
-- Provincia: {dst['prov']} | CP: {dst['cp']} | País: {dst['pais']}
-- Teléfono: {dest_tel} | Móvil: {dest_movil} | Email: {dest_email}
-
---------------------------------------------------------------------------------
-3. TRANSPORTISTA / REBUSCADOR
-- NIF: {t_nif}
-- Nombre: {t_nombre}
-- Matrícula Vehículo: {v_mat}
-- Matrícula Remolque: {matricula_remolque}
-- Teléfono: {t_tel} | Email: {t_email}
-
---------------------------------------------------------------------------------
-4. DATOS DEL PORTE
-- Fecha Salida: {fecha_salida} | Hora: {hora_salida}
-- Fecha Entrega Estimada: {fecha_entrega_estimada}
-{lineas_carga}
-
---------------------------------------------------------------------------------
-5. CALIDAD COMERCIAL
-- ¿Calidad Diferenciada? {es_calidad_dif}
-- {check_dop}
-- {check_igp}
-- {check_etg}
-- {check_eco}
-- {check_int}
-- Naturaleza/Composición: {naturaleza}
-- Utilización/Finalidad: {finalidad}
-- Categoría: {categoria}
-- Instrucciones de uso: {instrucciones_uso}
-- Condiciones producción/distribución: {condiciones_transporte}
-
---------------------------------------------------------------------------------
-6 y 7. FIRMAS
-- Lugar: {org['loc']} | Fecha: {fecha_salida}
-- Firma Titular: (Pendiente)
-- Firma Transportista: (Pendiente)
-"""
-                return reporte
+            def _operacion_db():
+                try:
+                    emitidos = emitir_datos_dats(dats)
+                except ErrorDAT as e:
+                    return f"Error: {e}"
+                numeros = ", ".join(datos["numero"] for datos in emitidos)
+                cabecera = f"DAT EMITIDOS: {len(emitidos)} ({numeros})"
+                return "\n\n".join([cabecera] + [renderizar_dat(d) for d in emitidos])
 
+            try:
+                return await db(_operacion_db, "generar_dats_lote")()
             except Exception as e:
-                return f"Error generando DAT: {str(e)}"
+                return f"Error generando DATs: {str(e)}"
 
         @mcp.tool()
         async def registrar_venta(
@@ -987,9 +1037,11 @@ class Command(BaseCommand):
             Registra una venta o salida de cosecha completa.
             Comando asociado: /venta
             """
-            try:
-                explotacion = await sync_to_async(Explotacion.objects.first)()
-                await sync_to_async(RegistroMovimientoProducto.objects.create)(
+
+            @transaction.atomic
+            def _operacion_db():
+                explotacion = maestros.explotacion_principal()
+                RegistroMovimientoProducto.objects.create(
                     explotacion=explotacion,
                     fecha=fecha,
                     producto=producto,
@@ -1001,6 +1053,9 @@ class Command(BaseCommand):
                     numero_rgseaa=numero_rgseaa,
                 )
                 return f"Venta registrada: {cantidad}kg de {producto} a {cliente} (Alb: {albaran})."
+
+            try:
+                return await db(_operacion_db, "registrar_venta")()
             except Exception as e:
                 return f"Error registrando venta: {str(e)}"
 
@@ -1016,345 +1071,11 @@ class Command(BaseCommand):
             Comando asociado: /cuaderno
             """
             try:
-                start_date = date(anio, 1, 1)
-                end_date = date(anio, 12, 31)
-
-                # 1. Recuperar Explotación y datos maestros
-                explotacion = await sync_to_async(
-                    Explotacion.objects.select_related("titular", "direccion").first
-                )()
-                if not explotacion:
-                    return "Error: No hay explotación configurada en el sistema."
-
-                titular = explotacion.titular
-                dir_exp = explotacion.direccion
-
-                # Helper para formatear direcciones
-                def fmt_dir(d):
-                    if not d:
-                        return "VACÍO"
-                    return f"{d.tipo_via or ''} {d.nombre_via or ''} Nº{d.numero or ''}, {d.codigo_postal or ''} {d.localidad or ''} ({d.provincia or ''})"
-
-                # --- SECCIÓN 1: INFORMACIÓN GENERAL ---
-
-                # 1.1 Datos Generales
-                t_nombre = (
-                    f"{titular.nombre} {titular.apellidos or ''}"
-                    if titular
-                    else explotacion.nombre
-                )
-                t_nif = titular.documento or "VACÍO"
-                t_rega = explotacion.numero_registro_nacional or "VACÍO"
-                t_rea = explotacion.numero_registro_autonomico or "VACÍO"
-                t_dir = fmt_dir(dir_exp)
-                t_tel = "VACÍO"
-                t_movil = "VACÍO"
-                t_email = "VACÍO"
-
-                if titular.documento:
-                    persona_transp = await sync_to_async(
-                        Persona.objects.filter(nif=titular.documento).first
-                    )()
-                    if persona_transp:
-                        t_nombre = persona_transp.nombre
-                        t_tel = persona_transp.telefono or t_tel
-                        t_movil = persona_transp.movil or t_movil
-                        t_email = persona_transp.email or t_email
-
-                # Representante (Lógica: Si el tipo es REPRESENTANTE, asumimos que los datos del titular vinculado son del rep.)
-                rep_nombre = "VACÍO"
-                rep_nif = "VACÍO"
-                rep_tipo = "VACÍO"
-                if explotacion.tipo_representacion == "REPRESENTANTE":
-                    rep_nombre = t_nombre
-                    rep_nif = t_nif
-                    rep_tipo = "Representante Legal"
-
-                r = f"""DATOS PARA CUADERNO DE EXPLOTACIÓN (CAMPAÑA {anio})
-================================================================================
-1. INFORMACIÓN GENERAL
---------------------------------------------------------------------------------
-1.1 DATOS DE LA EXPLOTACIÓN
-- Titular (Nombre/Razón Social): {t_nombre}
-- NIF: {t_nif}
-- Nº Registro Nacional (REGA): {t_rega}
-- Nº Registro Autonómico (REA): {t_rea}
-- Dirección Completa: {t_dir}
-- Teléfono Fijo: {t_tel} | Móvil: {t_movil}
-- Email: {t_email}
-
-REPRESENTANTE (Si procede):
-- Nombre y Apellidos: {rep_nombre}
-- NIF: {rep_nif}
-- Tipo de Representación: {rep_tipo}
-- Firma y Fecha: (Pendiente manuscrita)
-"""
-
-                # 1.2 Personas/Empresas (Aplicadores)
-                # Filtramos personal habilitado
-                aplicadores = await sync_to_async(list)(
-                    Personal.objects.filter(habilitado_fitosanitarios=True)
-                )
-                r += "\n1.2 PERSONAS O EMPRESAS QUE INTERVIENEN (APLICADORES)\n"
-                if not aplicadores:
-                    r += "* (VACÍO - Registrar aplicadores en 'Personal' con /nuevo_personal)\n"
-                else:
-                    for i, p in enumerate(aplicadores, 1):
-                        # Inferir checkboxes del carné desde el cargo
-                        carnet = (p.cargo or "").upper()
-                        check_basico = "[X]" if "BASICO" in carnet else "[ ]"
-                        check_cualif = "[X]" if "CUALIFICADO" in carnet else "[ ]"
-                        check_fumig = "[X]" if "FUMIGADOR" in carnet else "[ ]"
-                        check_piloto = "[X]" if "PILOTO" in carnet else "[ ]"
-
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Nombre/Empresa: {p.nombre} {p.apellidos}\n"
-                        r += f"  - NIF: {p.documento}\n"
-                        r += f"  - Nº Inscripción ROPO: {p.documento}\n"
-                        r += f"  - Carné: {check_basico}Básico {check_cualif}Cualif. {check_fumig}Fumigador {check_piloto}Piloto\n"
-                        r += "  - ¿Es Asesor?: [ ] (Marcar si procede)\n"
-
-                # 1.3 Equipos (Maquinaria)
-                equipos = await sync_to_async(list)(
-                    EquipoAplicacion.objects.filter(explotacion=explotacion)
+                return await generar_cuaderno_concurrente(
+                    anio, db, herramienta="generar_cuaderno"
                 )
-                r += "\n1.3 EQUIPOS DE APLICACIÓN (MAQUINARIA)\n"
-                if not equipos:
-                    r += "* (VACÍO - Registrar en 'EquipoAplicacion' con /nueva_maquina)\n"
-                else:
-                    for i, eq in enumerate(equipos, 1):
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Descripción: {eq.descripcion}\n"
-                        r += f"  - Nº Inscripción ROMA: {eq.numero_inscripcion_roma}\n"
-                        r += f"  - Fecha Adquisición: {eq.fecha_adquisicion or 'VACÍO'}\n"
-                        r += f"  - Fecha Última Inspección (ITEAF): {eq.fecha_ultima_inspeccion or 'VACÍO'}\n"
-
-                # 1.4 Asesoramiento
-                asesores = await sync_to_async(list)(
-                    Asesor.objects.select_related("persona").all()
-                )
-                r += "\n1.4 ASESORAMIENTO (GIP)\n"
-                if not asesores:
-                    r += "* (VACÍO - Registrar en 'Asesor' con /nuevo_asesor)\n"
-                else:
-                    for i, a in enumerate(asesores, 1):
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Nombre/Entidad: {a.persona.nombre}\n"
-                        r += f"  - NIF: {a.persona.nif}\n"
-                        r += (
-                            f"  - Nº Identificación/ROPO: {a.numero_inscripcion_ropo}\n"
-                        )
-                        r += f"  - Tipo Explotación GIP: {a.tipo_carnet or 'VACÍO'} (Ej: AE, PI, Atrias)\n"
-
-                # ==============================================================================
-                # SECCIÓN 2: IDENTIFICACIÓN DE PARCELAS
-                # ==============================================================================
-                parcelas = await sync_to_async(list)(
-                    Parcela.objects.filter(explotacion=explotacion)
-                )
-                r += "\n--------------------------------------------------------------------------------\n"
-                r += "2. IDENTIFICACIÓN DE PARCELAS\n"
-                r += "--------------------------------------------------------------------------------\n"
-
-                # 2.1 Datos Identificativos y Agronómicos
-                r += "2.1 DATOS IDENTIFICATIVOS Y AGRONÓMICOS\n"
-                if not parcelas:
-                    r += "* (VACÍO - Registrar en 'Parcela' con /nueva_parcela)\n"
-                else:
-                    for i, p in enumerate(parcelas, 1):
-                        r += f"  FILA {i} (Nº Orden: {i}):\n"
-                        r += f"  - Provincia/Municipio/Agregado/Zona: (Ver Ref SIGPAC: {p.referencia_sigpac})\n"
-                        r += f"  - Polígono: {p.poligono or ''} | Parcela: {p.parcela or ''} | Recinto: {p.recinto or ''}\n"
-                        r += f"  - Uso SIGPAC: {p.uso_sigpac or 'VACÍO'}\n"
-                        r += f"  - Superficie SIGPAC: {p.superficie_sigpac or 0} ha\n"
-                        r += f"  - Superficie Cultivada: {p.superficie_cultivada or 0} ha\n"
-                        r += f"  - Especie: {p.especie or 'VACÍO'}\n"
-                        r += f"  - Variedad: {p.variedad or 'VACÍO'}\n"
-                        r += f"  - Secano/Regadío: {p.secano_regadio or 'VACÍO'}\n"
-                        r += (
-                            f"  - Aire Libre/Protegido: {p.aire_protegido or 'VACÍO'}\n"
-                        )
-                        r += "  - Sistema Asesoramiento GIP: (Rellenar manual: AE, PI, etc.)\n"
-
-                # 2.2 Datos Medioambientales (Placeholder, modelo actual no tiene estos campos específicos)
-                r += "\n2.2 DATOS MEDIOAMBIENTALES\n"
-                if not parcelas:
-                    r += "* (VACÍO)\n"
-                else:
-                    for i, p in enumerate(parcelas, 1):
-                        r += f"  FILA {i} (Parcela Orden {i}):\n"
-                        r += "  - ¿Puntos de agua en parcela?: [ ]SI [ ]NO\n"
-                        r += "  - Distancia a agua (m): \n"
-                        r += "  - Zonas Específicas (Protegidas): [ ]Totalmente [ ]Parcialmente [ ]NO\n"
-
-                # ==============================================================================
-                # SECCIÓN 3: TRATAMIENTOS FITOSANITARIOS
-                # ==============================================================================
-                r += "\n--------------------------------------------------------------------------------\n"
-                r += "3. TRATAMIENTOS FITOSANITARIOS\n"
-                r += "--------------------------------------------------------------------------------\n"
-
-                # 3.1 Registro de Actuaciones
-                tratamientos = await sync_to_async(list)(
-                    DiarioActividad.objects.filter(
-                        explotacion=explotacion,
-                        fecha__range=(start_date, end_date),
-                        tipo="TRATAMIENTO",
-                    ).select_related("parcela", "aplicador", "equipo")
-                )
-
-                r += "3.1 REGISTRO DE ACTUACIONES FITOSANITARIAS\n"
-                if not tratamientos:
-                    r += "* (VACÍO - Sin tratamientos registrados en este periodo)\n"
-                else:
-                    for i, t in enumerate(tratamientos, 1):
-                        parc_ref = t.parcela.referencia_sigpac if t.parcela else "TODAS"
-                        cultivo_txt = (
-                            f"{t.parcela.especie} {t.parcela.variedad}"
-                            if t.parcela
-                            else "Varios"
-                        )
-                        aplicador_txt = (
-                            f"{t.aplicador.nombre} (NIF: {t.aplicador.documento})"
-                            if t.aplicador
-                            else "VACÍO"
-                        )
-                        equipo_txt = (
-                            t.equipo.descripcion if t.equipo else "Manual/Sin equipo"
-                        )
-
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Id. Parcelas: {parc_ref}\n"
-                        r += f"  - Cultivo/Especie/Variedad: {cultivo_txt}\n"
-                        r += f"  - Fechas: {t.fecha}\n"
-                        r += f"  - Sup. Tratada: {t.superficie_tratada_ha} ha\n"
-                        r += f"  - Problema Fitosanitario: {t.problema_fitosanitario}\n"
-                        r += f"  - Aplicador: {aplicador_txt}\n"
-                        r += f"  - Equipo: {equipo_txt}\n"
-                        r += f"  - Producto (Nombre): {t.producto_nombre}\n"
-                        r += f"  - Producto (Nº Registro): {t.producto_numero_registro or 'VACÍO'}\n"
-                        r += f"  - Dosis: {t.dosis} {t.dosis_text or ''}\n"
-                        r += f"  - Eficacia: {t.eficacia or 'Buena'}\n"
-                        r += f"  - Observaciones: {t.observaciones}\n"
-
-                # 3.2 Semilla Tratada
-                siembras = await sync_to_async(list)(
-                    SemillaTratada.objects.filter(
-                        explotacion=explotacion,
-                        fecha_siembra__range=(start_date, end_date),
-                    ).select_related("parcela")
-                )
-
-                r += "\n3.2 USO DE SEMILLA TRATADA\n"
-                r += f"  ¿Aplica Tratamiento? [{'X' if siembras else ' '}] SI  [{' ' if siembras else 'X'}] NO\n"
-                if siembras:
-                    for i, s in enumerate(siembras, 1):
-                        parc_ref = s.parcela.referencia_sigpac if s.parcela else "N/A"
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Fecha Siembra: {s.fecha_siembra}\n"
-                        r += f"  - Id. Parcela: {parc_ref}\n"
-                        r += f"  - Cultivo/Variedad: {s.cultivo}\n"
-                        r += f"  - Sup. Sembrada: {s.superficie_sembrada_ha} ha\n"
-                        r += f"  - Cantidad Semilla: {s.cantidad_semilla_kg} kg\n"
-                        r += f"  - Producto (Nombre): {s.producto_fitosanitario}\n"
-                        r += f"  - Producto (Nº Registro): {s.numero_registro}\n"
-
-                # 3.3, 3.4, 3.5 (Postcosecha, Locales, Transporte) - Modelos no específicos
-                r += "\n3.3 TRATAMIENTOS POSTCOSECHA\n"
-                r += "  ¿Aplica Tratamiento? [ ] SI  [X] NO (Consultar registros manuales si existen)\n"
-                r += "\n3.4 TRATAMIENTOS LOCALES ALMACENAMIENTO\n"
-                r += "  ¿Aplica Tratamiento? [ ] SI  [X] NO\n"
-                r += "\n3.5 TRATAMIENTOS MEDIOS DE TRANSPORTE\n"
-                r += "  ¿Aplica Tratamiento? [ ] SI  [X] NO\n"
-
-                # ==============================================================================
-                # SECCIÓN 4: ANÁLISIS
-                # ==============================================================================
-                r += "\n--------------------------------------------------------------------------------\n"
-                r += "4. REGISTRO DE ANÁLISIS (RESIDUOS)\n"
-                r += "--------------------------------------------------------------------------------\n"
-                analisis = await sync_to_async(list)(
-                    AnalisisLaboratorio.objects.filter(
-                        explotacion=explotacion, fecha__range=(start_date, end_date)
-                    )
-                )
-                if not analisis:
-                    r += "* (VACÍO - Registrar con /analisis)\n"
-                else:
-                    for i, an in enumerate(analisis, 1):
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Fecha: {an.fecha}\n"
-                        r += f"  - Material Analizado: {an.material_analizado} (Veg/Tierra/Agua)\n"
-                        r += f"  - Cultivo/Cosecha Muestreado: {an.cultivo}\n"
-                        r += f"  - Nº Boletín Análisis: {an.numero_boletin}\n"
-                        r += f"  - Laboratorio: {an.laboratorio}\n"
-                        r += f"  - Sustancias Detectadas: {an.sustancias_activas_detectadas}\n"
-
-                # ==============================================================================
-                # SECCIÓN 5: COSECHA COMERCIALIZADA
-                # ==============================================================================
-                r += "\n--------------------------------------------------------------------------------\n"
-                r += "5. REGISTRO DE COSECHA COMERCIALIZADA\n"
-                r += "--------------------------------------------------------------------------------\n"
-                ventas = await sync_to_async(list)(
-                    RegistroMovimientoProducto.objects.filter(
-                        explotacion=explotacion, fecha__range=(start_date, end_date)
-                    )
-                )
-                if not ventas:
-                    r += "* (VACÍO - Registrar con /venta)\n"
-                else:
-                    for i, v in enumerate(ventas, 1):
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Fecha: {v.fecha}\n"
-                        r += f"  - Producto: {v.producto}\n"
-                        r += f"  - Cantidad: {v.cantidad_kg} kg\n"
-                        r += "  - Parcela Origen: (Indicar Nº Orden de Parcela)\n"
-                        r += f"  - Nº Albarán/Factura: {v.numero_albaran}\n"
-                        r += f"  - Nº Lote: {v.numero_lote or 'VACÍO'}\n"
-                        r += f"  - Cliente (Nombre): {v.cliente_nombre}\n"
-                        r += f"  - Cliente (NIF): {v.cliente_nif}\n"
-                        r += f"  - Cliente (RGSEAA): {v.numero_rgseaa or 'VACÍO'}\n"
-
-                # ==============================================================================
-                # SECCIÓN 6: FERTILIZACIÓN
-                # ==============================================================================
-                r += "\n--------------------------------------------------------------------------------\n"
-                r += "6. REGISTRO DE FERTILIZACIÓN\n"
-                r += "--------------------------------------------------------------------------------\n"
-                abonados = await sync_to_async(list)(
-                    DiarioActividad.objects.filter(
-                        explotacion=explotacion,
-                        fecha__range=(start_date, end_date),
-                        tipo__in=["ABONADO", "RIEGO"],
-                    ).select_related("parcela")
-                )
-
-                if not abonados:
-                    r += "* (VACÍO - Registrar con /riego)\n"
-                else:
-                    for i, ab in enumerate(abonados, 1):
-                        parc_ref = (
-                            ab.parcela.referencia_sigpac if ab.parcela else "TODAS"
-                        )
-                        cultivo = ab.parcela.especie if ab.parcela else ""
-                        prod_abono = (
-                            ab.producto_nombre if ab.producto_nombre else "Agua/Riego"
-                        )
-
-                        r += f"  FILA {i}:\n"
-                        r += f"  - Intervalo Fechas: {ab.fecha}\n"
-                        r += f"  - Nº Orden Parcela: {parc_ref}\n"
-                        r += f"  - Cultivo/Variedad: {cultivo}\n"
-                        r += f"  - Tipo Abono/Producto: {prod_abono}\n"
-                        r += "  - Nº Albarán: (Ver Observaciones)\n"
-                        r += "  - Riqueza NPK: (Ver Observaciones)\n"
-                        r += f"  - Dosis: {ab.dosis}\n"
-                        r += f"  - Tipo Fertilización: {ab.tipo} (F/AF/AC)\n"
-                        r += f"  - Observaciones: {ab.observaciones}\n"
-
-                return r
-
+            except ErrorCuaderno as e:
+                return f"Error: {e}"
             except Exception as e:
                 return f"Error generando cuaderno completo: {str(e)}"
 
@@ -1366,53 +1087,164 @@ REPRESENTANTE (Si procede):
             tipo_actividad: str = None,
             parcela_ref: str = None,
             plaga: str = None,
+            texto: str = None,
+            agrupar_por: str = None,
+            cursor: str = None,
+            limite: int = 5,
+            contar: bool = True,
         ) -> str:
             """
             Consulta datos históricos con filtros avanzados.
             Comando asociado: /consulta
+
+            'texto' busca palabras en el producto, el problema fitosanitario y las
+            observaciones de cada actividad (p. ej. "oídio azufre") y ordena los
+            resultados por relevancia.
+
+            Modos:
+            - Listado (por defecto): 'limite' registros (máx. 100). Si hay más, la
+              respuesta incluye un cursor; pásalo en 'cursor' para la página siguiente.
+              Con contar=False (o al pasar 'cursor') no se calcula el total.
+            - Resumen: 'agrupar_por' con uno o varios de mes, producto, parcela, tipo
+              separados por comas (p. ej. "mes" con producto="cobre" para los
+              tratamientos con cobre de cada mes). Devuelve totales por grupo.
             """
+            criterios = [
+                a.strip().lower() for a in (agrupar_por or "").split(",") if a.strip()
+            ]
+
+            def _operacion_db():
+                qs, filtros = buscar_actividades(
+                    texto=texto,
+                    anio=anio,
+                    producto=producto,
+                    tipo_actividad=tipo_actividad,
+                    parcela_ref=parcela_ref,
+                    plaga=plaga,
+                    por_relevancia=not criterios,
+                )
+                if criterios:
+                    return None, filtros, list(agregar_actividades(qs, criterios)), None
+                count = qs.count() if contar and not cursor else None
+                if count == 0:
+                    return count, filtros, [], None
+                filas, siguiente = paginar(qs.select_related("parcela"), cursor, limite)
+                return count, filtros, filas, siguiente
+
             try:
-                qs = DiarioActividad.objects.all()
-                filters_desc = []
-
-                if anio:
-                    qs = qs.filter(fecha__year=anio)
-                    filters_desc.append(f"Año {anio}")
-                if producto:
-                    qs = qs.filter(producto_nombre__icontains=producto)
-                    filters_desc.append(f"Producto '{producto}'")
-                if tipo_actividad:
-                    qs = qs.filter(tipo__icontains=tipo_actividad)
-                    filters_desc.append(f"Tipo '{tipo_actividad}'")
-                if parcela_ref:
-                    qs = qs.filter(
-                        Q(parcela__referencia_sigpac__icontains=parcela_ref)
-                        | Q(parcela__especie__icontains=parcela_ref)
+                count, filters_desc, results, siguiente = await db(
+                    _operacion_db, "consultar_historico"
+                )()
+            except ValueError as e:
+                return f"Error: {e}"
+            except Exception as e:
+                return f"Error en consulta: {str(e)}"
+
+            filtros_txt = ", ".join(filters_desc) or "Ninguno"
+
+            if criterios:
+                if not results:
+                    return f"No hay registros. Filtros: {filtros_txt}."
+                resumen = (
+                    f"Resumen por {', '.join(criterios)}. Filtros: {filtros_txt}.\n"
+                )
+                for fila in results:
+                    grupo = []
+                    for criterio in criterios:
+                        valor = fila[AGRUPACIONES[criterio]]
+                        if criterio == "mes" and valor:
+                            valor = f"{valor:%m/%Y}"
+                        grupo.append(str(valor or f"Sin {criterio}"))
+                    superficie = (
+                        f" | {fila['superficie'].normalize():f} ha"
+                        if fila["superficie"]
+                        else ""
+                    )
+                    resumen += (
+                        f"- {' | '.join(grupo)}: {fila['actividades']} actividades"
+                        f"{superficie} ({fila['primera']} a {fila['ultima']})\n"
                     )
-                    filters_desc.append(f"Parcela '{parcela_ref}'")
-                if plaga:
-                    qs = qs.filter(problema_fitosanitario__icontains=plaga)
-                    filters_desc.append(f"Plaga '{plaga}'")
+                return resumen
+
+            if count is not None:
+                resumen = f"Se encontraron {count} registros. Filtros: {filtros_txt}.\n"
+            else:
+                resumen = f"Filtros: {filtros_txt}.\n"
+
+            if results:
+                if cursor:
+                    resumen += f"Siguientes {len(results)} registros:\n"
+                elif texto and usa_postgres():
+                    resumen += f"{len(results)} registros más relevantes:\n"
+                else:
+                    resumen += f"Últimos {len(results)} registros:\n"
+                for r in results:
+                    parc = r.parcela.referencia_sigpac if r.parcela else "N/A"
+                    prod = r.producto_nombre or "Sin producto"
+                    resumen += f"- {r.fecha} | {r.tipo} | {prod} ({r.dosis}) | Parcela: {parc}\n"
+            elif count is None:
+                resumen += "No hay más registros.\n"
 
-                count = await sync_to_async(qs.count)()
+            if siguiente:
+                resumen += f"Hay más registros: cursor='{siguiente}'\n"
 
-                resumen = f"Se encontraron {count} registros. Filtros: {', '.join(filters_desc) or 'Ninguno'}.\n"
+            return resumen
 
-                if count > 0:
-                    results = await sync_to_async(list)(
-                        qs.select_related("parcela").order_by("-fecha")[:5]
+        @mcp.tool()
+        async def consultar_volumen_dat(
+            anio: int,
+            mes: int = None,
+            producto: str = None,
+            destinatario: str = None,
+            unidad: str = None,
+        ) -> str:
+            """
+            Volumen expedido con DAT (suma de todas sus líneas de carga) por producto,
+            destinatario y mes. Útil para trazabilidad y totales de campaña
+            (p. ej. kg de mango enviados a cada cliente por mes).
+            """
+            if mes is not None and not 1 <= mes <= 12:
+                return f"Error: El mes debe estar entre 1 y 12 (recibido {mes})."
+            try:
+                desde = date(anio, mes or 1, 1)
+                hasta = (
+                    date(anio, 12, 31)
+                    if not mes or mes == 12
+                    else date(anio, mes + 1, 1) - timedelta(days=1)
+                )
+            except ValueError:
+                return f"Error: El año {anio} no es válido."
+
+            def _operacion_db():
+                return list(
+                    volumen_por_destinatario_mes(
+                        desde, hasta, producto, destinatario, unidad
                     )
-                    resumen += "Últimos 5 registros:\n"
-                    for r in results:
-                        parc = r.parcela.referencia_sigpac if r.parcela else "N/A"
-                        prod = r.producto_nombre or "Sin producto"
-                        resumen += f"- {r.fecha} | {r.tipo} | {prod} ({r.dosis}) | Parcela: {parc}\n"
+                )
 
-                return resumen
+            try:
+                filas = await db(_operacion_db, "consultar_volumen_dat")()
             except Exception as e:
-                return f"Error en consulta: {str(e)}"
+                return f"Error en consulta de volúmenes: {str(e)}"
+
+            if not filas:
+                return f"No hay DAT emitidos entre {desde} y {hasta} con esos filtros."
+            resumen = f"Volumen expedido entre {desde} y {hasta}:\n"
+            for f in filas:
+                resumen += (
+                    f"- {f['mes']:%m/%Y} | {f['producto']} | "
+                    f"{f['destinatario__nombre'] or 'Sin destinatario'} | "
+                    f"{f['total'].normalize():f} {f['unidad']} "
+                    f"({f['dats']} DAT, {f['lineas']} líneas)\n"
+                )
+            return resumen
 
-        self.stdout.write(
-            self.style.SUCCESS("Iniciando servidor MCP Agrícola en puerto 8001...")
-        )
-        mcp.run(transport="http", host="0.0.0.0", port=8001, path="/mcp")
+        @mcp.tool()
+        async def informe_rendimiento() -> str:
+            """
+            Devuelve, por herramienta, el nº medio de consultas SQL y la latencia
+            (tiempo en BD y tiempo total) desde que arrancó el servidor.
+            """
+            return f"{db.informe()}\n\n{maestros.cache.estadisticas()}"
+
+        return mcp
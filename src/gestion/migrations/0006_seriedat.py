@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0005_alter_diarioactividad_aplicador"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SerieDAT",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("anio", models.PositiveIntegerField(verbose_name="año")),
+                (
+                    "ultimo_numero",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="último número emitido"
+                    ),
+                ),
+                (
+                    "explotacion",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="series_dat",
+                        to="gestion.explotacion",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Serie DAT",
+                "verbose_name_plural": "Series DAT",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("explotacion", "anio"), name="serie_dat_unica_por_anio"
+                    )
+                ],
+            },
+        ),
+    ]
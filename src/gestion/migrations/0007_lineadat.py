@@ -0,0 +1,113 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:18
+
+from decimal import Decimal
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def crear_lineas_existentes(apps, schema_editor):
+    """
+    Los DAT anteriores solo guardaban su primera línea en DocumentoDAT; se
+    traslada a LineaDAT para que entren en los informes de volumen.
+    """
+    DocumentoDAT = apps.get_model("gestion", "DocumentoDAT")
+    LineaDAT = apps.get_model("gestion", "LineaDAT")
+    RegistroTransporte = apps.get_model("gestion", "RegistroTransporte")
+
+    destinatarios = dict(
+        RegistroTransporte.objects.filter(documento_dat__isnull=False)
+        .order_by("-pk")
+        .values_list("documento_dat_id", "destinatario_id")
+    )
+    documentos = DocumentoDAT.objects.exclude(producto="").filter(
+        cantidad__isnull=False
+    )
+    LineaDAT.objects.bulk_create(
+        (
+            LineaDAT(
+                documento_dat_id=d.pk,
+                orden=1,
+                producto=d.producto,
+                cantidad=d.cantidad,
+                unidad=d.unidad,
+                fecha=d.fecha_emision,
+                destinatario_id=destinatarios.get(d.pk),
+            )
+            for d in documentos.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0006_seriedat"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LineaDAT",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("orden", models.PositiveSmallIntegerField(default=1)),
+                ("producto", models.CharField(max_length=200)),
+                ("variedad", models.CharField(blank=True, max_length=150)),
+                (
+                    "cantidad",
+                    models.DecimalField(
+                        decimal_places=6,
+                        max_digits=14,
+                        validators=[
+                            django.core.validators.MinValueValidator(Decimal("0"))
+                        ],
+                    ),
+                ),
+                ("unidad", models.CharField(blank=True, max_length=20)),
+                ("fecha", models.DateField()),
+                (
+                    "destinatario",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="lineas_dat",
+                        to="gestion.destinatario",
+                    ),
+                ),
+                (
+                    "documento_dat",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lineas",
+                        to="gestion.documentodat",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Línea DAT",
+                "verbose_name_plural": "Líneas DAT",
+                "ordering": ["documento_dat", "orden"],
+                "indexes": [
+                    models.Index(
+                        fields=["fecha", "producto", "destinatario"],
+                        name="linea_dat_fecha_prod_dest",
+                    ),
+                    models.Index(
+                        fields=["destinatario", "fecha"], name="linea_dat_dest_fecha"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(crear_lineas_existentes, migrations.RunPython.noop),
+    ]
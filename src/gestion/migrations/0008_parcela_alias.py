@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0007_lineadat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parcela",
+            name="alias",
+            field=models.CharField(
+                blank=True,
+                help_text="Nombres con los que se conoce la parcela, separados por comas (p. ej. 'la de abajo, la del pozo')",
+                max_length=250,
+                verbose_name="alias",
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+INDICES_TRIGRAMAS = {
+    "producto_nombre": "diario_producto_trgm",
+    "problema_fitosanitario": "diario_plaga_trgm",
+}
+
+
+def _indices():
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models.functions import Upper
+
+    # Misma expresión que gestion.servicios.historico.vector_busqueda()
+    indices = [
+        GinIndex(
+            SearchVector(
+                "producto_nombre",
+                "problema_fitosanitario",
+                "observaciones",
+                config="spanish",
+            ),
+            name="diario_busqueda_gin",
+        )
+    ]
+    # icontains compara UPPER(campo) LIKE UPPER('%...%')
+    for campo, nombre in INDICES_TRIGRAMAS.items():
+        indices.append(
+            GinIndex(OpClass(Upper(campo), name="gin_trgm_ops"), name=nombre)
+        )
+    return indices
+
+
+def crear_indices(apps, schema_editor):
+    """Índices de búsqueda del histórico; solo existen en PostgreSQL."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    DiarioActividad = apps.get_model("gestion", "DiarioActividad")
+    for indice in _indices():
+        schema_editor.add_index(DiarioActividad, indice)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    DiarioActividad = apps.get_model("gestion", "DiarioActividad")
+    for indice in _indices():
+        schema_editor.remove_index(DiarioActividad, indice)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0008_parcela_alias"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
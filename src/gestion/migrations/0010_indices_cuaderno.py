@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0009_diario_busqueda"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="analisislaboratorio",
+            index=models.Index(
+                fields=["explotacion", "fecha"], name="analisis_expl_fecha"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="diarioactividad",
+            index=models.Index(
+                fields=["explotacion", "tipo", "fecha"], name="diario_expl_tipo_fecha"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="diarioactividad",
+            index=models.Index(
+                fields=["explotacion", "fecha"], name="diario_expl_fecha"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="diarioactividad",
+            index=models.Index(
+                fields=["parcela", "fecha"], name="diario_parcela_fecha"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="registromovimientoproducto",
+            index=models.Index(
+                fields=["explotacion", "fecha"], name="movimiento_expl_fecha"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="semillatratada",
+            index=models.Index(
+                fields=["explotacion", "fecha_siembra"], name="semilla_expl_fecha"
+            ),
+        ),
+    ]
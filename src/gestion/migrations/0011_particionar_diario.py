@@ -0,0 +1,167 @@
+"""
+Convierte gestion_diarioactividad en una tabla particionada por año de ``fecha``
+(particionado declarativo por rango de PostgreSQL). Solo en PostgreSQL; en otras
+bases de datos no hace nada.
+
+- La clave primaria pasa a ser (id, fecha), porque PostgreSQL exige que incluya
+  la columna de partición. El ORM sigue usando ``id``.
+- ``id`` se numera con una secuencia: PostgreSQL 15 no admite columnas identity
+  en tablas particionadas.
+- Ninguna clave ajena puede apuntar a ``id`` solo, así que se quita la de la
+  tabla intermedia de ``documentos``; Django ya borra esas filas al borrar la
+  actividad.
+- Se crea una partición por cada año con datos, más el actual y el siguiente, y
+  una partición por defecto para el resto. Las siguientes se crean con
+  ``manage.py crear_particiones``.
+"""
+
+import re
+from datetime import date
+
+from django.db import migrations
+
+TABLA = "gestion_diarioactividad"
+ANTIGUA = f"{TABLA}_antigua"
+SECUENCIA = f"{TABLA}_id_seq"
+INTERMEDIA = "gestion_diarioactividad_documentos"
+FK_INTERMEDIA = f"{INTERMEDIA}_diarioactividad_id_fk"
+
+
+def _indices(cursor, tabla):
+    """(nombre, definición) de los índices de ``tabla`` salvo la clave primaria."""
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass AND NOT x.indisprimary
+        """,
+        [tabla],
+    )
+    return cursor.fetchall()
+
+
+def _restricciones(cursor, tabla, tipo):
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = %s
+        """,
+        [tabla, tipo],
+    )
+    return cursor.fetchall()
+
+
+def _apartar_tabla(cursor):
+    """
+    Renombra la tabla actual a ANTIGUA, le quita clave primaria, índices y
+    numeración, y devuelve lo necesario para rehacerlos en la nueva.
+    """
+    cursor.execute(f"ALTER TABLE {TABLA} RENAME TO {ANTIGUA}")
+    indices = _indices(cursor, ANTIGUA)
+    claves_ajenas = _restricciones(cursor, ANTIGUA, "f")
+
+    cursor.execute(f"SELECT pg_get_serial_sequence('{ANTIGUA}', 'id')")
+    secuencia = cursor.fetchone()[0]
+    cursor.execute(f"SELECT nextval('{secuencia}')")
+    siguiente_id = cursor.fetchone()[0]
+
+    for nombre, _ in indices:
+        cursor.execute(f'DROP INDEX "{nombre}"')
+    for nombre, _ in _restricciones(cursor, ANTIGUA, "p"):
+        cursor.execute(f'ALTER TABLE {ANTIGUA} DROP CONSTRAINT "{nombre}"')
+    cursor.execute(f"ALTER TABLE {ANTIGUA} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    cursor.execute(f"ALTER TABLE {ANTIGUA} ALTER COLUMN id DROP DEFAULT")
+    cursor.execute(f"DROP SEQUENCE IF EXISTS {secuencia}")
+    return indices, claves_ajenas, siguiente_id
+
+
+def _completar_tabla(cursor, indices, claves_ajenas):
+    """Copia los datos de ANTIGUA a la nueva tabla, rehace índices y claves ajenas."""
+    cursor.execute(f"INSERT INTO {TABLA} SELECT * FROM {ANTIGUA}")
+    for _, definicion in indices:
+        cursor.execute(
+            re.sub(rf" ON (ONLY )?(\S+\.)?{ANTIGUA} ", f" ON {TABLA} ", definicion)
+        )
+    for nombre, definicion in claves_ajenas:
+        cursor.execute(f'ALTER TABLE {TABLA} ADD CONSTRAINT "{nombre}" {definicion}')
+    cursor.execute(f"DROP TABLE {ANTIGUA} CASCADE")
+
+
+def particionar(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # Claves ajenas que apuntan a la tabla (la de la tabla intermedia)
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE confrelid = %s::regclass AND contype = 'f'
+            """,
+            [TABLA],
+        )
+        for tabla, nombre in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {tabla} DROP CONSTRAINT "{nombre}"')
+
+        indices, claves_ajenas, siguiente_id = _apartar_tabla(cursor)
+
+        cursor.execute(f"""
+            CREATE TABLE {TABLA} (
+                LIKE {ANTIGUA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                PRIMARY KEY (id, fecha)
+            ) PARTITION BY RANGE (fecha)
+            """)
+        cursor.execute(
+            f"CREATE SEQUENCE {SECUENCIA} START WITH {siguiente_id} OWNED BY {TABLA}.id"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLA} ALTER COLUMN id SET DEFAULT nextval('{SECUENCIA}')"
+        )
+
+        cursor.execute(f"SELECT DISTINCT EXTRACT(YEAR FROM fecha)::int FROM {ANTIGUA}")
+        anio_actual = date.today().year
+        anios = {fila[0] for fila in cursor.fetchall()} | {anio_actual, anio_actual + 1}
+        for anio in sorted(anios):
+            cursor.execute(
+                f"CREATE TABLE {TABLA}_{anio} PARTITION OF {TABLA} "
+                f"FOR VALUES FROM ('{anio}-01-01') TO ('{anio + 1}-01-01')"
+            )
+        cursor.execute(f"CREATE TABLE {TABLA}_default PARTITION OF {TABLA} DEFAULT")
+
+        _completar_tabla(cursor, indices, claves_ajenas)
+
+
+def desparticionar(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indices, claves_ajenas, siguiente_id = _apartar_tabla(cursor)
+
+        cursor.execute(
+            f"CREATE TABLE {TABLA} "
+            f"(LIKE {ANTIGUA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(f"ALTER TABLE {TABLA} ALTER COLUMN id DROP DEFAULT")
+        cursor.execute(f"ALTER TABLE {TABLA} ADD PRIMARY KEY (id)")
+        cursor.execute(
+            f"ALTER TABLE {TABLA} ALTER COLUMN id "
+            f"ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {siguiente_id})"
+        )
+
+        _completar_tabla(cursor, indices, claves_ajenas)
+
+        cursor.execute(
+            f"ALTER TABLE {INTERMEDIA} ADD CONSTRAINT {FK_INTERMEDIA} "
+            f"FOREIGN KEY (diarioactividad_id) REFERENCES {TABLA} (id) "
+            f"DEFERRABLE INITIALLY DEFERRED"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0010_indices_cuaderno"),
+    ]
+
+    operations = [
+        migrations.RunPython(particionar, desparticionar),
+    ]
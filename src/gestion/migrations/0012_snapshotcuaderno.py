@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0011_particionar_diario"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SnapshotCuaderno",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("anio", models.PositiveIntegerField(verbose_name="año")),
+                ("seccion", models.CharField(max_length=30, verbose_name="sección")),
+                ("contenido", models.TextField(blank=True)),
+                ("valido", models.BooleanField(default=False)),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("generado_en", models.DateTimeField(blank=True, null=True)),
+                (
+                    "explotacion",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshots_cuaderno",
+                        to="gestion.explotacion",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Snapshot de cuaderno",
+                "verbose_name_plural": "Snapshots de cuaderno",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("explotacion", "anio", "seccion"),
+                        name="snapshot_cuaderno_unico",
+                    )
+                ],
+            },
+        ),
+    ]
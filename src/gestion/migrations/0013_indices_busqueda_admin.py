@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# Campos de texto de search_fields en las tablas grandes del admin (los de las
+# tablas relacionadas se buscan en su tabla y se filtran por la clave ajena).
+# producto_nombre y problema_fitosanitario del diario ya los indexa la 0009.
+INDICES_TRIGRAMAS = {
+    "DiarioActividad": {"observaciones": "diario_observaciones_trgm"},
+    "Parcela": {
+        "referencia_sigpac": "parcela_sigpac_trgm",
+        "poligono": "parcela_poligono_trgm",
+        "parcela": "parcela_parcela_trgm",
+        "recinto": "parcela_recinto_trgm",
+        "especie": "parcela_especie_trgm",
+        "alias": "parcela_alias_trgm",
+    },
+    "SemillaTratada": {
+        "cultivo": "semilla_cultivo_trgm",
+        "producto_fitosanitario": "semilla_producto_trgm",
+        "numero_registro": "semilla_registro_trgm",
+    },
+    "RegistroMovimientoProducto": {
+        "producto": "movimiento_producto_trgm",
+        "numero_albaran": "movimiento_albaran_trgm",
+        "numero_lote": "movimiento_lote_trgm",
+        "cliente_nombre": "movimiento_cliente_trgm",
+        "cliente_nif": "movimiento_cliente_nif_trgm",
+    },
+    "AnalisisLaboratorio": {
+        "material_analizado": "analisis_material_trgm",
+        "cultivo": "analisis_cultivo_trgm",
+        "laboratorio": "analisis_laboratorio_trgm",
+        "numero_boletin": "analisis_boletin_trgm",
+    },
+    "DocumentoDAT": {
+        "numero": "dat_numero_trgm",
+        "producto": "dat_producto_trgm",
+    },
+    "RegistroTransporte": {
+        "referencia": "transporte_referencia_trgm",
+        "dat_numero": "transporte_dat_trgm",
+    },
+}
+
+
+def _indices():
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.db.models.functions import Upper
+
+    # icontains compara UPPER(campo) LIKE UPPER('%...%')
+    for modelo, campos in INDICES_TRIGRAMAS.items():
+        for campo, nombre in campos.items():
+            yield modelo, GinIndex(
+                OpClass(Upper(campo), name="gin_trgm_ops"), name=nombre
+            )
+
+
+def crear_indices(apps, schema_editor):
+    """Índices de la búsqueda del admin; solo existen en PostgreSQL."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for modelo, indice in _indices():
+        schema_editor.add_index(apps.get_model("gestion", modelo), indice)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for modelo, indice in _indices():
+        schema_editor.remove_index(apps.get_model("gestion", modelo), indice)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0012_snapshotcuaderno"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
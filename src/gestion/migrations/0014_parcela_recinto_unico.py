@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:11
+
+import re
+
+from django.db import migrations, models
+
+
+def _numero(valor):
+    valor = (valor or "").strip()
+    return (valor.lstrip("0") or "0") if valor.isdigit() else valor or None
+
+
+def _recinto(referencia):
+    """Polígono, parcela y recinto de una referencia SIGPAC de 7, 5 o 3 números."""
+    numeros = re.findall(r"\d+", referencia or "")
+    if len(numeros) in (3, 5, 7):
+        return tuple(_numero(n) for n in numeros[-3:])
+    return None
+
+
+def completar_recintos(apps, schema_editor):
+    """
+    Prepara la restricción única: polígono/parcela/recinto vacíos pasan a NULL, se
+    quitan los ceros a la izquierda y, si faltan, se sacan de la referencia
+    SIGPAC. Si dos parcelas de una explotación quedarían con el mismo recinto, la
+    segunda se deja sin él (NULL; la referencia SIGPAC no cambia).
+    """
+    Parcela = apps.get_model("gestion", "Parcela")
+    ocupados = set()
+    cambiadas = []
+    for parcela in Parcela.objects.order_by("pk"):
+        actual = (parcela.poligono, parcela.parcela, parcela.recinto)
+        recinto = tuple(_numero(v) for v in actual)
+        if not all(recinto):
+            recinto = _recinto(parcela.referencia_sigpac) or (None, None, None)
+        if not all(recinto):
+            recinto = tuple(_numero(v) for v in actual)
+        elif (parcela.explotacion_id, *recinto) in ocupados:
+            recinto = (None, None, None)
+        else:
+            ocupados.add((parcela.explotacion_id, *recinto))
+        if recinto != actual:
+            parcela.poligono, parcela.parcela, parcela.recinto = recinto
+            cambiadas.append(parcela)
+    Parcela.objects.bulk_update(
+        cambiadas, ["poligono", "parcela", "recinto"], batch_size=500
+    )
+
+
+def vaciar_recintos(apps, schema_editor):
+    Parcela = apps.get_model("gestion", "Parcela")
+    for campo in ("poligono", "parcela", "recinto"):
+        Parcela.objects.filter(**{campo: None}).update(**{campo: ""})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0013_indices_busqueda_admin"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="parcela",
+            name="parcela",
+            field=models.CharField(
+                blank=True, max_length=50, null=True, verbose_name="parcela"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="parcela",
+            name="poligono",
+            field=models.CharField(
+                blank=True, max_length=50, null=True, verbose_name="polígono"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="parcela",
+            name="recinto",
+            field=models.CharField(
+                blank=True, max_length=50, null=True, verbose_name="recinto"
+            ),
+        ),
+        migrations.RunPython(completar_recintos, vaciar_recintos),
+        migrations.AddConstraint(
+            model_name="parcela",
+            constraint=models.UniqueConstraint(
+                fields=("explotacion", "poligono", "parcela", "recinto"),
+                name="parcela_recinto_unico",
+            ),
+        ),
+    ]
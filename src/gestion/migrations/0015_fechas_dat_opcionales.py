@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestion", "0014_parcela_recinto_unico"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="documentodat",
+            name="fecha_emision",
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="lineadat",
+            name="fecha",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="registrotransporte",
+            name="fecha_transporte",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
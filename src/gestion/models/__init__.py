@@ -1,5 +1,6 @@
 from .analisis import AnalisisLaboratorio
 from .contacto import Direccion, Persona
+from .cuaderno import SnapshotCuaderno
 from .destinatario import Destinatario
 from .diario import DiarioActividad, SemillaTratada
 from .dummy import Dummy
@@ -8,7 +9,13 @@ from .movimientos import RegistroMovimientoProducto
 from .operativa import Asesor, EquipoAplicacion
 from .personal import Personal
 from .titular import Titular
-from .transporte import DocumentoDAT, RegistroTransporte, Transportista
+from .transporte import (
+    DocumentoDAT,
+    LineaDAT,
+    RegistroTransporte,
+    SerieDAT,
+    Transportista,
+)
 from .vehiculo import Vehiculo
 
 __all__ = [
@@ -27,7 +34,10 @@ __all__ = [
     "AnalisisLaboratorio",
     "Transportista",
     "DocumentoDAT",
+    "LineaDAT",
     "RegistroTransporte",
+    "SerieDAT",
     "Asesor",
     "EquipoAplicacion",
+    "SnapshotCuaderno",
 ]
@@ -17,3 +17,8 @@ class AnalisisLaboratorio(models.Model):
     )
     laboratorio = models.CharField("laboratorio", max_length=250, blank=True)
     sustancias_activas_detectadas = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["explotacion", "fecha"], name="analisis_expl_fecha"),
+        ]
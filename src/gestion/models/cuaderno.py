@@ -0,0 +1,32 @@
+from django.db import models
+
+
+class SnapshotCuaderno(models.Model):
+    """Texto ya generado de una sección del cuaderno de un año (caché persistente)."""
+
+    explotacion = models.ForeignKey(
+        "gestion.Explotacion",
+        on_delete=models.CASCADE,
+        related_name="snapshots_cuaderno",
+    )
+    anio = models.PositiveIntegerField("año")
+    seccion = models.CharField("sección", max_length=30)
+    contenido = models.TextField(blank=True)
+    valido = models.BooleanField(default=False)
+    # Se incrementa en cada invalidación: un texto generado con datos anteriores
+    # a la última invalidación no se guarda
+    version = models.PositiveIntegerField(default=0)
+    generado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Snapshot de cuaderno"
+        verbose_name_plural = "Snapshots de cuaderno"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["explotacion", "anio", "seccion"],
+                name="snapshot_cuaderno_unico",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.explotacion_id}/{self.anio}/{self.seccion} (v{self.version})"
@@ -100,6 +100,17 @@ class DiarioActividad(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Accesos del cuaderno (por explotación y año, a veces por tipo) y del
+        # histórico por parcela
+        indexes = [
+            models.Index(
+                fields=["explotacion", "tipo", "fecha"], name="diario_expl_tipo_fecha"
+            ),
+            models.Index(fields=["explotacion", "fecha"], name="diario_expl_fecha"),
+            models.Index(fields=["parcela", "fecha"], name="diario_parcela_fecha"),
+        ]
+
 
 class SemillaTratada(models.Model):
     """Registro de uso de semilla tratada."""
@@ -139,3 +150,10 @@ class SemillaTratada(models.Model):
     )
     numero_registro = models.CharField("nº registro", max_length=100, blank=True)
     observaciones = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["explotacion", "fecha_siembra"], name="semilla_expl_fecha"
+            ),
+        ]
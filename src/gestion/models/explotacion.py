@@ -52,9 +52,10 @@ class Parcela(models.Model):
     referencia_sigpac = models.CharField(
         "referencia SIGPAC", max_length=100, blank=True, db_index=True
     )
-    poligono = models.CharField("polígono", max_length=50, blank=True)
-    parcela = models.CharField("parcela", max_length=50, blank=True)
-    recinto = models.CharField("recinto", max_length=50, blank=True)
+    # Nulos (no vacíos) si no se conocen, para que no choquen en la restricción única
+    poligono = models.CharField("polígono", max_length=50, null=True, blank=True)
+    parcela = models.CharField("parcela", max_length=50, null=True, blank=True)
+    recinto = models.CharField("recinto", max_length=50, null=True, blank=True)
     uso_sigpac = models.CharField("uso SIGPAC", max_length=100, blank=True)
     superficie_sigpac = models.DecimalField(
         "superficie SIGPAC (ha)", max_digits=10, decimal_places=4, null=True, blank=True
@@ -72,3 +73,19 @@ class Parcela(models.Model):
     aire_protegido = models.CharField(
         "aire libre / protegido", max_length=20, blank=True
     )
+    alias = models.CharField(
+        "alias",
+        max_length=250,
+        blank=True,
+        help_text="Nombres con los que se conoce la parcela, separados por comas "
+        "(p. ej. 'la de abajo, la del pozo')",
+    )
+
+    class Meta:
+        constraints = [
+            # Clave de la importación de recintos SIGPAC (bulk_create con upsert)
+            models.UniqueConstraint(
+                fields=["explotacion", "poligono", "parcela", "recinto"],
+                name="parcela_recinto_unico",
+            )
+        ]
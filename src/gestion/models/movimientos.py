@@ -30,3 +30,8 @@ class RegistroMovimientoProducto(models.Model):
     cliente_nif = models.CharField("NIF cliente", max_length=30, blank=True)
     cliente_direccion = models.JSONField(null=True, blank=True)
     numero_rgseaa = models.CharField("nº RGSEAA", max_length=100, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["explotacion", "fecha"], name="movimiento_expl_fecha"),
+        ]
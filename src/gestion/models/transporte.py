@@ -24,7 +24,8 @@ class DocumentoDAT(models.Model):
     """Documento de acompañamiento al transporte (DAT)."""
 
     numero = models.CharField(max_length=150, unique=True, db_index=True)
-    fecha_emision = models.DateField(db_index=True)
+    # Vacía en DAT importados cuyo documento no trae el día ni el mes de salida
+    fecha_emision = models.DateField(db_index=True, null=True, blank=True)
     explotacion = models.ForeignKey(
         "gestion.Explotacion",
         null=True,
@@ -40,6 +41,75 @@ class DocumentoDAT(models.Model):
     observaciones = models.TextField(blank=True)
 
 
+class LineaDAT(models.Model):
+    """Línea de carga de un DAT (producto, variedad y cantidad)."""
+
+    documento_dat = models.ForeignKey(
+        "gestion.DocumentoDAT",
+        on_delete=models.CASCADE,
+        related_name="lineas",
+    )
+    orden = models.PositiveSmallIntegerField(default=1)
+    producto = models.CharField(max_length=200)
+    variedad = models.CharField(max_length=150, blank=True)
+    cantidad = models.DecimalField(
+        max_digits=14,
+        decimal_places=6,
+        validators=[MinValueValidator(Decimal("0"))],
+    )
+    unidad = models.CharField(max_length=20, blank=True)
+
+    # Copias del DAT para agregar volúmenes sin joins
+    # (p. ej. kg por producto, destinatario y mes)
+    fecha = models.DateField(null=True, blank=True)
+    destinatario = models.ForeignKey(
+        "gestion.Destinatario",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="lineas_dat",
+    )
+
+    class Meta:
+        verbose_name = "Línea DAT"
+        verbose_name_plural = "Líneas DAT"
+        ordering = ["documento_dat", "orden"]
+        indexes = [
+            models.Index(
+                fields=["fecha", "producto", "destinatario"],
+                name="linea_dat_fecha_prod_dest",
+            ),
+            models.Index(fields=["destinatario", "fecha"], name="linea_dat_dest_fecha"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto} {self.cantidad} {self.unidad}"
+
+
+class SerieDAT(models.Model):
+    """Contador de numeración de DAT por explotación y año."""
+
+    explotacion = models.ForeignKey(
+        "gestion.Explotacion",
+        on_delete=models.CASCADE,
+        related_name="series_dat",
+    )
+    anio = models.PositiveIntegerField("año")
+    ultimo_numero = models.PositiveIntegerField("último número emitido", default=0)
+
+    class Meta:
+        verbose_name = "Serie DAT"
+        verbose_name_plural = "Series DAT"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["explotacion", "anio"], name="serie_dat_unica_por_anio"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.explotacion_id}/{self.anio}: {self.ultimo_numero}"
+
+
 class RegistroTransporte(models.Model):
     """Registro operativo de transporte realizado."""
 
@@ -53,7 +123,7 @@ class RegistroTransporte(models.Model):
     referencia = models.CharField(max_length=120, blank=True, db_index=True)
     dat_numero = models.CharField(max_length=150, blank=True, null=True, db_index=True)
 
-    fecha_transporte = models.DateTimeField(db_index=True)
+    fecha_transporte = models.DateTimeField(db_index=True, null=True, blank=True)
     tiempo_carga = models.DateTimeField(null=True, blank=True)
     tiempo_descarga = models.DateTimeField(null=True, blank=True)
 
@@ -0,0 +1,3 @@
+"""
+Lógica de dominio compartida por las herramientas MCP y los comandos de gestión.
+"""
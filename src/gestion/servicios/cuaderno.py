@@ -0,0 +1,557 @@
+"""
+Generación del Cuaderno de Explotación en texto.
+
+El cuaderno se produce por trozos (``lineas_cuaderno``) sección a sección, y
+los registros de cada sección se leen con ``.iterator(chunk_size=...)``. Así la
+memoria no crece con el nº de tratamientos o abonados, y el texto puede
+escribirse directamente en un fichero (``escribir_cuaderno``) en lugar de
+acumularse en una cadena.
+
+Cada sección generada se guarda en SnapshotCuaderno y se reutiliza hasta que un
+cambio en sus datos la invalida (ver ``gestion.servicios.snapshots``): el
+cuaderno de un año cerrado sale de una sola consulta. Las secciones que se van a
+guardar se generan con los maestros leídos de la BD y no de la caché de
+``maestros``, que puede no tener aún un cambio hecho desde otro proceso.
+
+Las secciones son independientes: desde las herramientas asíncronas,
+``generar_cuaderno_concurrente`` genera las que no están guardadas a la vez,
+cada una en un hilo del EjecutorBD con su propia conexión.
+"""
+
+import asyncio
+import io
+from datetime import date
+from itertools import chain
+
+from django.utils import timezone
+
+from gestion.models import (
+    AnalisisLaboratorio,
+    DiarioActividad,
+    Parcela,
+    Persona,
+    RegistroMovimientoProducto,
+    SemillaTratada,
+    SnapshotCuaderno,
+)
+from gestion.servicios import maestros
+
+# Filas que se leen de la BD en cada viaje al recorrer una sección
+TAMANO_LOTE = 500
+
+SEPARADOR = (
+    "--------------------------------------------------------------------------------\n"
+)
+
+
+class ErrorCuaderno(Exception):
+    """El cuaderno no se puede generar (p. ej. no hay explotación configurada)."""
+
+
+def _fmt_dir(d):
+    if not d:
+        return "VACÍO"
+    return f"{d.tipo_via or ''} {d.nombre_via or ''} Nº{d.numero or ''}, {d.codigo_postal or ''} {d.localidad or ''} ({d.provincia or ''})"
+
+
+def _primero_y_resto(iterador):
+    """``(primer elemento o None, iterador con todos)`` sin consultar dos veces."""
+    iterador = iter(iterador)
+    primero = next(iterador, None)
+    if primero is None:
+        return None, iter(())
+    return primero, chain([primero], iterador)
+
+
+# ==============================================================================
+# CONSULTAS (compartidas con el cuaderno en PDF)
+# ==============================================================================
+
+
+def datos_generales(explotacion):
+    """
+    Datos de la sección 1.1: titular (o la propia explotación), registros,
+    contacto y representante (``(nombre, nif, tipo)`` o None). Los que faltan
+    son None.
+    """
+    titular = explotacion.titular
+    datos = {
+        "nombre": (
+            f"{titular.nombre} {titular.apellidos or ''}"
+            if titular
+            else explotacion.nombre
+        ),
+        "nif": titular.documento if titular else None,
+        "registro_nacional": explotacion.numero_registro_nacional,
+        "registro_autonomico": explotacion.numero_registro_autonomico,
+        "direccion": explotacion.direccion,
+        "telefono": None,
+        "movil": None,
+        "email": None,
+        "representante": None,
+    }
+    if titular and titular.documento:
+        persona = Persona.objects.filter(nif=titular.documento).first()
+        if persona:
+            datos["nombre"] = persona.nombre
+            datos["telefono"] = persona.telefono
+            datos["movil"] = persona.movil
+            datos["email"] = persona.email
+
+    # Si el tipo es REPRESENTANTE, los datos del titular vinculado son del representante
+    if explotacion.tipo_representacion == "REPRESENTANTE":
+        datos["representante"] = (datos["nombre"], datos["nif"], "Representante Legal")
+    return datos
+
+
+def consulta_parcelas(explotacion):
+    # Ordenadas por alta: su posición es el "Nº de orden" del resto de secciones
+    return Parcela.objects.filter(explotacion=explotacion).order_by("pk")
+
+
+def consulta_tratamientos(explotacion, desde, hasta):
+    return (
+        DiarioActividad.objects.filter(
+            explotacion=explotacion,
+            fecha__range=(desde, hasta),
+            tipo="TRATAMIENTO",
+        )
+        .select_related("parcela", "aplicador", "equipo")
+        .order_by("fecha", "pk")
+    )
+
+
+def consulta_siembras(explotacion, desde, hasta):
+    return (
+        SemillaTratada.objects.filter(
+            explotacion=explotacion,
+            fecha_siembra__range=(desde, hasta),
+        )
+        .select_related("parcela")
+        .order_by("fecha_siembra", "pk")
+    )
+
+
+def consulta_analisis(explotacion, desde, hasta):
+    return AnalisisLaboratorio.objects.filter(
+        explotacion=explotacion, fecha__range=(desde, hasta)
+    ).order_by("fecha", "pk")
+
+
+def consulta_ventas(explotacion, desde, hasta):
+    return RegistroMovimientoProducto.objects.filter(
+        explotacion=explotacion, fecha__range=(desde, hasta)
+    ).order_by("fecha", "pk")
+
+
+def consulta_abonados(explotacion, desde, hasta):
+    return (
+        DiarioActividad.objects.filter(
+            explotacion=explotacion,
+            fecha__range=(desde, hasta),
+            tipo__in=["ABONADO", "RIEGO"],
+        )
+        .select_related("parcela")
+        .order_by("fecha", "pk")
+    )
+
+
+# ==============================================================================
+# SECCIONES
+# ==============================================================================
+
+
+def _seccion_general(explotacion, anio, desde, hasta, lote):
+    datos = datos_generales(explotacion)
+
+    # 1.1 Datos Generales
+    t_nombre = datos["nombre"]
+    t_nif = datos["nif"] or "VACÍO"
+    t_rega = datos["registro_nacional"] or "VACÍO"
+    t_rea = datos["registro_autonomico"] or "VACÍO"
+    t_dir = _fmt_dir(datos["direccion"])
+    t_tel = datos["telefono"] or "VACÍO"
+    t_movil = datos["movil"] or "VACÍO"
+    t_email = datos["email"] or "VACÍO"
+
+    rep_nombre, rep_nif, rep_tipo = (
+        valor or "VACÍO" for valor in datos["representante"] or (None,) * 3
+    )
+
+    yield f"""DATOS PARA CUADERNO DE EXPLOTACIÓN (CAMPAÑA {anio})
+================================================================================
+1. INFORMACIÓN GENERAL
+--------------------------------------------------------------------------------
+1.1 DATOS DE LA EXPLOTACIÓN
+- Titular (Nombre/Razón Social): {t_nombre}
+- NIF: {t_nif}
+- Nº Registro Nacional (REGA): {t_rega}
+- Nº Registro Autonómico (REA): {t_rea}
+- Dirección Completa: {t_dir}
+- Teléfono Fijo: {t_tel} | Móvil: {t_movil}
+- Email: {t_email}
+
+REPRESENTANTE (Si procede):
+- Nombre y Apellidos: {rep_nombre}
+- NIF: {rep_nif}
+- Tipo de Representación: {rep_tipo}
+- Firma y Fecha: (Pendiente manuscrita)
+"""
+
+    # 1.2 Personas/Empresas (Aplicadores)
+    aplicadores = maestros.aplicadores()
+    yield "\n1.2 PERSONAS O EMPRESAS QUE INTERVIENEN (APLICADORES)\n"
+    if not aplicadores:
+        yield "* (VACÍO - Registrar aplicadores en 'Personal' con /nuevo_personal)\n"
+    for i, p in enumerate(aplicadores, 1):
+        # Inferir checkboxes del carné desde el cargo
+        carnet = (p.cargo or "").upper()
+        check_basico = "[X]" if "BASICO" in carnet else "[ ]"
+        check_cualif = "[X]" if "CUALIFICADO" in carnet else "[ ]"
+        check_fumig = "[X]" if "FUMIGADOR" in carnet else "[ ]"
+        check_piloto = "[X]" if "PILOTO" in carnet else "[ ]"
+
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Nombre/Empresa: {p.nombre} {p.apellidos}\n"
+            f"  - NIF: {p.documento}\n"
+            f"  - Nº Inscripción ROPO: {p.documento}\n"
+            f"  - Carné: {check_basico}Básico {check_cualif}Cualif. {check_fumig}Fumigador {check_piloto}Piloto\n"
+            "  - ¿Es Asesor?: [ ] (Marcar si procede)\n"
+        )
+
+    # 1.3 Equipos (Maquinaria)
+    equipos = maestros.equipos(explotacion)
+    yield "\n1.3 EQUIPOS DE APLICACIÓN (MAQUINARIA)\n"
+    if not equipos:
+        yield "* (VACÍO - Registrar en 'EquipoAplicacion' con /nueva_maquina)\n"
+    for i, eq in enumerate(equipos, 1):
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Descripción: {eq.descripcion}\n"
+            f"  - Nº Inscripción ROMA: {eq.numero_inscripcion_roma}\n"
+            f"  - Fecha Adquisición: {eq.fecha_adquisicion or 'VACÍO'}\n"
+            f"  - Fecha Última Inspección (ITEAF): {eq.fecha_ultima_inspeccion or 'VACÍO'}\n"
+        )
+
+    # 1.4 Asesoramiento
+    asesores = maestros.asesores()
+    yield "\n1.4 ASESORAMIENTO (GIP)\n"
+    if not asesores:
+        yield "* (VACÍO - Registrar en 'Asesor' con /nuevo_asesor)\n"
+    for i, a in enumerate(asesores, 1):
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Nombre/Entidad: {a.persona.nombre}\n"
+            f"  - NIF: {a.persona.nif}\n"
+            f"  - Nº Identificación/ROPO: {a.numero_inscripcion_ropo}\n"
+            f"  - Tipo Explotación GIP: {a.tipo_carnet or 'VACÍO'} (Ej: AE, PI, Atrias)\n"
+        )
+
+
+def _seccion_parcelas(explotacion, anio, desde, hasta, lote):
+    yield "\n" + SEPARADOR + "2. IDENTIFICACIÓN DE PARCELAS\n" + SEPARADOR
+
+    # 2.1 Datos Identificativos y Agronómicos
+    yield "2.1 DATOS IDENTIFICATIVOS Y AGRONÓMICOS\n"
+    total = 0
+    parcelas = consulta_parcelas(explotacion)
+    for total, p in enumerate(parcelas.iterator(chunk_size=lote), 1):
+        yield (
+            f"  FILA {total} (Nº Orden: {total}):\n"
+            f"  - Provincia/Municipio/Agregado/Zona: (Ver Ref SIGPAC: {p.referencia_sigpac})\n"
+            f"  - Polígono: {p.poligono or ''} | Parcela: {p.parcela or ''} | Recinto: {p.recinto or ''}\n"
+            f"  - Uso SIGPAC: {p.uso_sigpac or 'VACÍO'}\n"
+            f"  - Superficie SIGPAC: {p.superficie_sigpac or 0} ha\n"
+            f"  - Superficie Cultivada: {p.superficie_cultivada or 0} ha\n"
+            f"  - Especie: {p.especie or 'VACÍO'}\n"
+            f"  - Variedad: {p.variedad or 'VACÍO'}\n"
+            f"  - Secano/Regadío: {p.secano_regadio or 'VACÍO'}\n"
+            f"  - Aire Libre/Protegido: {p.aire_protegido or 'VACÍO'}\n"
+            "  - Sistema Asesoramiento GIP: (Rellenar manual: AE, PI, etc.)\n"
+        )
+    if not total:
+        yield "* (VACÍO - Registrar en 'Parcela' con /nueva_parcela)\n"
+
+    # 2.2 Datos Medioambientales (el modelo no tiene estos campos: una fila por parcela)
+    yield "\n2.2 DATOS MEDIOAMBIENTALES\n"
+    if not total:
+        yield "* (VACÍO)\n"
+    for i in range(1, total + 1):
+        yield (
+            f"  FILA {i} (Parcela Orden {i}):\n"
+            "  - ¿Puntos de agua en parcela?: [ ]SI [ ]NO\n"
+            "  - Distancia a agua (m): \n"
+            "  - Zonas Específicas (Protegidas): [ ]Totalmente [ ]Parcialmente [ ]NO\n"
+        )
+
+
+def _seccion_tratamientos(explotacion, anio, desde, hasta, lote):
+    yield "\n" + SEPARADOR + "3. TRATAMIENTOS FITOSANITARIOS\n" + SEPARADOR
+
+    # 3.1 Registro de Actuaciones
+    yield "3.1 REGISTRO DE ACTUACIONES FITOSANITARIAS\n"
+    tratamientos = consulta_tratamientos(explotacion, desde, hasta)
+    i = 0
+    for i, t in enumerate(tratamientos.iterator(chunk_size=lote), 1):
+        parc_ref = t.parcela.referencia_sigpac if t.parcela else "TODAS"
+        cultivo_txt = (
+            f"{t.parcela.especie} {t.parcela.variedad}" if t.parcela else "Varios"
+        )
+        aplicador_txt = (
+            f"{t.aplicador.nombre} (NIF: {t.aplicador.documento})"
+            if t.aplicador
+            else "VACÍO"
+        )
+        equipo_txt = t.equipo.descripcion if t.equipo else "Manual/Sin equipo"
+
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Id. Parcelas: {parc_ref}\n"
+            f"  - Cultivo/Especie/Variedad: {cultivo_txt}\n"
+            f"  - Fechas: {t.fecha}\n"
+            f"  - Sup. Tratada: {t.superficie_tratada_ha} ha\n"
+            f"  - Problema Fitosanitario: {t.problema_fitosanitario}\n"
+            f"  - Aplicador: {aplicador_txt}\n"
+            f"  - Equipo: {equipo_txt}\n"
+            f"  - Producto (Nombre): {t.producto_nombre}\n"
+            f"  - Producto (Nº Registro): {t.producto_numero_registro or 'VACÍO'}\n"
+            f"  - Dosis: {t.dosis} {t.dosis_text or ''}\n"
+            f"  - Eficacia: {t.eficacia or 'Buena'}\n"
+            f"  - Observaciones: {t.observaciones}\n"
+        )
+    if not i:
+        yield "* (VACÍO - Sin tratamientos registrados en este periodo)\n"
+
+    # 3.2 Semilla Tratada
+    primera, siembras = _primero_y_resto(
+        consulta_siembras(explotacion, desde, hasta).iterator(chunk_size=lote)
+    )
+    yield "\n3.2 USO DE SEMILLA TRATADA\n"
+    yield f"  ¿Aplica Tratamiento? [{'X' if primera else ' '}] SI  [{' ' if primera else 'X'}] NO\n"
+    for i, s in enumerate(siembras, 1):
+        parc_ref = s.parcela.referencia_sigpac if s.parcela else "N/A"
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Fecha Siembra: {s.fecha_siembra}\n"
+            f"  - Id. Parcela: {parc_ref}\n"
+            f"  - Cultivo/Variedad: {s.cultivo}\n"
+            f"  - Sup. Sembrada: {s.superficie_sembrada_ha} ha\n"
+            f"  - Cantidad Semilla: {s.cantidad_semilla_kg} kg\n"
+            f"  - Producto (Nombre): {s.producto_fitosanitario}\n"
+            f"  - Producto (Nº Registro): {s.numero_registro}\n"
+        )
+
+    # 3.3, 3.4, 3.5 (Postcosecha, Locales, Transporte) - Modelos no específicos
+    yield (
+        "\n3.3 TRATAMIENTOS POSTCOSECHA\n"
+        "  ¿Aplica Tratamiento? [ ] SI  [X] NO (Consultar registros manuales si existen)\n"
+        "\n3.4 TRATAMIENTOS LOCALES ALMACENAMIENTO\n"
+        "  ¿Aplica Tratamiento? [ ] SI  [X] NO\n"
+        "\n3.5 TRATAMIENTOS MEDIOS DE TRANSPORTE\n"
+        "  ¿Aplica Tratamiento? [ ] SI  [X] NO\n"
+    )
+
+
+def _seccion_analisis(explotacion, anio, desde, hasta, lote):
+    yield "\n" + SEPARADOR + "4. REGISTRO DE ANÁLISIS (RESIDUOS)\n" + SEPARADOR
+    analisis = consulta_analisis(explotacion, desde, hasta)
+    i = 0
+    for i, an in enumerate(analisis.iterator(chunk_size=lote), 1):
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Fecha: {an.fecha}\n"
+            f"  - Material Analizado: {an.material_analizado} (Veg/Tierra/Agua)\n"
+            f"  - Cultivo/Cosecha Muestreado: {an.cultivo}\n"
+            f"  - Nº Boletín Análisis: {an.numero_boletin}\n"
+            f"  - Laboratorio: {an.laboratorio}\n"
+            f"  - Sustancias Detectadas: {an.sustancias_activas_detectadas}\n"
+        )
+    if not i:
+        yield "* (VACÍO - Registrar con /analisis)\n"
+
+
+def _seccion_cosecha(explotacion, anio, desde, hasta, lote):
+    yield "\n" + SEPARADOR + "5. REGISTRO DE COSECHA COMERCIALIZADA\n" + SEPARADOR
+    ventas = consulta_ventas(explotacion, desde, hasta)
+    i = 0
+    for i, v in enumerate(ventas.iterator(chunk_size=lote), 1):
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Fecha: {v.fecha}\n"
+            f"  - Producto: {v.producto}\n"
+            f"  - Cantidad: {v.cantidad_kg} kg\n"
+            "  - Parcela Origen: (Indicar Nº Orden de Parcela)\n"
+            f"  - Nº Albarán/Factura: {v.numero_albaran}\n"
+            f"  - Nº Lote: {v.numero_lote or 'VACÍO'}\n"
+            f"  - Cliente (Nombre): {v.cliente_nombre}\n"
+            f"  - Cliente (NIF): {v.cliente_nif}\n"
+            f"  - Cliente (RGSEAA): {v.numero_rgseaa or 'VACÍO'}\n"
+        )
+    if not i:
+        yield "* (VACÍO - Registrar con /venta)\n"
+
+
+def _seccion_fertilizacion(explotacion, anio, desde, hasta, lote):
+    yield "\n" + SEPARADOR + "6. REGISTRO DE FERTILIZACIÓN\n" + SEPARADOR
+    abonados = consulta_abonados(explotacion, desde, hasta)
+    i = 0
+    for i, ab in enumerate(abonados.iterator(chunk_size=lote), 1):
+        parc_ref = ab.parcela.referencia_sigpac if ab.parcela else "TODAS"
+        cultivo = ab.parcela.especie if ab.parcela else ""
+        prod_abono = ab.producto_nombre if ab.producto_nombre else "Agua/Riego"
+
+        yield (
+            f"  FILA {i}:\n"
+            f"  - Intervalo Fechas: {ab.fecha}\n"
+            f"  - Nº Orden Parcela: {parc_ref}\n"
+            f"  - Cultivo/Variedad: {cultivo}\n"
+            f"  - Tipo Abono/Producto: {prod_abono}\n"
+            "  - Nº Albarán: (Ver Observaciones)\n"
+            "  - Riqueza NPK: (Ver Observaciones)\n"
+            f"  - Dosis: {ab.dosis}\n"
+            f"  - Tipo Fertilización: {ab.tipo} (F/AF/AC)\n"
+            f"  - Observaciones: {ab.observaciones}\n"
+        )
+    if not i:
+        yield "* (VACÍO - Registrar con /riego)\n"
+
+
+# Secciones del cuaderno, en orden
+SECCIONES = (
+    ("general", _seccion_general),
+    ("parcelas", _seccion_parcelas),
+    ("tratamientos", _seccion_tratamientos),
+    ("analisis", _seccion_analisis),
+    ("cosecha", _seccion_cosecha),
+    ("fertilizacion", _seccion_fertilizacion),
+)
+
+
+# ==============================================================================
+# API
+# ==============================================================================
+
+
+def _explotacion():
+    explotacion = maestros.explotacion_principal()
+    if not explotacion:
+        raise ErrorCuaderno("No hay explotación configurada en el sistema.")
+    return explotacion
+
+
+def lineas_cuaderno(anio, lote=TAMANO_LOTE):
+    """
+    Iterador con el texto del cuaderno de ``anio`` por trozos, generado desde la
+    BD (sin snapshots). Lanza ``ErrorCuaderno`` al llamarla, antes de producir
+    nada, si no hay explotación.
+    """
+    explotacion = _explotacion()
+    desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+    return chain.from_iterable(
+        seccion(explotacion, anio, desde, hasta, lote) for _, seccion in SECCIONES
+    )
+
+
+def _preparar(anio, usar_snapshots):
+    """
+    Explotación y snapshots del cuaderno de ``anio`` por sección. Los que faltan
+    se crean vacíos antes de generar, para que una invalidación durante la
+    generación incremente su versión. Con snapshots, la explotación se lee de la
+    BD, ya que sus datos acaban guardados en la sección general.
+    """
+    if not usar_snapshots:
+        return _explotacion(), {}
+    with maestros.cache.desde_bd():
+        explotacion = _explotacion()
+    snapshots = {
+        s.seccion: s
+        for s in SnapshotCuaderno.objects.filter(explotacion=explotacion, anio=anio)
+    }
+    for nombre, _ in SECCIONES:
+        if nombre not in snapshots:
+            snapshots[nombre], _ = SnapshotCuaderno.objects.get_or_create(
+                explotacion=explotacion, anio=anio, seccion=nombre
+            )
+    return explotacion, snapshots
+
+
+def _escribir_seccion(explotacion, anio, nombre, salida, lote, snapshot=None):
+    """
+    Escribe la sección ``nombre`` en ``salida``. Con ``snapshot``, la genera con
+    los maestros de la BD y la guarda en él salvo que se haya invalidado
+    mientras tanto.
+    """
+    if snapshot is not None and snapshot.valido:
+        salida.write(snapshot.contenido)
+        return
+
+    seccion = dict(SECCIONES)[nombre]
+    desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+    if snapshot is None:
+        for trozo in seccion(explotacion, anio, desde, hasta, lote):
+            salida.write(trozo)
+        return
+
+    trozos = []
+    with maestros.cache.desde_bd():
+        for trozo in seccion(explotacion, anio, desde, hasta, lote):
+            salida.write(trozo)
+            trozos.append(trozo)
+    SnapshotCuaderno.objects.filter(pk=snapshot.pk, version=snapshot.version).update(
+        contenido="".join(trozos), valido=True, generado_en=timezone.now()
+    )
+
+
+def _texto_seccion(explotacion, anio, nombre, lote, snapshot=None):
+    salida = io.StringIO()
+    _escribir_seccion(explotacion, anio, nombre, salida, lote, snapshot)
+    return salida.getvalue()
+
+
+def escribir_cuaderno(anio, salida, lote=TAMANO_LOTE, usar_snapshots=True):
+    """
+    Escribe el cuaderno de ``anio`` en ``salida`` (cualquier objeto con ``write``).
+    Con ``usar_snapshots``, las secciones válidas se copian de SnapshotCuaderno
+    y las demás se generan y se guardan.
+    """
+    if not usar_snapshots:
+        for trozo in lineas_cuaderno(anio, lote):
+            salida.write(trozo)
+        return
+
+    explotacion, snapshots = _preparar(anio, usar_snapshots)
+    for nombre, _ in SECCIONES:
+        _escribir_seccion(explotacion, anio, nombre, salida, lote, snapshots[nombre])
+
+
+def generar_cuaderno(anio, lote=TAMANO_LOTE, usar_snapshots=True):
+    """Texto completo del cuaderno de ``anio``."""
+    salida = io.StringIO()
+    escribir_cuaderno(anio, salida, lote, usar_snapshots)
+    return salida.getvalue()
+
+
+async def generar_cuaderno_concurrente(
+    anio, db, lote=TAMANO_LOTE, usar_snapshots=True, herramienta=None
+):
+    """
+    Igual que ``generar_cuaderno``, pero genera las secciones a la vez con el
+    EjecutorBD ``db`` y las une en orden. Solo hay paralelismo si ``db`` tiene
+    pool de hilos; con un hilo único las secciones se generan una tras otra.
+
+    Cada sección se lee en su propia conexión, así que un registro guardado
+    durante la generación puede aparecer en unas secciones y no en otras (como
+    al generarlas seguidas fuera de una transacción).
+    """
+    explotacion, snapshots = await db(_preparar, herramienta)(anio, usar_snapshots)
+    generar = db(_texto_seccion, herramienta and f"{herramienta} (sección)")
+
+    async def seccion(nombre):
+        snapshot = snapshots.get(nombre)
+        if snapshot is not None and snapshot.valido:
+            return snapshot.contenido
+        return await generar(explotacion, anio, nombre, lote, snapshot)
+
+    textos = await asyncio.gather(*(seccion(nombre) for nombre, _ in SECCIONES))
+    return "".join(textos)
@@ -0,0 +1,472 @@
+"""
+Cuaderno de Explotación en PDF sobre el modelo oficial (``specs/cuaderno_explotacion.pdf``).
+
+La plantilla se lee una sola vez por proceso y se queda en memoria. Cada cuaderno
+dibuja una capa de texto por hoja y la superpone a la página de la plantilla
+correspondiente (ver ``gestion.servicios.plantillas_pdf``).
+
+Las tablas con más filas de las que caben en la página del modelo repiten esa
+página las veces necesarias, numerando las hojas de cada sección ("Hoja nº X de
+la sección nº Y"). Los registros se leen por lotes, hoja a hoja.
+
+Coordenadas: las páginas del modelo son verticales (595 x 842) con ``/Rotate 90``.
+Se usa el sistema de la página sin girar: ``x`` crece hacia abajo en la hoja
+apaisada (filas) e ``y`` hacia la derecha (columnas). El texto se dibuja girado
+90º, igual que el de la plantilla.
+"""
+
+import io
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+from itertools import chain, islice
+
+from django.conf import settings
+from pypdf import PdfReader
+from reportlab.pdfgen.canvas import Canvas
+
+from gestion.servicios import maestros
+from gestion.servicios.cuaderno import (
+    TAMANO_LOTE,
+    consulta_abonados,
+    consulta_analisis,
+    consulta_parcelas,
+    consulta_siembras,
+    consulta_tratamientos,
+    consulta_ventas,
+    datos_generales,
+)
+from gestion.servicios.plantillas_pdf import (
+    FUENTE,
+    ajustar,
+    componer,
+    formatear,
+    leer_plantilla,
+)
+
+RUTA_PLANTILLA = settings.BASE_DIR / "specs" / "cuaderno_explotacion.pdf"
+
+TAMANO = 7
+
+# Tabla del modelo: página (desde 0), borde superior de la primera fila de datos,
+# alto de cada fila, filas por página y bordes de las columnas
+Tabla = namedtuple("Tabla", "pagina primera_fila alto_fila filas columnas")
+
+TABLAS = {
+    "aplicadores": Tabla(
+        3,
+        170.5,
+        17.0,
+        4,
+        (42.3, 105.3, 357.3, 429.3, 510.3, 564.3, 618.3, 663.3, 717.3, 789.3),
+    ),
+    "equipos": Tabla(3, 317.0, 17.0, 4, (42.3, 105.3, 393.3, 483.3, 636.3, 789.3)),
+    "asesores": Tabla(3, 452.9, 17.1, 1, (42.3, 455.3, 613.4, 701.3, 789.3)),
+    "parcelas": Tabla(
+        4,
+        228.5,
+        17.6,
+        10,
+        (42.3, 68.2, 96.3, 177.3, 213.3, 249.3, 285.3, 330.3, 366.3)
+        + (411.3, 456.3, 501.3, 573.3, 636.3, 681.3, 726.3, 789.3),
+    ),
+    "medioambiente": Tabla(5, 249.3, 20.25, 8, (36.7, 106.1, 177.0, 247.9)),
+    "tratamientos": Tabla(
+        6,
+        207.6,
+        19.85,
+        10,
+        (56.6, 97.8, 150.3, 204.4, 247.9, 297.5, 354.2, 403.9, 453.4)
+        + (546.0, 588.2, 624.4, 676.4, 784.9),
+    ),
+    "siembras": Tabla(
+        8,
+        207.5,
+        20.25,
+        4,
+        (36.7, 106.1, 186.3, 276.3, 366.3, 429.3, 492.3, 690.3, 807.3),
+    ),
+    "analisis": Tabla(
+        10, 221.6, 19.85, 9, (55.4, 110.0, 190.5, 302.0, 362.0, 596.6, 786.4)
+    ),
+    "ventas": Tabla(
+        11,
+        181.4,
+        19.86,
+        14,
+        (56.4, 101.0, 158.2, 220.6, 265.9, 312.8, 357.2, 524.3, 596.0, 729.7, 785.0),
+    ),
+    "abonados": Tabla(
+        12,
+        162.4,
+        23.2,
+        13,
+        (36.9, 94.7, 156.3, 202.6, 257.3, 393.3, 465.3, 564.3, 636.3, 725.3, 804.5),
+    ),
+}
+
+# Nº de sección de cada página del modelo (None: portada, índice y anexo)
+SECCION_POR_PAGINA = (None, None, 1, 1, 2, 2, 3, 3, 3, 3, 4, 5, 6, None)
+
+# Cabecera "Explotación/ Titular de la explotación: ____ AÑO: ____" (páginas 3 a 12)
+CABECERA = {"linea": 39.5, "titular": (246.0, 700.0), "anio": (740.0, 795.0)}
+# "Hoja nº ____de la sección nº_____" (páginas con sección)
+PIE = {"linea": 557.6, "hoja": 673.0, "seccion": 758.0}
+
+# Página 2, 1.1 Datos generales: campo -> (línea base, inicio, fin)
+CAMPOS_GENERALES = {
+    "nombre": (212.4, 279.0, 627.0),
+    "nif": (212.4, 658.0, 789.0),
+    "registro_nacional": (232.7, 237.0, 420.0),
+    "registro_autonomico": (232.7, 630.0, 789.0),
+    "via": (253.1, 99.0, 384.0),
+    "localidad": (253.1, 443.0, 555.0),
+    "codigo_postal": (253.1, 609.0, 681.0),
+    "provincia": (253.1, 738.0, 789.0),
+    "telefono": (273.5, 113.0, 312.0),
+    "movil": (273.5, 394.0, 582.0),
+    "email": (273.5, 623.0, 789.0),
+    "rep_nombre": (315.2, 145.0, 623.0),
+    "rep_nif": (315.2, 654.0, 789.0),
+    "rep_tipo": (352.7, 162.0, 389.0),
+}
+
+# Casillas "APLICA TRATAMIENTO: [ ] SI [ ] NO": (página, línea base, y de SI, y de NO)
+CASILLAS = {
+    "siembras": (8, 159.5, 456.4, 487.0),
+    "postcosecha": (8, 345.1, 455.9, 486.5),
+    "locales": (9, 158.7, 455.7, 486.3),
+    "transporte": (9, 352.7, 457.3, 487.9),
+}
+
+
+@lru_cache(maxsize=1)
+def plantilla():
+    """Modelo oficial ya leído, compartido por todos los cuadernos del proceso."""
+    return leer_plantilla(RUTA_PLANTILLA)
+
+
+def _fecha(valor):
+    return valor.strftime("%d/%m/%Y") if valor else ""
+
+
+def _direccion_cliente(direccion):
+    if isinstance(direccion, dict):
+        return ", ".join(str(v) for v in direccion.values() if v)
+    return formatear(direccion)
+
+
+def _escribir(lienzo, linea, inicio, fin, texto, tamano=TAMANO):
+    """Escribe ``texto`` sobre la línea base ``linea`` entre ``inicio`` y ``fin``."""
+    texto = formatear(texto)
+    if not texto:
+        return
+    texto, tamano = ajustar(texto, fin - inicio, tamano)
+    lienzo.setFont(FUENTE, tamano)
+    # El lienzo está girado 90º (ver _capa): el punto (x, y) de la página es (y, -x)
+    lienzo.drawString(inicio, -linea, texto)
+
+
+def _rellenar_tabla(lienzo, tabla, filas):
+    margen = 2.0
+    for i, fila in enumerate(filas):
+        linea = tabla.primera_fila + tabla.alto_fila * (i + 0.5) + TAMANO * 0.35
+        for valor, inicio, fin in zip(fila, tabla.columnas, tabla.columnas[1:]):
+            _escribir(lienzo, linea, inicio + margen, fin - margen, valor)
+
+
+def _marcar(lienzo, casilla, aplica):
+    _, linea, si, no = CASILLAS[casilla]
+    _escribir(lienzo, linea, si + 1, si + 8, "X" if aplica else "", tamano=9)
+    _escribir(lienzo, linea, no + 1, no + 8, "" if aplica else "X", tamano=9)
+
+
+# ==============================================================================
+# FILAS DE CADA TABLA
+# ==============================================================================
+
+
+def _filas_aplicadores():
+    for i, p in enumerate(maestros.aplicadores(), 1):
+        carnet = (p.cargo or "").upper()
+        marcas = ("BASICO", "CUALIFICADO", "FUMIGADOR", "PILOTO")
+        yield (
+            i,
+            f"{p.nombre} {p.apellidos}",
+            p.documento,
+            p.documento,
+            *("X" if marca in carnet else "" for marca in marcas),
+        )
+
+
+def _filas_equipos(explotacion):
+    for i, eq in enumerate(maestros.equipos(explotacion), 1):
+        yield (
+            i,
+            eq.descripcion,
+            eq.numero_inscripcion_roma,
+            _fecha(eq.fecha_adquisicion),
+            _fecha(eq.fecha_ultima_inspeccion),
+        )
+
+
+def _filas_asesores():
+    for a in maestros.asesores():
+        yield (
+            a.persona.nombre,
+            a.persona.nif,
+            a.numero_inscripcion_ropo,
+            a.tipo_carnet,
+        )
+
+
+def _filas_parcelas(explotacion, lote):
+    parcelas = consulta_parcelas(explotacion).iterator(chunk_size=lote)
+    for i, p in enumerate(parcelas, 1):
+        # Referencia SIGPAC: provincia:municipio:agregado:zona:polígono:parcela:recinto
+        partes = (p.referencia_sigpac or "").split(":")
+        provincia, municipio, agregado, zona = (partes + [""] * 4)[:4]
+        yield (
+            i,
+            provincia,
+            municipio,
+            agregado,
+            zona,
+            p.poligono,
+            p.parcela,
+            p.recinto,
+            p.uso_sigpac,
+            p.superficie_sigpac,
+            p.superficie_cultivada,
+            p.especie,
+            p.variedad,
+            p.secano_regadio,
+            p.aire_protegido,
+        )
+
+
+def _filas_medioambiente(explotacion, lote):
+    parcelas = consulta_parcelas(explotacion).values_list("especie", "variedad")
+    for i, (especie, variedad) in enumerate(parcelas.iterator(chunk_size=lote), 1):
+        yield (i, especie, variedad)
+
+
+def _filas_tratamientos(explotacion, desde, hasta, lote, ordenes):
+    tratamientos = consulta_tratamientos(explotacion, desde, hasta)
+    for t in tratamientos.iterator(chunk_size=lote):
+        yield (
+            ordenes.get(t.parcela_id, "TODAS"),
+            t.parcela.especie if t.parcela else "",
+            t.parcela.variedad if t.parcela else "",
+            _fecha(t.fecha),
+            t.superficie_tratada_ha,
+            t.problema_fitosanitario,
+            f"{t.aplicador.nombre} {t.aplicador.apellidos}" if t.aplicador else "",
+            t.equipo.descripcion if t.equipo else "",
+            t.producto_nombre,
+            t.producto_numero_registro,
+            f"{formatear(t.dosis)} {t.dosis_text or ''}".strip(),
+            t.eficacia,
+            t.observaciones,
+        )
+
+
+def _filas_siembras(siembras, ordenes):
+    for s in siembras:
+        yield (
+            _fecha(s.fecha_siembra),
+            ordenes.get(s.parcela_id, ""),
+            s.cultivo,
+            s.parcela.variedad if s.parcela else "",
+            s.superficie_sembrada_ha,
+            s.cantidad_semilla_kg,
+            s.producto_fitosanitario,
+            s.numero_registro,
+        )
+
+
+def _filas_analisis(explotacion, desde, hasta, lote):
+    analisis = consulta_analisis(explotacion, desde, hasta)
+    for an in analisis.iterator(chunk_size=lote):
+        yield (
+            _fecha(an.fecha),
+            an.material_analizado,
+            an.cultivo,
+            an.numero_boletin,
+            an.laboratorio,
+            an.sustancias_activas_detectadas,
+        )
+
+
+def _filas_ventas(explotacion, desde, hasta, lote):
+    ventas = consulta_ventas(explotacion, desde, hasta)
+    for v in ventas.iterator(chunk_size=lote):
+        yield (
+            _fecha(v.fecha),
+            v.producto,
+            v.cantidad_kg,
+            "",
+            v.numero_albaran,
+            v.numero_lote,
+            v.cliente_nombre,
+            v.cliente_nif,
+            _direccion_cliente(v.cliente_direccion),
+            v.numero_rgseaa,
+        )
+
+
+def _filas_abonados(explotacion, desde, hasta, lote, ordenes):
+    abonados = consulta_abonados(explotacion, desde, hasta)
+    for ab in abonados.iterator(chunk_size=lote):
+        yield (
+            _fecha(ab.fecha),
+            ordenes.get(ab.parcela_id, "TODAS"),
+            ab.parcela.especie if ab.parcela else "",
+            ab.parcela.variedad if ab.parcela else "",
+            ab.producto_nombre or "Agua/Riego",
+            "",
+            "",
+            formatear(ab.dosis),
+            ab.tipo,
+            ab.observaciones,
+        )
+
+
+def _paginar(tablas):
+    """
+    Reparte las filas de las tablas de una hoja en páginas del modelo. Produce,
+    por cada página, ``{tabla: filas}``; siempre al menos una (vacía si no hay
+    filas).
+    """
+    pendientes = {nombre: iter(filas) for nombre, filas in tablas.items()}
+    while True:
+        yield {
+            nombre: list(islice(filas, TABLAS[nombre].filas))
+            for nombre, filas in pendientes.items()
+        }
+        quedan = {}
+        for nombre, filas in pendientes.items():
+            siguiente = next(filas, None)
+            if siguiente is not None:
+                quedan[nombre] = chain([siguiente], filas)
+        if not quedan:
+            return
+        pendientes = {nombre: quedan.get(nombre, iter(())) for nombre in pendientes}
+
+
+# ==============================================================================
+# COMPOSICIÓN
+# ==============================================================================
+
+
+def _capa(explotacion, anio, lote):
+    """
+    Dibuja la capa de datos de todas las hojas. Devuelve el PDF de la capa y la
+    página del modelo que va debajo de cada una de sus páginas.
+    """
+    desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+    datos = datos_generales(explotacion)
+    ordenes = {
+        pk: i
+        for i, pk in enumerate(
+            consulta_parcelas(explotacion)
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=lote),
+            1,
+        )
+    }
+    # Postcosecha, locales y transporte no tienen modelo: siempre "NO"
+    aplica = {"siembras": consulta_siembras(explotacion, desde, hasta).exists()}
+    siembras = consulta_siembras(explotacion, desde, hasta).iterator(chunk_size=lote)
+    filas = {
+        "aplicadores": _filas_aplicadores(),
+        "equipos": _filas_equipos(explotacion),
+        "asesores": _filas_asesores(),
+        "parcelas": _filas_parcelas(explotacion, lote),
+        "medioambiente": _filas_medioambiente(explotacion, lote),
+        "tratamientos": _filas_tratamientos(explotacion, desde, hasta, lote, ordenes),
+        "siembras": _filas_siembras(siembras, ordenes),
+        "analisis": _filas_analisis(explotacion, desde, hasta, lote),
+        "ventas": _filas_ventas(explotacion, desde, hasta, lote),
+        "abonados": _filas_abonados(explotacion, desde, hasta, lote, ordenes),
+    }
+    titular = f"{explotacion.nombre} / {datos['nombre']}"
+
+    salida = io.BytesIO()
+    caja = plantilla().pages[0].mediabox
+    lienzo = Canvas(salida, pagesize=(float(caja.width), float(caja.height)))
+    paginas = []
+    hojas_por_seccion = {}
+    for pagina, seccion in enumerate(SECCION_POR_PAGINA):
+        tablas = [nombre for nombre, tabla in TABLAS.items() if tabla.pagina == pagina]
+        for contenido in _paginar({nombre: filas[nombre] for nombre in tablas}):
+            lienzo.rotate(90)
+            if seccion is not None:
+                hoja = hojas_por_seccion[seccion] = (
+                    hojas_por_seccion.get(seccion, 0) + 1
+                )
+                _escribir(lienzo, PIE["linea"], PIE["hoja"], PIE["hoja"] + 20, hoja, 9)
+                _escribir(
+                    lienzo,
+                    PIE["linea"],
+                    PIE["seccion"],
+                    PIE["seccion"] + 20,
+                    seccion,
+                    9,
+                )
+                if pagina != 2:
+                    _escribir(
+                        lienzo, CABECERA["linea"], *CABECERA["titular"], titular, 10
+                    )
+                    _escribir(lienzo, CABECERA["linea"], *CABECERA["anio"], anio, 10)
+            if pagina == 2:
+                _datos_generales(lienzo, datos)
+            for casilla, (pagina_casilla, *_) in CASILLAS.items():
+                if pagina_casilla == pagina:
+                    _marcar(lienzo, casilla, aplica.get(casilla, False))
+            for nombre, filas_pagina in contenido.items():
+                _rellenar_tabla(lienzo, TABLAS[nombre], filas_pagina)
+            lienzo.showPage()
+            paginas.append(pagina)
+    lienzo.save()
+    return PdfReader(salida), paginas
+
+
+def _datos_generales(lienzo, datos):
+    direccion = datos["direccion"]
+    valores = {
+        **datos,
+        "via": (
+            " ".join(
+                formatear(v)
+                for v in (direccion.tipo_via, direccion.nombre_via, direccion.numero)
+                if v
+            )
+            if direccion
+            else ""
+        ),
+        "localidad": direccion.localidad if direccion else "",
+        "codigo_postal": direccion.codigo_postal if direccion else "",
+        "provincia": direccion.provincia if direccion else "",
+    }
+    representante = datos["representante"] or ("", "", "")
+    valores["rep_nombre"], valores["rep_nif"], valores["rep_tipo"] = representante
+    for campo, (linea, inicio, fin) in CAMPOS_GENERALES.items():
+        _escribir(lienzo, linea, inicio, fin, valores[campo])
+
+
+def escribir_cuaderno_pdf(explotacion, anio, salida, lote=TAMANO_LOTE):
+    """
+    Escribe en ``salida`` (fichero binario) el cuaderno de ``anio`` de
+    ``explotacion`` sobre el modelo oficial. Devuelve el nº de hojas.
+    """
+    capa, paginas = _capa(explotacion, anio, lote)
+    componer(plantilla(), capa, paginas).write(salida)
+    return len(paginas)
+
+
+def generar_cuaderno_pdf(explotacion, anio, lote=TAMANO_LOTE):
+    """Bytes del cuaderno en PDF."""
+    salida = io.BytesIO()
+    escribir_cuaderno_pdf(explotacion, anio, salida, lote)
+    return salida.getvalue()
@@ -0,0 +1,583 @@
+"""
+Importación de cuadernos de campo antiguos (modelo oficial en Word, como los de
+``specs/Cuaderno agrícola ejemplos``) a las tablas del cuaderno.
+
+Va en dos fases para poder repartir la primera entre procesos:
+
+- ``leer_cuaderno``: sin BD. Lee las tablas del documento (``.doc``, ``.docx`` o
+  texto, ver ``documentos_word``), reconoce cada sección por la última fila de su
+  encabezado y su número de columnas, y devuelve sus filas con los valores ya
+  convertidos (fechas, números) en estructuras simples que se pueden pasar entre
+  procesos.
+- ``cargar_cuaderno``: en una transacción, crea las parcelas que falten y los
+  registros de actividades (3.1 y 6), semillas (3.2), análisis (4) y ventas (5)
+  con ``bulk_create``. Los registros que ya existen no se repiten, así que volver
+  a importar un fichero no duplica nada.
+
+Las parcelas del documento se identifican por polígono/parcela/recinto (o solo
+polígono/parcela si el recinto está vacío, como en los cuadernos antiguos) y las
+que ya existen no se modifican: sus datos actuales valen más que los de un
+cuaderno de hace años. Las filas se enlazan a su parcela por el nº de orden o,
+si no lo tienen, por especie y variedad cuando solo hay una parcela con ellas.
+"""
+
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import models, transaction
+
+from gestion.common import TipoActividad
+from gestion.models import (
+    AnalisisLaboratorio,
+    DiarioActividad,
+    Parcela,
+    Personal,
+    RegistroMovimientoProducto,
+    SemillaTratada,
+)
+from gestion.servicios import maestros, snapshots
+from gestion.servicios.documentos_word import leer_tablas
+from gestion.servicios.parcelas import indice as indice_parcelas
+from gestion.servicios.parcelas import normalizar_texto
+from gestion.servicios.sigpac import ErrorImportacion, normalizar_numero
+
+TAMANO_LOTE = 500
+
+# Sección: texto de una celda de la última fila del encabezado y columnas de sus
+# filas de datos (una sección se reconoce por ambos: varias comparten rótulos)
+SECCIONES = {
+    "parcelas": (
+        "superficie sigpac",
+        (
+            "orden",
+            "provincia",
+            "municipio",
+            "agregado",
+            "zona",
+            "poligono",
+            "parcela",
+            "recinto",
+            "uso_sigpac",
+            "superficie_sigpac",
+            "superficie_cultivada",
+            "especie",
+            "variedad",
+            "secano_regadio",
+            "aire_protegido",
+            "asesoramiento",
+        ),
+    ),
+    "tratamientos": (
+        "nombre comercial",
+        (
+            "parcelas",
+            "especie",
+            "variedad",
+            "fechas",
+            "superficie",
+            "problema",
+            "aplicador",
+            "equipo",
+            "producto",
+            "registro",
+            "dosis",
+            "eficacia",
+            "observaciones",
+        ),
+    ),
+    "semillas": (
+        "materia activa",
+        (
+            "fecha",
+            "parcelas",
+            "especie",
+            "variedad",
+            "superficie",
+            "cantidad",
+            "producto",
+            "registro",
+        ),
+    ),
+    "analisis": (
+        "boletin de analisis",
+        ("fecha", "material", "cultivo", "boletin", "laboratorio", "sustancias"),
+    ),
+    "ventas": (
+        "nombre o razon social",
+        (
+            "fecha",
+            "producto",
+            "cantidad",
+            "parcelas",
+            "albaran",
+            "lote",
+            "cliente",
+            "nif",
+            "direccion",
+            "rgseaa",
+        ),
+    ),
+    "fertilizacion": (
+        "especie",
+        (
+            "fechas",
+            "parcelas",
+            "especie",
+            "variedad",
+            "producto",
+            "albaran",
+            "riqueza",
+            "dosis",
+            "tipo",
+            "observaciones",
+        ),
+    ),
+}
+
+# dd/mm/aa o dd/mm/aaaa; el año de 4 cifras solo si empieza por 19 o 20, para
+# separar fechas pegadas ("15/10/2115/11/21")
+_FECHA = re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-]((?:19|20)\d{2}(?!\d)|\d{2})")
+_RANGO = re.compile(_FECHA.pattern + r"\s*(?:-|al?)\s*" + _FECHA.pattern)
+_NIF = re.compile(r"^NIF:\s*(\S+)", re.IGNORECASE)
+_MILES = re.compile(r"\d{1,3}(\.\d{3})+")
+_NUMERO = re.compile(r"\d+(?:[.,]\d+)*")
+_CUATRO_DECIMALES = Decimal("0.0001")
+
+# Registros que se importan: modelo, campo de fecha y campos que, con la fecha,
+# identifican un registro ya existente (para no duplicarlo al reimportar)
+TIPOS = {
+    "actividades": (
+        DiarioActividad,
+        "fecha",
+        ("tipo", "parcela_id", "producto_nombre", "problema_fitosanitario"),
+    ),
+    "semillas": (
+        SemillaTratada,
+        "fecha_siembra",
+        ("parcela_id", "cultivo", "producto_fitosanitario"),
+    ),
+    "analisis": (
+        AnalisisLaboratorio,
+        "fecha",
+        ("material_analizado", "numero_boletin"),
+    ),
+    "ventas": (
+        RegistroMovimientoProducto,
+        "fecha",
+        ("producto", "numero_albaran", "cantidad_kg"),
+    ),
+}
+
+
+def _fecha(dia, mes, anio):
+    anio = int(anio)
+    if anio < 100:
+        anio += 2000
+    try:
+        return date(anio, int(mes), int(dia))
+    except ValueError:
+        return None
+
+
+def _fechas(texto):
+    """``(fechas, es_intervalo)`` de una celda de fechas."""
+    fechas = [f for f in (_fecha(*m) for m in _FECHA.findall(texto)) if f]
+    return fechas, len(fechas) == 2 and bool(_RANGO.search(texto))
+
+
+def _numero(texto):
+    """Primer número de la celda (coma decimal; punto de miles si agrupa de 3 en 3)."""
+    encontrado = _NUMERO.search(texto.replace(" ", ""))
+    if not encontrado:
+        return None
+    numero = encontrado.group()
+    if "," in numero:
+        numero = numero.replace(".", "").replace(",", ".")
+    elif _MILES.fullmatch(numero):
+        numero = numero.replace(".", "")
+    try:
+        return Decimal(numero)
+    except InvalidOperation:
+        return None
+
+
+def _superficie(texto):
+    numero = _numero(texto)
+    return None if numero is None else numero.quantize(_CUATRO_DECIMALES)
+
+
+def _dosis(texto):
+    """Dosis numérica solo si la celda es un número sin unidades."""
+    return _numero(texto) if _NUMERO.fullmatch(texto.replace(" ", "")) else None
+
+
+def _filas(tablas):
+    """``(sección, fila)`` de cada fila de datos, en el orden del documento."""
+    seccion = columnas = None
+    for tabla in tablas:
+        for celdas in tabla:
+            encabezado = next(
+                (
+                    (nombre, cols)
+                    for nombre, (rotulo, cols) in SECCIONES.items()
+                    if len(celdas) == len(cols)
+                    and any(rotulo in normalizar_texto(c) for c in celdas)
+                ),
+                None,
+            )
+            if encabezado:
+                seccion, columnas = encabezado
+            elif columnas and len(celdas) == len(columnas):
+                if any(celdas):
+                    yield seccion, dict(zip(columnas, celdas))
+            else:
+                seccion = columnas = None
+
+
+def _indices_parcelas(fila, parcelas):
+    """Posiciones en ``parcelas`` de las parcelas a las que se refiere la fila."""
+    ordenes = [
+        normalizar_numero(n) for n in re.findall(r"\d+", fila.get("parcelas", ""))
+    ]
+    if ordenes:
+        por_orden = {p["orden"]: i for i, p in enumerate(parcelas)}
+        return [por_orden[o] for o in ordenes if o in por_orden]
+    especie = normalizar_texto(fila.get("especie"))
+    variedad = normalizar_texto(fila.get("variedad"))
+    candidatas = [
+        i
+        for i, p in enumerate(parcelas)
+        if especie
+        and normalizar_texto(p["especie"]) == especie
+        and (not variedad or normalizar_texto(p["variedad"]) == variedad)
+    ]
+    return candidatas if len(candidatas) == 1 else []
+
+
+def _parcela(fila, orden):
+    return {
+        "orden": normalizar_numero(fila["orden"]) or str(orden),
+        "provincia": normalizar_numero(fila["provincia"]),
+        "municipio": fila["municipio"],
+        "poligono": normalizar_numero(fila["poligono"]),
+        "parcela": normalizar_numero(fila["parcela"]),
+        "recinto": normalizar_numero(fila["recinto"]),
+        "uso_sigpac": fila["uso_sigpac"],
+        "superficie_sigpac": _superficie(fila["superficie_sigpac"]),
+        "superficie_cultivada": _superficie(fila["superficie_cultivada"]),
+        "especie": fila["especie"],
+        "variedad": fila["variedad"],
+        "secano_regadio": fila["secano_regadio"].capitalize(),
+        "aire_protegido": fila["aire_protegido"].capitalize(),
+    }
+
+
+def _cultivo(fila):
+    return " ".join(v for v in (fila.get("especie"), fila.get("variedad")) if v)
+
+
+def _actividades(fila, seccion, nombre, parcelas, avisos):
+    """Actividades del diario de una fila de tratamientos (3.1) o fertilización (6)."""
+    fechas, intervalo = _fechas(fila["fechas"])
+    if not fechas:
+        avisos.append(f"{seccion}: fila sin fecha reconocible ({fila['fechas']!r}).")
+        return []
+    if seccion == "fertilizacion" or normalizar_texto(fila["observaciones"]) in (
+        "abonado",
+        "abono",
+    ):
+        # Los cuadernos antiguos anotan a veces el abonado en la tabla 3.1
+        tipo = TipoActividad.ABONADO
+    else:
+        tipo = TipoActividad.TRATAMIENTO
+    extra = {
+        "importado_de": nombre,
+        "cultivo": _cultivo(fila),
+        "parcelas": fila["parcelas"],
+        "fechas": fila["fechas"] if len(fechas) > 1 else "",
+        "albaran": fila.get("albaran", ""),
+        "tipo_fertilizacion": fila.get("tipo", ""),
+    }
+    actividad = {
+        "tipo": tipo,
+        "parcelas": _indices_parcelas(fila, parcelas),
+        "superficie_tratada_ha": _superficie(fila.get("superficie", "")),
+        "problema_fitosanitario": fila.get("problema", ""),
+        "aplicador": fila.get("aplicador", "").upper(),
+        "equipo": fila.get("equipo", ""),
+        "producto_nombre": fila["producto"],
+        "producto_numero_registro": fila.get("registro", ""),
+        "dosis": _dosis(fila["dosis"]),
+        "dosis_text": fila["dosis"],
+        "eficacia": fila.get("eficacia", ""),
+        "observaciones": fila["observaciones"],
+        "insumos": {"riqueza_npk": fila["riqueza"]} if fila.get("riqueza") else None,
+        "datos_extra": {k: v for k, v in extra.items() if v},
+    }
+    # Un intervalo es una sola actividad; varias fechas sueltas, una por fecha
+    return [
+        {**actividad, "fecha": fecha} for fecha in (fechas[:1] if intervalo else fechas)
+    ]
+
+
+def _semilla(fila, fecha, parcelas):
+    return {
+        "fecha_siembra": fecha,
+        "parcelas": _indices_parcelas(fila, parcelas),
+        "cultivo": _cultivo(fila),
+        "superficie_sembrada_ha": _superficie(fila["superficie"]),
+        "cantidad_semilla_kg": _numero(fila["cantidad"]),
+        "producto_fitosanitario": fila["producto"],
+        "numero_registro": fila["registro"],
+    }
+
+
+def _analisis(fila, fecha, parcelas):
+    return {
+        "fecha": fecha,
+        "material_analizado": fila["material"],
+        "cultivo": fila["cultivo"],
+        "numero_boletin": fila["boletin"],
+        "laboratorio": fila["laboratorio"],
+        "sustancias_activas_detectadas": fila["sustancias"],
+    }
+
+
+def _venta(fila, fecha, parcelas):
+    return {
+        "fecha": fecha,
+        "producto": fila["producto"],
+        "cantidad_kg": _numero(fila["cantidad"]),
+        "numero_albaran": fila["albaran"],
+        "numero_lote": fila["lote"],
+        "cliente_nombre": fila["cliente"],
+        "cliente_nif": fila["nif"].upper(),
+        "cliente_direccion": (
+            {"direccion": fila["direccion"]} if fila["direccion"] else None
+        ),
+        "numero_rgseaa": fila["rgseaa"],
+    }
+
+
+# Secciones de una sola fecha: registro del cuaderno leído y cómo se obtiene
+_REGISTROS = {
+    "semillas": ("semillas", _semilla),
+    "analisis": ("analisis", _analisis),
+    "ventas": ("ventas", _venta),
+}
+
+
+def leer_cuaderno(contenido, nombre):
+    """
+    Lee un cuaderno antiguo (``contenido`` en bytes). Devuelve un diccionario con
+    el NIF del titular (``nif``), los registros de cada tipo con los valores ya
+    convertidos y los ``avisos`` de las filas que no se han podido leer. No usa
+    la BD, así que se puede llamar desde un proceso aparte.
+    """
+    tablas = leer_tablas(contenido, nombre)
+    nifs = (_NIF.match(c) for tabla in tablas[:1] for fila in tabla for c in fila)
+    cuaderno = {
+        "nombre": nombre,
+        "nif": next((m.group(1).upper() for m in nifs if m), ""),
+        "parcelas": [],
+        "actividades": [],
+        "semillas": [],
+        "analisis": [],
+        "ventas": [],
+        "avisos": [],
+    }
+    parcelas, avisos = cuaderno["parcelas"], cuaderno["avisos"]
+    for seccion, fila in _filas(tablas):
+        if seccion == "parcelas":
+            parcelas.append(_parcela(fila, len(parcelas) + 1))
+        elif seccion in ("tratamientos", "fertilizacion"):
+            cuaderno["actividades"] += _actividades(
+                fila, seccion, nombre, parcelas, avisos
+            )
+        else:
+            fechas, _ = _fechas(fila["fecha"])
+            if not fechas:
+                avisos.append(
+                    f"{seccion}: fila sin fecha reconocible ({fila['fecha']!r})."
+                )
+                continue
+            registro, convertir = _REGISTROS[seccion]
+            cuaderno[registro].append(convertir(fila, fechas[0], parcelas))
+
+    if not any(cuaderno[r] for r in ("parcelas", *TIPOS)):
+        raise ErrorImportacion(
+            f"{nombre}: no se ha reconocido ninguna tabla del cuaderno con datos."
+        )
+    return cuaderno
+
+
+def _recortar(modelo, datos):
+    """Recorta los textos a la longitud de su columna (las celdas no tienen límite)."""
+    for campo in modelo._meta.concrete_fields:
+        valor = datos.get(campo.attname)
+        if isinstance(campo, models.CharField) and valor and campo.max_length:
+            datos[campo.attname] = valor[: campo.max_length]
+    return datos
+
+
+def _parcelas(explotacion, parcelas):
+    """
+    Parcela (ya guardada) de cada parcela del documento, creando las que no
+    existen. Devuelve ``(parcelas, creadas)``.
+    """
+    existentes = list(
+        Parcela.objects.filter(explotacion=explotacion).only(
+            "poligono", "parcela", "recinto", "superficie_cultivada"
+        )
+    )
+    por_recinto = {(p.poligono, p.parcela, p.recinto): p for p in existentes}
+    por_parcela = {}
+    for p in existentes:
+        por_parcela.setdefault((p.poligono, p.parcela), p)
+
+    resultado, nuevas = [], {}
+    for datos in parcelas:
+        clave = (datos["poligono"], datos["parcela"], datos["recinto"])
+        if not (datos["poligono"] and datos["parcela"]):
+            resultado.append(None)
+            continue
+        parcela = por_recinto.get(clave) or nuevas.get(clave)
+        if not parcela and not datos["recinto"]:
+            parcela = por_parcela.get(clave[:2])
+        if not parcela:
+            if datos["provincia"] and datos["municipio"].isdigit():
+                partes = (datos["provincia"], datos["municipio"], *clave)
+            else:
+                partes = clave
+            campos = {
+                k: datos[k]
+                for k in (
+                    "uso_sigpac",
+                    "superficie_sigpac",
+                    "superficie_cultivada",
+                    "especie",
+                    "variedad",
+                    "secano_regadio",
+                    "aire_protegido",
+                )
+            }
+            campos["superficie_cultivada"] = (
+                campos["superficie_cultivada"] or campos["superficie_sigpac"]
+            )
+            parcela = nuevas[clave] = Parcela(
+                explotacion=explotacion,
+                referencia_sigpac=":".join(p for p in partes if p),
+                poligono=datos["poligono"],
+                parcela=datos["parcela"],
+                recinto=datos["recinto"],
+                **_recortar(Parcela, campos),
+            )
+        resultado.append(parcela)
+
+    Parcela.objects.bulk_create(nuevas.values(), batch_size=TAMANO_LOTE)
+    return resultado, len(nuevas)
+
+
+def _nuevos(modelo, explotacion, campo_fecha, clave, objetos):
+    """Objetos de ``objetos`` cuya ``clave`` no está ya en la BD."""
+    if not objetos:
+        return []
+    fechas = [getattr(o, campo_fecha) for o in objetos]
+    existentes = set(
+        modelo.objects.filter(
+            explotacion=explotacion,
+            **{f"{campo_fecha}__range": (min(fechas), max(fechas))},
+        ).values_list(campo_fecha, *clave)
+    )
+    return [
+        o
+        for o in objetos
+        if (getattr(o, campo_fecha), *(getattr(o, c) for c in clave)) not in existentes
+    ]
+
+
+def _por_parcela(filas, parcelas):
+    """Cada fila con la parcela a la que se refiere (una fila por parcela)."""
+    for fila in filas:
+        fila = dict(fila)
+        indices = fila.pop("parcelas")
+        destino = [parcelas[i] for i in indices if parcelas[i]] or [None]
+        for parcela in destino:
+            yield parcela, fila
+
+
+def _objetos(explotacion, cuaderno, parcelas):
+    """Registros del cuaderno leído como objetos sin guardar, por tipo."""
+    aplicadores = dict(Personal.objects.values_list("documento", "pk"))
+    actividades = []
+    for parcela, datos in _por_parcela(cuaderno["actividades"], parcelas):
+        datos["aplicador_id"] = aplicadores.get(datos.pop("aplicador"))
+        equipo = maestros.equipo_por_nombre(datos.pop("equipo"))
+        datos["equipo_id"] = equipo.pk if equipo else None
+        actividades.append(
+            DiarioActividad(
+                explotacion=explotacion,
+                parcela=parcela,
+                **_recortar(DiarioActividad, datos),
+            )
+        )
+    semillas = [
+        SemillaTratada(
+            explotacion=explotacion, parcela=parcela, **_recortar(SemillaTratada, datos)
+        )
+        for parcela, datos in _por_parcela(cuaderno["semillas"], parcelas)
+    ]
+    return {
+        "actividades": actividades,
+        "semillas": semillas,
+        "analisis": [
+            AnalisisLaboratorio(
+                explotacion=explotacion, **_recortar(AnalisisLaboratorio, datos)
+            )
+            for datos in cuaderno["analisis"]
+        ],
+        "ventas": [
+            RegistroMovimientoProducto(
+                explotacion=explotacion, **_recortar(RegistroMovimientoProducto, datos)
+            )
+            for datos in cuaderno["ventas"]
+        ],
+    }
+
+
+def _secciones(tipo, objeto):
+    """``(sección del cuaderno, año)`` en que aparece un registro creado."""
+    if tipo == "actividades":
+        return snapshots.SECCION_POR_TIPO[objeto.tipo], objeto.fecha.year
+    seccion, campo = snapshots.REGISTROS_CON_FECHA[type(objeto)]
+    return seccion, getattr(objeto, campo).year
+
+
+@transaction.atomic
+def cargar_cuaderno(explotacion, cuaderno):
+    """
+    Guarda en ``explotacion`` lo leído con ``leer_cuaderno``, en bloque y en una
+    sola transacción. Devuelve el número de parcelas y registros creados por
+    tipo, y los ``omitidos`` por existir ya.
+    """
+    parcelas, creadas = _parcelas(explotacion, cuaderno["parcelas"])
+    objetos = _objetos(explotacion, cuaderno, parcelas)
+    resumen = {"parcelas": creadas, "omitidos": 0}
+    secciones_por_anio = {}
+    for tipo, (modelo, campo_fecha, clave) in TIPOS.items():
+        nuevos = _nuevos(modelo, explotacion, campo_fecha, clave, objetos[tipo])
+        modelo.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE)
+        resumen[tipo] = len(nuevos)
+        resumen["omitidos"] += len(objetos[tipo]) - len(nuevos)
+        for objeto in nuevos:
+            seccion, anio = _secciones(tipo, objeto)
+            secciones_por_anio.setdefault(anio, set()).add(seccion)
+
+    # bulk_create no emite señales: snapshots del cuaderno e índice de parcelas
+    for anio, secciones in sorted(secciones_por_anio.items()):
+        snapshots.invalidar(sorted(secciones), explotacion.pk, anio)
+    if creadas:
+        snapshots.invalidar(snapshots.MAESTROS[Parcela], explotacion.pk)
+        transaction.on_commit(indice_parcelas.invalidar)
+    return resumen
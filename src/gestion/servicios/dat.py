@@ -0,0 +1,590 @@
+"""
+Emisión de Documentos de Acompañamiento al Transporte (DAT).
+
+Compartido por las herramientas ``generar_dat`` / ``generar_dats_lote`` del servidor
+MCP y el comando ``generar_dats_lote``. Los datos de todos los DAT de un lote se
+cargan con un número fijo de consultas (una por tabla, con ``__in``), se insertan
+con ``bulk_create`` y los informes se generan en memoria. El PDF oficial se
+rellena con los mismos datos (``gestion.servicios.dat_pdf``).
+"""
+
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q, Subquery, Sum, Value
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from gestion.models import (
+    Destinatario,
+    DocumentoDAT,
+    Explotacion,
+    LineaDAT,
+    Persona,
+    RegistroTransporte,
+    Transportista,
+    Vehiculo,
+)
+from gestion.servicios.numeracion import reservar_numeros_dat
+
+# Campos opcionales de una petición de DAT y su valor por defecto
+# (los mismos parámetros que la herramienta generar_dat)
+CAMPOS_OPCIONALES = {
+    "variedades": [],
+    "matricula_vehiculo": "",
+    "matricula_remolque": "",
+    "nif_transportista": "",
+    "nombre_transportista": "",
+    "telefono_transportista": "",
+    "email_transportista": "",
+    "fecha_entrega_estimada": "",
+    "nombre_autorizado": "",
+    "nif_autorizado": "",
+    "es_ecologico": False,
+    "es_integrada": False,
+    "denominacion_origen": "",
+    "indicacion_geografica": "",
+    "especialidad_tradicional": "",
+    "categoria": "",
+    "naturaleza": "",
+    "finalidad": "",
+    "instrucciones_uso": "",
+    "condiciones_transporte": "",
+}
+
+
+class ErrorDAT(Exception):
+    """Petición de DAT que no se puede emitir (datos incompletos o inexistentes)."""
+
+
+def _primero_que_contiene(objetos, atributo, texto):
+    texto = texto.lower()
+    return next(
+        (o for o in objetos if texto in (getattr(o, atributo) or "").lower()), None
+    )
+
+
+class ContextoDAT:
+    """
+    Datos maestros necesarios para emitir un lote de DAT, cargados de una vez y
+    consultados después en memoria.
+
+    Para un DAT sin matrícula de vehículo explícita son tres consultas
+    (``CONSULTAS_MAXIMAS``), sea cual sea el tamaño del lote:
+
+    1. Parcelas de origen con su explotación, titular y dirección.
+    2. Destinatarios con su dirección y vehículo asignado.
+    3. Personas y transportistas por NIF (``UNION`` de ambas tablas).
+    """
+
+    CONSULTAS_MAXIMAS = 3
+
+    def __init__(self, peticiones):
+        productos = {p["productos"][0] for p in peticiones if p["productos"]}
+        self.explotacion, self.parcelas = self._cargar_explotacion(productos)
+
+        # Destinatarios: coincidencia parcial por nombre, como en generar_dat
+        nombres = {p["nombre_destinatario"] for p in peticiones}
+        filtro = Q()
+        for nombre in nombres:
+            filtro |= Q(nombre__icontains=nombre)
+        candidatos = list(
+            Destinatario.objects.filter(filtro)
+            .select_related("transporte_asignado", "direccion")
+            .order_by("pk")
+        )
+        self.destinatarios = {
+            n: _primero_que_contiene(candidatos, "nombre", n) for n in nombres
+        }
+
+        matriculas = {p["matricula_vehiculo"] for p in peticiones} - {""}
+        self.vehiculos = {}
+        if matriculas:
+            for v in Vehiculo.objects.filter(matricula__in=matriculas):
+                self.vehiculos[v.matricula] = v
+
+        # NIF de transportistas, autorizados, titular y destinatarios
+        nifs_transportista = {p["nif_transportista"] for p in peticiones} - {""}
+        titular = self.explotacion.titular if self.explotacion else None
+        nifs = nifs_transportista | {p["nif_autorizado"] for p in peticiones}
+        nifs |= {d.documento for d in self.destinatarios.values() if d}
+        if titular:
+            nifs.add(titular.documento)
+        elif self.explotacion:
+            nifs.add(self.explotacion.nif)
+        nifs -= {"", None}
+        self.personas, self.transportistas = self._cargar_contactos(
+            nifs, nifs_transportista
+        )
+
+    @staticmethod
+    def _cargar_explotacion(productos):
+        """
+        La explotación de origen (la primera, como en el resto de herramientas) se
+        obtiene junto a las parcelas cuya especie coincide con algún producto, con
+        un LEFT JOIN desde la explotación: si ninguna coincide, la fila llega igual
+        con la parcela a None y no hace falta otra consulta.
+        """
+        primera = Explotacion.objects.order_by("pk").values("pk")[:1]
+        qs = Explotacion.objects.filter(pk=Subquery(primera)).select_related(
+            "titular", "direccion"
+        )
+        if productos:
+            filtro = Q()
+            for producto in productos:
+                filtro |= Q(parcelas__especie__icontains=producto)
+            qs = (
+                qs.annotate(coincidente=FilteredRelation("parcelas", condition=filtro))
+                .select_related("coincidente")
+                .order_by("coincidente__pk")
+            )
+        filas = list(qs)
+        if not filas:
+            return None, []
+        explotacion = filas[0]
+        parcelas = [f.coincidente for f in filas if getattr(f, "coincidente", None)]
+        for parcela in parcelas:
+            parcela.explotacion = explotacion
+        return explotacion, parcelas
+
+    @staticmethod
+    def _cargar_contactos(nifs, nifs_transportista):
+        """Personas y transportistas por NIF en una sola consulta."""
+        personas, transportistas = {}, {}
+        if not nifs:
+            return personas, transportistas
+
+        campos = ("id", "nombre", "nif", "telefono", "email", "movil", "sexo", "tipo")
+        qs = (
+            Persona.objects.filter(nif__in=nifs)
+            .annotate(tipo=Value("P"))
+            .values_list(*campos)
+        )
+        if nifs_transportista:
+            qs = qs.union(
+                Transportista.objects.filter(nif__in=nifs_transportista)
+                .annotate(movil=Value(""), sexo=Value(""), tipo=Value("T"))
+                .values_list(*campos),
+                all=True,
+            )
+
+        # En orden descendente para que, con NIF repetidos, prevalezca el registro
+        # más antiguo (como con .first())
+        for fila in qs.order_by("-id"):
+            contacto = SimpleNamespace(**dict(zip(campos, fila)))
+            destino = transportistas if contacto.tipo == "T" else personas
+            destino[contacto.nif] = contacto
+        return personas, transportistas
+
+    def persona(self, nif):
+        return self.personas.get(nif) if nif else None
+
+    def parcela_origen(self, producto):
+        return _primero_que_contiene(self.parcelas, "especie", producto)
+
+
+def normalizar_peticion(datos):
+    """Completa una petición de DAT con los valores por defecto."""
+    peticion = {**CAMPOS_OPCIONALES, **datos}
+    for campo in ("nombre_destinatario", "productos", "cantidades", "unidades"):
+        if campo not in peticion:
+            raise ErrorDAT(f"Falta el campo obligatorio '{campo}'.")
+    peticion["variedades"] = peticion["variedades"] or []
+    return peticion
+
+
+def _validar(peticion, contexto):
+    productos = peticion["productos"]
+    if not productos or not (
+        len(productos) == len(peticion["cantidades"]) == len(peticion["unidades"])
+    ):
+        return "Las listas de productos, cantidades y unidades deben tener la misma longitud."
+    if not contexto.destinatarios.get(peticion["nombre_destinatario"]):
+        return f"Destinatario '{peticion['nombre_destinatario']}' no encontrado. Créalo con /nuevo_cliente."
+    matricula = peticion["matricula_vehiculo"]
+    if matricula and matricula not in contexto.vehiculos:
+        return f"Vehículo '{matricula}' no encontrado. Créalo con /nuevo_vehiculo."
+    return None
+
+
+@transaction.atomic
+def emitir_datos_dats(peticiones):
+    """
+    Emite un DAT por petición (diccionarios con los parámetros de ``generar_dat``
+    y, opcionalmente, ``matricula_vehiculo``) y devuelve sus datos (``datos_dat``)
+    en el mismo orden. Si alguna petición no es válida no se emite ninguno y se
+    lanza ``ErrorDAT`` con todos los problemas encontrados.
+    """
+    peticiones = [normalizar_peticion(p) for p in peticiones]
+    if not peticiones:
+        return []
+
+    contexto = ContextoDAT(peticiones)
+    if not contexto.explotacion:
+        raise ErrorDAT("No hay Explotación configurada como origen.")
+
+    errores = [
+        (i, error)
+        for i, error in enumerate((_validar(p, contexto) for p in peticiones), 1)
+        if error
+    ]
+    if errores:
+        if len(peticiones) == 1:
+            raise ErrorDAT(errores[0][1])
+        raise ErrorDAT(
+            "No se ha emitido ningún DAT.\n"
+            + "\n".join(f"- DAT {i}: {error}" for i, error in errores)
+        )
+
+    ahora = timezone.localtime()
+    explotacion = contexto.explotacion
+
+    # Bloque de números consecutivos reservado en una sola sentencia, justo antes
+    # de los INSERT para mantener el bloqueo de la serie el menor tiempo posible
+    numeros = reservar_numeros_dat(explotacion, len(peticiones), ahora.year)
+
+    documentos = []
+    for numero, p in zip(numeros, peticiones):
+        destinatario = contexto.destinatarios[p["nombre_destinatario"]]
+        documentos.append(
+            DocumentoDAT(
+                numero=numero,
+                fecha_emision=ahora.date(),
+                explotacion=explotacion,
+                producto=p["productos"][0],
+                cantidad=p["cantidades"][0],
+                unidad=p["unidades"][0],
+                observaciones=f"Destino: {destinatario.nombre}. Eco: {p['es_ecologico']}. Total líneas: {len(p['productos'])}",
+            )
+        )
+    documentos = DocumentoDAT.objects.bulk_create(documentos)
+
+    LineaDAT.objects.bulk_create(
+        LineaDAT(
+            documento_dat=documento,
+            orden=orden,
+            producto=producto,
+            variedad=variedad or "",
+            cantidad=cantidad,
+            unidad=unidad,
+            fecha=documento.fecha_emision,
+            destinatario=contexto.destinatarios[p["nombre_destinatario"]],
+        )
+        for documento, p in zip(documentos, peticiones)
+        for orden, (producto, cantidad, unidad, variedad) in enumerate(
+            zip(
+                p["productos"],
+                p["cantidades"],
+                p["unidades"],
+                p["variedades"] + [""] * (len(p["productos"]) - len(p["variedades"])),
+            ),
+            1,
+        )
+    )
+
+    RegistroTransporte.objects.bulk_create(
+        RegistroTransporte(
+            documento_dat=documento,
+            fecha_transporte=ahora,
+            destinatario=contexto.destinatarios[p["nombre_destinatario"]],
+            vehiculo=_vehiculo(p, contexto),
+            cantidad=p["cantidades"][0],
+            unidad=p["unidades"][0],
+            estado="emitido",
+        )
+        for documento, p in zip(documentos, peticiones)
+    )
+
+    return [
+        datos_dat(p, numero, ahora, contexto) for numero, p in zip(numeros, peticiones)
+    ]
+
+
+def emitir_dats(peticiones):
+    """Como ``emitir_datos_dats``, pero devuelve los informes de texto."""
+    return [renderizar_dat(datos) for datos in emitir_datos_dats(peticiones)]
+
+
+def volumen_por_destinatario_mes(
+    desde, hasta, producto=None, destinatario=None, unidad=None
+):
+    """
+    Cantidad total expedida por producto, destinatario, mes y unidad entre dos
+    fechas (incluidas), en un único GROUP BY sobre ``LineaDAT``.
+    """
+    qs = LineaDAT.objects.filter(fecha__range=(desde, hasta))
+    if producto:
+        qs = qs.filter(producto__icontains=producto)
+    if destinatario:
+        qs = qs.filter(destinatario__nombre__icontains=destinatario)
+    if unidad:
+        qs = qs.filter(unidad__iexact=unidad)
+    return (
+        qs.annotate(mes=TruncMonth("fecha"))
+        .values("mes", "producto", "unidad", "destinatario__nombre")
+        .annotate(
+            total=Sum("cantidad"),
+            lineas=Count("id"),
+            dats=Count("documento_dat", distinct=True),
+        )
+        .order_by("mes", "producto", "destinatario__nombre", "unidad")
+    )
+
+
+def _vehiculo(peticion, contexto):
+    if peticion["matricula_vehiculo"]:
+        return contexto.vehiculos[peticion["matricula_vehiculo"]]
+    return contexto.destinatarios[peticion["nombre_destinatario"]].transporte_asignado
+
+
+def _partes_direccion(d):
+    if not d:
+        return {
+            "via": "",
+            "nombre": "",
+            "num": "",
+            "cp": "",
+            "loc": "",
+            "prov": "",
+            "entidad": "",
+            "pais": "",
+        }
+    return {
+        "via": d.tipo_via or "",
+        "nombre": d.nombre_via or "",
+        "num": d.numero or "",
+        "cp": d.codigo_postal or "",
+        "loc": d.localidad or "",
+        "prov": d.provincia or "",
+        "entidad": d.entidad_poblacion or d.localidad or "",
+        "pais": d.pais or "España",
+    }
+
+
+def datos_dat(p, numero_dat, ahora, contexto):
+    """
+    Datos de un DAT emitido (sin acceso a BD), compartidos por el informe de texto
+    (``renderizar_dat``) y el formulario oficial en PDF (``dat_pdf``).
+    """
+    explotacion = contexto.explotacion
+    destinatario = contexto.destinatarios[p["nombre_destinatario"]]
+    titular = explotacion.titular
+
+    # Transportista: datos indicados, completados con Transportista o Persona
+    tr_nombre = p["nombre_transportista"]
+    tr_tel = p["telefono_transportista"]
+    tr_email = p["email_transportista"]
+
+    if p["nif_transportista"]:
+        transp_db = contexto.transportistas.get(p["nif_transportista"])
+        persona_transp = contexto.persona(p["nif_transportista"])
+        if transp_db:
+            tr_nombre = transp_db.nombre
+            tr_tel = transp_db.telefono or tr_tel
+            tr_email = transp_db.email or tr_email
+        elif persona_transp:
+            tr_nombre = persona_transp.nombre
+            tr_tel = persona_transp.telefono or persona_transp.movil or tr_tel
+            tr_email = persona_transp.email or tr_email
+
+    # Autorizado
+    auth_nom = p["nombre_autorizado"]
+    auth_nif = p["nif_autorizado"]
+
+    persona_auth = contexto.persona(p["nif_autorizado"])
+    if persona_auth:
+        auth_nom = persona_auth.nombre
+
+    if not auth_nom and explotacion.tipo_representacion == "REPRESENTANTE" and titular:
+        auth_nom = titular.nombre
+        auth_nif = titular.documento
+
+    # Datos Titular
+    t_nif = titular.documento if titular else explotacion.nif
+    persona_titular = contexto.persona(t_nif)
+
+    # Datos Destinatario (Extra)
+    persona_dest = contexto.persona(destinatario.documento)
+
+    # Sigpac
+    sigpac = {"prov": "", "mun": "", "pol": "", "par": "", "rec": ""}
+    parcela_origen = contexto.parcela_origen(p["productos"][0])
+    if parcela_origen:
+        sigpac = {
+            "prov": (explotacion.direccion.provincia if explotacion.direccion else ""),
+            "mun": (explotacion.direccion.localidad if explotacion.direccion else ""),
+            "pol": parcela_origen.poligono or "",
+            "par": parcela_origen.parcela or "",
+            "rec": parcela_origen.recinto or "",
+        }
+
+    vehiculo = _vehiculo(p, contexto)
+    variedades = p["variedades"] + [""] * (len(p["productos"]) - len(p["variedades"]))
+
+    return {
+        "numero": numero_dat,
+        "fecha_salida": ahora.strftime("%d/%m/%Y"),
+        "hora_salida": ahora.strftime("%H:%M"),
+        "titular": {
+            "nombre": titular.nombre if titular else explotacion.nombre,
+            "nif": t_nif,
+            "sexo": persona_titular.sexo if persona_titular else "",
+            "direccion": _partes_direccion(explotacion.direccion),
+            "telefono": persona_titular.telefono if persona_titular else "",
+            "movil": persona_titular.movil if persona_titular else "",
+            "email": persona_titular.email if persona_titular else "",
+        },
+        "autorizado": {"nombre": auth_nom, "nif": auth_nif},
+        "explotacion": explotacion.nombre,
+        "sigpac": sigpac,
+        "destinatario": {
+            "nombre": destinatario.nombre,
+            "nif": destinatario.documento,
+            "direccion": _partes_direccion(destinatario.direccion),
+            "telefono": persona_dest.telefono if persona_dest else "",
+            "movil": persona_dest.movil if persona_dest else "",
+            "email": persona_dest.email if persona_dest else "",
+        },
+        "transportista": {
+            "nif": p["nif_transportista"],
+            "nombre": tr_nombre,
+            "matricula_vehiculo": vehiculo.matricula if vehiculo else "",
+            "matricula_remolque": p["matricula_remolque"],
+            "telefono": tr_tel,
+            "email": tr_email,
+        },
+        "fecha_entrega_estimada": p["fecha_entrega_estimada"],
+        "lineas": list(zip(p["productos"], variedades, p["unidades"], p["cantidades"])),
+        "calidad": {
+            campo: p[campo]
+            for campo in (
+                "denominacion_origen",
+                "indicacion_geografica",
+                "especialidad_tradicional",
+                "es_ecologico",
+                "es_integrada",
+                "naturaleza",
+                "finalidad",
+                "categoria",
+                "instrucciones_uso",
+                "condiciones_transporte",
+            )
+        },
+    }
+
+
+def _casilla(marcada, texto_marcada, texto_vacia):
+    return f"[X] {texto_marcada}" if marcada else f"[ ] {texto_vacia}"
+
+
+def renderizar_dat(datos):
+    """Informe de texto de un DAT emitido a partir de ``datos_dat``."""
+    titular = datos["titular"]
+    org = titular["direccion"]
+    dst = datos["destinatario"]["direccion"]
+    destinatario = datos["destinatario"]
+    transportista = datos["transportista"]
+    sigpac_data = datos["sigpac"]
+    calidad = datos["calidad"]
+
+    check_sexo_h = "[X]" if titular["sexo"] == "H" else "[ ]"
+    check_sexo_m = "[X]" if titular["sexo"] == "M" else "[ ]"
+
+    denominacion_origen = calidad["denominacion_origen"]
+    indicacion_geografica = calidad["indicacion_geografica"]
+    especialidad_tradicional = calidad["especialidad_tradicional"]
+    check_dop = _casilla(
+        denominacion_origen,
+        denominacion_origen,
+        "Denominación de Origen Protegida",
+    )
+    check_igp = _casilla(
+        indicacion_geografica,
+        indicacion_geografica,
+        "Indicación Geográfica Protegida",
+    )
+    check_etg = _casilla(
+        especialidad_tradicional,
+        especialidad_tradicional,
+        "Especialidad Tradicional Garantizada",
+    )
+    check_eco = _casilla(
+        calidad["es_ecologico"], "Producción ecológica", "Producción ecológica"
+    )
+    check_int = _casilla(
+        calidad["es_integrada"],
+        "Producción integrada de Andalucía",
+        "Producción integrada de Andalucía",
+    )
+    es_calidad_dif = (
+        "SÍ"
+        if (denominacion_origen or indicacion_geografica or especialidad_tradicional)
+        else "NO"
+    )
+
+    lineas_carga = ""
+    for i, (prod, var, unid, cant) in enumerate(datos["lineas"], 1):
+        lineas_carga += f"\n* LÍNEA {i}:\n - Denominación: {prod}\n - Variedad: {var or 'VACÍO'}\n - Unidad: {unid}\n - Cantidad: {cant}"
+
+    fecha_salida = datos["fecha_salida"]
+
+    return f"""DAT GENERADO: {datos['numero']}
+--------------------------------------------------------------------------------
+1. ORIGEN DEL PORTE
+1.1 TITULAR:
+- Nombre/Razón Social: {titular['nombre']}
+- DNI/NIE/NIF: {titular['nif']} | Sexo: {check_sexo_h}H {check_sexo_m}M
+- Domicilio: {org['via']} {org['nombre']} Nº {org['num']}
+- Entidad Población: {org['entidad']} | Municipio: {org['loc']}
+- Provincia: {org['prov']} | CP: {org['cp']} | País: {org['pais']}
+- Teléfono: {titular['telefono'] or 'VACÍO'} | Móvil: {titular['movil'] or ''} | Email: {titular['email'] or 'VACÍO'}
+- Autorizado: {datos['autorizado']['nombre'] or 'VACÍO'} | DNI Autorizado: {datos['autorizado']['nif'] or 'VACÍO'}
+
+1.2 UNIDAD DE PRODUCCIÓN (SIGPAC):
+- Nombre Explotación: {datos['explotacion']}
+- Provincia: {sigpac_data['prov']} | Municipio: {sigpac_data['mun']}
+- Polígono: {sigpac_data['pol']} | Parcela: {sigpac_data['par']} | Recinto: {sigpac_data['rec']}
+
+--------------------------------------------------------------------------------
+2. DESTINATARIO
+- Nombre/Razón Social: {destinatario['nombre']}
+- DNI/NIE/NIF: {destinatario['nif']}
+- Domicilio: {dst['via']} {dst['nombre']} Nº {dst['num']}
+- Entidad Población: {dst['entidad']} | Municipio: {dst['loc']}
+- Provincia: {dst['prov']} | CP: {dst['cp']} | País: {dst['pais']}
+- Teléfono: {destinatario['telefono']} | Móvil: {destinatario['movil']} | Email: {destinatario['email']}
+
+--------------------------------------------------------------------------------
+3. TRANSPORTISTA / REBUSCADOR
+- NIF: {transportista['nif'] or 'VACÍO'}
+- Nombre: {transportista['nombre'] or '(Rellenar)'}
+- Matrícula Vehículo: {transportista['matricula_vehiculo'] or 'PENDIENTE DE ASIGNAR'}
+- Matrícula Remolque: {transportista['matricula_remolque']}
+- Teléfono: {transportista['telefono'] or 'VACÍO'} | Email: {transportista['email'] or 'VACÍO'}
+
+--------------------------------------------------------------------------------
+4. DATOS DEL PORTE
+- Fecha Salida: {fecha_salida} | Hora: {datos['hora_salida']}
+- Fecha Entrega Estimada: {datos['fecha_entrega_estimada']}
+{lineas_carga}
+
+--------------------------------------------------------------------------------
+5. CALIDAD COMERCIAL
+- ¿Calidad Diferenciada? {es_calidad_dif}
+- {check_dop}
+- {check_igp}
+- {check_etg}
+- {check_eco}
+- {check_int}
+- Naturaleza/Composición: {calidad['naturaleza']}
+- Utilización/Finalidad: {calidad['finalidad']}
+- Categoría: {calidad['categoria']}
+- Instrucciones de uso: {calidad['instrucciones_uso']}
+- Condiciones producción/distribución: {calidad['condiciones_transporte']}
+
+--------------------------------------------------------------------------------
+6 y 7. FIRMAS
+- Lugar: {org['loc']} | Fecha: {fecha_salida}
+- Firma Titular: (Pendiente)
+- Firma Transportista: (Pendiente)
+"""
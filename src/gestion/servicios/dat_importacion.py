@@ -0,0 +1,940 @@
+"""
+Importación en bloque de DAT ya emitidos en PDF sobre el formulario oficial
+(Anexo VI), como los de ``specs/DAT relleno ejemplos/``, para conservar su
+historial de transportes.
+
+Como la de cuadernos antiguos, va en dos fases para poder repartir la primera
+entre procesos:
+
+- ``leer_dat_pdf``: sin BD. Lee cada campo del formulario por su posición, con
+  los rectángulos de ``gestion.servicios.dat_pdf``: de los campos rellenables si
+  el PDF los conserva (sus nombres no sirven: el NIF del transportista está en
+  un campo ``TELEFONO`` y las matrículas en ``FAX``) y, si está aplanado, del
+  texto de la página, situando cada fragmento con las métricas de su fuente (un
+  mismo ``TJ`` lleva varios campos separados por desplazamientos). Un PDF puede
+  traer varios DAT seguidos (los lotes de ``escribir_dats_pdf``): cada uno
+  empieza en la hoja con "Página 1".
+- ``cargar_dats``: en una transacción, crea los destinatarios, vehículos y
+  transportistas que falten y los DocumentoDAT, LineaDAT y RegistroTransporte
+  con ``bulk_create``.
+
+Cada DAT se identifica por el número del margen izquierdo y los que ya existen
+no se vuelven a crear. Los formularios rellenados a mano llevan ahí el código del
+modelo (``CODIGO_MODELO``), no un número: a esos se les asigna uno derivado del
+contenido del fichero, así que importar otra vez el mismo fichero (o una copia)
+tampoco duplica nada.
+"""
+
+import hashlib
+import re
+import unicodedata
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from pypdf import PdfReader
+from pypdf.errors import PdfReadError
+from pypdf.generic import ArrayObject, ContentStream
+
+from gestion.common import TipoDocumento, TipoVehiculo
+from gestion.models import (
+    Destinatario,
+    Direccion,
+    DocumentoDAT,
+    Explotacion,
+    LineaDAT,
+    Persona,
+    RegistroTransporte,
+    Transportista,
+    Vehiculo,
+)
+from gestion.servicios import maestros
+from gestion.servicios.dat_pdf import (
+    CAMPOS,
+    CASILLAS,
+    CODIGOS_POSTALES,
+    LINEAS,
+    MESES,
+    PAGINACION,
+    plantilla,
+)
+from gestion.servicios.numeracion import avanzar_series_dat
+from gestion.servicios.sigpac import ErrorImportacion
+
+TAMANO_LOTE = 500
+
+# Código del modelo oficial: los formularios rellenados a mano lo llevan en el
+# margen donde los emitidos por la aplicación llevan el nº de DAT
+CODIGO_MODELO = "002897/2"
+PREFIJO_SIN_NUMERO = "IMP-"
+# Estado del RegistroTransporte de los DAT importados sin día ni mes de salida
+ESTADO_SIN_FECHA = "revisar"
+
+# Holgura (en puntos) al situar un texto en el rectángulo de su campo
+_HOLGURA = 3
+# Desplazamiento dentro de un TJ (en em) a partir del cual empieza otro campo
+_SALTO_CAMPO = 1.0
+
+_FECHA = re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-]((?:19|20)\d{2}|\d{2})(?!\d)")
+_HORA = re.compile(r"(\d{1,2})[:.h](\d{2})")
+_ANIO = re.compile(r"(?:19|20)\d{2}")
+_NUMERO = re.compile(r"\d+(?:[.,]\d+)*")
+_MILES = re.compile(r"\d{1,3}(\.\d{3})+")
+_DNI = re.compile(r"\d{8}[A-Z]")
+_NIE = re.compile(r"[XYZ]\d{7}[A-Z]")
+_IDENTIDAD = (1, 0, 0, 1, 0, 0)
+
+
+# --- Texto posicionado de una página -------------------------------------------
+
+
+def _multiplicar(a, b):
+    return (
+        a[0] * b[0] + a[1] * b[2],
+        a[0] * b[1] + a[1] * b[3],
+        a[2] * b[0] + a[3] * b[2],
+        a[2] * b[1] + a[3] * b[3],
+        a[4] * b[0] + a[5] * b[2] + b[4],
+        a[4] * b[1] + a[5] * b[3] + b[5],
+    )
+
+
+def _desplazar(matriz, tx, ty=0):
+    return _multiplicar((1, 0, 0, 1, tx, ty), matriz)
+
+
+def _unicode_cmap(flujo):
+    """Código -> texto de un CMap ``ToUnicode`` (``bfchar`` y ``bfrange``)."""
+    datos = flujo.get_object().get_data().decode("latin-1")
+    mapa = {}
+
+    def texto(hexadecimal):
+        return bytes.fromhex(hexadecimal).decode("utf-16-be", "replace")
+
+    for bloque in re.findall(r"beginbfchar(.*?)endbfchar", datos, re.S):
+        for codigo, destino in re.findall(r"<(\w+)>\s*<(\w*)>", bloque):
+            mapa[int(codigo, 16)] = texto(destino)
+    for bloque in re.findall(r"beginbfrange(.*?)endbfrange", datos, re.S):
+        for inicio, fin, destino in re.findall(
+            r"<(\w+)>\s*<(\w+)>\s*(<\w*>|\[[^\]]*\])", bloque
+        ):
+            inicio, fin = int(inicio, 16), int(fin, 16)
+            if destino.startswith("["):
+                for i, valor in enumerate(re.findall(r"<(\w*)>", destino)):
+                    mapa[inicio + i] = texto(valor)
+            else:
+                primero = texto(destino[1:-1])
+                for i in range(fin - inicio + 1):
+                    mapa[inicio + i] = primero[:-1] + chr(ord(primero[-1]) + i)
+    return mapa
+
+
+class _Fuente:
+    """Decodificación y anchos de glifo de una fuente de la página."""
+
+    def __init__(self, fuente):
+        fuente = fuente.get_object()
+        self.compuesta = fuente.get("/Subtype") == "/Type0"
+        self.unicode = (
+            _unicode_cmap(fuente["/ToUnicode"]) if "/ToUnicode" in fuente else {}
+        )
+        self.anchos = {}
+        if self.compuesta:
+            descendiente = fuente["/DescendantFonts"][0].get_object()
+            self.ancho_defecto = float(descendiente.get("/DW", 1000))
+            anchos = [w.get_object() for w in descendiente.get("/W", [])]
+            i = 0
+            while i + 1 < len(anchos):
+                if isinstance(anchos[i + 1], list):
+                    # c [w1 w2 ...]
+                    for k, ancho in enumerate(anchos[i + 1]):
+                        self.anchos[int(anchos[i]) + k] = float(ancho)
+                    i += 2
+                else:
+                    # c_primero c_ultimo w
+                    for codigo in range(int(anchos[i]), int(anchos[i + 1]) + 1):
+                        self.anchos[codigo] = float(anchos[i + 2])
+                    i += 3
+        else:
+            descriptor = fuente.get("/FontDescriptor")
+            descriptor = descriptor.get_object() if descriptor else {}
+            self.ancho_defecto = float(descriptor.get("/MissingWidth", 0)) or 500
+            primero = int(fuente.get("/FirstChar", 0))
+            for k, ancho in enumerate(fuente.get("/Widths", [])):
+                self.anchos[primero + k] = float(ancho)
+
+    def glifos(self, cadena):
+        """``(texto, ancho en milésimas de em)`` de cada glifo de una cadena."""
+        datos = cadena if isinstance(cadena, bytes) else cadena.get_original_bytes()
+        if self.compuesta:
+            codigos = [
+                int.from_bytes(datos[i : i + 2], "big")
+                for i in range(0, len(datos) - 1, 2)
+            ]
+        else:
+            codigos = list(datos)
+        for codigo in codigos:
+            if codigo in self.unicode:
+                texto = self.unicode[codigo]
+            elif self.compuesta:
+                texto = chr(codigo)
+            else:
+                texto = bytes([codigo]).decode("cp1252", "replace")
+            yield texto, self.anchos.get(codigo, self.ancho_defecto)
+
+
+def _flujos(pagina):
+    contenido = pagina.get("/Contents")
+    contenido = contenido.get_object() if contenido else []
+    if isinstance(contenido, list):
+        return [flujo.get_object() for flujo in contenido]
+    return [contenido]
+
+
+@lru_cache(maxsize=1)
+def _flujos_plantilla():
+    """
+    Resúmenes de los flujos de contenido de la plantilla de ``dat_pdf``. Los DAT
+    de la aplicación los copian tal cual en cada hoja y no llevan datos, así que
+    no hace falta interpretarlos (son casi todo el contenido de la página).
+    """
+    return frozenset(
+        hashlib.sha1(flujo.get_data()).digest()
+        for pagina in plantilla().pages
+        for flujo in _flujos(pagina)
+    )
+
+
+class _Texto:
+    """
+    Intérprete mínimo del contenido de una página: solo el estado de texto y la
+    matriz de transformación. Devuelve los fragmentos de texto con la posición
+    (en puntos de la página) del inicio de su línea base.
+    """
+
+    def __init__(self, lector):
+        self.lector = lector
+        self.fragmentos = []
+
+    def pagina(self, pagina):
+        flujos = [
+            flujo
+            for flujo in _flujos(pagina)
+            if hashlib.sha1(flujo.get_data()).digest() not in _flujos_plantilla()
+        ]
+        if flujos:
+            self._contenido(ArrayObject(flujos), pagina.get("/Resources"), _IDENTIDAD)
+        return self.fragmentos
+
+    def _contenido(self, contenido, recursos, ctm):
+        if contenido is None:
+            return
+        recursos = recursos.get_object() if recursos else {}
+        fuentes = recursos.get("/Font")
+        fuentes = fuentes.get_object() if fuentes else {}
+        formularios = recursos.get("/XObject")
+        formularios = formularios.get_object() if formularios else {}
+        cargadas, pila = {}, []
+        self.fuente, self.tamano = None, 1
+        self.espaciado = self.palabras = self.interlineado = 0
+        self.escala = 1
+        self.tm = self.tlm = _IDENTIDAD
+        self.actual = None
+        for operandos, operador in ContentStream(contenido, self.lector).operations:
+            if operador == b"q":
+                pila.append(ctm)
+            elif operador == b"Q":
+                ctm = pila.pop() if pila else ctm
+            elif operador == b"cm":
+                ctm = _multiplicar([float(o) for o in operandos], ctm)
+            elif operador in (b"BT", b"ET"):
+                self.tm = self.tlm = _IDENTIDAD
+                self._cerrar()
+            elif operador == b"Tf":
+                nombre = operandos[0]
+                if nombre not in cargadas and nombre in fuentes:
+                    cargadas[nombre] = _Fuente(fuentes[nombre])
+                self.fuente = cargadas.get(nombre)
+                self.tamano = float(operandos[1])
+            elif operador == b"Tc":
+                self.espaciado = float(operandos[0])
+            elif operador == b"Tw":
+                self.palabras = float(operandos[0])
+            elif operador == b"Tz":
+                self.escala = float(operandos[0]) / 100
+            elif operador == b"TL":
+                self.interlineado = float(operandos[0])
+            elif operador in (b"Td", b"TD"):
+                if operador == b"TD":
+                    self.interlineado = -float(operandos[1])
+                self._linea(float(operandos[0]), float(operandos[1]))
+            elif operador == b"Tm":
+                self.tm = self.tlm = tuple(float(o) for o in operandos)
+                self._cerrar()
+            elif operador == b"T*":
+                self._linea(0, -self.interlineado)
+            elif operador == b"Tj":
+                self._mostrar(operandos[:1], ctm)
+            elif operador == b"TJ":
+                self._mostrar(operandos[0], ctm)
+            elif operador == b"'":
+                self._linea(0, -self.interlineado)
+                self._mostrar(operandos[:1], ctm)
+            elif operador == b'"':
+                self.palabras, self.espaciado = float(operandos[0]), float(operandos[1])
+                self._linea(0, -self.interlineado)
+                self._mostrar(operandos[2:3], ctm)
+            elif operador == b"Do" and operandos[0] in formularios:
+                # Los campos aplanados pueden quedar en XObjects de formulario
+                formulario = formularios[operandos[0]].get_object()
+                if formulario.get("/Subtype") == "/Form":
+                    estado = self.__dict__.copy()
+                    matriz = [float(m) for m in formulario.get("/Matrix", _IDENTIDAD)]
+                    self._contenido(
+                        formulario,
+                        formulario.get("/Resources", recursos),
+                        _multiplicar(matriz, ctm),
+                    )
+                    self.__dict__.update(estado, fragmentos=self.fragmentos)
+        self._cerrar()
+
+    def _linea(self, tx, ty):
+        self.tm = self.tlm = _desplazar(self.tlm, tx, ty)
+        self._cerrar()
+
+    def _cerrar(self):
+        if self.actual and self.actual[2].strip():
+            x, y, texto = self.actual
+            self.fragmentos.append((x, y, texto.strip()))
+        self.actual = None
+
+    def _mostrar(self, elementos, ctm):
+        if self.fuente is None:
+            return
+        for elemento in elementos:
+            if isinstance(elemento, (int, float)):
+                salto = -float(elemento) / 1000
+                if salto > _SALTO_CAMPO:
+                    self._cerrar()
+                self.tm = _desplazar(self.tm, salto * self.tamano * self.escala)
+                continue
+            for texto, ancho in self.fuente.glifos(elemento):
+                if self.actual is None:
+                    origen = _multiplicar(self.tm, ctm)
+                    self.actual = [origen[4], origen[5], ""]
+                self.actual[2] += texto.replace("\ufeff", "")
+                avance = ancho / 1000 * self.tamano + self.espaciado
+                if texto == " " and not self.fuente.compuesta:
+                    avance += self.palabras
+                self.tm = _desplazar(self.tm, avance * self.escala)
+
+
+def _widgets(pagina):
+    """Fragmentos de los campos rellenables: el valor en la esquina de su rectángulo."""
+    for anotacion in pagina.get("/Annots") or []:
+        anotacion = anotacion.get_object()
+        if anotacion.get("/Subtype") != "/Widget" or "/Rect" not in anotacion:
+            continue
+        padre = anotacion.get("/Parent")
+        padre = padre.get_object() if padre else {}
+        x0, y0, x1, y1 = (float(c) for c in anotacion["/Rect"])
+        x, y = min(x0, x1) + 2, min(y0, y1) + _HOLGURA
+        if anotacion.get("/FT", padre.get("/FT")) == "/Btn":
+            estado = anotacion.get("/AS", anotacion.get("/V", padre.get("/V")))
+            if estado not in (None, "/Off"):
+                yield x, y, "X"
+            continue
+        valor = anotacion.get("/V", padre.get("/V"))
+        if isinstance(valor, list):
+            valor = " ".join(str(v) for v in valor)
+        if valor is not None and str(valor).strip():
+            yield x, y, str(valor).strip()
+
+
+# --- Campos del formulario ----------------------------------------------------
+
+
+def _zonas(modelo):
+    """
+    ``(clave, rectángulo, completo)`` de cada zona de una página del modelo. Las
+    zonas normales contienen el texto cuya línea base cae en su mitad inferior
+    (la etiqueta del campo queda justo encima); las ``completo``, el que cae en
+    cualquier punto del rectángulo.
+    """
+    zonas = [
+        (("casilla", nombre), rectangulo, False)
+        for nombre, (pagina, *rectangulo) in CASILLAS.items()
+        if pagina == modelo
+    ]
+    zonas += [
+        (("campo", nombre), rectangulo, False)
+        for nombre, (pagina, *rectangulo) in CAMPOS.items()
+        if pagina == modelo
+    ]
+    zonas.append((("numero",), PAGINACION[modelo]["margen"], True))
+    if modelo == 0:
+        zonas += [
+            (("cp", nombre), rectangulo, False)
+            for nombre, (_, *rectangulo) in CODIGOS_POSTALES.items()
+        ]
+        for fila, superior in enumerate(LINEAS["filas"]):
+            for columna, (inicio, fin) in enumerate(LINEAS["columnas"]):
+                rectangulo = (inicio, superior - LINEAS["alto"], fin, superior)
+                zonas.append((("linea", fila, columna), rectangulo, False))
+        zonas.append((("salida",), LINEAS["salida"], True))
+        zonas.append((("entrega",), LINEAS["entrega"], True))
+    return zonas
+
+
+_ZONAS = {modelo: _zonas(modelo) for modelo in PAGINACION}
+
+
+def _en_zona(x, y, rectangulo, completo):
+    x0, y0, x1, y1 = rectangulo
+    if not x0 - _HOLGURA <= x < x1:
+        return False
+    return y0 - _HOLGURA <= y <= (y1 + _HOLGURA if completo else (y0 + y1) / 2)
+
+
+def _clasificar(fragmentos, modelo):
+    """Textos de cada zona de una hoja, de arriba abajo y de izquierda a derecha."""
+    valores = {}
+    for x, y, texto in sorted(fragmentos, key=lambda f: (-round(f[1]), f[0])):
+        for clave, rectangulo, completo in _ZONAS[modelo]:
+            if _en_zona(x, y, rectangulo, completo):
+                valores.setdefault(clave, []).append(texto)
+                break
+    return valores
+
+
+def _paginacion(fragmentos):
+    """Nº de hoja leído en "(Página __ de __)", con la posición de cualquier modelo."""
+    for pie in PAGINACION.values():
+        x0, linea, x1 = pie["pagina"]
+        for x, y, texto in fragmentos:
+            if x0 - 2 <= x <= x1 and abs(y - linea) <= 2.5 and texto.isdigit():
+                return int(texto)
+    return None
+
+
+def _agrupar(hojas):
+    """
+    Hojas de cada DAT del PDF: uno nuevo en cada "Página 1". La última hoja de
+    cada DAT es la segunda página del modelo y las demás, la primera.
+    """
+    dats = []
+    for fragmentos in hojas:
+        if not dats or _paginacion(fragmentos) == 1:
+            dats.append([])
+        dats[-1].append(fragmentos)
+    return [
+        [
+            _clasificar(fragmentos, 1 if i == len(dat) - 1 and i else 0)
+            for i, fragmentos in enumerate(dat)
+        ]
+        for dat in dats
+    ]
+
+
+# --- Conversión de valores ------------------------------------------------------
+
+
+def _numero(texto):
+    """Primer número del texto (coma decimal; punto de miles si agrupa de 3 en 3)."""
+    encontrado = _NUMERO.search(texto.replace(" ", ""))
+    if not encontrado:
+        return None
+    numero = encontrado.group()
+    if "," in numero:
+        numero = numero.replace(".", "").replace(",", ".")
+    elif _MILES.fullmatch(numero):
+        numero = numero.replace(".", "")
+    try:
+        return Decimal(numero)
+    except InvalidOperation:
+        return None
+
+
+def _fecha(dia, mes, anio):
+    try:
+        anio = int(anio)
+        return date(anio + 2000 if anio < 100 else anio, int(mes), int(dia))
+    except ValueError:
+        return None
+
+
+def _sin_tildes(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _fecha_firma(campos, apartado):
+    """Fecha de la autorización o la aceptación (el mes, en número o en letra)."""
+    dia, mes = campos[f"{apartado}_dia"], _sin_tildes(campos[f"{apartado}_mes"])
+    anio = _ANIO.search(campos[f"{apartado}_anio"])
+    if not (dia.isdigit() and anio and mes):
+        return None
+    meses = [_sin_tildes(m) for m in MESES]
+    if not mes.isdigit():
+        mes = next((i for i, m in enumerate(meses, 1) if m.startswith(mes[:3])), 0)
+    return _fecha(dia, mes, anio.group())
+
+
+def normalizar_documento(texto):
+    """NIF o matrícula sin espacios, guiones ni puntos y en mayúsculas."""
+    return re.sub(r"[\s.\-]", "", texto or "").upper()
+
+
+def _texto(valores, clave, separador=" "):
+    return separador.join(valores.get(clave, [])).strip()
+
+
+def _dat(hojas, nombre, numero_sin_codigo):
+    """Datos de un DAT a partir de los textos de sus hojas."""
+    principal = {}
+    for valores in reversed(hojas):
+        principal.update(valores)
+    campos = {
+        nombre_campo: _texto(principal, ("campo", nombre_campo))
+        for nombre_campo in CAMPOS
+    }
+    avisos = []
+
+    numero = _texto(principal, ("numero",), "")
+    if not numero or numero == CODIGO_MODELO:
+        numero = numero_sin_codigo
+
+    lineas = []
+    for valores in hojas:
+        for fila in range(len(LINEAS["filas"])):
+            producto, variedad, unidad, cantidad = (
+                _texto(valores, ("linea", fila, columna))
+                for columna in range(len(LINEAS["columnas"]))
+            )
+            if producto:
+                lineas.append(
+                    {
+                        "producto": producto,
+                        "variedad": variedad,
+                        "unidad": unidad,
+                        "cantidad": _numero(cantidad),
+                    }
+                )
+            elif variedad or cantidad:
+                avisos.append(f"Línea {len(lineas) + 1} sin producto: se omite.")
+
+    marcadas = {c for (tipo, *resto) in principal if tipo == "casilla" for c in resto}
+    personas = {}
+    for prefijo in ("titular", "destinatario"):
+        personas[prefijo] = {
+            campo: campos[f"{prefijo}_{campo}"]
+            for campo in (
+                "nombre",
+                "nif",
+                "via",
+                "nombre_via",
+                "numero",
+                "entidad",
+                "municipio",
+                "provincia",
+                "pais",
+                "telefono",
+                "movil",
+                "email",
+            )
+        }
+        personas[prefijo]["nif"] = normalizar_documento(personas[prefijo]["nif"])
+        personas[prefijo]["codigo_postal"] = _texto(principal, ("cp", prefijo), "")
+    if not (personas["titular"]["nif"] or personas["destinatario"]["nombre"] or lineas):
+        raise ErrorImportacion(f"{nombre}: no tiene los campos de un DAT.")
+
+    salida = _texto(principal, ("salida",))
+    hora = _HORA.search(_FECHA.sub("", salida))
+    fecha = next((_fecha(*m) for m in _FECHA.findall(salida)), None)
+    fecha = fecha or _fecha_firma(campos, "autorizacion")
+    fecha = fecha or _fecha_firma(campos, "aceptacion")
+    if fecha:
+        anio = fecha.year
+    else:
+        # Solo el año: se importa sin fecha (para no contarlo en un mes que no es)
+        # y su registro de transporte queda pendiente de revisar
+        encontrado = _ANIO.search(
+            campos["autorizacion_anio"] or campos["aceptacion_anio"]
+        )
+        if not encontrado:
+            raise ErrorImportacion(f"{nombre}: el DAT {numero} no tiene fecha.")
+        anio = int(encontrado.group())
+        avisos.append(
+            f"Sin día ni mes de salida (año {anio}): se importa sin fecha y "
+            "queda pendiente de revisar."
+        )
+
+    return {
+        "numero": numero,
+        "fichero": nombre,
+        "fecha": fecha,
+        "anio": anio,
+        "hora": hora and time(int(hora.group(1)) % 24, int(hora.group(2)) % 60),
+        "fecha_entrega": _texto(principal, ("entrega",)),
+        "explotacion": campos["explotacion"],
+        "titular": personas["titular"],
+        "destinatario": personas["destinatario"],
+        "transportista": {
+            "nif": normalizar_documento(campos["transportista_nif"]),
+            "nombre": campos["aceptacion_firma"],
+            "telefono": campos["transportista_telefono"],
+            "email": campos["transportista_email"],
+            "matricula_vehiculo": normalizar_documento(campos["matricula_vehiculo"]),
+            "matricula_remolque": normalizar_documento(campos["matricula_remolque"]),
+        },
+        "autorizado": campos["autorizacion_firma"],
+        "lineas": lineas,
+        "calidad": {
+            **{
+                campo: campos[campo]
+                for campo in (
+                    "denominacion_origen",
+                    "indicacion_geografica",
+                    "especialidad_tradicional",
+                    "naturaleza",
+                    "finalidad",
+                    "categoria",
+                    "instrucciones_uso",
+                    "condiciones_transporte",
+                )
+            },
+            "es_ecologico": "es_ecologico" in marcadas,
+            "es_integrada": "es_integrada" in marcadas,
+        },
+        "avisos": avisos,
+    }
+
+
+def leer_dat_pdf(contenido, nombre):
+    """
+    Lee los DAT de un PDF (``contenido`` en bytes) sin tocar la BD. Devuelve una
+    lista con los datos de cada DAT (estructuras simples que se pueden pasar
+    entre procesos) y sus ``avisos``. Lanza ErrorImportacion si el PDF no se
+    puede leer o no es un DAT.
+    """
+    try:
+        lector = PdfReader(BytesIO(contenido))
+        hojas = [
+            _Texto(lector).pagina(pagina) + list(_widgets(pagina))
+            for pagina in lector.pages
+        ]
+    except (PdfReadError, ValueError, KeyError, TypeError) as e:
+        raise ErrorImportacion(f"{nombre}: PDF no válido: {e}")
+    dats = _agrupar(hojas)
+    resumen = hashlib.sha1(contenido).hexdigest()[:12].upper()
+    return [
+        _dat(
+            hojas_dat,
+            nombre,
+            f"{PREFIJO_SIN_NUMERO}{resumen}" + (f"-{i}" if len(dats) > 1 else ""),
+        )
+        for i, hojas_dat in enumerate(dats, 1)
+    ]
+
+
+# --- Carga en la BD ---------------------------------------------------------------
+
+
+def _recortar(objetos):
+    """Recorta los textos a la longitud de su columna (los campos del PDF no tienen límite)."""
+    objetos = list(objetos)
+    for objeto in objetos:
+        for campo in objeto._meta.concrete_fields:
+            valor = getattr(objeto, campo.attname)
+            if isinstance(campo, models.CharField) and valor and campo.max_length:
+                setattr(objeto, campo.attname, valor[: campo.max_length])
+    return objetos
+
+
+def _tipo_documento(nif):
+    if _DNI.fullmatch(nif):
+        return TipoDocumento.DNI
+    if _NIE.fullmatch(nif):
+        return TipoDocumento.NIE
+    return None
+
+
+def _tipo_vehiculo(fichero):
+    """Tipo de vehículo si el nombre del fichero lo indica ("DAT ... TRACTOR ...")."""
+    palabras = set(re.findall(r"\w+", _sin_tildes(fichero).upper()))
+    return next((t for t in TipoVehiculo if t in palabras), TipoVehiculo.OTRO)
+
+
+def _explotaciones(dats, explotacion):
+    """Explotación de cada NIF de titular (la principal si no hay ninguna con él)."""
+    if explotacion:
+        return dict.fromkeys((d["titular"]["nif"] for d in dats), explotacion)
+    nifs = {d["titular"]["nif"] for d in dats if d["titular"]["nif"]}
+    por_nif = {}
+    for e in (
+        Explotacion.objects.filter(Q(nif__in=nifs) | Q(titular__documento__in=nifs))
+        .select_related("titular")
+        .order_by("-pk")
+    ):
+        for nif in (e.nif, e.titular and e.titular.documento):
+            if nif in nifs:
+                por_nif[nif] = e
+    principal = maestros.explotacion_principal()
+    return {
+        d["titular"]["nif"]: por_nif.get(d["titular"]["nif"], principal) for d in dats
+    }
+
+
+def _destinatarios(dats):
+    """Destinatario de cada DAT (por NIF o, si no tiene, por nombre), creando los que falten."""
+    nifs = {d["destinatario"]["nif"] for d in dats if d["destinatario"]["nif"]}
+    nombres = {d["destinatario"]["nombre"].upper() for d in dats}
+    por_clave = {}
+    for destinatario in Destinatario.objects.filter(
+        Q(documento__in=nifs) | Q(nombre__in=nombres)
+    ).order_by("-pk"):
+        if destinatario.documento:
+            por_clave[normalizar_documento(destinatario.documento)] = destinatario
+        por_clave[destinatario.nombre.strip().upper()] = destinatario
+
+    def clave(datos):
+        return datos["nif"] or datos["nombre"].upper()
+
+    nuevos = {}
+    for d in dats:
+        datos = d["destinatario"]
+        if datos["nombre"] and not (
+            por_clave.get(datos["nif"]) or por_clave.get(datos["nombre"].upper())
+        ):
+            nuevos.setdefault(clave(datos), datos)
+    direcciones = Direccion.objects.bulk_create(
+        _recortar(
+            Direccion(
+                tipo_via=datos["via"],
+                nombre_via=datos["nombre_via"],
+                numero=datos["numero"],
+                entidad_poblacion=datos["entidad"],
+                localidad=datos["municipio"],
+                provincia=datos["provincia"],
+                pais=datos["pais"] or "ES",
+                codigo_postal=datos["codigo_postal"],
+                telefono=datos["telefono"],
+                movil=datos["movil"],
+                email=datos["email"],
+            )
+            for datos in nuevos.values()
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    creados = Destinatario.objects.bulk_create(
+        _recortar(
+            Destinatario(
+                nombre=datos["nombre"],
+                tipo_documento=_tipo_documento(datos["nif"]),
+                documento=datos["nif"] or None,
+                direccion=direccion,
+            )
+            for datos, direccion in zip(nuevos.values(), direcciones)
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    por_clave.update(zip(nuevos, creados))
+    return (
+        [
+            por_clave.get(d["destinatario"]["nif"])
+            or por_clave.get(d["destinatario"]["nombre"].upper())
+            for d in dats
+        ],
+        len(creados),
+    )
+
+
+def _vehiculos(dats):
+    """Vehículos por matrícula (tractora y remolque), creando los que falten."""
+    tipos = {}
+    for d in dats:
+        transportista = d["transportista"]
+        if transportista["matricula_remolque"]:
+            tipos.setdefault(transportista["matricula_remolque"], TipoVehiculo.REMOLQUE)
+        if transportista["matricula_vehiculo"]:
+            tipos.setdefault(
+                transportista["matricula_vehiculo"], _tipo_vehiculo(d["fichero"])
+            )
+    # Pocos vehículos por explotación: se comparan todos con la matrícula
+    # normalizada, que en la BD puede estar escrita con guiones o espacios
+    vehiculos = {normalizar_documento(v.matricula): v for v in Vehiculo.objects.all()}
+    creados = Vehiculo.objects.bulk_create(
+        _recortar(
+            Vehiculo(tipo=tipo, matricula=matricula)
+            for matricula, tipo in tipos.items()
+            if matricula not in vehiculos
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    vehiculos.update((v.matricula, v) for v in creados)
+    return vehiculos, len(creados)
+
+
+def _transportistas(dats):
+    """Transportistas por NIF, creando los que falten."""
+    nuevos = {}
+    for d in dats:
+        if d["transportista"]["nif"]:
+            nuevos.setdefault(d["transportista"]["nif"], d["transportista"])
+    transportistas = {
+        t.nif: t for t in Transportista.objects.filter(nif__in=nuevos).order_by("-pk")
+    }
+    creados = Transportista.objects.bulk_create(
+        _recortar(
+            Transportista(
+                nombre=datos["nombre"] or nif,
+                nif=nif,
+                telefono=datos["telefono"],
+                email=datos["email"],
+            )
+            for nif, datos in nuevos.items()
+            if nif not in transportistas
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    transportistas.update((t.nif, t) for t in creados)
+    return transportistas, len(creados)
+
+
+def _fecha_transporte(d):
+    if not d["fecha"]:
+        return None
+    momento = datetime.combine(d["fecha"], d["hora"] or time())
+    return timezone.make_aware(momento) if settings.USE_TZ else momento
+
+
+@transaction.atomic
+def cargar_dats(dats, explotacion=None):
+    """
+    Guarda en bloque y en una sola transacción los DAT leídos con
+    ``leer_dat_pdf``, de la explotación de su titular (o de ``explotacion`` si se
+    indica). Los DAT con un número que ya existe (o repetido en ``dats``) se
+    omiten. Las series de numeración avanzan hasta los números importados con el
+    formato de este sistema. Devuelve el número de DAT, destinatarios, vehículos y transportistas
+    creados y de DAT ``omitidos``.
+    """
+    existentes = set(
+        DocumentoDAT.objects.filter(numero__in={d["numero"] for d in dats}).values_list(
+            "numero", flat=True
+        )
+    )
+    nuevos = []
+    for d in dats:
+        if d["numero"] not in existentes:
+            existentes.add(d["numero"])
+            nuevos.append(d)
+    resumen = {
+        "dats": len(nuevos),
+        "omitidos": len(dats) - len(nuevos),
+        "destinatarios": 0,
+        "vehiculos": 0,
+        "transportistas": 0,
+    }
+    if not nuevos:
+        return resumen
+
+    explotaciones = _explotaciones(nuevos, explotacion)
+    destinatarios, resumen["destinatarios"] = _destinatarios(nuevos)
+    vehiculos, resumen["vehiculos"] = _vehiculos(nuevos)
+    transportistas, resumen["transportistas"] = _transportistas(nuevos)
+    personas = {
+        p.nif: p
+        for p in Persona.objects.filter(
+            nif__in={d["titular"]["nif"] for d in nuevos if d["titular"]["nif"]}
+        ).order_by("-pk")
+    }
+
+    documentos = []
+    for d, destinatario in zip(nuevos, destinatarios):
+        primera = d["lineas"][0] if d["lineas"] else {}
+        documentos.append(
+            DocumentoDAT(
+                numero=d["numero"],
+                fecha_emision=d["fecha"],
+                explotacion=explotaciones[d["titular"]["nif"]],
+                producto=primera.get("producto", ""),
+                cantidad=primera.get("cantidad"),
+                unidad=primera.get("unidad", ""),
+                observaciones=(
+                    f"Destino: {destinatario.nombre if destinatario else ''}. "
+                    f"Eco: {d['calidad']['es_ecologico']}. "
+                    f"Total líneas: {len(d['lineas'])}. Importado de {d['fichero']}."
+                    + ("" if d["fecha"] else f" Sin fecha de salida (año {d['anio']}).")
+                ),
+            )
+        )
+    documentos = DocumentoDAT.objects.bulk_create(
+        _recortar(documentos), batch_size=TAMANO_LOTE
+    )
+    avanzar_series_dat(d.numero for d in documentos)
+
+    # LineaDAT exige la cantidad: las líneas sin ella solo quedan en datos_extra
+    LineaDAT.objects.bulk_create(
+        _recortar(
+            LineaDAT(
+                documento_dat=documento,
+                orden=orden,
+                producto=linea["producto"],
+                variedad=linea["variedad"],
+                cantidad=linea["cantidad"],
+                unidad=linea["unidad"],
+                fecha=documento.fecha_emision,
+                destinatario=destinatario,
+            )
+            for documento, d, destinatario in zip(documentos, nuevos, destinatarios)
+            for orden, linea in enumerate(d["lineas"], 1)
+            if linea["cantidad"] is not None
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+
+    RegistroTransporte.objects.bulk_create(
+        _recortar(
+            RegistroTransporte(
+                documento_dat=documento,
+                dat_numero=documento.numero,
+                fecha_transporte=_fecha_transporte(d),
+                explotacion_origen=documento.explotacion,
+                persona_origen=personas.get(d["titular"]["nif"]),
+                destinatario=destinatario,
+                transportista=transportistas.get(d["transportista"]["nif"]),
+                vehiculo=vehiculos.get(d["transportista"]["matricula_vehiculo"]),
+                cantidad=documento.cantidad,
+                unidad=documento.unidad,
+                estado="emitido" if d["fecha"] else ESTADO_SIN_FECHA,
+                datos_extra={
+                    "importado_de": d["fichero"],
+                    "anio": d["anio"],
+                    "explotacion": d["explotacion"],
+                    "matricula_remolque": d["transportista"]["matricula_remolque"],
+                    "fecha_entrega_estimada": d["fecha_entrega"],
+                    "autorizado": d["autorizado"],
+                    "lineas": [
+                        {
+                            **linea,
+                            "cantidad": (
+                                None
+                                if linea["cantidad"] is None
+                                else str(linea["cantidad"])
+                            ),
+                        }
+                        for linea in d["lineas"]
+                    ],
+                    "calidad": d["calidad"],
+                },
+            )
+            for documento, d, destinatario in zip(documentos, nuevos, destinatarios)
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    return resumen
@@ -0,0 +1,407 @@
+"""
+DAT en PDF sobre el formulario oficial (Anexo VI, ``specs/dat_plantilla.pdf``).
+
+La plantilla es el formulario de los ejemplos de ``specs/DAT relleno ejemplos/``
+sin los campos rellenables. Se lee una sola vez por proceso y cada campo del
+formulario se rellena dibujando su valor en la posición del campo original, con
+los mismos datos que el informe de texto (``gestion.servicios.dat.datos_dat``).
+
+Un lote de DAT puede generarse como un único PDF (todas sus hojas comparten la
+plantilla, ver ``gestion.servicios.plantillas_pdf``) o como un ZIP con un PDF por
+DAT que se escribe DAT a DAT, sin tener el lote entero en memoria.
+
+Si un DAT tiene más líneas de carga de las que caben en el apartado 4, la
+primera página del formulario se repite con el resto de líneas.
+"""
+
+import io
+import zipfile
+from functools import lru_cache
+
+from django.conf import settings
+from pypdf import PdfReader
+from reportlab.pdfgen.canvas import Canvas
+
+from gestion.servicios.plantillas_pdf import (
+    FUENTE,
+    ajustar,
+    componer,
+    formatear,
+    leer_plantilla,
+)
+
+RUTA_PLANTILLA = settings.BASE_DIR / "specs" / "dat_plantilla.pdf"
+
+TAMANO = 8
+
+MESES = (
+    "enero",
+    "febrero",
+    "marzo",
+    "abril",
+    "mayo",
+    "junio",
+    "julio",
+    "agosto",
+    "septiembre",
+    "octubre",
+    "noviembre",
+    "diciembre",
+)
+
+# Campos del formulario: nombre -> (página, x0, y0, x1, y1), el rectángulo del
+# campo rellenable original
+CAMPOS = {
+    # 1. Origen del porte: unidad de producción
+    "explotacion": (0, 72, 626, 571, 639),
+    "unidad_entidad": (0, 72, 603, 253, 616),
+    "unidad_municipio": (0, 256, 603, 414, 616),
+    "unidad_provincia": (0, 417, 603, 571, 616),
+    # 1. Origen del porte: titular
+    "titular_nombre": (0, 72, 580, 461, 594),
+    "titular_nif": (0, 502, 580, 571, 594),
+    "titular_via": (0, 72, 549, 132, 563),
+    "titular_nombre_via": (0, 135, 549, 571, 563),
+    "titular_numero": (0, 72, 527, 132, 540),
+    "titular_entidad": (0, 72, 504, 226, 517),
+    "titular_municipio": (0, 229, 504, 383, 517),
+    "titular_provincia": (0, 386, 504, 465, 517),
+    "titular_pais": (0, 468, 504, 529, 517),
+    "titular_telefono": (0, 72, 481, 145, 495),
+    "titular_movil": (0, 147, 481, 220, 495),
+    "titular_email": (0, 223, 481, 571, 495),
+    # 2. Destinatario
+    "destinatario_nombre": (0, 72, 423, 499, 436),
+    "destinatario_nif": (0, 502, 423, 572, 436),
+    "destinatario_via": (0, 72, 392, 132, 405),
+    "destinatario_nombre_via": (0, 135, 392, 572, 405),
+    "destinatario_numero": (0, 72, 369, 132, 383),
+    "destinatario_entidad": (0, 72, 347, 226, 360),
+    "destinatario_municipio": (0, 229, 347, 383, 360),
+    "destinatario_provincia": (0, 386, 347, 465, 360),
+    "destinatario_pais": (0, 468, 347, 529, 360),
+    "destinatario_telefono": (0, 72, 324, 145, 337),
+    "destinatario_movil": (0, 147, 324, 220, 337),
+    "destinatario_email": (0, 223, 324, 571, 337),
+    # 3. Transportista
+    "transportista_nif": (0, 72, 279, 136, 292),
+    "matricula_vehiculo": (0, 139, 279, 226, 292),
+    "matricula_remolque": (0, 228, 279, 362, 291),
+    "transportista_telefono": (0, 365, 279, 416, 291),
+    "transportista_email": (0, 418, 279, 571, 291),
+    # 5. Calidad comercial
+    "denominacion_origen": (1, 274, 738, 567, 747),
+    "indicacion_geografica": (1, 266, 724, 567, 733),
+    "especialidad_tradicional": (1, 280, 710, 567, 719),
+    "naturaleza": (1, 165, 653, 567, 662),
+    "finalidad": (1, 150, 639, 567, 648),
+    "categoria": (1, 116, 624, 567, 634),
+    "instrucciones_uso": (1, 152, 610, 567, 619),
+    "condiciones_transporte": (1, 219, 596, 567, 605),
+    # 6. Autorización (titular) y 7. aceptación (transportista)
+    "autorizacion_lugar": (1, 178, 530, 312, 543),
+    "autorizacion_dia": (1, 320, 530, 351, 543),
+    "autorizacion_mes": (1, 361, 530, 427, 543),
+    "autorizacion_anio": (1, 440, 530, 474, 543),
+    "autorizacion_firma": (1, 206, 449, 455, 461),
+    "aceptacion_lugar": (1, 178, 382, 312, 395),
+    "aceptacion_dia": (1, 320, 382, 351, 395),
+    "aceptacion_mes": (1, 361, 382, 427, 395),
+    "aceptacion_anio": (1, 440, 382, 474, 395),
+    "aceptacion_firma": (1, 206, 298, 455, 310),
+}
+
+# Código postal en casillas de un carácter: nombre -> (página, x0, y0, x1, y1)
+CODIGOS_POSTALES = {
+    "titular": (0, 530, 503, 573, 517),
+    "destinatario": (0, 530, 346, 573, 360),
+}
+
+# Casillas de verificación: nombre -> (página, x0, y0, x1, y1)
+CASILLAS = {
+    "sexo_h": (0, 463, 582, 472, 591),
+    "sexo_m": (0, 480, 582, 489, 591),
+    "calidad_si": (1, 361, 768, 370, 777),
+    "calidad_no": (1, 381, 768, 390, 777),
+    "denominacion_origen": (1, 88, 740, 96, 748),
+    "indicacion_geografica": (1, 88, 726, 96, 734),
+    "especialidad_tradicional": (1, 88, 711, 96, 720),
+    "es_ecologico": (1, 88, 697, 96, 706),
+    "es_integrada": (1, 88, 683, 96, 692),
+}
+
+# 4. Datos del porte: bordes superiores de cada fila, alto de fila y columnas
+# (producto, variedad, unidad, cantidad)
+LINEAS = {
+    "filas": (221, 207, 193),
+    "alto": 11.5,
+    "columnas": ((133, 262), (265, 405), (408, 459), (462, 513)),
+    "salida": (72, 181, 130, 221),
+    "entrega": (516, 181, 571, 221),
+}
+
+# "(Página __ de __)" y nº de DAT en el margen izquierdo, por página del modelo
+PAGINACION = {
+    0: {
+        "pagina": (417, 826.5, 425),
+        "total": (441, 826.5, 449),
+        "margen": (20, 167, 57, 261),
+    },
+    1: {
+        "pagina": (412, 819.5, 421),
+        "total": (437, 819.5, 445),
+        "margen": (23, 170, 54, 258),
+    },
+}
+ANEXO = {0: (454, 825, 571), 1: (449, 818, 568)}
+
+
+@lru_cache(maxsize=1)
+def plantilla():
+    """Formulario oficial ya leído, compartido por todos los DAT del proceso."""
+    return leer_plantilla(RUTA_PLANTILLA)
+
+
+def _escribir(lienzo, rectangulo, texto, tamano=TAMANO):
+    """Escribe ``texto`` centrado en vertical dentro de ``rectangulo``."""
+    x0, y0, x1, y1 = rectangulo
+    texto = formatear(texto)
+    if not texto:
+        return
+    texto, tamano = ajustar(texto, x1 - x0 - 4, tamano)
+    lienzo.setFont(FUENTE, tamano)
+    lienzo.drawString(x0 + 2, (y0 + y1) / 2 - tamano * 0.35, texto)
+
+
+def _marcar(lienzo, rectangulo):
+    x0, y0, x1, y1 = rectangulo
+    lienzo.setFont(FUENTE, 9)
+    lienzo.drawCentredString((x0 + x1) / 2, (y0 + y1) / 2 - 3.2, "X")
+
+
+def _codigo_postal(lienzo, rectangulo, codigo):
+    x0, y0, x1, y1 = rectangulo
+    codigo = formatear(codigo)[:5]
+    ancho = (x1 - x0) / 5
+    lienzo.setFont(FUENTE, TAMANO)
+    for i, caracter in enumerate(codigo):
+        lienzo.drawCentredString(
+            x0 + ancho * (i + 0.5), (y0 + y1) / 2 - TAMANO * 0.35, caracter
+        )
+
+
+def _valores(datos):
+    """Valor de cada campo de ``CAMPOS`` y casillas marcadas."""
+    titular, destinatario = datos["titular"], datos["destinatario"]
+    transportista, calidad, sigpac = (
+        datos["transportista"],
+        datos["calidad"],
+        datos["sigpac"],
+    )
+    org, dst = titular["direccion"], destinatario["direccion"]
+    dia, mes, anio = datos["fecha_salida"].split("/")
+
+    explotacion = datos["explotacion"]
+    recinto = " ".join(
+        f"{etiqueta} {sigpac[clave]}"
+        for etiqueta, clave in (
+            ("Polígono", "pol"),
+            ("Parcela", "par"),
+            ("Recinto", "rec"),
+        )
+        if sigpac[clave]
+    )
+    if recinto:
+        explotacion = f"{explotacion} ({recinto})"
+
+    valores = {
+        "explotacion": explotacion,
+        "unidad_entidad": sigpac["mun"] or org["entidad"],
+        "unidad_municipio": sigpac["mun"] or org["loc"],
+        "unidad_provincia": sigpac["prov"] or org["prov"],
+        "transportista_nif": transportista["nif"],
+        "matricula_vehiculo": transportista["matricula_vehiculo"],
+        "matricula_remolque": transportista["matricula_remolque"],
+        "transportista_telefono": transportista["telefono"],
+        "transportista_email": transportista["email"],
+        "autorizacion_firma": datos["autorizado"]["nombre"] or titular["nombre"],
+        "aceptacion_firma": transportista["nombre"],
+    }
+    for prefijo, persona, direccion in (
+        ("titular", titular, org),
+        ("destinatario", destinatario, dst),
+    ):
+        valores.update(
+            {
+                f"{prefijo}_nombre": persona["nombre"],
+                f"{prefijo}_nif": persona["nif"],
+                f"{prefijo}_via": direccion["via"],
+                f"{prefijo}_nombre_via": direccion["nombre"],
+                f"{prefijo}_numero": direccion["num"],
+                f"{prefijo}_entidad": direccion["entidad"],
+                f"{prefijo}_municipio": direccion["loc"],
+                f"{prefijo}_provincia": direccion["prov"],
+                f"{prefijo}_pais": direccion["pais"],
+                f"{prefijo}_telefono": persona["telefono"],
+                f"{prefijo}_movil": persona["movil"],
+                f"{prefijo}_email": persona["email"],
+            }
+        )
+    for apartado in ("autorizacion", "aceptacion"):
+        valores.update(
+            {
+                f"{apartado}_lugar": org["loc"],
+                f"{apartado}_dia": dia,
+                f"{apartado}_mes": MESES[int(mes) - 1],
+                f"{apartado}_anio": anio,
+            }
+        )
+    for campo in (
+        "denominacion_origen",
+        "indicacion_geografica",
+        "especialidad_tradicional",
+        "naturaleza",
+        "finalidad",
+        "categoria",
+        "instrucciones_uso",
+        "condiciones_transporte",
+    ):
+        valores[campo] = calidad[campo]
+
+    diferenciada = any(
+        calidad[campo]
+        for campo in (
+            "denominacion_origen",
+            "indicacion_geografica",
+            "especialidad_tradicional",
+        )
+    )
+    marcadas = {
+        "sexo_h": titular["sexo"] == "H",
+        "sexo_m": titular["sexo"] == "M",
+        "calidad_si": diferenciada,
+        "calidad_no": not diferenciada,
+        **{
+            campo: bool(calidad[campo])
+            for campo in (
+                "denominacion_origen",
+                "indicacion_geografica",
+                "especialidad_tradicional",
+                "es_ecologico",
+                "es_integrada",
+            )
+        },
+    }
+    return valores, [casilla for casilla, marcada in marcadas.items() if marcada]
+
+
+def _lineas(lienzo, datos, lineas):
+    """Apartado 4: fechas y hasta ``len(LINEAS["filas"])`` líneas de carga."""
+    x0, y0, x1, y1 = LINEAS["salida"]
+    lienzo.setFont(FUENTE, TAMANO)
+    centro = (y0 + y1) / 2
+    lienzo.drawCentredString((x0 + x1) / 2, centro + 2, datos["fecha_salida"])
+    lienzo.drawCentredString((x0 + x1) / 2, centro - 8, datos["hora_salida"])
+    x0, y0, x1, _ = LINEAS["entrega"]
+    _escribir(lienzo, (x0, centro - 6, x1, centro + 6), datos["fecha_entrega_estimada"])
+
+    for superior, linea in zip(LINEAS["filas"], lineas):
+        for (inicio, fin), valor in zip(LINEAS["columnas"], linea):
+            _escribir(lienzo, (inicio, superior - LINEAS["alto"], fin, superior), valor)
+
+
+def _paginas_dat(datos):
+    """Páginas del modelo de un DAT y las líneas de carga de cada una."""
+    por_pagina = len(LINEAS["filas"])
+    lineas = datos["lineas"]
+    bloques = [lineas[i : i + por_pagina] for i in range(0, len(lineas), por_pagina)]
+    return [(0, bloque) for bloque in bloques or [[]]] + [(1, [])]
+
+
+def _capa(lista_datos):
+    """
+    Dibuja la capa de datos de todas las hojas de los DAT de ``lista_datos``.
+    Devuelve el PDF de la capa y la página del modelo de cada una de sus páginas.
+    """
+    salida = io.BytesIO()
+    caja = plantilla().pages[0].mediabox
+    lienzo = Canvas(salida, pagesize=(float(caja.width), float(caja.height)))
+    paginas = []
+    for datos in lista_datos:
+        valores, marcadas = _valores(datos)
+        hojas = _paginas_dat(datos)
+        for numero, (pagina, lineas) in enumerate(hojas, 1):
+            pie = PAGINACION[pagina]
+            lienzo.setFont(FUENTE, 9)
+            lienzo.drawCentredString(*_centro(pie["pagina"]), str(numero))
+            lienzo.drawCentredString(*_centro(pie["total"]), str(len(hojas)))
+            _, linea, fin = ANEXO[pagina]
+            lienzo.drawRightString(fin, linea, "ANEXO VI")
+            _numero_dat(lienzo, pie["margen"], datos["numero"])
+
+            for campo, (pagina_campo, *rectangulo) in CAMPOS.items():
+                if pagina_campo == pagina:
+                    _escribir(lienzo, rectangulo, valores[campo])
+            for casilla in marcadas:
+                pagina_casilla, *rectangulo = CASILLAS[casilla]
+                if pagina_casilla == pagina:
+                    _marcar(lienzo, rectangulo)
+            if pagina == 0:
+                for nombre, (_, *rectangulo) in CODIGOS_POSTALES.items():
+                    _codigo_postal(lienzo, rectangulo, datos[nombre]["direccion"]["cp"])
+                _lineas(lienzo, datos, lineas)
+            lienzo.showPage()
+            paginas.append(pagina)
+    lienzo.save()
+    return PdfReader(salida), paginas
+
+
+def _centro(posicion):
+    x0, linea, x1 = posicion
+    return (x0 + x1) / 2, linea
+
+
+def _numero_dat(lienzo, rectangulo, numero):
+    """Nº de DAT en vertical en el margen izquierdo (donde va el código de barras)."""
+    x0, y0, x1, y1 = rectangulo
+    texto, tamano = ajustar(numero, y1 - y0, 9)
+    lienzo.saveState()
+    lienzo.translate((x0 + x1) / 2 + tamano * 0.35, (y0 + y1) / 2)
+    lienzo.rotate(90)
+    lienzo.setFont(FUENTE, tamano)
+    lienzo.drawCentredString(0, 0, texto)
+    lienzo.restoreState()
+
+
+def escribir_dats_pdf(lista_datos, salida):
+    """
+    Escribe en ``salida`` (fichero binario) un único PDF con los DAT de
+    ``lista_datos`` (``datos_dat``), uno tras otro. Devuelve el nº de páginas.
+    """
+    capa, paginas = _capa(lista_datos)
+    componer(plantilla(), capa, paginas).write(salida)
+    return len(paginas)
+
+
+def generar_dat_pdf(datos):
+    """Bytes del PDF de un DAT."""
+    salida = io.BytesIO()
+    escribir_dats_pdf([datos], salida)
+    return salida.getvalue()
+
+
+def escribir_dats_zip(lista_datos, salida):
+    """
+    Escribe en ``salida`` un ZIP con un PDF por DAT (``<número>.pdf``). Cada PDF
+    se genera y se añade al ZIP antes de pasar al siguiente, así que ``salida``
+    puede ser un flujo no posicionable (p. ej. una respuesta HTTP). Devuelve el
+    nº de DAT.
+    """
+    total = 0
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as archivo:
+        for datos in lista_datos:
+            # pypdf necesita conocer la posición al escribir: cada PDF se genera en
+            # memoria y se añade entero al ZIP
+            archivo.writestr(f"{datos['numero']}.pdf", generar_dat_pdf(datos))
+            total += 1
+    return total
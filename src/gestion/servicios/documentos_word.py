@@ -0,0 +1,283 @@
+"""
+Lectura de las tablas de un documento de Word: binario de Word 97-2003
+(``.doc``), ``.docx`` o su exportación a texto.
+
+Cada formato se reduce a la misma estructura: la lista de tablas del documento,
+cada tabla como lista de filas y cada fila como lista de textos de celda (los
+párrafos de una celda unidos con saltos de línea). El texto fuera de las tablas
+se descarta.
+
+- ``.doc``: se lee con ``olefile`` el texto del documento principal (tabla de
+  piezas) y, de cada párrafo, si está dentro de una tabla y si cierra una fila
+  (``sprmPFInTable`` y ``sprmPFTtp`` de sus propiedades de párrafo). No hace falta
+  tener Word ni LibreOffice.
+- ``.docx``: con ``python-docx``; las celdas combinadas horizontalmente cuentan
+  una sola vez.
+- Texto: la exportación de Word a texto sin formato escribe cada fila de tabla
+  en una línea con las celdas separadas por tabuladores.
+
+El PDF no conserva los límites de las celdas (solo posiciones de texto), así que
+no se admite: hay que exportar el documento a DOCX o a texto.
+"""
+
+import io
+import struct
+import zipfile
+from bisect import bisect_right
+
+from gestion.servicios.sigpac import ErrorImportacion
+
+_OLE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# Propiedades de párrafo (sprm) del formato binario
+_SPRM_EN_TABLA = 0x2416
+_SPRM_FIN_FILA = 0x2417
+_SPRM_NIVEL_TABLA = 0x6649
+_SPRM_PAPX_GRANDE = 0x6646
+_SPRM_DEF_TABLA = 0xD608
+_SPRM_TABULACIONES = 0xC615
+# Tamaño del operando según los 3 bits altos del sprm (6: longitud variable)
+_TAMANO_OPERANDO = {0: 1, 1: 1, 2: 2, 3: 4, 4: 2, 5: 2, 7: 3}
+
+# Caracteres especiales del texto de Word 97
+_CARACTERES = {
+    "\x0b": "\n",  # salto de línea manual
+    "\t": " ",
+    "\xa0": " ",
+    "\x1e": "-",  # guion de no separación
+}
+_DESCARTADOS = set("\x01\x02\x03\x04\x05\x08\x0c\x1f")
+_CAMPO_INICIO, _CAMPO_SEPARADOR, _CAMPO_FIN = "\x13", "\x14", "\x15"
+
+
+def leer_tablas(contenido, nombre):
+    """
+    Tablas de un documento (``contenido`` en bytes; el formato se deduce del
+    propio contenido). Lanza ErrorImportacion si el formato no se admite.
+    """
+    if contenido.startswith(_OLE):
+        return _tablas_doc(contenido)
+    if contenido.startswith(b"PK"):
+        return _tablas_docx(contenido)
+    if contenido.startswith(b"%PDF") or nombre.lower().endswith(".pdf"):
+        raise ErrorImportacion(
+            f"{nombre}: el PDF no conserva las tablas; exporta el documento a "
+            "DOCX o a texto."
+        )
+    return _tablas_texto(contenido)
+
+
+def _tablas_texto(contenido):
+    try:
+        texto = contenido.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        texto = contenido.decode("cp1252")
+    tablas, filas = [], []
+    for linea in texto.splitlines():
+        if "\t" in linea:
+            filas.append([celda.strip() for celda in linea.split("\t")])
+        elif filas:
+            tablas.append(filas)
+            filas = []
+    if filas:
+        tablas.append(filas)
+    return tablas
+
+
+def _tablas_docx(contenido):
+    import docx
+    from docx.opc.exceptions import PackageNotFoundError
+
+    try:
+        documento = docx.Document(io.BytesIO(contenido))
+    except (PackageNotFoundError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise ErrorImportacion(f"DOCX no válido: {e}")
+    tablas = []
+    for tabla in documento.tables:
+        filas = []
+        for fila in tabla.rows:
+            celdas, vistas = [], set()
+            for celda in fila.cells:
+                # Una celda combinada se repite en cada columna que ocupa
+                if id(celda._tc) not in vistas:
+                    vistas.add(id(celda._tc))
+                    celdas.append(celda.text.strip())
+            filas.append(celdas)
+        tablas.append(filas)
+    return tablas
+
+
+def _tablas_doc(contenido):
+    import olefile
+
+    try:
+        with olefile.OleFileIO(contenido) as ole:
+            documento = ole.openstream("WordDocument").read()
+            (banderas,) = struct.unpack_from("<H", documento, 0x0A)
+            nombre_tabla = "1Table" if banderas & 0x0200 else "0Table"
+            tabla = ole.openstream(nombre_tabla).read()
+            datos = ole.openstream("Data").read() if ole.exists("Data") else b""
+        piezas = _piezas(documento, tabla)
+        propiedades = _PropiedadesParrafo(documento, tabla, datos)
+        (ccp_texto,) = struct.unpack_from("<i", documento, 0x4C)
+        return _agrupar_tablas(_parrafos(documento, piezas, propiedades, ccp_texto))
+    except (OSError, struct.error, IndexError, ValueError) as e:
+        raise ErrorImportacion(f"Documento de Word no válido: {e}")
+
+
+def _piezas(documento, tabla):
+    """``(cp_inicio, cp_fin, fc, comprimida)`` de cada pieza del texto (CLX)."""
+    fc_clx, lcb_clx = struct.unpack_from("<II", documento, 0x01A2)
+    clx = tabla[fc_clx : fc_clx + lcb_clx]
+    i = 0
+    while clx[i] == 1:  # Prc: propiedades de las piezas, no se usan
+        i += 3 + struct.unpack_from("<H", clx, i + 1)[0]
+    if clx[i] != 2:
+        raise ValueError("tabla de piezas no encontrada")
+    (lcb,) = struct.unpack_from("<I", clx, i + 1)
+    plc = clx[i + 5 : i + 5 + lcb]
+    n = (lcb - 4) // 12
+    cps = struct.unpack_from(f"<{n + 1}I", plc)
+    piezas = []
+    for k in range(n):
+        (fc,) = struct.unpack_from("<I", plc, 4 * (n + 1) + 8 * k + 2)
+        comprimida = bool(fc & 0x40000000)
+        if comprimida:
+            fc = (fc & ~0x40000000) // 2
+        piezas.append((cps[k], cps[k + 1], fc, comprimida))
+    return piezas
+
+
+def _parrafos(documento, piezas, propiedades, ccp_texto):
+    """
+    ``(texto, marca, en_tabla, fin_fila)`` de cada párrafo del documento
+    principal; ``marca`` es ``"\\r"`` (párrafo) o ``"\\a"`` (fin de celda o fila).
+    """
+    texto, campos = [], []
+    for cp_inicio, cp_fin, fc, comprimida in piezas:
+        if cp_inicio >= ccp_texto:
+            break
+        largo = min(cp_fin, ccp_texto) - cp_inicio
+        if comprimida:
+            caracteres = documento[fc : fc + largo].decode("cp1252", "replace")
+        else:
+            caracteres = documento[fc : fc + 2 * largo].decode("utf-16-le", "replace")
+        for posicion, caracter in enumerate(caracteres):
+            if caracter == _CAMPO_INICIO:
+                campos.append(False)
+            elif caracter == _CAMPO_SEPARADOR and campos:
+                campos[-1] = True
+            elif caracter == _CAMPO_FIN and campos:
+                campos.pop()
+            elif caracter in "\r\x07":
+                fc_marca = fc + posicion * (1 if comprimida else 2)
+                en_tabla, fin_fila = propiedades.tabla(fc_marca)
+                yield "".join(texto).strip(), caracter, en_tabla, fin_fila
+                texto = []
+            elif all(campos) and caracter not in _DESCARTADOS:
+                # De los campos solo se conserva el resultado, no el código
+                texto.append(_CARACTERES.get(caracter, caracter))
+
+
+def _agrupar_tablas(parrafos):
+    tablas, filas, celdas, contenido = [], [], [], []
+    for texto, marca, en_tabla, fin_fila in parrafos:
+        if fin_fila:
+            filas.append(celdas)
+            celdas, contenido = [], []
+        elif en_tabla:
+            contenido.append(texto)
+            if marca == "\x07":
+                celdas.append("\n".join(t for t in contenido if t))
+                contenido = []
+        elif filas:
+            tablas.append(filas)
+            filas = []
+    if filas:
+        tablas.append(filas)
+    return tablas
+
+
+class _PropiedadesParrafo:
+    """Propiedades de tabla de los párrafos (PlcBtePapx y sus páginas FKP)."""
+
+    def __init__(self, documento, tabla, datos):
+        self.documento = documento
+        self.datos = datos
+        fc, lcb = struct.unpack_from("<II", documento, 0x0102)
+        n = (lcb - 4) // 8
+        self.fcs = struct.unpack_from(f"<{n + 1}I", tabla, fc)
+        self.paginas = [
+            p & 0x3FFFFF for p in struct.unpack_from(f"<{n}I", tabla, fc + 4 * (n + 1))
+        ]
+        self._cache = {}
+
+    def tabla(self, fc):
+        """``(en_tabla, fin_fila)`` del párrafo cuya marca está en ``fc``."""
+        indice = bisect_right(self.fcs, fc) - 1
+        if not 0 <= indice < len(self.paginas):
+            return False, False
+        pagina = self._pagina(self.paginas[indice])
+        rgfc, grupos = pagina
+        j = bisect_right(rgfc, fc) - 1
+        if not 0 <= j < len(grupos):
+            return False, False
+        return grupos[j]
+
+    def _pagina(self, numero):
+        if numero not in self._cache:
+            fkp = self.documento[numero * 512 : (numero + 1) * 512]
+            crun = fkp[511]
+            rgfc = struct.unpack_from(f"<{crun + 1}I", fkp)
+            grupos = []
+            for j in range(crun):
+                desplazamiento = fkp[4 * (crun + 1) + 13 * j] * 2
+                grupos.append(self._papx(fkp, desplazamiento))
+            self._cache[numero] = (rgfc, grupos)
+        return self._cache[numero]
+
+    def _papx(self, fkp, desplazamiento):
+        """``(en_tabla, fin_fila)`` de un PapxInFkp (solo tablas de primer nivel)."""
+        if not desplazamiento:
+            return False, False
+        cb = fkp[desplazamiento]
+        if cb:
+            inicio, fin = desplazamiento + 1, desplazamiento + 2 * cb
+        else:
+            inicio = desplazamiento + 2
+            fin = inicio + 2 * fkp[desplazamiento + 1]
+        sprms = dict(_sprms(fkp, inicio + 2, fin))  # tras el istd
+        if _SPRM_PAPX_GRANDE in sprms:
+            # Propiedades que no caben en la página (filas con muchas celdas):
+            # van en el stream Data
+            (fc,) = struct.unpack_from("<I", sprms[_SPRM_PAPX_GRANDE])
+            (cb,) = struct.unpack_from("<H", self.datos, fc)
+            sprms.update(_sprms(self.datos, fc + 2, fc + 2 + cb))
+        nivel = sprms.get(_SPRM_NIVEL_TABLA)
+        if nivel and struct.unpack("<i", nivel)[0] > 1:
+            # Tabla anidada: su contenido cuenta como texto de la celda exterior
+            return True, False
+        return (
+            bool(sprms.get(_SPRM_EN_TABLA, b"\0")[0]),
+            bool(sprms.get(_SPRM_FIN_FILA, b"\0")[0]),
+        )
+
+
+def _sprms(buffer, inicio, fin):
+    """``(sprm, operando)`` de un grpprl entre ``inicio`` y ``fin``."""
+    i = inicio
+    while i + 2 <= fin:
+        (sprm,) = struct.unpack_from("<H", buffer, i)
+        i += 2
+        spra = sprm >> 13
+        if spra == 6:
+            if sprm == _SPRM_DEF_TABLA:
+                tamano = 2 + struct.unpack_from("<H", buffer, i)[0] - 1
+            elif sprm == _SPRM_TABULACIONES and buffer[i] == 255:
+                return  # formato complejo; las marcas de tabla van antes
+            else:
+                tamano = 1 + buffer[i]
+        else:
+            tamano = _TAMANO_OPERANDO[spra]
+        yield sprm, buffer[i : i + tamano]
+        i += tamano
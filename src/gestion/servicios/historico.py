@@ -0,0 +1,195 @@
+"""
+Búsqueda en el histórico del cuaderno (DiarioActividad).
+
+En PostgreSQL (índices creados en la migración 0009):
+
+- ``texto`` es una búsqueda de texto completo en español sobre producto,
+  problema fitosanitario y observaciones, con los resultados ordenados por
+  relevancia (índice GIN sobre el mismo ``to_tsvector``).
+- Los filtros ``producto`` y ``plaga`` siguen siendo "contiene, sin distinguir
+  mayúsculas"; los sirven índices GIN de trigramas (pg_trgm) sobre
+  ``UPPER(campo)``, que es lo que compara ``icontains``.
+
+En otras bases de datos (p. ej. SQLite en pruebas) ``texto`` se resuelve con
+``icontains``: cada palabra debe aparecer en alguno de los tres campos.
+
+La parcela se resuelve con el índice en memoria de parcelas, así que el filtro
+es un ``parcela_id IN (...)`` en lugar de un JOIN con ``icontains``.
+
+Los listados se paginan por clave (keyset): el cursor guarda la clave de orden
+de la última fila devuelta (``fecha`` e ``id``, más la relevancia si se busca
+texto) y la página siguiente filtra "menor que" esa clave, sin ``OFFSET`` ni
+``COUNT``. Los resúmenes (``agregar_actividades``) se calculan con GROUP BY en SQL.
+"""
+
+from datetime import date
+
+from django.db import connection
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from gestion.models import DiarioActividad
+from gestion.servicios.parcelas import indice as indice_parcelas
+
+CAMPOS_TEXTO = ("producto_nombre", "problema_fitosanitario", "observaciones")
+CONFIGURACION_TEXTO = "spanish"
+
+LIMITE_PAGINA = 100
+
+# Criterios de agrupación de agregar_actividades y columna de cada uno
+AGRUPACIONES = {
+    "mes": "mes",
+    "producto": "producto_nombre",
+    "parcela": "parcela__referencia_sigpac",
+    "tipo": "tipo",
+}
+
+# Clave de orden (descendente) de los listados y cómo leer cada parte del cursor
+_CLAVE_FECHA = (("fecha", date.fromisoformat), ("pk", int))
+_CLAVE_RELEVANCIA = (("relevancia", float),) + _CLAVE_FECHA
+
+
+def usa_postgres():
+    return connection.vendor == "postgresql"
+
+
+def vector_busqueda():
+    """
+    Vector de texto completo del diario. Debe coincidir con el del índice
+    ``diario_busqueda_gin`` para que PostgreSQL lo use.
+    """
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector(*CAMPOS_TEXTO, config=CONFIGURACION_TEXTO)
+
+
+def _filtrar_texto(qs, texto, por_relevancia):
+    if usa_postgres():
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        consulta = SearchQuery(
+            texto, config=CONFIGURACION_TEXTO, search_type="websearch"
+        )
+        qs = qs.alias(busqueda=vector_busqueda()).filter(busqueda=consulta)
+        if por_relevancia:
+            qs = qs.annotate(
+                relevancia=SearchRank(vector_busqueda(), consulta)
+            ).order_by("-relevancia", "-fecha", "-pk")
+        return qs
+
+    for palabra in texto.split():
+        condicion = Q()
+        for campo in CAMPOS_TEXTO:
+            condicion |= Q(**{f"{campo}__icontains": palabra})
+        qs = qs.filter(condicion)
+    return qs
+
+
+def buscar_actividades(
+    texto=None,
+    anio=None,
+    producto=None,
+    tipo_actividad=None,
+    parcela_ref=None,
+    plaga=None,
+    por_relevancia=True,
+):
+    """
+    Devuelve ``(queryset, filtros)``: las actividades que cumplen los filtros,
+    de más reciente a más antigua (o por relevancia si se busca ``texto`` en
+    PostgreSQL y ``por_relevancia``), y la descripción legible de cada filtro
+    aplicado.
+    """
+    qs = DiarioActividad.objects.order_by("-fecha", "-pk")
+    filtros = []
+
+    if anio:
+        qs = qs.filter(fecha__year=anio)
+        filtros.append(f"Año {anio}")
+    if producto:
+        qs = qs.filter(producto_nombre__icontains=producto)
+        filtros.append(f"Producto '{producto}'")
+    if tipo_actividad:
+        qs = qs.filter(tipo__icontains=tipo_actividad)
+        filtros.append(f"Tipo '{tipo_actividad}'")
+    if parcela_ref:
+        qs = qs.filter(parcela_id__in=indice_parcelas.coincidentes(parcela_ref))
+        filtros.append(f"Parcela '{parcela_ref}'")
+    if plaga:
+        qs = qs.filter(problema_fitosanitario__icontains=plaga)
+        filtros.append(f"Plaga '{plaga}'")
+    if texto and texto.strip():
+        qs = _filtrar_texto(qs, texto.strip(), por_relevancia)
+        filtros.append(f"Texto '{texto.strip()}'")
+
+    return qs, filtros
+
+
+def _clave_orden(qs):
+    return _CLAVE_RELEVANCIA if "relevancia" in qs.query.annotations else _CLAVE_FECHA
+
+
+def paginar(qs, cursor=None, limite=5):
+    """
+    Una página de ``qs`` (ordenado por ``buscar_actividades``) a partir de
+    ``cursor``. Devuelve ``(filas, cursor_siguiente)``; ``cursor_siguiente`` es
+    ``None`` en la última página. Lanza ``ValueError`` si el cursor no es válido.
+    """
+    clave = _clave_orden(qs)
+    limite = max(1, min(limite, LIMITE_PAGINA))
+
+    if cursor:
+        partes = cursor.split("|")
+        if len(partes) != len(clave):
+            raise ValueError(f"Cursor no válido: '{cursor}'")
+        try:
+            valores = [convertir(v) for (_, convertir), v in zip(clave, partes)]
+        except ValueError:
+            raise ValueError(f"Cursor no válido: '{cursor}'")
+
+        # (a, b, c) < (A, B, C)  =>  a < A  o  (a = A y b < B)  o  ...
+        condicion = Q()
+        for i, (campo, _) in enumerate(clave):
+            iguales = {nombre: valores[j] for j, (nombre, _) in enumerate(clave[:i])}
+            condicion |= Q(**iguales, **{f"{campo}__lt": valores[i]})
+        qs = qs.filter(condicion)
+
+    filas = list(qs[: limite + 1])
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    siguiente = "|".join(
+        str(ultima.fecha.isoformat() if campo == "fecha" else getattr(ultima, campo))
+        for campo, _ in clave
+    )
+    return filas, siguiente
+
+
+def agregar_actividades(qs, agrupar_por):
+    """
+    Resume ``qs`` agrupando por los criterios de ``agrupar_por`` (lista de
+    claves de ``AGRUPACIONES``): nº de actividades, superficie tratada y
+    primera/última fecha de cada grupo. Cada fila trae el valor de los criterios
+    en su columna de ``AGRUPACIONES``.
+    """
+    desconocidas = [a for a in agrupar_por if a not in AGRUPACIONES]
+    if desconocidas or not agrupar_por:
+        raise ValueError(
+            f"Agrupación no válida: {', '.join(desconocidas) or '(vacía)'}. "
+            f"Opciones: {', '.join(AGRUPACIONES)}."
+        )
+    columnas = [AGRUPACIONES[a] for a in agrupar_por]
+    qs = qs.order_by()
+    if "mes" in agrupar_por:
+        qs = qs.annotate(mes=TruncMonth("fecha"))
+    return (
+        qs.values(*columnas)
+        .annotate(
+            actividades=Count("pk"),
+            superficie=Sum("superficie_tratada_ha"),
+            primera=Min("fecha"),
+            ultima=Max("fecha"),
+        )
+        .order_by(*columnas)
+    )
@@ -0,0 +1,458 @@
+"""
+Exportación a hojas de cálculo (XLSX) del cuaderno y del histórico del diario.
+
+Se usa un libro de openpyxl en modo solo escritura: cada fila se escribe en un
+fichero temporal al añadirla y no queda en memoria, y las filas se leen de la BD
+por lotes (``.iterator()``), así que la memoria no crece con el nº de filas (solo
+con el de textos distintos, que openpyxl guarda en la tabla de cadenas
+compartidas).
+
+Las celdas llevan su tipo (fechas, números), no el texto del cuaderno, para que
+se puedan filtrar y sumar.
+"""
+
+from datetime import date
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+
+from gestion.common import TipoActividad
+from gestion.servicios import maestros
+from gestion.servicios.cuaderno import (
+    TAMANO_LOTE,
+    ErrorCuaderno,
+    consulta_abonados,
+    consulta_analisis,
+    consulta_parcelas,
+    consulta_siembras,
+    consulta_tratamientos,
+    consulta_ventas,
+    datos_generales,
+)
+
+# Filas de datos por hoja (el límite de Excel es 1.048.576 con la cabecera);
+# el resto continúa en otra hoja
+FILAS_POR_HOJA = 1_048_575
+
+NEGRITA = Font(bold=True)
+
+TIPOS_ACTIVIDAD = dict(TipoActividad.choices)
+
+# Histórico del diario: (cabecera, campos de values_list que forman la columna)
+COLUMNAS_DIARIO = (
+    ("Fecha", ("fecha",)),
+    ("Tipo", ("tipo",)),
+    ("Explotación", ("explotacion__nombre",)),
+    ("Parcela (SIGPAC)", ("parcela__referencia_sigpac",)),
+    ("Especie", ("parcela__especie",)),
+    ("Variedad", ("parcela__variedad",)),
+    ("Sup. tratada (ha)", ("superficie_tratada_ha",)),
+    ("Problema fitosanitario", ("problema_fitosanitario",)),
+    ("Aplicador", ("aplicador__nombre", "aplicador__apellidos")),
+    ("Equipo", ("equipo__descripcion",)),
+    ("Producto", ("producto_nombre",)),
+    ("Nº registro", ("producto_numero_registro",)),
+    ("Dosis", ("dosis",)),
+    ("Dosis (texto)", ("dosis_text",)),
+    ("Eficacia", ("eficacia",)),
+    ("Observaciones", ("observaciones",)),
+    ("Estado", ("estado_validacion",)),
+)
+
+
+def _valor(valor):
+    if isinstance(valor, str):
+        # Caracteres de control que no admite el formato XLSX
+        return ILLEGAL_CHARACTERS_RE.sub("", valor)
+    if isinstance(valor, dict):
+        return ", ".join(str(v) for v in valor.values() if v)
+    return valor
+
+
+class _Hoja:
+    """
+    Hoja de solo escritura con cabecera en negrita e inmovilizada. Si se llena,
+    continúa en otra hoja ("Nombre (2)", ...) con la misma cabecera.
+    """
+
+    def __init__(self, libro, titulo, cabecera=None):
+        self.libro, self.titulo, self.cabecera = libro, titulo, cabecera
+        self.hojas = 0
+        self._nueva()
+
+    def _nueva(self):
+        self.hojas += 1
+        titulo = self.titulo if self.hojas == 1 else f"{self.titulo} ({self.hojas})"
+        self.hoja = self.libro.create_sheet(titulo[:31])
+        self.filas = 0
+        if self.cabecera:
+            self.hoja.freeze_panes = "A2"
+            self.titulo_tabla(self.cabecera)
+
+    def titulo_tabla(self, textos):
+        """Fila de títulos en negrita (cabecera o título de una tabla intermedia)."""
+        celdas = []
+        for texto in textos:
+            celda = WriteOnlyCell(self.hoja, value=texto)
+            celda.font = NEGRITA
+            celdas.append(celda)
+        self.hoja.append(celdas)
+
+    def fila(self, valores):
+        if self.filas == FILAS_POR_HOJA:
+            self._nueva()
+        self.hoja.append([_valor(v) for v in valores])
+        self.filas += 1
+
+
+def _libro():
+    return Workbook(write_only=True)
+
+
+# ==============================================================================
+# HISTÓRICO DEL DIARIO
+# ==============================================================================
+
+
+def escribir_historico_xlsx(actividades, salida, lote=TAMANO_LOTE):
+    """
+    Escribe en ``salida`` (ruta o fichero binario) un XLSX con las actividades del
+    queryset ``actividades`` (DiarioActividad), en su orden. Devuelve el nº de
+    filas.
+    """
+    campos = [campo for _, grupo in COLUMNAS_DIARIO for campo in grupo]
+    posiciones = []
+    inicio = 0
+    for _, grupo in COLUMNAS_DIARIO:
+        posiciones.append((inicio, inicio + len(grupo)))
+        inicio += len(grupo)
+    tipo = campos.index("tipo")
+
+    libro = _libro()
+    hoja = _Hoja(libro, "Diario", [cabecera for cabecera, _ in COLUMNAS_DIARIO])
+    total = 0
+    for total, fila in enumerate(
+        actividades.values_list(*campos).iterator(chunk_size=lote), 1
+    ):
+        fila = list(fila)
+        fila[tipo] = TIPOS_ACTIVIDAD.get(fila[tipo], fila[tipo])
+        hoja.fila(
+            (
+                fila[a]
+                if b - a == 1
+                else " ".join(str(v) for v in fila[a:b] if v) or None
+            )
+            for a, b in posiciones
+        )
+    libro.save(salida)
+    return total
+
+
+# ==============================================================================
+# CUADERNO (una hoja por sección)
+# ==============================================================================
+
+
+def _hoja_general(libro, explotacion):
+    datos = datos_generales(explotacion)
+    direccion = datos["direccion"]
+    hoja = _Hoja(libro, "1. General", ["Campo", "Valor"])
+    for campo, valor in (
+        ("Explotación", explotacion.nombre),
+        ("Titular", datos["nombre"]),
+        ("NIF", datos["nif"]),
+        ("Nº Registro Nacional", datos["registro_nacional"]),
+        ("Nº Registro Autonómico", datos["registro_autonomico"]),
+        (
+            "Dirección",
+            (
+                " ".join(
+                    str(v)
+                    for v in (
+                        direccion.tipo_via,
+                        direccion.nombre_via,
+                        direccion.numero,
+                        direccion.codigo_postal,
+                        direccion.localidad,
+                        direccion.provincia,
+                    )
+                    if v
+                )
+                if direccion
+                else None
+            ),
+        ),
+        ("Teléfono", datos["telefono"]),
+        ("Móvil", datos["movil"]),
+        ("Email", datos["email"]),
+    ):
+        hoja.fila((campo, valor))
+    if datos["representante"]:
+        nombre, nif, tipo = datos["representante"]
+        hoja.fila(("Representante", f"{nombre} ({nif}) - {tipo}"))
+
+    hoja.fila(())
+    hoja.titulo_tabla(("Aplicadores", "NIF", "Carnet"))
+    for p in maestros.aplicadores():
+        hoja.fila((f"{p.nombre} {p.apellidos or ''}".strip(), p.documento, p.cargo))
+    hoja.fila(())
+    hoja.titulo_tabla(("Equipos", "Nº ROMA", "Fecha adquisición", "Última inspección"))
+    for eq in maestros.equipos(explotacion):
+        hoja.fila(
+            (
+                eq.descripcion,
+                eq.numero_inscripcion_roma,
+                eq.fecha_adquisicion,
+                eq.fecha_ultima_inspeccion,
+            )
+        )
+    hoja.fila(())
+    hoja.titulo_tabla(("Asesores", "NIF", "Nº ROPO", "Tipo de carnet"))
+    for a in maestros.asesores():
+        hoja.fila(
+            (a.persona.nombre, a.persona.nif, a.numero_inscripcion_ropo, a.tipo_carnet)
+        )
+
+
+def _hoja_parcelas(libro, explotacion, lote):
+    hoja = _Hoja(
+        libro,
+        "2. Parcelas",
+        (
+            "Nº orden",
+            "Ref. SIGPAC",
+            "Polígono",
+            "Parcela",
+            "Recinto",
+            "Uso SIGPAC",
+            "Sup. SIGPAC (ha)",
+            "Sup. cultivada (ha)",
+            "Especie",
+            "Variedad",
+            "Secano/Regadío",
+            "Aire libre/Protegido",
+        ),
+    )
+    for i, p in enumerate(consulta_parcelas(explotacion).iterator(chunk_size=lote), 1):
+        hoja.fila(
+            (
+                i,
+                p.referencia_sigpac,
+                p.poligono,
+                p.parcela,
+                p.recinto,
+                p.uso_sigpac,
+                p.superficie_sigpac,
+                p.superficie_cultivada,
+                p.especie,
+                p.variedad,
+                p.secano_regadio,
+                p.aire_protegido,
+            )
+        )
+
+
+def _hoja_tratamientos(libro, explotacion, desde, hasta, lote, ordenes):
+    hoja = _Hoja(
+        libro,
+        "3.1 Tratamientos",
+        (
+            "Fecha",
+            "Nº orden parcela",
+            "Ref. SIGPAC",
+            "Especie",
+            "Variedad",
+            "Sup. tratada (ha)",
+            "Problema fitosanitario",
+            "Aplicador",
+            "NIF aplicador",
+            "Equipo",
+            "Producto",
+            "Nº registro",
+            "Dosis",
+            "Dosis (texto)",
+            "Eficacia",
+            "Observaciones",
+        ),
+    )
+    tratamientos = consulta_tratamientos(explotacion, desde, hasta)
+    for t in tratamientos.iterator(chunk_size=lote):
+        parcela, aplicador = t.parcela, t.aplicador
+        hoja.fila(
+            (
+                t.fecha,
+                ordenes.get(t.parcela_id, "TODAS"),
+                parcela.referencia_sigpac if parcela else None,
+                parcela.especie if parcela else None,
+                parcela.variedad if parcela else None,
+                t.superficie_tratada_ha,
+                t.problema_fitosanitario,
+                (
+                    f"{aplicador.nombre} {aplicador.apellidos or ''}".strip()
+                    if aplicador
+                    else None
+                ),
+                aplicador.documento if aplicador else None,
+                t.equipo.descripcion if t.equipo else None,
+                t.producto_nombre,
+                t.producto_numero_registro,
+                t.dosis,
+                t.dosis_text,
+                t.eficacia,
+                t.observaciones,
+            )
+        )
+
+    hoja = _Hoja(
+        libro,
+        "3.2 Semilla tratada",
+        (
+            "Fecha siembra",
+            "Nº orden parcela",
+            "Ref. SIGPAC",
+            "Cultivo",
+            "Sup. sembrada (ha)",
+            "Semilla (kg)",
+            "Producto",
+            "Nº registro",
+        ),
+    )
+    siembras = consulta_siembras(explotacion, desde, hasta)
+    for s in siembras.iterator(chunk_size=lote):
+        hoja.fila(
+            (
+                s.fecha_siembra,
+                ordenes.get(s.parcela_id),
+                s.parcela.referencia_sigpac if s.parcela else None,
+                s.cultivo,
+                s.superficie_sembrada_ha,
+                s.cantidad_semilla_kg,
+                s.producto_fitosanitario,
+                s.numero_registro,
+            )
+        )
+
+
+def _hoja_analisis(libro, explotacion, desde, hasta, lote):
+    hoja = _Hoja(
+        libro,
+        "4. Análisis",
+        (
+            "Fecha",
+            "Material analizado",
+            "Cultivo",
+            "Nº boletín",
+            "Laboratorio",
+            "Sustancias detectadas",
+        ),
+    )
+    analisis = consulta_analisis(explotacion, desde, hasta)
+    for an in analisis.iterator(chunk_size=lote):
+        hoja.fila(
+            (
+                an.fecha,
+                an.material_analizado,
+                an.cultivo,
+                an.numero_boletin,
+                an.laboratorio,
+                an.sustancias_activas_detectadas,
+            )
+        )
+
+
+def _hoja_cosecha(libro, explotacion, desde, hasta, lote):
+    hoja = _Hoja(
+        libro,
+        "5. Cosecha",
+        (
+            "Fecha",
+            "Producto",
+            "Cantidad (kg)",
+            "Nº albarán/factura",
+            "Nº lote",
+            "Cliente",
+            "NIF cliente",
+            "Dirección cliente",
+            "RGSEAA",
+        ),
+    )
+    ventas = consulta_ventas(explotacion, desde, hasta)
+    for v in ventas.iterator(chunk_size=lote):
+        hoja.fila(
+            (
+                v.fecha,
+                v.producto,
+                v.cantidad_kg,
+                v.numero_albaran,
+                v.numero_lote,
+                v.cliente_nombre,
+                v.cliente_nif,
+                v.cliente_direccion,
+                v.numero_rgseaa,
+            )
+        )
+
+
+def _hoja_fertilizacion(libro, explotacion, desde, hasta, lote, ordenes):
+    hoja = _Hoja(
+        libro,
+        "6. Fertilización",
+        (
+            "Fecha",
+            "Nº orden parcela",
+            "Ref. SIGPAC",
+            "Especie",
+            "Variedad",
+            "Producto",
+            "Dosis",
+            "Tipo",
+            "Observaciones",
+        ),
+    )
+    abonados = consulta_abonados(explotacion, desde, hasta)
+    for ab in abonados.iterator(chunk_size=lote):
+        hoja.fila(
+            (
+                ab.fecha,
+                ordenes.get(ab.parcela_id, "TODAS"),
+                ab.parcela.referencia_sigpac if ab.parcela else None,
+                ab.parcela.especie if ab.parcela else None,
+                ab.parcela.variedad if ab.parcela else None,
+                ab.producto_nombre or "Agua/Riego",
+                ab.dosis,
+                TIPOS_ACTIVIDAD.get(ab.tipo, ab.tipo),
+                ab.observaciones,
+            )
+        )
+
+
+def escribir_cuaderno_xlsx(anio, salida, lote=TAMANO_LOTE):
+    """
+    Escribe en ``salida`` (ruta o fichero binario) el cuaderno de ``anio`` de la
+    explotación principal, con una hoja por sección (y la semilla tratada aparte
+    de los tratamientos).
+    """
+    explotacion = maestros.explotacion_principal()
+    if not explotacion:
+        raise ErrorCuaderno("No hay explotación configurada en el sistema.")
+    desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+    ordenes = {
+        pk: i
+        for i, pk in enumerate(
+            consulta_parcelas(explotacion)
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=lote),
+            1,
+        )
+    }
+
+    libro = _libro()
+    _hoja_general(libro, explotacion)
+    _hoja_parcelas(libro, explotacion, lote)
+    _hoja_tratamientos(libro, explotacion, desde, hasta, lote, ordenes)
+    _hoja_analisis(libro, explotacion, desde, hasta, lote)
+    _hoja_cosecha(libro, explotacion, desde, hasta, lote)
+    _hoja_fertilizacion(libro, explotacion, desde, hasta, lote, ordenes)
+    libro.save(salida)
@@ -0,0 +1,221 @@
+"""
+Caché en memoria de los datos maestros que casi nunca cambian (explotación,
+personal aplicador, equipos y asesores) para que las herramientas más usadas no
+repitan sus consultas en cada llamada.
+
+- Con ``post_save``/``post_delete`` de un modelo se invalidan solo las entradas
+  que lo incluyen (``CLAVES_POR_MODELO``): p. ej. guardar una persona invalida
+  los asesores, pero no la explotación ni el personal.
+- Si el cambio ocurre dentro de una transacción, esas entradas se vuelven a
+  invalidar al hacer commit, y mientras tanto ese hilo las lee de la BD (el
+  cambio podría deshacerse con un rollback). La invalidación pendiente se
+  registra con ``transaction.on_commit``, así que termina con la transacción
+  más externa, tanto si se confirma como si se deshace.
+- Las señales solo llegan al proceso que guarda; los cambios hechos desde otro
+  proceso (p. ej. el admin) o con ``QuerySet.update`` se recogen al caducar las
+  entradas (``MAESTROS_CACHE_TTL`` segundos; 0 desactiva la caché). Lo que se
+  guarda a partir de los maestros (p. ej. los snapshots del cuaderno) se genera
+  dentro de ``cache.desde_bd()``, que lee de la BD sin pasar por la caché.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+from gestion.models import (
+    Asesor,
+    Direccion,
+    EquipoAplicacion,
+    Explotacion,
+    Persona,
+    Personal,
+    Titular,
+)
+
+# Entradas de la caché que incluyen datos de cada modelo (la explotación se
+# carga con su titular y su dirección, y los asesores con su persona)
+CLAVES_POR_MODELO = {
+    Explotacion: ("explotacion",),
+    Titular: ("explotacion",),
+    Direccion: ("explotacion",),
+    Personal: ("aplicadores",),
+    EquipoAplicacion: ("equipos",),
+    Asesor: ("asesores",),
+    Persona: ("asesores",),
+}
+
+
+class _Invalidacion:
+    """Invalidación de ``claves`` (todas si es None) pendiente del commit."""
+
+    def __init__(self, cache, claves):
+        self.cache = cache
+        self.claves = claves
+
+    def __call__(self):
+        self.cache.invalidar(self.claves)
+
+    def afecta(self, clave):
+        return self.claves is None or clave in self.claves
+
+
+class CacheMaestros:
+    """Caché versionada, segura entre hilos, con contadores de aciertos y fallos."""
+
+    def __init__(self, ttl=None):
+        self.ttl = settings.MAESTROS_CACHE_TTL if ttl is None else ttl
+        self.version = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def obtener(self, clave, cargar):
+        """Devuelve el valor de ``clave`` o lo carga con ``cargar()``."""
+        if getattr(self._local, "desde_bd", False):
+            return cargar()
+        if self._sin_confirmar(clave):
+            # Este hilo ha modificado sus datos en la transacción en curso: leer de BD
+            with self._lock:
+                self.fallos += 1
+            return cargar()
+
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] > ahora:
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            version = self.version
+
+        valor = cargar()
+
+        if self.ttl > 0:
+            with self._lock:
+                # Si alguien invalidó mientras se cargaba, el valor puede ser viejo
+                if self.version == version:
+                    self._datos[clave] = (ahora + self.ttl, valor)
+        return valor
+
+    @contextmanager
+    def desde_bd(self):
+        """Dentro del bloque, este hilo lee los maestros de la BD (sin la caché)."""
+        anterior = getattr(self._local, "desde_bd", False)
+        self._local.desde_bd = True
+        try:
+            yield
+        finally:
+            self._local.desde_bd = anterior
+
+    def invalidar(self, claves=None):
+        """Invalida las entradas ``claves`` (por defecto, todas)."""
+        with self._lock:
+            self.version += 1
+            if claves is None:
+                self._datos.clear()
+            else:
+                for clave in claves:
+                    self._datos.pop(clave, None)
+
+        if connection.in_atomic_block:
+            transaction.on_commit(_Invalidacion(self, claves))
+
+    def _sin_confirmar(self, clave):
+        """
+        Si este hilo ha invalidado ``clave`` en la transacción en curso. Django
+        descarta las funciones de ``on_commit`` al hacer commit o rollback (y las
+        registradas en un savepoint al deshacerlo), así que no queda pendiente
+        ninguna de una transacción ya terminada.
+        """
+        if not connection.in_atomic_block:
+            return False
+        return any(
+            isinstance(funcion, _Invalidacion)
+            and funcion.cache is self
+            and funcion.afecta(clave)
+            for _, funcion, *_ in connection.run_on_commit
+        )
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        ratio = self.aciertos / total * 100 if total else 0
+        return (
+            f"Caché de maestros (v{self.version}): {self.aciertos} aciertos, "
+            f"{self.fallos} fallos ({ratio:.0f}% aciertos), "
+            f"{len(self._datos)} entradas, TTL {self.ttl}s"
+        )
+
+
+cache = CacheMaestros()
+
+
+def conectar_senales():
+    for modelo in CLAVES_POR_MODELO:
+        uid = f"cache-maestros-{modelo.__name__}"
+        post_save.connect(_invalidar, sender=modelo, dispatch_uid=uid + "-save")
+        post_delete.connect(_invalidar, sender=modelo, dispatch_uid=uid + "-delete")
+
+
+def _invalidar(sender, **kwargs):
+    cache.invalidar(CLAVES_POR_MODELO[sender])
+
+
+# ==============================================================================
+# CONSULTAS CACHEADAS
+# ==============================================================================
+
+
+def explotacion_principal():
+    """La explotación configurada (la primera), con titular y dirección."""
+    return cache.obtener(
+        "explotacion",
+        lambda: Explotacion.objects.select_related("titular", "direccion").first(),
+    )
+
+
+def aplicadores():
+    """Personal habilitado para fitosanitarios."""
+    return cache.obtener(
+        "aplicadores",
+        lambda: list(
+            Personal.objects.filter(habilitado_fitosanitarios=True).order_by("pk")
+        ),
+    )
+
+
+def aplicador_habilitado():
+    """Primer aplicador habilitado (el que se asigna por defecto a los tratamientos)."""
+    todos = aplicadores()
+    return todos[0] if todos else None
+
+
+def equipos(explotacion=None):
+    """Equipos de aplicación, opcionalmente solo los de ``explotacion``."""
+    todos = cache.obtener(
+        "equipos", lambda: list(EquipoAplicacion.objects.order_by("pk"))
+    )
+    if explotacion is None:
+        return todos
+    return [e for e in todos if e.explotacion_id == explotacion.pk]
+
+
+def equipo_por_nombre(nombre):
+    """Primer equipo cuya descripción contiene ``nombre`` (sin distinguir mayúsculas)."""
+    if not nombre:
+        return None
+    nombre = nombre.lower()
+    return next((e for e in equipos() if nombre in e.descripcion.lower()), None)
+
+
+def asesores():
+    """Asesores con su persona."""
+    return cache.obtener(
+        "asesores",
+        lambda: list(Asesor.objects.select_related("persona").order_by("pk")),
+    )
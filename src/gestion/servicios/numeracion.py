@@ -0,0 +1,95 @@
+"""
+Numeración de los Documentos de Acompañamiento al Transporte (DAT).
+
+Cada explotación tiene una serie por año (``SerieDAT``). El contador se incrementa
+con un ``UPDATE ... SET ultimo_numero = ultimo_numero + n`` dentro de la misma
+transacción que crea los DAT:
+
+- Dos emisiones simultáneas nunca obtienen el mismo número: la segunda espera al
+  bloqueo de fila de la primera y lee el contador ya incrementado.
+- Si la transacción falla, el incremento se deshace con ella y no quedan huecos.
+- El bloqueo afecta solo a la fila de esa explotación y año, y dura hasta el
+  commit, así que conviene reservar el número lo más tarde posible.
+"""
+
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from gestion.models import Explotacion, SerieDAT
+
+FORMATO_NUMERO_DAT = "DAT-{explotacion}-{anio}-{numero:06d}"
+# Números con FORMATO_NUMERO_DAT (p. ej. los de DAT importados de este sistema)
+PATRON_NUMERO_DAT = re.compile(r"DAT-(\d+)-(\d{4})-(\d{6,})")
+
+
+def reservar_numeros_dat(explotacion, cantidad=1, anio=None):
+    """
+    Reserva ``cantidad`` números consecutivos de la serie de ``explotacion`` para
+    ``anio`` (por defecto, el año en curso) y los devuelve formateados.
+    Debe llamarse dentro de ``transaction.atomic``.
+    """
+    if cantidad < 1:
+        return []
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("reservar_numeros_dat requiere una transacción activa.")
+
+    anio = anio or timezone.localdate().year
+    series = SerieDAT.objects.filter(explotacion=explotacion, anio=anio)
+
+    if not series.update(ultimo_numero=F("ultimo_numero") + cantidad):
+        # Primera emisión del año: crear la serie. Si otra transacción la crea a la
+        # vez, la restricción única hace fallar el INSERT y se incrementa la suya.
+        try:
+            with transaction.atomic():
+                SerieDAT.objects.create(
+                    explotacion=explotacion, anio=anio, ultimo_numero=cantidad
+                )
+        except IntegrityError:
+            series.update(ultimo_numero=F("ultimo_numero") + cantidad)
+
+    ultimo = series.values_list("ultimo_numero", flat=True).get()
+    return [
+        FORMATO_NUMERO_DAT.format(explotacion=explotacion.pk, anio=anio, numero=n)
+        for n in range(ultimo - cantidad + 1, ultimo + 1)
+    ]
+
+
+def avanzar_series_dat(numeros):
+    """
+    Lleva el contador de cada serie al menos hasta el mayor de ``numeros`` con
+    ``FORMATO_NUMERO_DAT`` (los demás se ignoran), para que las emisiones
+    siguientes no repitan un número ya usado. Crea la serie si no existe.
+    Debe llamarse dentro de ``transaction.atomic``.
+    """
+    maximos = {}
+    for numero in numeros:
+        coincidencia = PATRON_NUMERO_DAT.fullmatch(numero or "")
+        if coincidencia:
+            explotacion_id, anio, n = map(int, coincidencia.groups())
+            clave = (explotacion_id, anio)
+            maximos[clave] = max(maximos.get(clave, 0), n)
+    if not maximos:
+        return
+
+    existentes = set(
+        Explotacion.objects.filter(
+            pk__in={explotacion_id for explotacion_id, _ in maximos}
+        ).values_list("pk", flat=True)
+    )
+    for (explotacion_id, anio), maximo in maximos.items():
+        if explotacion_id not in existentes:
+            continue
+        series = SerieDAT.objects.filter(explotacion_id=explotacion_id, anio=anio)
+        if series.update(ultimo_numero=Greatest("ultimo_numero", maximo)):
+            continue
+        try:
+            with transaction.atomic():
+                SerieDAT.objects.create(
+                    explotacion_id=explotacion_id, anio=anio, ultimo_numero=maximo
+                )
+        except IntegrityError:
+            series.update(ultimo_numero=Greatest("ultimo_numero", maximo))
@@ -0,0 +1,246 @@
+"""
+Resolución de parcelas a partir del texto que indica el usuario.
+
+Las parcelas se indexan en memoria (una consulta al primer uso) por:
+
+- Referencia SIGPAC normalizada (sin ceros a la izquierda y con cualquier
+  separador): completa, provincia/municipio/polígono/parcela/recinto,
+  polígono/parcela/recinto y polígono/parcela.
+- Especie, variedad y alias definidos por el usuario ("la de abajo"), sin
+  mayúsculas ni tildes.
+
+El índice se actualiza parcela a parcela con ``post_save``/``post_delete`` al
+confirmarse la transacción, y se reconstruye entero cada ``MAESTROS_CACHE_TTL``
+segundos para recoger cambios hechos desde otros procesos (p. ej. el admin).
+"""
+
+import copy
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from gestion.models import Parcela
+
+# Puntuación de cada tipo de coincidencia (mayor = más fiable)
+SIGPAC_COMPLETA = 100
+ALIAS = 90
+POL_PAR_REC = 80
+ESPECIE_VARIEDAD = 70
+POL_PAR = 60
+PARCIAL = 50
+
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def _partes_sigpac(texto):
+    partes = [p for p in _SEPARADORES.split(normalizar_texto(texto)) if p]
+    return [p.lstrip("0") or "0" if p.isdigit() else p for p in partes]
+
+
+def _claves_sigpac(parcela):
+    """Claves SIGPAC de una parcela con la puntuación de cada una."""
+    claves = {}
+    partes = _partes_sigpac(parcela.referencia_sigpac)
+    if len(partes) >= 3:
+        claves[":".join(partes)] = SIGPAC_COMPLETA
+    if len(partes) == 7:
+        # prov:mun:agregado:zona:pol:par:rec -> prov:mun:pol:par:rec
+        claves[":".join(partes[:2] + partes[4:])] = SIGPAC_COMPLETA
+
+    pol_par_rec = [
+        _partes_sigpac(v)[0] if _partes_sigpac(v) else ""
+        for v in (parcela.poligono, parcela.parcela, parcela.recinto)
+    ]
+    if not all(pol_par_rec[:2]) and len(partes) >= 5:
+        pol_par_rec = partes[-3:]
+    if all(pol_par_rec):
+        claves.setdefault(":".join(pol_par_rec), POL_PAR_REC)
+    if all(pol_par_rec[:2]):
+        claves.setdefault(":".join(pol_par_rec[:2]), POL_PAR)
+    return claves
+
+
+def _textos(parcela):
+    """Textos exactos (especie, variedad, alias) de una parcela con su puntuación."""
+    textos = {}
+    for valor in (parcela.especie, parcela.variedad):
+        if normalizar_texto(valor):
+            textos.setdefault(normalizar_texto(valor), ESPECIE_VARIEDAD)
+    for alias in (parcela.alias or "").split(","):
+        if normalizar_texto(alias):
+            textos[normalizar_texto(alias)] = ALIAS
+    return textos
+
+
+class IndiceParcelas:
+    """Índice en memoria de parcelas, seguro entre hilos."""
+
+    def __init__(self, ttl=None):
+        self.ttl = settings.MAESTROS_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._parcelas = None
+        self._claves = {}
+        self._texto_completo = {}
+        self._caduca = 0
+        self._cambios = 0
+
+    # --- Mantenimiento -----------------------------------------------------
+
+    def _asegurar_cargado(self):
+        if self._parcelas is not None and time.monotonic() < self._caduca:
+            return
+        cambios = self._cambios
+        parcelas = list(Parcela.objects.order_by("pk"))
+        with self._lock:
+            self._parcelas = {}
+            self._claves = {}
+            self._texto_completo = {}
+            for parcela in parcelas:
+                self._indexar(parcela)
+            # Un cambio confirmado durante la carga puede no estar en la lista:
+            # se sirve esta versión y se recarga en la siguiente búsqueda
+            recargar = cambios != self._cambios
+            self._caduca = 0 if recargar else time.monotonic() + self.ttl
+
+    def _indexar(self, parcela):
+        self._parcelas[parcela.pk] = parcela
+        self._texto_completo[parcela.pk] = " | ".join(
+            normalizar_texto(c)
+            for c in (
+                parcela.referencia_sigpac,
+                parcela.especie,
+                parcela.variedad,
+                parcela.alias,
+            )
+        )
+        for clave, puntos in {**_claves_sigpac(parcela), **_textos(parcela)}.items():
+            self._claves.setdefault(clave, {})[parcela.pk] = puntos
+
+    def _desindexar(self, pk):
+        parcela = self._parcelas.pop(pk, None)
+        if parcela is None:
+            return
+        self._texto_completo.pop(pk, None)
+        for clave in {**_claves_sigpac(parcela), **_textos(parcela)}:
+            pks = self._claves.get(clave, {})
+            pks.pop(pk, None)
+            if not pks:
+                self._claves.pop(clave, None)
+
+    def actualizar(self, parcela):
+        with self._lock:
+            self._cambios += 1
+            if self._parcelas is None:
+                return
+            self._desindexar(parcela.pk)
+            self._indexar(parcela)
+
+    def eliminar(self, pk):
+        with self._lock:
+            self._cambios += 1
+            if self._parcelas is not None:
+                self._desindexar(pk)
+
+    def invalidar(self):
+        with self._lock:
+            self._parcelas = None
+            self._claves = {}
+            self._texto_completo = {}
+
+    # --- Búsqueda ----------------------------------------------------------
+
+    def candidatas(self, texto, limite=5):
+        """
+        Parcelas que encajan con ``texto``, de mejor a peor: lista de
+        ``(parcela, puntuacion)``. A igual puntuación, la de menor id.
+        """
+        texto_norm = normalizar_texto(texto)
+        if not texto_norm:
+            return []
+        self._asegurar_cargado()
+
+        with self._lock:
+            puntos = {}
+            claves = {texto_norm, ":".join(_partes_sigpac(texto))}
+            for clave in claves:
+                for pk, p in self._claves.get(clave, {}).items():
+                    puntos[pk] = max(puntos.get(pk, 0), p)
+
+            if not puntos:
+                # Sin coincidencia exacta: búsqueda parcial, como el antiguo icontains
+                for pk, completo in self._texto_completo.items():
+                    if texto_norm in completo:
+                        puntos[pk] = PARCIAL
+
+            ordenadas = sorted(puntos.items(), key=lambda kv: (-kv[1], kv[0]))
+            return [(self._parcelas[pk], p) for pk, p in ordenadas[:limite]]
+
+    def coincidentes(self, texto):
+        """
+        Ids de todas las parcelas que encajan con ``texto``, de forma exacta o
+        parcial (equivale a un ``icontains`` sobre SIGPAC, cultivo, variedad y alias).
+        """
+        texto_norm = normalizar_texto(texto)
+        if not texto_norm:
+            return []
+        self._asegurar_cargado()
+
+        with self._lock:
+            pks = set(self._claves.get(":".join(_partes_sigpac(texto)), {}))
+            pks.update(
+                pk
+                for pk, completo in self._texto_completo.items()
+                if texto_norm in completo
+            )
+            return sorted(pks)
+
+    def resolver(self, texto):
+        mejores = self.candidatas(texto, limite=1)
+        return mejores[0][0] if mejores else None
+
+
+indice = IndiceParcelas()
+
+
+def _al_guardar(sender, instance, **kwargs):
+    parcela = copy.copy(instance)
+    parcela._state = copy.copy(instance._state)
+    parcela._state.fields_cache = {}
+    transaction.on_commit(lambda: indice.actualizar(parcela))
+
+
+def _al_borrar(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: indice.eliminar(pk))
+
+
+def conectar_senales():
+    post_save.connect(_al_guardar, sender=Parcela, dispatch_uid="indice-parcelas-save")
+    post_delete.connect(
+        _al_borrar, sender=Parcela, dispatch_uid="indice-parcelas-delete"
+    )
+
+
+def resolver_parcela(referencia):
+    """Mejor parcela para ``referencia`` (SIGPAC, especie, variedad o alias)."""
+    return indice.resolver(referencia)
+
+
+def resolver_parcelas(referencias):
+    """
+    Resuelve varias referencias de una vez. Devuelve ``{referencia: Parcela |
+    None}`` con las referencias sin espacios sobrantes.
+    """
+    referencias = dict.fromkeys(r.strip() for r in referencias if r.strip())
+    return {ref: indice.resolver(ref) for ref in referencias}
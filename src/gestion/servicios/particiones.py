@@ -0,0 +1,80 @@
+"""
+Particiones por año de las tablas grandes del cuaderno (solo PostgreSQL).
+
+La migración 0011 convierte DiarioActividad en una tabla particionada por rango
+de ``fecha``: una partición ``<tabla>_<año>`` por año y ``<tabla>_default`` para
+las fechas que no tienen la suya. Las consultas acotadas por fecha (cuaderno,
+histórico por año) solo leen las particiones de su rango sin cambiar el ORM.
+
+Las particiones de años futuros se crean por adelantado con
+``manage.py crear_particiones``. Si ya hay filas de ese año en la partición por
+defecto (p. ej. importadas de un cuaderno antiguo), se trasladan a la nueva.
+"""
+
+from django.db import connection, transaction
+
+from gestion.models import DiarioActividad
+
+# Modelos particionados y su columna de partición
+MODELOS_PARTICIONADOS = {DiarioActividad: "fecha"}
+
+
+def esta_particionada(modelo):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [modelo._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def particiones(modelo):
+    """Años con partición propia de ``modelo``."""
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [tabla],
+        )
+        nombres = [fila[0] for fila in cursor.fetchall()]
+    sufijos = (nombre.removeprefix(f"{tabla}_") for nombre in nombres)
+    return sorted(int(s) for s in sufijos if s.isdigit())
+
+
+def crear_particion(modelo, anio):
+    """
+    Crea la partición de ``anio`` de ``modelo`` moviendo a ella las filas de ese
+    año que hubiera en la partición por defecto. Devuelve el nº de filas movidas.
+    """
+    tabla = modelo._meta.db_table
+    columna = MODELOS_PARTICIONADOS[modelo]
+    particion = f"{tabla}_{anio}"
+    desde, hasta = f"{anio}-01-01", f"{anio + 1}-01-01"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Evita que entren filas de ese año en la partición por defecto mientras tanto
+        cursor.execute(f"LOCK TABLE {tabla}_default IN EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TABLE {particion} (LIKE {tabla} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH movidas AS (
+                DELETE FROM {tabla}_default
+                WHERE {columna} >= %s AND {columna} < %s
+                RETURNING *
+            )
+            INSERT INTO {particion} SELECT * FROM movidas
+            """,
+            [desde, hasta],
+        )
+        movidas = cursor.rowcount
+        # Al adjuntarla, PostgreSQL le crea los índices y claves ajenas de la tabla
+        cursor.execute(
+            f"ALTER TABLE {tabla} ATTACH PARTITION {particion} "
+            f"FOR VALUES FROM ('{desde}') TO ('{hasta}')"
+        )
+    return movidas
@@ -0,0 +1,100 @@
+"""
+Relleno de modelos oficiales en PDF (cuaderno de explotación, DAT).
+
+Cada modelo se lee una sola vez por proceso. Los datos se dibujan con reportlab
+en una capa (un PDF con una página por hoja) y cada página de la capa se
+superpone a su página del modelo sin copiar el contenido del modelo: todas las
+hojas que usan la misma página del modelo comparten sus objetos en el PDF final.
+"""
+
+import io
+from decimal import Decimal
+
+from pypdf import PageObject, PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+FUENTE = "Helvetica"
+TAMANO_MINIMO = 4.5
+
+
+def leer_plantilla(ruta):
+    """Modelo en PDF leído en memoria (el fichero no queda abierto)."""
+    return PdfReader(io.BytesIO(ruta.read_bytes()))
+
+
+def formatear(valor):
+    """Valor como texto para el PDF (vacío si no hay valor)."""
+    if valor is None:
+        return ""
+    if isinstance(valor, Decimal):
+        # 1.5000 -> "1,5"
+        return format(valor.normalize(), "f").replace(".", ",")
+    return str(valor)
+
+
+def ajustar(texto, ancho, tamano):
+    """Reduce el tamaño de letra (y recorta el texto si no basta) hasta que quepa."""
+    medida = stringWidth(texto, FUENTE, tamano)
+    if medida <= ancho:
+        return texto, tamano
+    # El ancho es proporcional al tamaño: se calcula el que cabe, en medios puntos
+    reducido = int(tamano * ancho / medida * 2) / 2
+    if reducido >= TAMANO_MINIMO:
+        return texto, reducido
+    while texto and stringWidth(texto, FUENTE, TAMANO_MINIMO) > ancho:
+        texto = texto[:-2] + "…"
+    return texto, TAMANO_MINIMO
+
+
+def componer(plantilla, capa, paginas):
+    """
+    PDF final: cada página de ``capa`` sobre la página ``paginas[i]`` de
+    ``plantilla``. El contenido y los recursos de cada página del modelo se copian
+    una sola vez al documento y todas sus hojas los referencian.
+    """
+    escritor = PdfWriter()
+    # El contenido del modelo va entre q/Q para que no altere el estado gráfico de la capa
+    guardar, restaurar = (
+        escritor._add_object(_flujo(datos)) for datos in (b"q\n", b"\nQ\n")
+    )
+    copiadas = {}
+    for capa_pagina, indice in zip(capa.pages, paginas):
+        if indice not in copiadas:
+            original = plantilla.pages[indice]
+            contenido = original.raw_get("/Contents").clone(escritor)
+            if isinstance(contenido.get_object(), ArrayObject):
+                contenido = list(contenido.get_object())
+            else:
+                contenido = [contenido]
+            recursos = original["/Resources"].clone(escritor).get_object()
+            copiadas[indice] = (original, contenido, recursos)
+        original, contenido, recursos = copiadas[indice]
+
+        recursos = DictionaryObject(recursos)
+        fuentes = DictionaryObject(recursos.get("/Font", {}))
+        fuentes.update(capa_pagina["/Resources"]["/Font"].clone(escritor).get_object())
+        recursos[NameObject("/Font")] = fuentes
+
+        hoja = PageObject(escritor)
+        hoja[NameObject("/Type")] = NameObject("/Page")
+        for clave in ("/MediaBox", "/CropBox", "/Rotate"):
+            if clave in original:
+                hoja[NameObject(clave)] = original[clave]
+        hoja[NameObject("/Resources")] = recursos
+        hoja[NameObject("/Contents")] = ArrayObject(
+            [
+                guardar,
+                *contenido,
+                restaurar,
+                capa_pagina.raw_get("/Contents").clone(escritor),
+            ]
+        )
+        escritor.add_page(hoja)
+    return escritor
+
+
+def _flujo(datos):
+    flujo = DecodedStreamObject()
+    flujo.set_data(datos)
+    return flujo
@@ -0,0 +1,278 @@
+"""
+Importación en bloque de recintos SIGPAC a las parcelas de una explotación.
+
+Admite el CSV o el GeoJSON que exportan el visor SIGPAC y las aplicaciones de la
+declaración de la PAC. Las columnas se reconocen por nombre (sin mayúsculas ni
+tildes, con sus abreviaturas habituales: ``prov``, ``pol``, ``rec``, ``uso``...);
+de la geometría del GeoJSON solo se leen las propiedades.
+
+Cada recinto se identifica por polígono/parcela/recinto dentro de la explotación
+(restricción ``parcela_recinto_unico``): los que ya existen se actualizan con las
+columnas del fichero y los demás se crean, todo en un ``bulk_create`` con
+``update_conflicts`` (INSERT ... ON CONFLICT DO UPDATE). El alias y los demás
+datos que no trae el fichero se conservan.
+"""
+
+import csv
+import io
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from gestion.models import Parcela
+from gestion.servicios import snapshots
+from gestion.servicios.parcelas import indice as indice_parcelas
+from gestion.servicios.parcelas import normalizar_texto
+
+CLAVE = ("explotacion", "poligono", "parcela", "recinto")
+TAMANO_LOTE = 500
+
+# Campo de la parcela (o dato del recinto) y nombres de columna que lo contienen
+COLUMNAS = {
+    "provincia": ("provincia", "prov", "cod_provincia", "cd_prov"),
+    "municipio": ("municipio", "mun", "cod_municipio", "cd_mun"),
+    "agregado": ("agregado", "agr"),
+    "zona": ("zona",),
+    "poligono": ("poligono", "pol"),
+    "parcela": ("parcela", "par", "parc"),
+    "recinto": ("recinto", "rec"),
+    "referencia_sigpac": ("referencia_sigpac", "referencia", "ref_sigpac", "sigpac"),
+    "uso_sigpac": ("uso_sigpac", "uso"),
+    "superficie_sigpac": (
+        "superficie_sigpac",
+        "superficie",
+        "superficie_ha",
+        "sup_sigpac",
+    ),
+    # Superficie en m² (visor SIGPAC)
+    "superficie_m2": ("dn_surface", "superficie_m2"),
+    "superficie_cultivada": (
+        "superficie_cultivada",
+        "superficie_declarada",
+        "sup_declarada",
+        "sup_cultivada",
+    ),
+    "especie": ("especie", "cultivo", "producto"),
+    "variedad": ("variedad",),
+    "secano_regadio": ("secano_regadio", "regimen", "sistema_explotacion"),
+    "aire_protegido": ("aire_protegido", "aire_libre_protegido"),
+    "alias": ("alias", "nombre"),
+}
+_CAMPO_COLUMNA = {
+    columna: campo for campo, columnas in COLUMNAS.items() for columna in columnas
+}
+
+_SECANO_REGADIO = {"s": "Secano", "r": "Regadío"}
+_CUATRO_DECIMALES = Decimal("0.0001")
+
+
+class ErrorImportacion(Exception):
+    """Fichero de recintos que no se puede importar (formato o datos no válidos)."""
+
+
+def normalizar_numero(valor):
+    """Código SIGPAC sin ceros a la izquierda ("007" -> "7"); ``None`` si está vacío."""
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    if re.fullmatch(r"\d+(\.0+)?", texto):
+        return texto.split(".")[0].lstrip("0") or "0"
+    return texto or None
+
+
+def desglosar_referencia(referencia):
+    """
+    ``(provincia, municipio, agregado, zona, poligono, parcela, recinto)`` de una
+    referencia SIGPAC con 7 números, o con 5 (sin agregado ni zona) o 3 (solo
+    polígono, parcela y recinto), con las partes que falten a ``None``. ``None``
+    si la referencia no tiene esa forma.
+    """
+    numeros = [normalizar_numero(n) for n in re.findall(r"\d+", referencia or "")]
+    if len(numeros) == 7:
+        return tuple(numeros)
+    if len(numeros) == 5:
+        return (*numeros[:2], None, None, *numeros[2:])
+    if len(numeros) == 3:
+        return (None, None, None, None, *numeros)
+    return None
+
+
+def _nombre_columna(nombre):
+    return re.sub(r"[^0-9a-z]+", "_", normalizar_texto(nombre)).strip("_")
+
+
+def _decodificar(contenido):
+    # Los exports de las administraciones suelen venir en Latin-1
+    try:
+        return contenido.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return contenido.decode("cp1252")
+
+
+def _leer_csv(texto):
+    try:
+        delimitador = csv.Sniffer().sniff(texto[:4096], delimiters=";,\t|").delimiter
+    except csv.Error:
+        delimitador = ";"
+    return list(csv.DictReader(io.StringIO(texto), delimiter=delimitador))
+
+
+def _leer_geojson(texto):
+    try:
+        datos = json.loads(texto)
+    except json.JSONDecodeError as e:
+        raise ErrorImportacion(f"GeoJSON no válido: {e}")
+    if datos.get("type") == "Feature":
+        datos = {"features": [datos]}
+    if not isinstance(datos.get("features"), list):
+        raise ErrorImportacion("El GeoJSON no tiene 'features'.")
+    return [f.get("properties") or {} for f in datos["features"]]
+
+
+def _decimal(valor, fila, columna):
+    if valor is None or isinstance(valor, (int, float)):
+        return None if valor is None else Decimal(str(valor))
+    texto = str(valor).strip().replace(" ", "")
+    if not texto:
+        return None
+    if "," in texto:
+        # 1.234,5678 o 1,2345 (coma decimal)
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ErrorImportacion(f"Fila {fila}: '{valor}' no es un número ({columna}).")
+
+
+def _texto(valor):
+    return "" if valor is None else str(valor).strip()
+
+
+def _recinto(registro, fila):
+    """Datos de la parcela de un registro del fichero (ya con los campos reconocidos)."""
+    datos = {}
+    partes = dict.fromkeys(
+        ("provincia", "municipio", "agregado", "zona", "poligono", "parcela", "recinto")
+    )
+    desglose = desglosar_referencia(_texto(registro.get("referencia_sigpac")))
+    if desglose:
+        partes.update(zip(partes, desglose))
+    for parte in partes:
+        if _texto(registro.get(parte)):
+            partes[parte] = normalizar_numero(registro[parte])
+    if not all(partes[p] for p in ("poligono", "parcela", "recinto")):
+        raise ErrorImportacion(
+            f"Fila {fila}: falta el polígono, la parcela o el recinto."
+        )
+    datos.update((p, partes[p]) for p in ("poligono", "parcela", "recinto"))
+
+    if partes["provincia"] and partes["municipio"]:
+        datos["referencia_sigpac"] = ":".join(partes[p] or "0" for p in partes)
+    else:
+        datos["referencia_sigpac"] = _texto(registro.get("referencia_sigpac")) or (
+            ":".join(partes[p] for p in ("poligono", "parcela", "recinto"))
+        )
+
+    for campo in ("uso_sigpac", "especie", "variedad", "aire_protegido", "alias"):
+        if campo in registro:
+            datos[campo] = _texto(registro[campo])
+    if "secano_regadio" in registro:
+        valor = _texto(registro["secano_regadio"])
+        datos["secano_regadio"] = _SECANO_REGADIO.get(valor.lower(), valor)
+
+    if "superficie_sigpac" in registro:
+        datos["superficie_sigpac"] = _decimal(
+            registro["superficie_sigpac"], fila, "superficie"
+        )
+    elif "superficie_m2" in registro:
+        metros = _decimal(registro["superficie_m2"], fila, "superficie")
+        datos["superficie_sigpac"] = None if metros is None else metros / 10_000
+    if "superficie_cultivada" in registro:
+        datos["superficie_cultivada"] = _decimal(
+            registro["superficie_cultivada"], fila, "superficie cultivada"
+        )
+    for campo in ("superficie_sigpac", "superficie_cultivada"):
+        if datos.get(campo) is not None:
+            datos[campo] = datos[campo].quantize(_CUATRO_DECIMALES)
+
+    for campo, valor in datos.items():
+        maximo = Parcela._meta.get_field(campo).max_length
+        if maximo and valor and len(valor) > maximo:
+            raise ErrorImportacion(
+                f"Fila {fila}: {campo} tiene más de {maximo} caracteres."
+            )
+    return datos
+
+
+def leer_recintos(contenido, nombre):
+    """
+    Lee un fichero de recintos (``contenido`` en bytes; el formato se deduce de
+    ``nombre`` o del propio contenido). Devuelve la lista de datos de parcela de
+    cada recinto. Lanza ErrorImportacion con la fila del primer error.
+    """
+    texto = _decodificar(contenido)
+    if nombre.lower().endswith((".geojson", ".json")) or texto.lstrip().startswith("{"):
+        registros, primera_fila = _leer_geojson(texto), 1
+    else:
+        registros, primera_fila = _leer_csv(texto), 2
+
+    recintos, filas_por_clave = [], {}
+    for fila, registro in enumerate(registros, start=primera_fila):
+        registro = {
+            _CAMPO_COLUMNA[_nombre_columna(columna)]: valor
+            for columna, valor in registro.items()
+            if columna and _nombre_columna(columna) in _CAMPO_COLUMNA
+        }
+        datos = _recinto(registro, fila)
+        clave = (datos["poligono"], datos["parcela"], datos["recinto"])
+        if clave in filas_por_clave:
+            raise ErrorImportacion(
+                f"Fila {fila}: el recinto {'/'.join(clave)} ya aparece en la fila "
+                f"{filas_por_clave[clave]}."
+            )
+        filas_por_clave[clave] = fila
+        recintos.append(datos)
+    if not recintos:
+        raise ErrorImportacion("El fichero no tiene recintos.")
+    return recintos
+
+
+@transaction.atomic
+def importar_recintos(explotacion, contenido, nombre):
+    """
+    Crea o actualiza en bloque las parcelas de ``explotacion`` con los recintos
+    del fichero. Devuelve ``(creadas, actualizadas)``.
+    """
+    recintos = leer_recintos(contenido, nombre)
+    existentes = set(
+        Parcela.objects.filter(explotacion=explotacion).values_list(
+            "poligono", "parcela", "recinto"
+        )
+    )
+    # Se actualizan solo las columnas que trae el fichero
+    actualizar = sorted(set().union(*recintos) - set(CLAVE))
+    parcelas = []
+    for datos in recintos:
+        parcela = Parcela(explotacion=explotacion, **datos)
+        # Las nuevas sin superficie cultivada toman la de SIGPAC, como en crear_parcela
+        if "superficie_cultivada" not in datos:
+            parcela.superficie_cultivada = parcela.superficie_sigpac
+        parcelas.append(parcela)
+
+    Parcela.objects.bulk_create(
+        parcelas,
+        batch_size=TAMANO_LOTE,
+        update_conflicts=True,
+        unique_fields=CLAVE,
+        update_fields=actualizar,
+    )
+    # bulk_create no emite señales: snapshots del cuaderno e índice de parcelas
+    snapshots.invalidar(snapshots.MAESTROS[Parcela], explotacion.pk)
+    transaction.on_commit(indice_parcelas.invalidar)
+
+    creadas = sum(
+        (d["poligono"], d["parcela"], d["recinto"]) not in existentes for d in recintos
+    )
+    return creadas, len(recintos) - creadas
@@ -0,0 +1,149 @@
+"""
+Invalidación de los snapshots del cuaderno (SnapshotCuaderno).
+
+Cada sección del cuaderno de un año se guarda ya generada. Al guardar o borrar
+un registro, solo se invalidan las secciones que lo muestran:
+
+- Actividades del diario, semillas, análisis y ventas: la sección de su tipo,
+  en el año de su fecha (y en el año anterior del registro si se ha movido).
+- Parcelas: parcelas, tratamientos y fertilización de su explotación.
+- Personal y equipos: información general y tratamientos.
+- Resto de maestros (explotación, titular, direcciones, personas, asesores):
+  información general.
+
+La invalidación es un UPDATE dentro de la misma transacción que el cambio e
+incrementa ``version``, así que un cuaderno que se estuviera generando a la vez
+no guarda un texto anterior al cambio. Las operaciones que no emiten señales
+(``bulk_create``, ``QuerySet.update``) deben llamar a ``invalidar``.
+
+Los snapshots se generan con los maestros leídos de la BD, no con los de la
+caché de ``maestros``, que en otro proceso puede seguir teniendo los datos de
+antes del cambio hasta que caduque.
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils.dateparse import parse_date
+
+from gestion.models import (
+    AnalisisLaboratorio,
+    Asesor,
+    DiarioActividad,
+    Direccion,
+    EquipoAplicacion,
+    Explotacion,
+    Parcela,
+    Persona,
+    Personal,
+    RegistroMovimientoProducto,
+    SemillaTratada,
+    SnapshotCuaderno,
+    Titular,
+)
+
+# Sección del cuaderno en la que aparece cada tipo de actividad del diario
+SECCION_POR_TIPO = {
+    "TRATAMIENTO": "tratamientos",
+    "ABONADO": "fertilizacion",
+    "RIEGO": "fertilizacion",
+}
+
+# Modelos con fecha: sección que los muestra y campo de fecha
+REGISTROS_CON_FECHA = {
+    SemillaTratada: ("tratamientos", "fecha_siembra"),
+    AnalisisLaboratorio: ("analisis", "fecha"),
+    RegistroMovimientoProducto: ("cosecha", "fecha"),
+}
+
+# Maestros: secciones de todos los años que los muestran
+MAESTROS = {
+    Parcela: ("parcelas", "tratamientos", "fertilizacion"),
+    Personal: ("general", "tratamientos"),
+    EquipoAplicacion: ("general", "tratamientos"),
+    Explotacion: ("general",),
+    Titular: ("general",),
+    Direccion: ("general",),
+    Persona: ("general",),
+    Asesor: ("general",),
+}
+
+
+def invalidar(secciones, explotacion_id=None, anio=None):
+    """Marca como no válidas las ``secciones`` (de una explotación/año si se indican)."""
+    # También las no válidas: puede haber un cuaderno generándose con ellas
+    qs = SnapshotCuaderno.objects.filter(seccion__in=secciones)
+    if explotacion_id is not None:
+        qs = qs.filter(explotacion_id=explotacion_id)
+    if anio is not None:
+        qs = qs.filter(anio=anio)
+    qs.update(valido=False, contenido="", version=F("version") + 1)
+
+
+def _anio(fecha):
+    """
+    Año de ``fecha``. Los registros creados desde las herramientas llevan la
+    fecha como texto, tal como la acepta ``DateField`` (p. ej. "2024-5-1"); si
+    no se reconoce, None (se invalidan todos los años).
+    """
+    if hasattr(fecha, "year"):
+        return fecha.year
+    fecha = parse_date(str(fecha))
+    return fecha.year if fecha else None
+
+
+def invalidar_actividades(explotacion_id, fecha, tipo):
+    """Invalida la sección donde aparece una actividad del diario."""
+    seccion = SECCION_POR_TIPO.get(tipo)
+    if seccion and fecha:
+        invalidar([seccion], explotacion_id, _anio(fecha))
+
+
+def _clave(instance):
+    """(secciones, explotacion_id, año) que muestran ``instance``."""
+    if isinstance(instance, DiarioActividad):
+        seccion = SECCION_POR_TIPO.get(instance.tipo)
+        fecha = instance.fecha
+    else:
+        seccion, campo = REGISTROS_CON_FECHA[type(instance)]
+        fecha = getattr(instance, campo)
+    if not seccion or not fecha:
+        return None
+    return [seccion], instance.explotacion_id, _anio(fecha)
+
+
+def _antes_de_guardar(sender, instance, **kwargs):
+    # Si el registro cambia de año, tipo o explotación, su sección anterior también
+    if instance._state.adding or instance.pk is None:
+        return
+    anterior = sender.objects.filter(pk=instance.pk).first()
+    if anterior is not None:
+        clave = _clave(anterior)
+        if clave:
+            invalidar(*clave)
+
+
+def _registro_cambiado(sender, instance, **kwargs):
+    clave = _clave(instance)
+    if clave:
+        invalidar(*clave)
+
+
+def _maestro_cambiado(sender, instance, **kwargs):
+    explotacion_id = instance.explotacion_id if sender is Parcela else None
+    invalidar(MAESTROS[sender], explotacion_id)
+
+
+def conectar_senales():
+    for modelo in (DiarioActividad, *REGISTROS_CON_FECHA):
+        uid = f"snapshots-cuaderno-{modelo.__name__}"
+        pre_save.connect(_antes_de_guardar, sender=modelo, dispatch_uid=uid + "-pre")
+        post_save.connect(_registro_cambiado, sender=modelo, dispatch_uid=uid + "-save")
+        post_delete.connect(
+            _registro_cambiado, sender=modelo, dispatch_uid=uid + "-delete"
+        )
+    for modelo in MAESTROS:
+        uid = f"snapshots-cuaderno-{modelo.__name__}"
+        post_save.connect(_maestro_cambiado, sender=modelo, dispatch_uid=uid + "-save")
+        post_delete.connect(
+            _maestro_cambiado, sender=modelo, dispatch_uid=uid + "-delete"
+        )
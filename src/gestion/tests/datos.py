@@ -0,0 +1,68 @@
+"""Datos de prueba comunes a los tests de ``gestion``."""
+
+from gestion.models import (
+    Destinatario,
+    Direccion,
+    Explotacion,
+    Parcela,
+    Persona,
+    Titular,
+    Transportista,
+    Vehiculo,
+)
+
+
+def crear_explotacion(destinatarios=1):
+    """
+    Explotación con titular, una parcela de mango, un transportista, una persona
+    autorizada y ``destinatarios`` clientes («Cliente 0», «Cliente 1»...), cada
+    uno con su vehículo asignado.
+    """
+    direccion = Direccion.objects.create(localidad="Vélez-Málaga", provincia="Málaga")
+    titular = Titular.objects.create(
+        nombre="Titular",
+        apellidos="Pruebas",
+        tipo_documento="DNI",
+        documento="B0000000",
+        direccion=direccion,
+        registro_explotacion="ES000",
+    )
+    explotacion = Explotacion.objects.create(
+        nombre="Finca Pruebas", nif="B0000000", direccion=direccion, titular=titular
+    )
+    Parcela.objects.create(
+        explotacion=explotacion,
+        referencia_sigpac="29:94:0:0:1:1:1",
+        poligono="1",
+        parcela="1",
+        recinto="1",
+        especie="MANGO",
+        variedad="Osteen",
+    )
+    Persona.objects.create(nombre="Autorizado Pruebas", nif="A0000000")
+    Transportista.objects.create(nombre="Transportes Pruebas", nif="X0000000")
+    for i in range(destinatarios):
+        Destinatario.objects.create(
+            nombre=f"Cliente {i}",
+            tipo_documento="DNI",
+            documento=f"C{i:07d}",
+            direccion=direccion,
+            transporte_asignado=Vehiculo.objects.create(
+                tipo="COCHE", matricula=f"{i:04d}PRB"
+            ),
+        )
+    return explotacion
+
+
+def peticion_dat(i=0):
+    """Petición de DAT para el destinatario «Cliente ``i``»."""
+    return {
+        "nombre_destinatario": f"Cliente {i}",
+        "productos": ["MANGO"],
+        "variedades": ["Osteen"],
+        "cantidades": [100 + i],
+        "unidades": ["kg"],
+        "nif_transportista": "X0000000",
+        "nombre_autorizado": "Autorizado Pruebas",
+        "nif_autorizado": "A0000000",
+    }
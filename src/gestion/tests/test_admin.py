@@ -0,0 +1,134 @@
+from datetime import date
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gestion.admin import GestionAdmin
+from gestion.management.commands.benchmark_mcp import sembrar_historico
+from gestion.models import (
+    Asesor,
+    DiarioActividad,
+    Dummy,
+    EquipoAplicacion,
+    Persona,
+    Personal,
+    SnapshotCuaderno,
+)
+from gestion.servicios.dat import emitir_datos_dats
+
+from .datos import crear_explotacion, peticion_dat
+
+
+class ListadosAdminTests(TestCase):
+    """
+    Los listados de todos los admins registrados, con y sin búsqueda y con cada
+    filtro, no superan GestionAdmin.CONSULTAS_MAXIMAS consultas con varias filas
+    por tabla (un N+1 en una columna las multiplicaría).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        explotacion = crear_explotacion(destinatarios=3)
+        emitir_datos_dats([peticion_dat(i) for i in range(3)])
+        sembrar_historico(100)
+        for i in range(3):
+            Dummy.objects.create(nombre=f"Dummy {i}")
+            Personal.objects.create(
+                nombre=f"Operario {i}",
+                apellidos="Pruebas",
+                sexo="H",
+                tipo_documento="DNI",
+                documento=f"P{i:07d}",
+                cargo="Aplicador",
+            )
+            Asesor.objects.create(
+                persona=Persona.objects.create(nombre=f"Asesor {i}", nif=f"S{i:07d}"),
+                tipo_carnet="cualificado",
+            )
+            EquipoAplicacion.objects.create(
+                descripcion=f"Atomizador {i}",
+                fecha_ultima_inspeccion=date(2024, 1, 1),
+                explotacion=explotacion,
+            )
+            SnapshotCuaderno.objects.create(
+                explotacion=explotacion, anio=2024, seccion=f"seccion_{i}"
+            )
+        cls.usuario = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _consultas(self, url):
+        with self.subTest(url):
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertLessEqual(len(capturadas), GestionAdmin.CONSULTAS_MAXIMAS)
+        return respuesta
+
+    def test_listados(self):
+        for modelo, modelo_admin in admin.site._registry.items():
+            opciones = modelo._meta
+            listado = reverse(
+                f"admin:{opciones.app_label}_{opciones.model_name}_changelist"
+            )
+            urls = [listado]
+            cl = self._consultas(listado).context["cl"]
+            # Primera opción de cada filtro que no sea «Todo»
+            for filtro in cl.filter_specs:
+                urls += [
+                    f"{listado}{opcion['query_string']}"
+                    for opcion in filtro.choices(cl)
+                    if not opcion["selected"]
+                ][:1]
+            if modelo_admin.search_fields:
+                urls += [f"{url}{'&' if '?' in url else '?'}q=pruebas" for url in urls]
+            for url in urls[1:]:
+                self._consultas(url)
+
+
+class ExportarXlsxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar_historico(20)
+        cls.usuario = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _exportar(self):
+        return self.client.post(
+            reverse("admin:gestion_diarioactividad_changelist"),
+            {
+                "action": "exportar_xlsx",
+                "select_across": "1",
+                "index": "0",
+                admin.helpers.ACTION_CHECKBOX_NAME: [
+                    DiarioActividad.objects.values_list("pk", flat=True).first()
+                ],
+            },
+        )
+
+    def test_exportacion(self):
+        respuesta = self._exportar()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn("diario_", respuesta["Content-Disposition"])
+        self.assertTrue(b"".join(respuesta.streaming_content).startswith(b"PK"))
+
+    def test_limite(self):
+        with mock.patch("gestion.admin.LIMITE_XLSX", 19):
+            respuesta = self._exportar()
+        self.assertEqual(respuesta.status_code, 302)
+        mensajes = [str(m) for m in get_messages(respuesta.wsgi_request)]
+        self.assertEqual(len(mensajes), 1)
+        self.assertIn("exportar_historico", mensajes[0])
@@ -0,0 +1,73 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from gestion.models import DiarioActividad, Personal, SnapshotCuaderno
+from gestion.servicios import maestros
+from gestion.servicios.cuaderno import SECCIONES, generar_cuaderno
+
+from .datos import crear_explotacion
+
+ANIO = 2024
+
+
+class SnapshotsMaestrosTests(TestCase):
+    """Los snapshots se generan con los maestros de la BD, no con la caché."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.explotacion = crear_explotacion()
+        Personal.objects.create(
+            nombre="Operario",
+            apellidos="Antiguo",
+            sexo="H",
+            tipo_documento="DNI",
+            documento="P0000000",
+            cargo="Aplicador cualificado",
+            habilitado_fitosanitarios=True,
+        )
+
+    def setUp(self):
+        cache = mock.patch.object(maestros, "cache", maestros.CacheMaestros(ttl=300))
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def test_cambio_sin_senal(self):
+        # La caché guarda el aplicador; el cambio (sin señales, como desde otro
+        # proceso) no la invalida
+        self.assertIn("Operario Antiguo", generar_cuaderno(ANIO, usar_snapshots=False))
+        Personal.objects.update(apellidos="Nuevo")
+        self.assertEqual(maestros.aplicadores()[0].apellidos, "Antiguo")
+
+        self.assertIn("Operario Nuevo", generar_cuaderno(ANIO))
+        general = SnapshotCuaderno.objects.get(
+            explotacion=self.explotacion, anio=ANIO, seccion="general"
+        )
+        self.assertTrue(general.valido)
+        self.assertIn("Operario Nuevo", general.contenido)
+        self.assertNotIn("Antiguo", general.contenido)
+
+    def test_invalida_solo_la_seccion(self):
+        # Las herramientas pasan la fecha como texto y sin ceros ("2024-5-1")
+        generar_cuaderno(ANIO)
+        generar_cuaderno(ANIO - 1)
+        DiarioActividad.objects.create(
+            explotacion=self.explotacion,
+            fecha="2024-5-1",
+            tipo="TRATAMIENTO",
+            producto_nombre="Azufre",
+        )
+
+        validos = dict(
+            SnapshotCuaderno.objects.filter(
+                explotacion=self.explotacion, anio=ANIO
+            ).values_list("seccion", "valido")
+        )
+        self.assertEqual(
+            validos, {seccion: seccion != "tratamientos" for seccion, _ in SECCIONES}
+        )
+        self.assertFalse(
+            SnapshotCuaderno.objects.filter(
+                explotacion=self.explotacion, anio=ANIO - 1, valido=False
+            ).exists()
+        )
@@ -0,0 +1,105 @@
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from gestion.common import TipoActividad
+from gestion.models import DiarioActividad, Parcela, RegistroMovimientoProducto
+from gestion.servicios import maestros
+from gestion.servicios.cuadernos_antiguos import cargar_cuaderno, leer_cuaderno
+
+from .datos import crear_explotacion
+
+CUADERNO = (
+    settings.BASE_DIR
+    / "specs"
+    / "Cuaderno agrícola ejemplos"
+    / "CUADERNO DE CAMPO 2022.doc"
+)
+REGISTROS = ("parcelas", "actividades", "semillas", "analisis", "ventas")
+
+
+class CuadernoAntiguoTests(TestCase):
+    """Cuaderno de campo oficial en Word (.doc) de 2022."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.explotacion = crear_explotacion()
+        cls.cuaderno = leer_cuaderno(CUADERNO.read_bytes(), CUADERNO.name)
+
+    def setUp(self):
+        cache = mock.patch.object(maestros, "cache", maestros.CacheMaestros(ttl=300))
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def _totales(self):
+        return tuple(
+            modelo.objects.count()
+            for modelo in (Parcela, DiarioActividad, RegistroMovimientoProducto)
+        )
+
+    def test_lectura(self):
+        cuaderno = self.cuaderno
+        self.assertEqual(cuaderno["nif"], "53367389Y")
+        self.assertEqual(cuaderno["avisos"], [])
+        self.assertEqual(
+            {registro: len(cuaderno[registro]) for registro in REGISTROS},
+            {
+                "parcelas": 6,
+                "actividades": 17,
+                "semillas": 0,
+                "analisis": 0,
+                "ventas": 4,
+            },
+        )
+        self.assertEqual(
+            Counter(a["tipo"] for a in cuaderno["actividades"]),
+            {TipoActividad.TRATAMIENTO: 9, TipoActividad.ABONADO: 8},
+        )
+
+        parcela = cuaderno["parcelas"][0]
+        self.assertEqual((parcela["poligono"], parcela["parcela"]), ("1", "311"))
+        self.assertIsNone(parcela["recinto"])
+        self.assertEqual(parcela["superficie_sigpac"], Decimal("8.3308"))
+        self.assertEqual(parcela["secano_regadio"], "Regadío")
+
+        # Un tratamiento con dos fechas en la celda se registra una vez por fecha
+        self.assertEqual(
+            [a["fecha"] for a in cuaderno["actividades"][:2]],
+            [date(2022, 4, 25), date(2022, 5, 15)],
+        )
+        venta = cuaderno["ventas"][0]
+        self.assertEqual(venta["fecha"], date(2021, 12, 20))
+        self.assertEqual(venta["cantidad_kg"], Decimal("7545"))
+        self.assertEqual(venta["cliente_nif"], "B92032127")
+
+    def test_cargar_dos_veces(self):
+        self.assertEqual(
+            cargar_cuaderno(self.explotacion, self.cuaderno),
+            {
+                "parcelas": 6,
+                "omitidos": 0,
+                "actividades": 17,
+                "semillas": 0,
+                "analisis": 0,
+                "ventas": 4,
+            },
+        )
+        # La parcela de crear_explotacion no está en el cuaderno
+        self.assertEqual(self._totales(), (7, 17, 4))
+
+        self.assertEqual(
+            cargar_cuaderno(self.explotacion, self.cuaderno),
+            {
+                "parcelas": 0,
+                "omitidos": 21,
+                "actividades": 0,
+                "semillas": 0,
+                "analisis": 0,
+                "ventas": 0,
+            },
+        )
+        self.assertEqual(self._totales(), (7, 17, 4))
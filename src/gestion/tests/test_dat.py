@@ -0,0 +1,66 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from gestion.models import DocumentoDAT, LineaDAT, RegistroTransporte, SerieDAT
+from gestion.servicios.dat import ContextoDAT, emitir_datos_dats, normalizar_peticion
+
+from .datos import crear_explotacion, peticion_dat
+
+LOTE = 20
+
+
+class ConsultasDATTests(TestCase):
+    """El número de consultas para emitir DAT no depende del tamaño del lote."""
+
+    # Savepoint del atomic (2), reserva de números (2) e INSERT de documentos,
+    # líneas y registros de transporte (3)
+    CONSULTAS_EMISION = ContextoDAT.CONSULTAS_MAXIMAS + 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.explotacion = crear_explotacion(destinatarios=LOTE)
+        # Serie del año ya creada: la primera emisión del año hace dos consultas más
+        SerieDAT.objects.create(
+            explotacion=cls.explotacion, anio=timezone.localdate().year
+        )
+
+    def _contexto(self, peticiones):
+        with self.assertNumQueries(ContextoDAT.CONSULTAS_MAXIMAS):
+            contexto = ContextoDAT([normalizar_peticion(p) for p in peticiones])
+        return contexto
+
+    def test_contexto_un_dat(self):
+        contexto = self._contexto([peticion_dat()])
+        self.assertEqual(contexto.explotacion, self.explotacion)
+        self.assertEqual(contexto.destinatarios["Cliente 0"].documento, "C0000000")
+        self.assertIn("A0000000", contexto.personas)
+        self.assertIn("X0000000", contexto.transportistas)
+
+    def test_contexto_sin_parcela(self):
+        # Ningún cultivo coincide: la explotación llega igual en la misma consulta
+        peticion = dict(peticion_dat(), productos=["PIÑA"], variedades=["MD2"])
+        contexto = self._contexto([peticion])
+        self.assertEqual(contexto.explotacion, self.explotacion)
+        self.assertEqual(contexto.explotacion.titular.documento, "B0000000")
+        self.assertEqual(contexto.parcelas, [])
+        self.assertIsNone(contexto.parcela_origen("PIÑA"))
+
+    def test_contexto_lote(self):
+        contexto = self._contexto([peticion_dat(i) for i in range(LOTE)])
+        self.assertEqual(
+            [contexto.destinatarios[f"Cliente {i}"].documento for i in range(LOTE)],
+            [f"C{i:07d}" for i in range(LOTE)],
+        )
+
+    def test_emision_un_dat(self):
+        with self.assertNumQueries(self.CONSULTAS_EMISION):
+            (datos,) = emitir_datos_dats([peticion_dat()])
+        self.assertTrue(DocumentoDAT.objects.filter(numero=datos["numero"]).exists())
+
+    def test_emision_lote(self):
+        with self.assertNumQueries(self.CONSULTAS_EMISION):
+            datos = emitir_datos_dats([peticion_dat(i) for i in range(LOTE)])
+        self.assertEqual(len({d["numero"] for d in datos}), LOTE)
+        self.assertEqual(DocumentoDAT.objects.count(), LOTE)
+        self.assertEqual(LineaDAT.objects.count(), LOTE)
+        self.assertEqual(RegistroTransporte.objects.count(), LOTE)
@@ -0,0 +1,94 @@
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from gestion.models import DocumentoDAT, LineaDAT, RegistroTransporte, SerieDAT
+from gestion.servicios.dat import emitir_datos_dats, volumen_por_destinatario_mes
+from gestion.servicios.dat_importacion import (
+    ESTADO_SIN_FECHA,
+    cargar_dats,
+    leer_dat_pdf,
+)
+from gestion.servicios.numeracion import FORMATO_NUMERO_DAT
+
+from .datos import crear_explotacion, peticion_dat
+
+EJEMPLOS = settings.BASE_DIR / "specs" / "DAT relleno ejemplos"
+
+
+class ImportarDatsSinFechaTests(TestCase):
+    """Los DAT que solo traen el año se importan sin fecha y para revisar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.explotacion = crear_explotacion()
+        ruta = next(EJEMPLOS.glob("DAT PROVELPACK*.pdf"))
+        (cls.sin_fecha,) = leer_dat_pdf(ruta.read_bytes(), ruta.name)
+        # El ejemplo no trae la cantidad, que LineaDAT exige
+        cls.sin_fecha["lineas"] = [
+            {**linea, "cantidad": Decimal("500")} for linea in cls.sin_fecha["lineas"]
+        ]
+
+    def test_lectura(self):
+        self.assertIsNone(self.sin_fecha["fecha"])
+        self.assertEqual(self.sin_fecha["anio"], 2024)
+        self.assertIn("pendiente de revisar", self.sin_fecha["avisos"][0])
+
+    def test_carga(self):
+        fechado = {
+            **self.sin_fecha,
+            "numero": "IMP-FECHADO",
+            "fecha": date(2024, 5, 10),
+        }
+        cargar_dats([self.sin_fecha, fechado])
+
+        documento = DocumentoDAT.objects.get(numero=self.sin_fecha["numero"])
+        self.assertIsNone(documento.fecha_emision)
+        self.assertIn("Sin fecha de salida (año 2024)", documento.observaciones)
+        self.assertEqual(
+            list(
+                LineaDAT.objects.filter(documento_dat=documento).values_list(
+                    "fecha", flat=True
+                )
+            ),
+            [None],
+        )
+        registro = RegistroTransporte.objects.get(documento_dat=documento)
+        self.assertIsNone(registro.fecha_transporte)
+        self.assertEqual(registro.estado, ESTADO_SIN_FECHA)
+        self.assertEqual(registro.datos_extra["anio"], 2024)
+        self.assertEqual(
+            RegistroTransporte.objects.get(dat_numero="IMP-FECHADO").estado, "emitido"
+        )
+
+        # Solo el DAT con fecha cuenta en el volumen del año, y en su mes
+        volumen = list(
+            volumen_por_destinatario_mes(date(2024, 1, 1), date(2024, 12, 31))
+        )
+        self.assertEqual([fila["mes"].month for fila in volumen], [5])
+        self.assertEqual(volumen[0]["dats"], 1)
+
+    def _numero(self, n):
+        return FORMATO_NUMERO_DAT.format(
+            explotacion=self.explotacion.pk, anio=timezone.localdate().year, numero=n
+        )
+
+    def _ultimo_numero(self):
+        return SerieDAT.objects.get(
+            explotacion=self.explotacion, anio=timezone.localdate().year
+        ).ultimo_numero
+
+    def test_emision_tras_importar(self):
+        # DAT impresos por este sistema: la serie sigue tras el mayor importado
+        cargar_dats([{**self.sin_fecha, "numero": self._numero(n)} for n in (5, 3)])
+        self.assertEqual(self._ultimo_numero(), 5)
+
+        (datos,) = emitir_datos_dats([peticion_dat()])
+        self.assertEqual(datos["numero"], self._numero(6))
+
+        # Importar números menores no hace retroceder la serie
+        cargar_dats([{**self.sin_fecha, "numero": self._numero(1)}])
+        self.assertEqual(self._ultimo_numero(), 6)
@@ -0,0 +1,32 @@
+import asyncio
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from gestion.ejecutor import EjecutorBD
+
+
+def _consultas(n):
+    with connection.cursor() as cursor:
+        for _ in range(n):
+            cursor.execute("SELECT 1")
+    return n
+
+
+class EjecutorBDTests(SimpleTestCase):
+    databases = {"default"}
+
+    def test_metricas_por_llamada(self):
+        # Varias llamadas a la vez a la misma función envuelta (como las
+        # secciones del cuaderno): cada una cuenta solo sus consultas
+        db = EjecutorBD(workers=3)
+        self.addCleanup(db.cerrar)
+        consultar = db(_consultas, "prueba")
+
+        async def llamadas():
+            return await asyncio.gather(*(consultar(n) for n in (1, 2, 3)))
+
+        self.assertEqual(asyncio.run(llamadas()), [1, 2, 3])
+        metricas = db._metricas["prueba"]
+        self.assertEqual(metricas["llamadas"], 3)
+        self.assertEqual(metricas["consultas"], 6)
@@ -0,0 +1,200 @@
+import io
+import tempfile
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from gestion.models import (
+    AnalisisLaboratorio,
+    Asesor,
+    DiarioActividad,
+    EquipoAplicacion,
+    Parcela,
+    Persona,
+    Personal,
+    RegistroMovimientoProducto,
+    SemillaTratada,
+)
+from gestion.servicios import maestros
+from gestion.servicios.cuaderno import generar_cuaderno
+
+from .datos import crear_explotacion
+
+ANIO = 2024
+# Texto del cuaderno de sembrar_anio() tal como lo generaba la herramienta
+# generar_cuaderno antes de escribirse por secciones
+ESPERADO = Path(__file__).parent / "esperados" / f"cuaderno_{ANIO}.txt"
+
+
+def sembrar_anio():
+    """
+    Explotación con registros de todas las secciones del cuaderno de ``ANIO``,
+    y algunos que no deben aparecer (de otro año o de otro tipo).
+    """
+    explotacion = crear_explotacion()
+    mango = Parcela.objects.get()
+    mango.superficie_sigpac = mango.superficie_cultivada = Decimal("1.25")
+    mango.uso_sigpac = "FY"
+    mango.save()
+    aguacate = Parcela.objects.create(
+        explotacion=explotacion,
+        referencia_sigpac="29:94:0:0:1:2:1",
+        poligono="1",
+        parcela="2",
+        recinto="1",
+        superficie_sigpac=Decimal("0.8"),
+        especie="AGUACATE",
+        variedad="Hass",
+        secano_regadio="Regadío",
+        aire_protegido="Aire libre",
+    )
+    Persona.objects.create(
+        nombre="Titular Pruebas SL",
+        nif="B0000000",
+        telefono="952000000",
+        email="titular@example.com",
+    )
+
+    aplicador = Personal.objects.create(
+        nombre="Ana",
+        apellidos="Aplicadora",
+        sexo="M",
+        tipo_documento="DNI",
+        documento="P0000001",
+        cargo="Aplicador cualificado",
+        habilitado_fitosanitarios=True,
+    )
+    Personal.objects.create(
+        nombre="Bruno",
+        apellidos="Básico",
+        sexo="H",
+        tipo_documento="DNI",
+        documento="P0000002",
+        cargo="Carné BASICO",
+        habilitado_fitosanitarios=True,
+    )
+    Personal.objects.create(
+        nombre="Carla",
+        apellidos="Administrativa",
+        sexo="M",
+        tipo_documento="DNI",
+        documento="P0000003",
+        cargo="Oficina",
+    )
+    equipo = EquipoAplicacion.objects.create(
+        explotacion=explotacion,
+        descripcion="Atomizador 1000 l",
+        numero_inscripcion_roma="ROMA-1",
+        fecha_adquisicion=date(2020, 3, 1),
+    )
+    Asesor.objects.create(
+        persona=Persona.objects.create(nombre="Asesora GIP", nif="G0000000"),
+        numero_inscripcion_ropo="ROPO-1",
+        tipo_carnet="PI",
+    )
+
+    DiarioActividad.objects.bulk_create(
+        DiarioActividad(explotacion=explotacion, **datos)
+        for datos in (
+            {
+                "fecha": date(ANIO, 4, 2),
+                "tipo": "TRATAMIENTO",
+                "parcela": mango,
+                "superficie_tratada_ha": Decimal("1.25"),
+                "problema_fitosanitario": "Oídio",
+                "aplicador": aplicador,
+                "equipo": equipo,
+                "producto_nombre": "Azufre",
+                "producto_numero_registro": "ES-00001",
+                "dosis": Decimal("3"),
+                "dosis_text": "kg/ha",
+                "observaciones": "Sin viento",
+            },
+            {
+                "fecha": date(ANIO, 6, 15),
+                "tipo": "TRATAMIENTO",
+                "problema_fitosanitario": "Trips",
+                "producto_nombre": "Aceite de parafina",
+            },
+            {
+                "fecha": date(ANIO, 3, 10),
+                "tipo": "ABONADO",
+                "parcela": aguacate,
+                "producto_nombre": "NPK 15-15-15",
+                "dosis": Decimal("200"),
+                "observaciones": "Albarán 12",
+            },
+            {"fecha": date(ANIO, 7, 1), "tipo": "RIEGO", "dosis": Decimal("40")},
+            {"fecha": date(ANIO, 8, 1), "tipo": "OTRO", "producto_nombre": "Poda"},
+            {
+                "fecha": date(ANIO - 1, 12, 31),
+                "tipo": "TRATAMIENTO",
+                "producto_nombre": "Cobre",
+            },
+        )
+    )
+    SemillaTratada.objects.create(
+        explotacion=explotacion,
+        fecha_siembra=date(ANIO, 2, 20),
+        parcela=aguacate,
+        cultivo="Aguacate Hass",
+        superficie_sembrada_ha=Decimal("0.5"),
+        cantidad_semilla_kg=Decimal("12.5"),
+        producto_fitosanitario="Tiram",
+    )
+    AnalisisLaboratorio.objects.create(
+        explotacion=explotacion,
+        fecha=date(ANIO, 9, 5),
+        material_analizado="Vegetal",
+        cultivo="Mango",
+        numero_boletin="B-123",
+        laboratorio="Laboratorio Axarquía",
+        sustancias_activas_detectadas="Ninguna",
+    )
+    RegistroMovimientoProducto.objects.create(
+        explotacion=explotacion,
+        fecha=date(ANIO, 9, 20),
+        producto="MANGO",
+        cantidad_kg=Decimal("1500"),
+        numero_albaran="ALB-1",
+        cliente_nombre="Cliente 0",
+        cliente_nif="C0000000",
+    )
+    return explotacion
+
+
+class ExportarCuadernoTests(TestCase):
+    """El cuaderno escrito por secciones es el mismo texto que antes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar_anio()
+
+    def setUp(self):
+        cache = mock.patch.object(maestros, "cache", maestros.CacheMaestros(ttl=300))
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.esperado = ESPERADO.read_text(encoding="utf-8")
+
+    def test_salida_estandar(self):
+        salida = io.StringIO()
+        call_command("exportar_cuaderno", str(ANIO), lote=2, stdout=salida)
+        self.assertEqual(salida.getvalue(), self.esperado)
+
+    def test_fichero(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = Path(directorio) / "cuaderno.txt"
+            call_command(
+                "exportar_cuaderno", str(ANIO), salida=str(ruta), stderr=io.StringIO()
+            )
+            self.assertEqual(ruta.read_text(encoding="utf-8"), self.esperado)
+
+    def test_generar_cuaderno(self):
+        self.assertEqual(generar_cuaderno(ANIO, usar_snapshots=False), self.esperado)
+        # Primero se generan y guardan los snapshots; después se copian
+        for _ in range(2):
+            self.assertEqual(generar_cuaderno(ANIO), self.esperado)
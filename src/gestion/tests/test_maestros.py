@@ -0,0 +1,77 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from gestion.models import Persona, Personal
+from gestion.servicios import maestros
+
+from .datos import crear_explotacion
+
+
+class Deshacer(Exception):
+    pass
+
+
+class CacheMaestrosTests(TransactionTestCase):
+    def setUp(self):
+        crear_explotacion()
+        self.cache = maestros.CacheMaestros(ttl=300)
+        parche = mock.patch.object(maestros, "cache", self.cache)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _crear_aplicador(self):
+        Personal.objects.create(
+            nombre="Operario",
+            apellidos="Pruebas",
+            sexo="H",
+            tipo_documento="DNI",
+            documento="P0000000",
+            cargo="Aplicador",
+            habilitado_fitosanitarios=True,
+        )
+
+    def _usa_cache(self):
+        """Si una transacción nueva de este hilo lee los aplicadores de la caché."""
+        with transaction.atomic():
+            maestros.aplicadores()
+            aciertos = self.cache.aciertos
+            maestros.aplicadores()
+            return self.cache.aciertos > aciertos
+
+    def test_cambio_sin_confirmar(self):
+        with transaction.atomic():
+            self._crear_aplicador()
+            self.assertEqual(len(maestros.aplicadores()), 1)
+            self.assertEqual(len(maestros.aplicadores()), 1)
+            self.assertEqual(self.cache.aciertos, 0)
+        self.assertTrue(self._usa_cache())
+
+    def test_rollback(self):
+        with self.assertRaises(Deshacer), transaction.atomic():
+            self._crear_aplicador()
+            raise Deshacer
+        self.assertTrue(self._usa_cache())
+        self.assertEqual(maestros.aplicadores(), [])
+
+    def test_rollback_de_savepoint(self):
+        with transaction.atomic():
+            with self.assertRaises(Deshacer), transaction.atomic():
+                self._crear_aplicador()
+                raise Deshacer
+            maestros.aplicadores()
+            maestros.aplicadores()
+            self.assertEqual(self.cache.aciertos, 1)
+
+    def test_invalidacion_por_modelo(self):
+        maestros.explotacion_principal()
+        maestros.aplicadores()
+        maestros.equipos()
+        maestros.asesores()
+        Persona.objects.create(nombre="Contacto", nif="Z0000000")
+        self.assertEqual(
+            set(self.cache._datos), {"explotacion", "aplicadores", "equipos"}
+        )
+        self._crear_aplicador()
+        self.assertEqual(set(self.cache._datos), {"explotacion", "equipos"})
@@ -0,0 +1,68 @@
+import asyncio
+
+from django.test import TransactionTestCase
+from fastmcp import Client
+
+from gestion.ejecutor import EjecutorBD
+from gestion.management.commands.run_mcp_server import Command as ServidorMCP
+from gestion.models import DocumentoDAT
+
+from .datos import crear_explotacion, peticion_dat
+
+
+def llamar(herramienta, argumentos):
+    """Texto que devuelve ``herramienta`` del servidor MCP."""
+
+    async def llamada():
+        mcp = ServidorMCP().construir_mcp(EjecutorBD())
+        async with Client(mcp) as client:
+            resultado = await client.call_tool(herramienta, argumentos)
+        return resultado.content[0].text
+
+    return asyncio.run(llamada())
+
+
+class GenerarDatsLoteTests(TransactionTestCase):
+    def setUp(self):
+        crear_explotacion(destinatarios=3)
+
+    def test_cabecera_con_los_numeros_emitidos(self):
+        texto = llamar(
+            "generar_dats_lote", {"dats": [peticion_dat(i) for i in range(3)]}
+        )
+        numeros = list(
+            DocumentoDAT.objects.order_by("pk").values_list("numero", flat=True)
+        )
+        self.assertEqual(len(numeros), 3)
+        self.assertEqual(
+            texto.splitlines()[0], f"DAT EMITIDOS: 3 ({', '.join(numeros)})"
+        )
+        for numero in numeros:
+            self.assertIn(f"DAT GENERADO: {numero}", texto)
+
+    def test_lote_no_valido(self):
+        peticiones = [
+            peticion_dat(0),
+            {**peticion_dat(1), "nombre_destinatario": "Nadie"},
+        ]
+        texto = llamar("generar_dats_lote", {"dats": peticiones})
+        self.assertTrue(texto.startswith("Error: No se ha emitido ningún DAT."), texto)
+        self.assertFalse(DocumentoDAT.objects.exists())
+
+
+class ConsultarVolumenDatTests(TransactionTestCase):
+    def test_mes_no_valido(self):
+        for mes in (0, 13):
+            with self.subTest(mes=mes):
+                texto = llamar("consultar_volumen_dat", {"anio": 2024, "mes": mes})
+                self.assertTrue(texto.startswith("Error: El mes"), texto)
+
+    def test_anio_no_valido(self):
+        texto = llamar("consultar_volumen_dat", {"anio": 0, "mes": 5})
+        self.assertTrue(texto.startswith("Error: El año 0"), texto)
+
+    def test_mes_de_diciembre(self):
+        texto = llamar("consultar_volumen_dat", {"anio": 2024, "mes": 12})
+        self.assertEqual(
+            texto, "No hay DAT emitidos entre 2024-12-01 y 2024-12-31 con esos filtros."
+        )
@@ -0,0 +1,159 @@
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
+
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from gestion.models import DocumentoDAT, Explotacion, SerieDAT
+from gestion.servicios.dat import emitir_datos_dats
+from gestion.servicios.numeracion import (
+    FORMATO_NUMERO_DAT,
+    PATRON_NUMERO_DAT,
+    reservar_numeros_dat,
+)
+
+from .datos import crear_explotacion, peticion_dat
+
+HILOS = 8
+RONDAS = 15
+# DAT por llamada: lotes de varias peticiones mezclados con DAT sueltos
+LOTES = (1, 3, 4, 8)
+
+
+@skipIf(
+    connection.vendor == "sqlite",
+    "La BD de pruebas de SQLite en memoria no admite escrituras desde varios hilos.",
+)
+class NumeracionConcurrenteTests(TransactionTestCase):
+    """
+    Varias transacciones emiten DAT a la vez en varias series, cada una con su
+    conexión: los números de cada explotación y año deben ser únicos y
+    correlativos, sin huecos.
+    """
+
+    def setUp(self):
+        self.explotacion = crear_explotacion(destinatarios=max(LOTES))
+        self.anio = timezone.localdate().year
+        otra = Explotacion.objects.create(nombre="Otra finca")
+        # La primera serie la usa emitir_datos_dats; las otras, reservas directas
+        self.series = [
+            (self.explotacion, self.anio),
+            (self.explotacion, self.anio - 1),
+            (otra, self.anio),
+        ]
+
+    def _plan(self, hilo):
+        """(serie, DAT de la llamada) de cada ronda de ``hilo``."""
+        return [
+            (ronda % len(self.series), LOTES[(hilo + ronda) % len(LOTES)])
+            for ronda in range(RONDAS)
+        ]
+
+    def _emitir(self, serie, cantidad):
+        if serie == 0:
+            peticiones = [peticion_dat(i) for i in range(cantidad)]
+            return [datos["numero"] for datos in emitir_datos_dats(peticiones)]
+        explotacion, anio = self.series[serie]
+        with transaction.atomic():
+            return reservar_numeros_dat(explotacion, cantidad, anio)
+
+    def _emitir_en_paralelo(self):
+        barrera = threading.Barrier(HILOS)
+
+        def emitir(hilo):
+            try:
+                barrera.wait()
+                return [
+                    numero
+                    for serie, cantidad in self._plan(hilo)
+                    for numero in self._emitir(serie, cantidad)
+                ]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(HILOS) as pool:
+            futuros = [pool.submit(emitir, hilo) for hilo in range(HILOS)]
+            return [numero for f in futuros for numero in f.result()]
+
+    def _comprobar_series(self, numeros):
+        esperados = Counter()
+        for hilo in range(HILOS):
+            for serie, cantidad in self._plan(hilo):
+                esperados[serie] += cantidad
+        self.assertGreaterEqual(sum(esperados.values()), 300)
+
+        obtenidos = defaultdict(list)
+        for numero in numeros:
+            explotacion_id, anio, n = PATRON_NUMERO_DAT.fullmatch(numero).groups()
+            obtenidos[int(explotacion_id), int(anio)].append(int(n))
+
+        for serie, (explotacion, anio) in enumerate(self.series):
+            with self.subTest(explotacion=explotacion.pk, anio=anio):
+                total = esperados[serie]
+                self.assertEqual(
+                    sorted(obtenidos.pop((explotacion.pk, anio))),
+                    list(range(1, total + 1)),
+                )
+                self.assertEqual(
+                    SerieDAT.objects.get(
+                        explotacion=explotacion, anio=anio
+                    ).ultimo_numero,
+                    total,
+                )
+        self.assertEqual(obtenidos, {})
+
+        self.assertEqual(
+            sorted(DocumentoDAT.objects.values_list("numero", flat=True)),
+            [
+                FORMATO_NUMERO_DAT.format(
+                    explotacion=self.explotacion.pk, anio=self.anio, numero=n
+                )
+                for n in range(1, esperados[0] + 1)
+            ],
+        )
+
+    def test_emision_concurrente(self):
+        for explotacion, anio in self.series:
+            SerieDAT.objects.create(explotacion=explotacion, anio=anio)
+        self._comprobar_series(self._emitir_en_paralelo())
+
+    def test_primera_emision_del_anio_concurrente(self):
+        # Sin series: todos los hilos compiten por crearlas
+        self._comprobar_series(self._emitir_en_paralelo())
+
+
+class SerieDATTests(TestCase):
+    def setUp(self):
+        self.explotacion = crear_explotacion()
+        self.anio = timezone.localdate().year
+
+    def test_serie_creada_por_otra_transaccion(self):
+        # Otra transacción crea la serie (y emite 3 DAT) entre el UPDATE que no
+        # encuentra fila y el INSERT: el INSERT falla y se incrementa la suya
+        update = QuerySet.update
+
+        def update_concurrente(queryset, **kwargs):
+            if not SerieDAT.objects.exists():
+                SerieDAT.objects.create(
+                    explotacion=self.explotacion, anio=self.anio, ultimo_numero=3
+                )
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", update_concurrente):
+            with transaction.atomic():
+                numeros = reservar_numeros_dat(self.explotacion, 2, self.anio)
+        self.assertEqual(
+            numeros,
+            [
+                FORMATO_NUMERO_DAT.format(
+                    explotacion=self.explotacion.pk, anio=self.anio, numero=n
+                )
+                for n in (4, 5)
+            ],
+        )
+        self.assertEqual(SerieDAT.objects.get().ultimo_numero, 5)
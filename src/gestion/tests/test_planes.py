@@ -0,0 +1,103 @@
+import json
+from datetime import date
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.db import connection
+from django.test import TestCase
+
+from gestion.management.commands.benchmark_mcp import sembrar_historico
+from gestion.models import (
+    AnalisisLaboratorio,
+    DiarioActividad,
+    RegistroMovimientoProducto,
+    SemillaTratada,
+)
+
+FILAS = 50_000
+
+
+def recorridos_secuenciales(qs):
+    """
+    Tablas que el plan de ``qs`` (``EXPLAIN`` en JSON) recorre enteras. Las
+    tablas casi vacías (p. ej. la partición de un año futuro) no cuentan:
+    recorrerlas es lo más barato y no indica un índice que falte.
+    """
+    secuenciales = []
+    pendientes = [json.loads(qs.explain(format="json"))[0]["Plan"]]
+    while pendientes:
+        nodo = pendientes.pop()
+        if nodo["Node Type"] == "Seq Scan":
+            secuenciales.append(nodo["Relation Name"])
+        pendientes.extend(nodo.get("Plans", []))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relname = ANY(%s) AND reltuples >= 1000",
+            [secuenciales],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "Los planes se comprueban con PostgreSQL."
+)
+class PlanesConsultasTests(TestCase):
+    """
+    Las consultas habituales de generar_cuaderno, consultar_historico y la
+    búsqueda del admin del diario usan índices con un histórico grande.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.explotacion, cls.parcela, cls.anio = sembrar_historico(FILAS)
+
+    def consultas(self):
+        explotacion, anio = self.explotacion, self.anio
+        desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+        diario = DiarioActividad.objects.filter(
+            explotacion=explotacion, fecha__range=(desde, hasta)
+        )
+        busqueda, _ = admin.site._registry[DiarioActividad].get_search_results(
+            None, DiarioActividad.objects.order_by("-pk"), f'"{explotacion.nombre}"'
+        )
+        return [
+            ("cuaderno: tratamientos", diario.filter(tipo="TRATAMIENTO")),
+            ("cuaderno: abonados/riegos", diario.filter(tipo__in=["ABONADO", "RIEGO"])),
+            ("cuaderno: diario del año", diario),
+            (
+                "cuaderno: semillas",
+                SemillaTratada.objects.filter(
+                    explotacion=explotacion, fecha_siembra__range=(desde, hasta)
+                ),
+            ),
+            (
+                "cuaderno: análisis",
+                AnalisisLaboratorio.objects.filter(
+                    explotacion=explotacion, fecha__range=(desde, hasta)
+                ),
+            ),
+            (
+                "cuaderno: ventas",
+                RegistroMovimientoProducto.objects.filter(
+                    explotacion=explotacion, fecha__range=(desde, hasta)
+                ),
+            ),
+            (
+                "histórico: parcela",
+                DiarioActividad.objects.filter(parcela=self.parcela).order_by("-fecha")[
+                    :5
+                ],
+            ),
+            (
+                "histórico: año",
+                DiarioActividad.objects.filter(fecha__year=anio).order_by(
+                    "-fecha", "-pk"
+                )[:5],
+            ),
+            ("admin: búsqueda diario", busqueda[:100]),
+        ]
+
+    def test_sin_recorridos_secuenciales(self):
+        for nombre, qs in self.consultas():
+            with self.subTest(nombre):
+                self.assertEqual(recorridos_secuenciales(qs), [])
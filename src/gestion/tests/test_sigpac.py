@@ -0,0 +1,154 @@
+import json
+from decimal import Decimal
+
+from django.test import TestCase
+
+from gestion.models import Parcela
+from gestion.servicios.sigpac import (
+    ErrorImportacion,
+    desglosar_referencia,
+    importar_recintos,
+    leer_recintos,
+)
+
+from .datos import crear_explotacion
+
+# Export del visor con coma decimal y ceros a la izquierda; sin columna de alias
+CSV = (
+    "Provincia;Municipio;Polígono;Parcela;Recinto;Uso;Superficie (ha);Cultivo\n"
+    "29;94;001;1;1;TA;1,2500;MANGO\n"
+    "29;094;1;2;3;TA;0,5;AGUACATE\n"
+).encode("cp1252")
+
+GEOJSON = json.dumps(
+    {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": None,
+                "properties": {
+                    "provincia": 29,
+                    "municipio": 94,
+                    "poligono": 1,
+                    "parcela": 2,
+                    "recinto": 3,
+                    "uso_sigpac": "FY",
+                    "dn_surface": 4800,
+                },
+            },
+            {
+                "type": "Feature",
+                "geometry": None,
+                "properties": {"referencia": "29:94:0:0:4:5:6", "uso": "TA"},
+            },
+        ],
+    }
+).encode()
+
+
+class ImportarRecintosTests(TestCase):
+    """Los recintos se crean o actualizan por polígono/parcela/recinto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.explotacion = crear_explotacion()
+        Parcela.objects.update(alias="la de abajo")
+
+    def _parcela(self, poligono, parcela, recinto):
+        return Parcela.objects.get(
+            explotacion=self.explotacion,
+            poligono=poligono,
+            parcela=parcela,
+            recinto=recinto,
+        )
+
+    def test_csv_dos_veces(self):
+        self.assertEqual(
+            importar_recintos(self.explotacion, CSV, "recintos.csv"), (1, 1)
+        )
+        self.assertEqual(
+            importar_recintos(self.explotacion, CSV, "recintos.csv"), (0, 2)
+        )
+        self.assertEqual(Parcela.objects.count(), 2)
+
+        existente = self._parcela("1", "1", "1")
+        self.assertEqual(existente.superficie_sigpac, Decimal("1.2500"))
+        self.assertEqual(existente.uso_sigpac, "TA")
+        self.assertEqual(existente.variedad, "Osteen")
+        self.assertEqual(existente.alias, "la de abajo")
+
+        nueva = self._parcela("1", "2", "3")
+        self.assertEqual(nueva.referencia_sigpac, "29:94:0:0:1:2:3")
+        self.assertEqual(nueva.especie, "AGUACATE")
+        # Sin superficie cultivada en el fichero, toma la de SIGPAC
+        self.assertEqual(nueva.superficie_cultivada, Decimal("0.5000"))
+
+    def test_geojson_dos_veces(self):
+        importar_recintos(self.explotacion, CSV, "recintos.csv")
+        Parcela.objects.filter(recinto="3").update(alias="la del pozo")
+
+        for esperado in ((1, 1), (0, 2)):
+            self.assertEqual(
+                importar_recintos(self.explotacion, GEOJSON, "recintos.geojson"),
+                esperado,
+            )
+        self.assertEqual(Parcela.objects.count(), 3)
+
+        actualizada = self._parcela("1", "2", "3")
+        self.assertEqual(actualizada.uso_sigpac, "FY")
+        self.assertEqual(actualizada.superficie_sigpac, Decimal("0.4800"))
+        self.assertEqual(actualizada.especie, "AGUACATE")
+        self.assertEqual(actualizada.alias, "la del pozo")
+        self.assertEqual(
+            self._parcela("4", "5", "6").referencia_sigpac, "29:94:0:0:4:5:6"
+        )
+        self.assertEqual(self._parcela("1", "1", "1").alias, "la de abajo")
+
+    def test_errores_con_fila(self):
+        casos = {
+            "recintos.csv": (
+                b"poligono;parcela;recinto;superficie\n1;1;1;2\n1;2;3;dos\n",
+                "Fila 3: 'dos' no es un número (superficie).",
+            ),
+            "sin_recinto.csv": (
+                b"poligono;parcela;recinto\n1;1;\n",
+                "Fila 2: falta el polígono, la parcela o el recinto.",
+            ),
+            "repetido.csv": (
+                b"pol;par;rec\n1;1;1\n1;2;1\n01;1;1\n",
+                "Fila 4: el recinto 1/1/1 ya aparece en la fila 2.",
+            ),
+            "recintos.geojson": (
+                json.dumps(
+                    {"features": [{"properties": {"referencia": "1:1:1"}}, {}]}
+                ).encode(),
+                "Fila 2: falta el polígono, la parcela o el recinto.",
+            ),
+        }
+        for nombre, (contenido, mensaje) in casos.items():
+            with self.subTest(nombre):
+                with self.assertRaisesMessage(ErrorImportacion, mensaje):
+                    importar_recintos(self.explotacion, contenido, nombre)
+        # La importación es atómica: nada a medias
+        self.assertEqual(Parcela.objects.count(), 1)
+
+    def test_desglosar_referencia(self):
+        self.assertEqual(
+            desglosar_referencia("29:094:0:0:1:2:03"),
+            ("29", "94", "0", "0", "1", "2", "3"),
+        )
+        self.assertEqual(
+            desglosar_referencia("29-94-1-2-3"),
+            ("29", "94", None, None, "1", "2", "3"),
+        )
+        self.assertEqual(
+            desglosar_referencia("1/2/3"), (None, None, None, None, "1", "2", "3")
+        )
+        self.assertIsNone(desglosar_referencia("29:94"))
+
+    def test_superficie_con_miles(self):
+        (recinto,) = leer_recintos(
+            b'pol,par,rec,sup_declarada\n1,1,1,"1.234,56789"\n', "recintos.csv"
+        )
+        self.assertEqual(recinto["superficie_cultivada"], Decimal("1234.5679"))